@@ -24,6 +24,7 @@
 import asyncio
 import threading
 import itertools
+from bisect import bisect_left
 from collections import defaultdict
 from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple, NamedTuple, Sequence, List
 
@@ -54,12 +55,139 @@ TX_TIMESTAMP_INF = 999_999_999_999
 TX_HEIGHT_INF = 10 ** 9
 
 
+class _AddressCoins:
+    """The outputs received by an address, and the txs spending them.
+    Same content as get_addr_io, without the heights, which change with verification.
+    """
+    __slots__ = ('received', 'spent', 'unspent')
+
+    def __init__(self):
+        self.received = {}  # type: Dict[str, Tuple[int, bool]]  # prevout_str -> (value, is_coinbase)
+        self.spent = {}  # type: Dict[str, str]  # prevout_str -> spending txid
+        self.unspent = set()  # type: Set[str]  # prevout_str
+
+    def add_received(self, prevout_str: str, value: int, is_coinbase: bool) -> None:
+        self.received[prevout_str] = value, is_coinbase
+        if prevout_str not in self.spent:
+            self.unspent.add(prevout_str)
+
+    def add_spent(self, prevout_str: str, spending_txid: str) -> None:
+        self.spent[prevout_str] = spending_txid
+        self.unspent.discard(prevout_str)
+
+    def remove_received(self, prevout_str: str) -> None:
+        self.received.pop(prevout_str, None)
+        self.unspent.discard(prevout_str)
+
+    def remove_spent(self, prevout_str: str, spending_txid: str) -> None:
+        if self.spent.get(prevout_str) == spending_txid:
+            del self.spent[prevout_str]
+            if prevout_str in self.received:
+                self.unspent.add(prevout_str)
+
+
+_HistoryEntry = Tuple[Tuple[int, int, str], int, TxMinedInfo, Optional[int]]  # (key, delta, tx_mined_info, fee)
+
+
+class _HistoryIndex:
+    """The history of all addresses, in the order of get_history, with running balances.
+
+    Entries are kept in parallel lists sorted by key = (sort height, txpos, txid).
+    Txs whose delta, height or fee might have changed are marked dirty, and are moved
+    to their new position by update(). Balances and monotonic timestamps are then
+    recomputed from the first position that changed, which for new txs usually
+    is the end of the list.
+    """
+
+    def __init__(self):
+        self.entries = {}  # type: Dict[str, _HistoryEntry]  # txid -> entry
+        self.keys = []  # type: List[Tuple[int, int, str]]
+        self.deltas = []  # type: List[int]
+        self.timestamps = []  # type: List[Optional[int]]
+        self.balances = []  # type: List[int]
+        self.monotonic_timestamps = []  # type: List[int]  # running max of timestamps, TX_TIMESTAMP_INF if None
+        self.dirty = set()  # type: Set[str]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, entries: Dict[str, Optional[_HistoryEntry]]) -> bool:
+        """Sets the entries of the given txs, None meaning the tx is not in the history.
+        Returns whether the index was rebuilt from scratch.
+        """
+        rebuild = len(entries) > len(self.keys) // 8 + 16
+        if rebuild:
+            for txid, entry in entries.items():
+                if entry is None:
+                    self.entries.pop(txid, None)
+                else:
+                    self.entries[txid] = entry
+            ordered = sorted(self.entries.values(), key=lambda entry: entry[0])
+            self.keys = [entry[0] for entry in ordered]
+            self.deltas = [entry[1] for entry in ordered]
+            self.timestamps = [entry[2].timestamp for entry in ordered]
+            first = 0
+        else:
+            first = len(self.keys)
+            for txid, entry in entries.items():
+                old_entry = self.entries.pop(txid, None)
+                if old_entry == entry:
+                    if entry is not None:
+                        self.entries[txid] = entry
+                    continue
+                if old_entry is not None:
+                    i = bisect_left(self.keys, old_entry[0])
+                    del self.keys[i], self.deltas[i], self.timestamps[i]
+                    first = min(first, i)
+                if entry is not None:
+                    key, delta, tx_mined_info, fee = entry
+                    i = bisect_left(self.keys, key)
+                    self.keys.insert(i, key)
+                    self.deltas.insert(i, delta)
+                    self.timestamps.insert(i, tx_mined_info.timestamp)
+                    self.entries[txid] = entry
+                    first = min(first, i)
+        del self.balances[first:]
+        del self.monotonic_timestamps[first:]
+        balance = self.balances[-1] if first else 0
+        monotonic_timestamp = self.monotonic_timestamps[-1] if first else 0
+        for delta, ts in zip(self.deltas[first:], self.timestamps[first:]):
+            balance += delta
+            monotonic_timestamp = max(monotonic_timestamp, ts or TX_TIMESTAMP_INF)
+            self.balances.append(balance)
+            self.monotonic_timestamps.append(monotonic_timestamp)
+        return rebuild
+
+    def get_range(
+            self, *,
+            from_height: int = None,
+            to_height: int = None,
+            from_timestamp: int = None,
+            to_timestamp: int = None,
+    ) -> Tuple[int, int]:
+        """Returns the (start, stop) positions of the entries mined in [from_height, to_height)
+        and with a monotonic timestamp in [from_timestamp, to_timestamp).
+        Txs that are not mined are after any height.
+        """
+        start, stop = 0, len(self.keys)
+        if from_height is not None:
+            start = max(start, bisect_left(self.keys, (from_height,)))
+        if to_height is not None:
+            stop = min(stop, bisect_left(self.keys, (to_height,)))
+        if from_timestamp is not None:
+            start = max(start, bisect_left(self.monotonic_timestamps, from_timestamp))
+        if to_timestamp is not None:
+            stop = min(stop, bisect_left(self.monotonic_timestamps, to_timestamp))
+        return start, stop
+
+
 class HistoryItem(NamedTuple):
     txid: str
     tx_mined_status: TxMinedInfo
     delta: int
     fee: Optional[int]
     balance: int
+    monotonic_timestamp: int = 0  # max of the block timestamps so far, TX_TIMESTAMP_INF if not mined
 
 
 class AddressSynchronizer(Logger, EventListener):
@@ -209,8 +337,8 @@ class AddressSynchronizer(Logger, EventListener):
                 self.db.put('stored_height', self.get_local_height())
 
     def add_address(self, address):
-        if address not in self.db.history:
-            self.db.history[address] = []
+        if not self.db.is_addr_in_history(address):
+            self.db.set_addr_history(address, [])
         if self.synchronizer:
             self.synchronizer.add(address)
         self.up_to_date_changed()
@@ -320,7 +448,7 @@ class AddressSynchronizer(Logger, EventListener):
                     except KeyError:
                         pass
                     else:
-                        self.db.add_txi_addr(tx_hash, addr, ser, v)
+                        self._add_txi_addr(tx_hash, addr, ser, v)
                         self._get_balance_cache.clear()  # invalidate cache
             for txi in tx.inputs():
                 if txi.is_coinbase_input():
@@ -338,12 +466,12 @@ class AddressSynchronizer(Logger, EventListener):
                 self.db.add_prevout_by_scripthash(scripthash, prevout=TxOutpoint.from_str(ser), value=v)
                 addr = txo.address
                 if addr and self.is_mine(addr):
-                    self.db.add_txo_addr(tx_hash, addr, n, v, is_coinbase)
+                    self._add_txo_addr(tx_hash, addr, n, v, is_coinbase)
                     self._get_balance_cache.clear()  # invalidate cache
                     # give v to txi that spends me
                     next_tx = self.db.get_spent_outpoint(tx_hash, n)
                     if next_tx is not None:
-                        self.db.add_txi_addr(next_tx, addr, ser, v)
+                        self._add_txi_addr(next_tx, addr, ser, v)
                         self._add_tx_to_local_history(next_tx)
             # add to local history
             self._add_tx_to_local_history(tx_hash)
@@ -392,6 +520,9 @@ class AddressSynchronizer(Logger, EventListener):
             self._remove_tx_from_local_history(tx_hash)
             for addr in itertools.chain(self.db.get_txi_addresses(tx_hash), self.db.get_txo_addresses(tx_hash)):
                 self._get_balance_cache.clear()  # invalidate cache
+            self._remove_txi_txo_from_coins_index(tx_hash)
+            self._tx_parents.pop(tx_hash, None)
+            self._tx_uncles.pop(tx_hash, None)
             self.db.remove_txi(tx_hash)
             self.db.remove_txo(tx_hash)
             self.db.remove_tx_fee(tx_hash)
@@ -405,6 +536,110 @@ class AddressSynchronizer(Logger, EventListener):
                     self.db.remove_prevout_by_scripthash(scripthash, prevout=prevout, value=txo.value)
         util.trigger_callback('adb_removed_tx', self, tx_hash, tx)
 
+    def _add_txi_addr(self, tx_hash: str, addr: str, ser: str, v: int) -> None:
+        self.db.add_txi_addr(tx_hash, addr, ser, v)
+        if coins := self._addr_coins.get(addr):
+            coins.add_spent(ser, tx_hash)
+        self._tx_uncles_dirty_addrs.add(addr)
+
+    def _add_txo_addr(self, tx_hash: str, addr: str, n: int, v: int, is_coinbase: bool) -> None:
+        self.db.add_txo_addr(tx_hash, addr, n, v, is_coinbase)
+        if coins := self._addr_coins.get(addr):
+            coins.add_received(f"{tx_hash}:{n}", v, is_coinbase)
+
+    def _remove_txi_txo_from_coins_index(self, tx_hash: str) -> None:
+        for addr in self.db.get_txi_addresses(tx_hash):
+            if coins := self._addr_coins.get(addr):
+                for ser, v in self.db.get_txi_addr(tx_hash, addr):
+                    coins.remove_spent(ser, tx_hash)
+            self._tx_uncles_dirty_addrs.add(addr)
+        for addr in self.db.get_txo_addresses(tx_hash):
+            if coins := self._addr_coins.get(addr):
+                for n in self.db.get_txo_addr(tx_hash, addr):
+                    coins.remove_received(f"{tx_hash}:{n}")
+
+    def _get_addr_coins(self, address: str) -> _AddressCoins:
+        """Returns the coins index of address, built from the db on first use,
+        and then kept up to date when txs are added or removed."""
+        with self.transaction_lock:
+            coins = self._addr_coins.get(address)
+            if coins is None:
+                coins = _AddressCoins()
+                for tx_hash in self._history_local.get(address, ()):
+                    for n, (v, is_cb) in self.db.get_txo_addr(tx_hash, address).items():
+                        coins.add_received(f"{tx_hash}:{n}", v, is_cb)
+                    for ser, v in self.db.get_txi_addr(tx_hash, address):
+                        coins.add_spent(ser, tx_hash)
+                self._addr_coins[address] = coins
+            return coins
+
+    def _mark_tx_height_changed(self, tx_hash: str) -> None:
+        self._history_index.dirty.add(tx_hash)
+        # the order of the txs spending from the same addresses changed
+        self._tx_uncles_dirty_addrs.update(self.db.get_txi_addresses(tx_hash))
+
+    def _get_addr_spending_order(self, address: str) -> Tuple[List[Tuple[int, int]], List[str]]:
+        """Returns the spent coins of address, sorted by the position of their spending tx in the history."""
+        order = self._addr_spending_order.get(address)
+        if order is None:
+            spent = sorted((self._get_tx_sort_key(spending_txid), ser)
+                           for ser, spending_txid in self._get_addr_coins(address).spent.items())
+            order = [key for key, ser in spent], [ser for key, ser in spent]
+            self._addr_spending_order[address] = order
+        return order
+
+    def _get_tx_uncles(self, tx_hash: str) -> List[str]:
+        uncles = self._tx_uncles.get(tx_hash)
+        if uncles is None:
+            uncles = []
+            my_key = self._get_tx_sort_key(tx_hash)
+            for addr in self.db.get_txi_addresses(tx_hash):
+                keys, sers = self._get_addr_spending_order(addr)
+                # coins spent by tx_hash itself have the same key, and are excluded
+                uncles.extend(ser[:64] for ser in sers[:bisect_left(keys, my_key)])
+            self._tx_uncles[tx_hash] = uncles
+        return uncles
+
+    def get_tx_parents(self, txid: str) -> Dict[str, Tuple[List[str], List[str]]]:
+        """Returns txid and its ancestors in the wallet history, as a flat dict:
+        txid -> (txids of inputs, uncle txids).
+
+        Uncles come from address reuse: they are the txs that funded coins of the same
+        address, if those coins were spent by txs that come before, in the order of the
+        history. Unconfirmed txs are ordered by height (unconfirmed, unconfirmed parent,
+        local), which is topological.
+        """
+        with self.lock, self.transaction_lock:
+            for addr in self._tx_uncles_dirty_addrs:
+                self._addr_spending_order.pop(addr, None)
+                if coins := self._addr_coins.get(addr):
+                    for spending_txid in coins.spent.values():
+                        self._tx_uncles.pop(spending_txid, None)
+            self._tx_uncles_dirty_addrs.clear()
+            result = {}  # type: Dict[str, Tuple[List[str], List[str]]]
+            in_history = {}  # type: Dict[str, bool]
+            todo = [txid]
+            while todo:
+                tx_hash = todo.pop()
+                if tx_hash in result:
+                    continue
+                parents = self._tx_parents.get(tx_hash)
+                if parents is None:
+                    tx = self.get_transaction(tx_hash)
+                    assert tx, f"cannot find {tx_hash} in db"
+                    parents = [txin.prevout.txid.hex() for txin in tx.inputs()]
+                    self._tx_parents[tx_hash] = parents
+                uncles = self._get_tx_uncles(tx_hash)
+                result[tx_hash] = parents, uncles
+                for _txid in itertools.chain(parents, uncles):
+                    if _txid in result:
+                        continue
+                    if _txid not in in_history:
+                        in_history[_txid] = bool(self.db.get_txi_addresses(_txid) or self.db.get_txo_addresses(_txid))
+                    if in_history[_txid]:
+                        todo.append(_txid)
+            return result
+
     def get_depending_transactions(self, tx_hash: str) -> Set[str]:
         """Returns all (grand-)children of tx_hash in this wallet."""
         with self.transaction_lock:
@@ -428,6 +663,7 @@ class AddressSynchronizer(Logger, EventListener):
                     self.unverified_tx.pop(tx_hash, None)
                     self.unconfirmed_tx.pop(tx_hash, None)
                     self.db.remove_verified_tx(tx_hash)
+                    self._mark_tx_height_changed(tx_hash)
                     if self.verifier:
                         self.verifier.remove_spv_proof_for_tx(tx_hash)
             self.db.set_addr_history(addr, hist)
@@ -446,12 +682,20 @@ class AddressSynchronizer(Logger, EventListener):
                 util.trigger_callback('adb_tx_height_changed', self, tx_hash, old_height, tx_height)
 
         # Store fees
-        for tx_hash, fee_sat in tx_fees.items():
-            self.db.add_tx_fee_from_server(tx_hash, fee_sat)
+        with self.lock:
+            for tx_hash, fee_sat in tx_fees.items():
+                self.db.add_tx_fee_from_server(tx_hash, fee_sat)
+                self._history_index.dirty.add(tx_hash)
 
     @profiler
     def load_local_history(self):
         self._history_local = {}  # type: Dict[str, Set[str]]  # address -> set(txid)
+        self._addr_coins = {}  # type: Dict[str, _AddressCoins]  # address -> coins, filled lazily
+        self._history_index = _HistoryIndex()
+        self._tx_parents = {}  # type: Dict[str, List[str]]  # txid -> txids of inputs
+        self._tx_uncles = {}  # type: Dict[str, List[str]]  # txid -> uncle txids, see get_tx_parents
+        self._addr_spending_order = {}  # type: Dict[str, Tuple[List[Tuple[int, int]], List[str]]]  # address -> (sort keys, prevout_strs)
+        self._tx_uncles_dirty_addrs = set()  # type: Set[str]  # addresses whose spending txs have new uncles
         self._address_history_changed_events = defaultdict(asyncio.Event)  # address -> Event
         for txid in itertools.chain(self.db.list_txi(), self.db.list_txo()):
             self._add_tx_to_local_history(txid)
@@ -482,6 +726,12 @@ class AddressSynchronizer(Logger, EventListener):
             with self.transaction_lock:
                 self.db.clear_history()
                 self._history_local.clear()
+                self._addr_coins.clear()
+                self._history_index = _HistoryIndex()
+                self._tx_parents.clear()
+                self._tx_uncles.clear()
+                self._addr_spending_order.clear()
+                self._tx_uncles_dirty_addrs.clear()
                 self._get_balance_cache.clear()  # invalidate cache
 
     def _get_tx_sort_key(self, tx_hash: str) -> Tuple[int, int]:
@@ -520,43 +770,97 @@ class AddressSynchronizer(Logger, EventListener):
                 self.threadlocal_cache.local_height = orig_val
         return f
 
+    def _get_history_entry(self, txid: str, delta: int) -> _HistoryEntry:
+        tx_mined_info = self.get_tx_height(txid)
+        height = self.tx_height_to_sort_height(tx_mined_info.height)
+        txpos = tx_mined_info.txpos or -1
+        return (height, txpos, txid), delta, tx_mined_info, self.get_tx_fee(txid)
+
+    def _update_history_index(self) -> bool:
+        """Moves the dirty txs of the history index to their new position.
+        Returns whether the index was rebuilt from scratch.
+        """
+        index = self._history_index
+        # the height of future txs depends on the local height
+        dirty = index.dirty | self.future_tx.keys()
+        index.dirty = set()
+        if not dirty:
+            return False
+        entries = {}
+        for txid in dirty:
+            addrs = set(self.db.get_txi_addresses(txid)) | set(self.db.get_txo_addresses(txid))
+            if addrs:
+                delta = sum(self.get_tx_delta(txid, addr) for addr in addrs)
+                entries[txid] = self._get_history_entry(txid, delta)
+            else:
+                entries[txid] = None
+        return index.update(entries)
+
     @with_lock
     @with_transaction_lock
     @with_local_height_cached
-    def get_history(self, domain) -> Sequence[HistoryItem]:
+    def get_history(
+            self,
+            domain,
+            *,
+            from_height: int = None,
+            to_height: int = None,
+            from_timestamp: int = None,
+            to_timestamp: int = None,
+            offset: int = 0,
+            limit: int = None,
+    ) -> Sequence[HistoryItem]:
+        """Returns the history of the addresses in domain, sorted by height.
+
+        The history can be restricted to txs mined in [from_height, to_height) (txs that
+        are not mined are after any height), and with a monotonic timestamp in
+        [from_timestamp, to_timestamp). The result can then be paged with offset and limit.
+        If domain contains all addresses that have a history, the history index is used,
+        and only the returned items are created.
+        """
         domain = set(domain)
-        # 1. Get the history of each address in the domain, maintain the
-        #    delta of a tx as the sum of its deltas on domain addresses
-        tx_deltas = defaultdict(int)  # type: Dict[str, int]
-        for addr in domain:
-            h = self.get_address_history(addr).items()
-            for tx_hash, height in h:
-                tx_deltas[tx_hash] += self.get_tx_delta(tx_hash, addr)
-        # 2. create sorted history
+        if all(addr in domain for addr, txids in self._history_local.items() if txids):
+            index = self._history_index
+            # incremental updates are not checked, that would cost more than the update itself
+            check_balance = self._update_history_index()
+        else:
+            # maintain the delta of a tx as the sum of its deltas on domain addresses
+            tx_deltas = defaultdict(int)  # type: Dict[str, int]
+            for addr in domain:
+                for tx_hash in self._history_local.get(addr, ()):
+                    tx_deltas[tx_hash] += self.get_tx_delta(tx_hash, addr)
+            index = _HistoryIndex()
+            index.update({tx_hash: self._get_history_entry(tx_hash, delta) for tx_hash, delta in tx_deltas.items()})
+            check_balance = True
+        # sanity check
+        if check_balance:
+            balance = index.balances[-1] if len(index) else 0
+            c, u, x = self.get_balance(domain)
+            if balance != c + u + x:
+                self.logger.error(f'sanity check failed! c={c},u={u},x={x} while history balance={balance}')
+                raise Exception("wallet.get_history() failed balance sanity-check")
+        start, stop = index.get_range(
+            from_height=from_height, to_height=to_height,
+            from_timestamp=from_timestamp, to_timestamp=to_timestamp)
+        start += offset
+        if limit is not None:
+            stop = min(stop, start + limit)
         history = []
-        for tx_hash in tx_deltas:
-            delta = tx_deltas[tx_hash]
-            tx_mined_status = self.get_tx_height(tx_hash)
-            fee = self.get_tx_fee(tx_hash)
-            history.append((tx_hash, tx_mined_status, delta, fee))
-        history.sort(key = lambda x: self._get_tx_sort_key(x[0]))
-        # 3. add balance
-        h2 = []
-        balance = 0
-        for tx_hash, tx_mined_status, delta, fee in history:
-            balance += delta
-            h2.append(HistoryItem(
+        local_height = self.get_local_height()
+        for i in range(start, stop):
+            tx_hash = index.keys[i][2]
+            key, delta, tx_mined_info, fee = index.entries[tx_hash]
+            if tx_mined_info.header_hash is not None:
+                # SPV-verified: only the number of confirmations changed
+                tx_mined_info = tx_mined_info._replace(conf=max(local_height - tx_mined_info.height + 1, 0))
+            history.append(HistoryItem(
                 txid=tx_hash,
-                tx_mined_status=tx_mined_status,
+                tx_mined_status=tx_mined_info,
                 delta=delta,
                 fee=fee,
-                balance=balance))
-        # sanity check
-        c, u, x = self.get_balance(domain)
-        if balance != c + u + x:
-            self.logger.error(f'sanity check failed! c={c},u={u},x={x} while history balance={balance}')
-            raise Exception("wallet.get_history() failed balance sanity-check")
-        return h2
+                balance=index.balances[i],
+                monotonic_timestamp=index.monotonic_timestamps[i]))
+        return history
 
     def _add_tx_to_local_history(self, txid):
         with self.transaction_lock:
@@ -565,6 +869,7 @@ class AddressSynchronizer(Logger, EventListener):
                 cur_hist.add(txid)
                 self._history_local[addr] = cur_hist
                 self._mark_address_history_changed(addr)
+            self._history_index.dirty.add(txid)
 
     def _remove_tx_from_local_history(self, txid):
         with self.transaction_lock:
@@ -577,6 +882,7 @@ class AddressSynchronizer(Logger, EventListener):
                 else:
                     self._history_local[addr] = cur_hist
                     self._mark_address_history_changed(addr)
+            self._history_index.dirty.add(txid)
 
     def _mark_address_history_changed(self, addr: str) -> None:
         def set_and_clear():
@@ -604,6 +910,7 @@ class AddressSynchronizer(Logger, EventListener):
                 with self.lock:
                     self.db.remove_verified_tx(tx_hash)
                     self.unconfirmed_tx[tx_hash] = tx_height
+                    self._mark_tx_height_changed(tx_hash)
                 if self.verifier:
                     self.verifier.remove_spv_proof_for_tx(tx_hash)
         else:
@@ -612,19 +919,28 @@ class AddressSynchronizer(Logger, EventListener):
                     self.unverified_tx[tx_hash] = tx_height
                 else:
                     self.unconfirmed_tx[tx_hash] = tx_height
+                self._mark_tx_height_changed(tx_hash)
 
     def remove_unverified_tx(self, tx_hash, tx_height):
         with self.lock:
             new_height = self.unverified_tx.get(tx_hash)
             if new_height == tx_height:
                 self.unverified_tx.pop(tx_hash, None)
+                self._mark_tx_height_changed(tx_hash)
 
     def add_verified_tx(self, tx_hash: str, info: TxMinedInfo):
+        self.add_verified_txs({tx_hash: info})
+
+    def add_verified_txs(self, infos: Dict[str, TxMinedInfo]):
         # Remove from the unverified map and add to the verified map
         with self.lock:
-            self.unverified_tx.pop(tx_hash, None)
-            self.db.add_verified_tx(tx_hash, info)
-        util.trigger_callback('adb_added_verified_tx', self, tx_hash)
+            for tx_hash in infos:
+                self.unverified_tx.pop(tx_hash, None)
+            self.db.add_verified_txs(infos)
+            for tx_hash in infos:
+                self._mark_tx_height_changed(tx_hash)
+        for tx_hash in infos:
+            util.trigger_callback('adb_added_verified_tx', self, tx_hash)
 
     def get_unverified_txs(self) -> Dict[str, int]:
         '''Returns a map from tx hash to transaction height'''
@@ -634,25 +950,27 @@ class AddressSynchronizer(Logger, EventListener):
     def undo_verifications(self, blockchain: Blockchain, above_height: int) -> Set[str]:
         '''Used by the verifier when a reorg has happened'''
         txs = set()
+        header_hashes = {}  # type: Dict[int, Optional[str]]  # height -> header hash in blockchain
         with self.lock:
-            for tx_hash in self.db.list_verified_tx():
-                info = self.db.get_verified_tx(tx_hash)
+            for tx_hash, info in self.db.get_verified_txs_above_height(above_height).items():
                 tx_height = info.height
-                if tx_height > above_height:
+                if tx_height not in header_hashes:
                     header = blockchain.read_header(tx_height)
-                    if not header or hash_header(header) != info.header_hash:
-                        self.db.remove_verified_tx(tx_hash)
-                        # NOTE: we should add these txns to self.unverified_tx,
-                        # but with what height?
-                        # If on the new fork after the reorg, the txn is at the
-                        # same height, we will not get a status update for the
-                        # address. If the txn is not mined or at a diff height,
-                        # we should get a status update. Unless we put tx into
-                        # unverified_tx, it will turn into local. So we put it
-                        # into unverified_tx with the old height, and if we get
-                        # a status update, that will overwrite it.
-                        self.unverified_tx[tx_hash] = tx_height
-                        txs.add(tx_hash)
+                    header_hashes[tx_height] = hash_header(header) if header else None
+                if header_hashes[tx_height] != info.header_hash:
+                    self.db.remove_verified_tx(tx_hash)
+                    # NOTE: we should add these txns to self.unverified_tx,
+                    # but with what height?
+                    # If on the new fork after the reorg, the txn is at the
+                    # same height, we will not get a status update for the
+                    # address. If the txn is not mined or at a diff height,
+                    # we should get a status update. Unless we put tx into
+                    # unverified_tx, it will turn into local. So we put it
+                    # into unverified_tx with the old height, and if we get
+                    # a status update, that will overwrite it.
+                    self.unverified_tx[tx_hash] = tx_height
+                    txs.add(tx_hash)
+                    self._mark_tx_height_changed(tx_hash)
 
         for tx_hash in txs:
             util.trigger_callback('adb_removed_verified_tx', self, tx_hash)
@@ -674,6 +992,7 @@ class AddressSynchronizer(Logger, EventListener):
         with self.lock:
             old_height = self.future_tx.get(txid) or None
             self.future_tx[txid] = wanted_height
+            self._mark_tx_height_changed(txid)
         if old_height != wanted_height:
             util.trigger_callback('adb_set_future_tx', self, txid)
 
@@ -796,52 +1115,54 @@ class AddressSynchronizer(Logger, EventListener):
 
     def get_addr_io(self, address: str):
         with self.lock, self.transaction_lock:
-            h = self.get_address_history(address).items()
+            coins = self._get_addr_coins(address)
             received = {}
             sent = {}
-            for tx_hash, height in h:
+            for prevout_str, (v, is_cb) in coins.received.items():
+                tx_mined_info = self.get_tx_height(prevout_str[:64])
+                txpos = tx_mined_info.txpos if tx_mined_info.txpos is not None else -1
+                received[prevout_str] = (tx_mined_info.height, txpos, v, is_cb)
+            for prevout_str, tx_hash in coins.spent.items():
                 tx_mined_info = self.get_tx_height(tx_hash)
                 txpos = tx_mined_info.txpos if tx_mined_info.txpos is not None else -1
-                d = self.db.get_txo_addr(tx_hash, address)
-                for n, (v, is_cb) in d.items():
-                    received[tx_hash + ':%d'%n] = (height, txpos, v, is_cb)
-                l = self.db.get_txi_addr(tx_hash, address)
-                for txi, v in l:
-                    sent[txi] = tx_hash, height, txpos
+                sent[prevout_str] = tx_hash, tx_mined_info.height, txpos
         return received, sent
 
+    def _make_utxo(self, address: str, prevout_str: str, value: int, is_cb: bool,
+                   spending_txid: Optional[str]) -> PartialTxInput:
+        tx_mined_info = self.get_tx_height(prevout_str[:64])
+        utxo = PartialTxInput(prevout=TxOutpoint.from_str(prevout_str), is_coinbase_output=is_cb)
+        utxo._trusted_address = address
+        utxo._trusted_value_sats = value
+        utxo.block_height = tx_mined_info.height
+        utxo.block_txpos = tx_mined_info.txpos if tx_mined_info.txpos is not None else -1
+        utxo.spent_txid = spending_txid
+        utxo.spent_height = self.get_tx_height(spending_txid).height if spending_txid is not None else None
+        return utxo
+
     def get_addr_outputs(self, address: str) -> Dict[TxOutpoint, PartialTxInput]:
-        received, sent = self.get_addr_io(address)
-        out = {}
-        for prevout_str, v in received.items():
-            tx_height, tx_pos, value, is_cb = v
-            prevout = TxOutpoint.from_str(prevout_str)
-            utxo = PartialTxInput(prevout=prevout, is_coinbase_output=is_cb)
-            utxo._trusted_address = address
-            utxo._trusted_value_sats = value
-            utxo.block_height = tx_height
-            utxo.block_txpos = tx_pos
-            if prevout_str in sent:
-                txid, height, pos = sent[prevout_str]
-                utxo.spent_txid = txid
-                utxo.spent_height = height
-            else:
-                utxo.spent_txid = None
-                utxo.spent_height = None
-            out[prevout] = utxo
+        with self.lock, self.transaction_lock:
+            coins = self._get_addr_coins(address)
+            out = {}
+            for prevout_str, (value, is_cb) in coins.received.items():
+                utxo = self._make_utxo(address, prevout_str, value, is_cb, coins.spent.get(prevout_str))
+                out[utxo.prevout] = utxo
         return out
 
     def get_addr_utxo(self, address: str) -> Dict[TxOutpoint, PartialTxInput]:
-        out = self.get_addr_outputs(address)
-        for k, v in list(out.items()):
-            if v.spent_height is not None:
-                out.pop(k)
+        with self.lock, self.transaction_lock:
+            coins = self._get_addr_coins(address)
+            out = {}
+            for prevout_str in coins.unspent:
+                value, is_cb = coins.received[prevout_str]
+                utxo = self._make_utxo(address, prevout_str, value, is_cb, None)
+                out[utxo.prevout] = utxo
         return out
 
     # return the total amount ever received by an address
     def get_addr_received(self, address):
-        received, sent = self.get_addr_io(address)
-        return sum([value for height, pos, value, is_cb in received.values()])
+        with self.transaction_lock:
+            return sum([value for value, is_cb in self._get_addr_coins(address).received.values()])
 
     @with_lock
     @with_transaction_lock
@@ -867,13 +1188,11 @@ class AddressSynchronizer(Logger, EventListener):
 
         coins = {}
         for address in domain:
-            coins.update(self.get_addr_outputs(address))
+            coins.update(self.get_addr_utxo(address))
 
         c = u = x = 0
         mempool_height = self.get_local_height() + 1  # height of next block
         for utxo in coins.values():  # type: PartialTxInput
-            if utxo.spent_height is not None:
-                continue
             if utxo.prevout.to_str() in excluded_coins:
                 continue
             v = utxo.value_sats()
@@ -885,16 +1204,15 @@ class AddressSynchronizer(Logger, EventListener):
                 c += v
             else:
                 txid = utxo.prevout.txid.hex()
-                tx = self.db.get_transaction(txid)
-                assert tx is not None # txid comes from get_addr_io
                 # we look at the outputs that are spent by this transaction
                 # if those outputs are ours and confirmed, we count this coin as confirmed
                 confirmed_spent_amount = 0
-                for txin in tx.inputs():
-                    if txin.prevout in coins:
-                        coin = coins[txin.prevout]
-                        if coin.block_height > 0:
-                            confirmed_spent_amount += coin.value_sats()
+                for address in self.db.get_txi_addresses(txid):
+                    if address not in domain:
+                        continue
+                    for prevout_str, value in self.db.get_txi_addr(txid, address):
+                        if self.get_tx_height(prevout_str[:64]).height > 0:
+                            confirmed_spent_amount += value
                 # Compare amount, in case tx has confirmed and unconfirmed inputs, or is a coinjoin.
                 # (fixme: tx may have multiple change outputs)
                 if confirmed_spent_amount >= v:
@@ -934,7 +1252,8 @@ class AddressSynchronizer(Logger, EventListener):
             domain = set(domain) - set(excluded_addresses)
         mempool_height = block_height + 1  # height of next block
         for addr in domain:
-            txos = self.get_addr_outputs(addr)
+            # spent coins are only needed if we look at the spending height
+            txos = self.get_addr_outputs(addr) if confirmed_spending_only else self.get_addr_utxo(addr)
             for txo in txos.values():
                 if txo.spent_height is not None:
                     if not confirmed_spending_only:
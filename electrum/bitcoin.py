@@ -256,6 +256,19 @@ def var_int(i: int) -> str:
         return "ff"+int_to_hex(i,8)
 
 
+def var_int_bytes(i: int) -> bytes:
+    """Same as var_int, but returns bytes."""
+    assert i >= 0, i
+    if i < 0xfd:
+        return i.to_bytes(1, byteorder="little")
+    elif i <= 0xffff:
+        return b"\xfd" + i.to_bytes(2, byteorder="little")
+    elif i <= 0xffffffff:
+        return b"\xfe" + i.to_bytes(4, byteorder="little")
+    else:
+        return b"\xff" + i.to_bytes(8, byteorder="little")
+
+
 def witness_push(item: str) -> str:
     """Returns data in the form it should be present in the witness.
     hex -> hex
@@ -20,10 +20,12 @@
 # ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import hashlib
+import mmap
 import os
 import threading
 import time
-from typing import Optional, Dict, Mapping, Sequence, TYPE_CHECKING
+from typing import Optional, Dict, List, Mapping, NamedTuple, Sequence, Tuple, Union, BinaryIO, TYPE_CHECKING
 
 from . import util
 from .bitcoin import hash_encode, int_to_hex, rev_hex
@@ -38,6 +40,7 @@ if TYPE_CHECKING:
 _logger = get_logger(__name__)
 
 HEADER_SIZE = 80  # bytes
+_HASH_BUCKET_SIZE = 64  # headers
 
 # see https://github.com/bitcoin/bitcoin/blob/feedb9c84e72e4fff489810a2bbeec09bcda5763/src/chainparams.cpp#L76
 MAX_TARGET = 0x00000000ffffffffffffffffffffffffffffffffffffffffffffffffffffffff  # compact: 0x1d00ffff
@@ -86,6 +89,46 @@ def hash_raw_header(header: str) -> str:
     return hash_encode(sha256d(bfh(header)))
 
 
+def verify_raw_headers(data: bytes, *, prev_hash: bytes, target: int, check_pow: bool = True) -> bytes:
+    """Verifies consecutive raw headers, without deserializing them.
+
+    prev_hash is the hash of the header before data[:HEADER_SIZE], in internal byte order.
+    All headers must have the given target; if check_pow is False, bits and proof of work
+    are not checked (as on testnet).
+    Returns the hashes of the headers, concatenated, in internal byte order.
+    Note: this is a module-level function so that it can be run in worker processes.
+    """
+    num = len(data) // HEADER_SIZE
+    bits = Blockchain.target_to_bits(target).to_bytes(4, byteorder='little')
+    sha256 = hashlib.sha256
+    hashes = bytearray()
+    for offset in range(0, num * HEADER_SIZE, HEADER_SIZE):
+        raw_header = data[offset:offset + HEADER_SIZE]
+        if raw_header[4:36] != prev_hash:
+            raise InvalidHeader("prev hash mismatch: %s vs %s" % (hash_encode(prev_hash), hash_encode(raw_header[4:36])))
+        prev_hash = sha256(sha256(raw_header).digest()).digest()
+        if check_pow:
+            if raw_header[72:76] != bits:
+                raise InvalidHeader("bits mismatch: %s vs %s" % (
+                    int.from_bytes(bits, byteorder='little'), int.from_bytes(raw_header[72:76], byteorder='little')))
+            block_hash_as_num = int.from_bytes(prev_hash, byteorder='little')
+            if block_hash_as_num > target:
+                raise InvalidHeader(f"insufficient proof of work: {block_hash_as_num} vs target {target}")
+        hashes += prev_hash
+    return bytes(hashes)
+
+
+class ChunkToVerify(NamedTuple):
+    idx: int
+    data: bytes
+    prev_hash: bytes  # of the header before the chunk, in internal byte order
+    target: int
+    check_pow: bool
+
+    def verify(self) -> bytes:
+        return verify_raw_headers(self.data, prev_hash=self.prev_hash, target=self.target, check_pow=self.check_pow)
+
+
 # key: blockhash hex at forkpoint
 # the chain at some key is the best chain that includes the given hash
 blockchains = {}  # type: Dict[str, Blockchain]
@@ -104,6 +147,7 @@ def read_blockchains(config: 'SimpleConfig'):
         header_after_cp = best_chain.read_header(constants.net.max_checkpoint()+1)
         if not header_after_cp or not best_chain.can_connect(header_after_cp, check_height=False):
             _logger.info("[blockchain] deleting best chain. cannot connect header after last cp to last cp.")
+            best_chain.close_headers_file()
             os.unlink(best_chain.path())
             best_chain.update_size()
     # forks
@@ -168,6 +212,7 @@ def init_headers_file_for_best_chain():
     filename = b.path()
     length = HEADER_SIZE * len(constants.net.CHECKPOINTS) * 2016
     if not os.path.exists(filename) or os.path.getsize(filename) < length:
+        b.close_headers_file()
         with open(filename, 'wb') as f:
             if length > 0:
                 f.seek(length - 1)
@@ -196,6 +241,15 @@ class Blockchain(Logger):
         self._forkpoint_hash = forkpoint_hash  # blockhash at forkpoint. "first hash"
         self._prev_hash = prev_hash  # blockhash immediately before forkpoint
         self.lock = threading.RLock()
+        # The headers file is kept open: self._file for writing, and a read-only mmap
+        # covering self._size headers for reading. Both are (re)opened lazily.
+        # Note: they must be closed before the file is modified by other means than self.write.
+        self._file = None  # type: Optional[BinaryIO]
+        self._mmap = None  # type: Optional[mmap.mmap]
+        # hashes of the headers stored in our file, in buckets of _HASH_BUCKET_SIZE heights:
+        # (height // _HASH_BUCKET_SIZE) -> _HASH_BUCKET_SIZE * 32 bytes.
+        # Filled lazily; all-zero entries are not computed yet.
+        self._hash_buckets = {}  # type: Dict[int, bytearray]
         self.update_size()
 
     @property
@@ -292,6 +346,64 @@ class Blockchain(Logger):
     def update_size(self) -> None:
         p = self.path()
         self._size = os.path.getsize(p)//HEADER_SIZE if os.path.exists(p) else 0
+        self._close_mmap()
+
+    def _close_mmap(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    @with_lock
+    def close_headers_file(self) -> None:
+        """Closes the headers file. It is opened again on next access."""
+        self._close_mmap()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _invalidate_hashes(self, *, from_height: int = None) -> None:
+        if from_height is None:
+            self._hash_buckets.clear()
+            return
+        for index in [index for index in self._hash_buckets if index >= from_height // _HASH_BUCKET_SIZE]:
+            del self._hash_buckets[index]
+
+    def _get_hash_slot(self, height: int) -> Tuple[bytearray, int]:
+        index, i = divmod(height, _HASH_BUCKET_SIZE)
+        hashes = self._hash_buckets.get(index)
+        if hashes is None:
+            hashes = self._hash_buckets[index] = bytearray(_HASH_BUCKET_SIZE * 32)
+        return hashes, i * 32
+
+    @with_lock
+    def _read_raw_header(self, height: int) -> bytes:
+        """Returns the header at height from our file. Caller must check the height is in range."""
+        if self._mmap is None:
+            name = self.path()
+            self.assert_headers_file_available(name)
+            with open(name, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), self._size * HEADER_SIZE, access=mmap.ACCESS_READ)
+        delta = height - self.forkpoint
+        return self._mmap[delta * HEADER_SIZE:(delta + 1) * HEADER_SIZE]
+
+    @with_lock
+    def _get_stored_hash(self, height: int) -> str:
+        """Returns the hash of the header at height from our file,
+        raises MissingHeader if we don't have it.
+        """
+        if height < self.forkpoint:
+            return self.parent.get_hash(height)
+        if height > self.height():
+            raise MissingHeader(height)
+        hashes, pos = self._get_hash_slot(height)
+        h = hashes[pos:pos + 32]
+        if h == bytes(32):
+            raw_header = self._read_raw_header(height)
+            if raw_header == bytes(HEADER_SIZE):
+                raise MissingHeader(height)
+            h = sha256d(raw_header)
+            hashes[pos:pos + 32] = h
+        return hash_encode(h)
 
     @classmethod
     def verify_header(cls, header: dict, prev_hash: str, target: int, expected_header_hash: str=None) -> None:
@@ -310,20 +422,30 @@ class Blockchain(Logger):
             raise InvalidHeader(f"insufficient proof of work: {block_hash_as_num} vs target {target}")
 
     def verify_chunk(self, index: int, data: bytes) -> None:
-        num = len(data) // HEADER_SIZE
         start_height = index * 2016
-        prev_hash = self.get_hash(start_height - 1)
+        prev_hash = bfh(self.get_hash(start_height - 1))[::-1]
         target = self.get_target(index-1)
-        for i in range(num):
-            height = start_height + i
+        hashes = verify_raw_headers(data, prev_hash=prev_hash, target=target, check_pow=not constants.net.TESTNET)
+        self._check_chunk_hashes(index, hashes)
+
+    def _check_chunk_hashes(self, index: int, hashes: bytes) -> None:
+        """Compares the hashes of a verified chunk with the ones we already know
+        (stored headers, genesis, checkpoints)."""
+        start_height = index * 2016
+        num = len(hashes) // 32
+        end_height = start_height + num - 1
+        heights = range(start_height, min(end_height, max(self.height(), 0)) + 1)
+        if end_height > self.height() and end_height <= constants.net.max_checkpoint():
+            heights = list(heights) + [end_height]
+        for height in heights:
             try:
                 expected_header_hash = self.get_hash(height)
             except MissingHeader:
-                expected_header_hash = None
-            raw_header = data[i*HEADER_SIZE : (i+1)*HEADER_SIZE]
-            header = deserialize_header(raw_header, index*2016 + i)
-            self.verify_header(header, prev_hash, target, expected_header_hash)
-            prev_hash = hash_header(header)
+                continue
+            i = height - start_height
+            _hash = hash_encode(hashes[i*32:(i+1)*32])
+            if expected_header_hash != _hash:
+                raise InvalidHeader("hash mismatches with expected: {} vs {}".format(expected_header_hash, _hash))
 
     @with_lock
     def path(self):
@@ -407,11 +529,15 @@ class Blockchain(Logger):
         self.write(parent_data, 0)
         parent.write(my_data, (forkpoint - parent.forkpoint)*HEADER_SIZE)
         # swap parameters
+        self._invalidate_hashes()
+        parent._invalidate_hashes()
         self.parent, parent.parent = parent.parent, self  # type: Optional[Blockchain], Optional[Blockchain]
         self.forkpoint, parent.forkpoint = parent.forkpoint, self.forkpoint
         self._forkpoint_hash, parent._forkpoint_hash = parent._forkpoint_hash, hash_raw_header(parent_data[:HEADER_SIZE].hex())
         self._prev_hash, parent._prev_hash = parent._prev_hash, self._prev_hash
         # parent's new name
+        self.close_headers_file()
+        parent.close_headers_file()
         os.replace(child_old_name, parent.path())
         self.update_size()
         parent.update_size()
@@ -437,15 +563,24 @@ class Blockchain(Logger):
     def write(self, data: bytes, offset: int, truncate: bool=True) -> None:
         filename = self.path()
         self.assert_headers_file_available(filename)
-        with open(filename, 'rb+') as f:
-            if truncate and offset != self._size * HEADER_SIZE:
-                f.seek(offset)
-                f.truncate()
+        self._close_mmap()
+        start_height = self.forkpoint + offset // HEADER_SIZE
+        self._invalidate_hashes(from_height=start_height)
+        if self._file is None:
+            self._file = open(filename, 'rb+')
+        f = self._file
+        if truncate and offset != self._size * HEADER_SIZE:
             f.seek(offset)
-            f.write(data)
-            f.flush()
-            os.fsync(f.fileno())
+            f.truncate()
+        f.seek(offset)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
         self.update_size()
+        if len(data) == HEADER_SIZE and data != bytes(HEADER_SIZE):
+            # single header appended during sync. its hash is needed to connect the next one
+            hashes, pos = self._get_hash_slot(start_height)
+            hashes[pos:pos + 32] = sha256d(data)
 
     @with_lock
     def save_header(self, header: dict) -> None:
@@ -465,14 +600,7 @@ class Blockchain(Logger):
             return self.parent.read_header(height)
         if height > self.height():
             return
-        delta = height - self.forkpoint
-        name = self.path()
-        self.assert_headers_file_available(name)
-        with open(name, 'rb') as f:
-            f.seek(delta * HEADER_SIZE)
-            h = f.read(HEADER_SIZE)
-            if len(h) < HEADER_SIZE:
-                raise Exception('Expected to read a full header. This was only {} bytes'.format(len(h)))
+        h = self._read_raw_header(height)
         if h == bytes([0])*HEADER_SIZE:
             return None
         return deserialize_header(h, height)
@@ -511,13 +639,11 @@ class Blockchain(Logger):
             h, t = self.checkpoints[index]
             return h
         else:
-            header = self.read_header(height)
-            if header is None:
-                raise MissingHeader(height)
-            return hash_header(header)
+            return self._get_stored_hash(height)
 
-    def get_target(self, index: int) -> int:
+    def get_target(self, index: int, *, chunk: bytes = None) -> int:
         # compute target from chunk x, used in chunk x+1
+        # if given, chunk is the raw data of chunk x, which does not need to be saved yet
         if constants.net.TESTNET:
             return 0
         if index == -1:
@@ -526,8 +652,12 @@ class Blockchain(Logger):
             h, t = self.checkpoints[index]
             return t
         # new target
-        first = self.read_header(index * 2016)
-        last = self.read_header(index * 2016 + 2015)
+        if chunk is not None:
+            first = deserialize_header(chunk[:HEADER_SIZE], index * 2016)
+            last = deserialize_header(chunk[2015 * HEADER_SIZE:2016 * HEADER_SIZE], index * 2016 + 2015)
+        else:
+            first = self.read_header(index * 2016)
+            last = self.read_header(index * 2016 + 2015)
         if not first or not last:
             raise MissingHeader()
         bits = last.get('bits')
@@ -648,6 +778,61 @@ class Blockchain(Logger):
             self.logger.info(f'verify_chunk idx {idx} failed: {repr(e)}')
             return False
 
+    def prepare_chunks(self, start_idx: int, hexchunks: Sequence[str]) -> List['ChunkToVerify']:
+        """Returns what is needed to verify consecutive chunks, starting with chunk start_idx.
+        Only the last chunk may be partial.
+
+        The expected prev hash and target of each chunk only depend on the previous one,
+        so all chunks can be verified independently, e.g. in an executor, using verify_raw_headers.
+        The chunks are then connected with connect_chunks.
+        """
+        assert start_idx >= 0, start_idx
+        check_pow = not constants.net.TESTNET
+        chunks = []  # type: List[ChunkToVerify]
+        try:
+            prev_hash = bfh(self.get_hash(start_idx * 2016 - 1))[::-1]
+            target = self.get_target(start_idx - 1)
+            for idx, hexdata in enumerate(hexchunks, start=start_idx):
+                data = bfh(hexdata)
+                chunks.append(ChunkToVerify(idx, data, prev_hash, target, check_pow))
+                if len(data) < 2016 * HEADER_SIZE:
+                    break
+                prev_hash = sha256d(data[-HEADER_SIZE:])
+                target = self.get_target(idx, chunk=data)
+        except BaseException as e:
+            self.logger.info(f'prepare_chunks from idx {start_idx} failed: {repr(e)}')
+        return chunks
+
+    def connect_chunks(self, chunks: Sequence['ChunkToVerify'],
+                       results: Sequence[Union[bytes, BaseException]] = None) -> int:
+        """Connects chunks returned by prepare_chunks.
+        results are the outcomes of verify_raw_headers for each chunk (the hashes, or the
+        exception raised); if None, the chunks are verified here.
+        Chunks are saved in order, until the first one that does not verify.
+        Returns the number of chunks that were connected.
+        """
+        num_connected = 0
+        for i, chunk in enumerate(chunks):
+            try:
+                if i == 0:
+                    # the chain might have changed while the chunks were being verified
+                    if (bfh(self.get_hash(chunk.idx * 2016 - 1))[::-1] != chunk.prev_hash
+                            or self.get_target(chunk.idx - 1) != chunk.target):
+                        raise InvalidHeader("chain changed since the chunks were prepared")
+                if results is None:
+                    hashes = chunk.verify()
+                elif isinstance(results[i], BaseException):
+                    raise results[i]
+                else:
+                    hashes = results[i]
+                self._check_chunk_hashes(chunk.idx, hashes)
+                self.save_chunk(chunk.idx, chunk.data)
+            except BaseException as e:
+                self.logger.info(f'verify_chunk idx {chunk.idx} failed: {repr(e)}')
+                break
+            num_connected += 1
+        return num_connected
+
     def get_checkpoints(self):
         # for each chunk, store the hash of the last block and the target after the chunk
         cp = []
@@ -26,6 +26,9 @@
 import time
 import random
 import os
+import gc
+import mmap
+import struct
 from collections import defaultdict
 from typing import Sequence, List, Tuple, Optional, Dict, NamedTuple, TYPE_CHECKING, Set
 import binascii
@@ -47,6 +50,7 @@ from .lnmsg import decode_msg
 from . import ecc
 from .crypto import sha256d
 from .lnmsg import FailedToParseMsg
+from .lngraph import CompactGraph
 
 if TYPE_CHECKING:
     from .network import Network
@@ -304,9 +308,43 @@ PRIMARY KEY(node_id)
 )"""
 
 
+# The graph snapshot is a binary dump of the parsed graph (channels, policies, nodes),
+# written on shutdown. Loading it is much faster than decoding the raw gossip messages
+# stored in the sql db. It is only used if the sql db has not changed since it was written.
+GRAPH_SNAPSHOT_MAGIC = b'ELGRAPH\x00'
+GRAPH_SNAPSHOT_VERSION = 1
+# magic, version, db file size, db file mtime_ns, num channels, num policies, num nodes
+_SNAPSHOT_HEADER = struct.Struct('<8sIQQIII')
+# short_channel_id, node1_id, node2_id, capacity_sat (-1 if None)
+_SNAPSHOT_CHANNEL = struct.Struct('<8s33s33sq')
+# key, cltv_expiry_delta, htlc_minimum_msat, htlc_maximum_msat (-1 if None), fee_base_msat,
+# fee_proportional_millionths, channel_flags, message_flags, timestamp
+_SNAPSHOT_POLICY = struct.Struct('<41sIQqIIBBQ')
+# node_id, timestamp, len(features), len(alias); followed by features and alias
+_SNAPSHOT_NODE = struct.Struct('<33sQHH')
+
+
+# (pubkey, signature, msg_hash) of a gossip message signature
+GossipSigCheck = Tuple[bytes, bytes, bytes]
+
+
+def verify_gossip_signatures(sig_checks: Sequence[GossipSigCheck]) -> Optional[int]:
+    """Returns the index of the first invalid signature in sig_checks, or None if all are valid.
+    note: this is a top-level function so that it can be run in a process pool.
+    """
+    for i, (pubkey, sig, h) in enumerate(sig_checks):
+        try:
+            if not ecc.verify_signature(pubkey, sig, h):
+                return i
+        except ecc.InvalidECPointException:
+            return i
+    return None
+
+
 class ChannelDB(SqlDB):
 
     NUM_MAX_RECENT_PEERS = 20
+    SQLITE_PRAGMAS = ('journal_mode=WAL', 'synchronous=NORMAL')
 
     def __init__(self, network: 'Network'):
         path = self.get_file_path(network.config)
@@ -320,11 +358,13 @@ class ChannelDB(SqlDB):
         # initialized in load_data
         # note: modify/iterate needs self.lock
         self._channels = {}  # type: Dict[ShortChannelID, ChannelInfo]
-        self._policies = {}  # type: Dict[Tuple[bytes, ShortChannelID], Policy]  # (node_id, scid) -> Policy
         self._nodes = {}  # type: Dict[bytes, NodeInfo]  # node_id -> NodeInfo
         # node_id -> NetAddress -> timestamp
         self._addresses = defaultdict(dict)  # type: Dict[bytes, Dict[NetAddress, int]]
-        self._channels_for_node = defaultdict(set)  # type: Dict[bytes, Set[ShortChannelID]]
+        # adjacency and policies of public channels
+        self.graph = CompactGraph()
+        # incremented whenever something changes that can affect path finding
+        self.graph_version = 0
         self._recent_peers = []  # type: List[bytes]  # list of node_ids
         self._chans_with_0_policies = set()  # type: Set[ShortChannelID]
         self._chans_with_1_policies = set()  # type: Set[ShortChannelID]
@@ -337,10 +377,13 @@ class ChannelDB(SqlDB):
     def get_file_path(cls, config: 'SimpleConfig') -> str:
         return os.path.join(get_headers_dir(config), 'gossip_db')
 
+    def get_snapshot_path(self) -> str:
+        return self.path + '_snapshot'
+
     def update_counts(self):
         self.num_nodes = len(self._nodes)
         self.num_channels = len(self._channels)
-        self.num_policies = len(self._policies)
+        self.num_policies = self.graph.num_policies
         util.trigger_callback('channel_db', self.num_nodes, self.num_channels, self.num_policies)
         util.trigger_callback('ln_gossip_sync_progress')
 
@@ -423,8 +466,8 @@ class ChannelDB(SqlDB):
         channel_info = channel_info._replace(capacity_sat=capacity_sat)
         with self.lock:
             self._channels[channel_info.short_channel_id] = channel_info
-            self._channels_for_node[channel_info.node1_id].add(channel_info.short_channel_id)
-            self._channels_for_node[channel_info.node2_id].add(channel_info.short_channel_id)
+            self.graph.add_channel(channel_info)
+            self.graph_version += 1
         self._update_num_policies_for_chan(channel_info.short_channel_id)
         if 'raw' in msg:
             self._db_save_channel(channel_info.short_channel_id, msg['raw'])
@@ -481,15 +524,17 @@ class ChannelDB(SqlDB):
         payload['start_node'] = start_node
         # compare updates to existing database entries
         short_channel_id = ShortChannelID(payload['short_channel_id'])
-        key = (start_node, short_channel_id)
-        old_policy = self._policies.get(key)
+        old_policy = self.graph.get_policy(short_channel_id, start_node)
         if old_policy and timestamp <= old_policy.timestamp + 60:
             return UpdateStatus.DEPRECATED
         if verify:
             self.verify_channel_update(payload)
         policy = Policy.from_msg(payload)
         with self.lock:
-            self._policies[key] = policy
+            self.graph.set_policy(policy)
+            # a refreshed timestamp does not change anything for path finding
+            if old_policy is None or old_policy[:-1] != policy[:-1]:
+                self.graph_version += 1
         self._update_num_policies_for_chan(short_channel_id)
         if 'raw' in payload:
             self._db_save_policy(policy.key, payload['raw'])
@@ -498,14 +543,15 @@ class ChannelDB(SqlDB):
         else:
             return UpdateStatus.GOOD
 
-    def add_channel_updates(self, payloads, max_age=None) -> CategorizedChannelUpdates:
+    def add_channel_updates(self, payloads, max_age=None, *, verified_ids: Set[int] = frozenset()) -> CategorizedChannelUpdates:
+        """verified_ids: ids of the payloads whose signature has already been verified."""
         orphaned = []
         expired = []
         deprecated = []
         unchanged = []
         good = []
         for payload in payloads:
-            r = self.add_channel_update(payload, max_age=max_age, verbose=False, verify=True)
+            r = self.add_channel_update(payload, max_age=max_age, verbose=False, verify=id(payload) not in verified_ids)
             if r == UpdateStatus.ORPHANED:
                 orphaned.append(payload)
             elif r == UpdateStatus.EXPIRED:
@@ -525,6 +571,116 @@ class ChannelDB(SqlDB):
             good=good)
 
 
+    def close_database(self):
+        super().close_database()
+        try:
+            self.write_snapshot()
+        except Exception as e:
+            self.logger.warning(f'failed to write graph snapshot: {e!r}')
+
+    def write_snapshot(self) -> None:
+        """Writes the in-memory graph to the snapshot file.
+        Must be called when there are no pending writes to the sql db.
+        """
+        if not self.data_loaded.is_set():
+            return
+        with self.lock:
+            channels = list(self._channels.values())
+            policies = list(self.graph.get_policies())
+            nodes = list(self._nodes.values())
+        st = os.stat(self.path)
+        parts = [_SNAPSHOT_HEADER.pack(
+            GRAPH_SNAPSHOT_MAGIC, GRAPH_SNAPSHOT_VERSION, st.st_size, st.st_mtime_ns,
+            len(channels), len(policies), len(nodes))]
+        for ci in channels:
+            parts.append(_SNAPSHOT_CHANNEL.pack(
+                ci.short_channel_id, ci.node1_id, ci.node2_id,
+                ci.capacity_sat if ci.capacity_sat is not None else -1))
+        for p in policies:
+            parts.append(_SNAPSHOT_POLICY.pack(
+                p.key, p.cltv_expiry_delta, p.htlc_minimum_msat,
+                p.htlc_maximum_msat if p.htlc_maximum_msat is not None else -1,
+                p.fee_base_msat, p.fee_proportional_millionths,
+                p.channel_flags, p.message_flags, p.timestamp))
+        for n in nodes:
+            features = n.features.to_bytes((n.features.bit_length() + 7) // 8, 'big')
+            alias = n.alias.encode('utf8')
+            parts.append(_SNAPSHOT_NODE.pack(n.node_id, n.timestamp, len(features), len(alias)))
+            parts.append(features)
+            parts.append(alias)
+        path = self.get_snapshot_path()
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(b''.join(parts))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        self.logger.info(f'graph snapshot written. {len(channels)} chans. {len(policies)} policies. {len(nodes)} nodes.')
+
+    def _load_snapshot(self) -> Optional[List[Policy]]:
+        """Loads channels and nodes from the snapshot file, and returns the policies.
+        Returns None if it is missing, stale or unreadable.
+        """
+        # no need for the cyclic garbage collector to run while we create ~10^5 tuples
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(self.get_snapshot_path(), 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    r = self._read_snapshot(buf)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.info(f'cannot read graph snapshot: {e!r}')
+            return None
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        if r is None:
+            return None
+        self._channels, policies, self._nodes = r
+        return policies
+
+    def _has_wal_data(self) -> bool:
+        # after an unclean shutdown, writes may be in the WAL but not in the db file
+        try:
+            return os.stat(self.path + '-wal').st_size > 0
+        except FileNotFoundError:
+            return False
+
+    def _read_snapshot(self, buf) -> Optional[Tuple[dict, list, dict]]:
+        magic, version, db_size, db_mtime_ns, num_channels, num_policies, num_nodes = _SNAPSHOT_HEADER.unpack_from(buf, 0)
+        if magic != GRAPH_SNAPSHOT_MAGIC or version != GRAPH_SNAPSHOT_VERSION:
+            self.logger.info('ignoring graph snapshot with unknown version')
+            return None
+        st = os.stat(self.path)
+        if (db_size, db_mtime_ns) != (st.st_size, st.st_mtime_ns) or self._has_wal_data():
+            self.logger.info('ignoring stale graph snapshot')
+            return None
+        offset = _SNAPSHOT_HEADER.size
+        end = offset + num_channels * _SNAPSHOT_CHANNEL.size
+        channels = {}
+        for scid, node1_id, node2_id, capacity_sat in _SNAPSHOT_CHANNEL.iter_unpack(buf[offset:end]):
+            scid = ShortChannelID(scid)
+            channels[scid] = ChannelInfo(scid, node1_id, node2_id, capacity_sat if capacity_sat >= 0 else None)
+        offset, end = end, end + num_policies * _SNAPSHOT_POLICY.size
+        # note: the struct fields are in the order of the NamedTuple fields
+        policies = [p if p.htlc_maximum_msat >= 0 else p._replace(htlc_maximum_msat=None)
+                    for p in map(Policy._make, _SNAPSHOT_POLICY.iter_unpack(buf[offset:end]))]
+        offset = end
+        nodes = {}
+        for i in range(num_nodes):
+            node_id, timestamp, features_len, alias_len = _SNAPSHOT_NODE.unpack_from(buf, offset)
+            offset += _SNAPSHOT_NODE.size
+            features = int.from_bytes(buf[offset:offset + features_len], 'big')
+            offset += features_len
+            alias = buf[offset:offset + alias_len].decode('utf8')
+            offset += alias_len
+            nodes[node_id] = NodeInfo(node_id=node_id, features=features, timestamp=timestamp, alias=alias)
+        if offset != len(buf):
+            raise Exception(f'unexpected snapshot size: {len(buf)} != {offset}')
+        return channels, policies, nodes
+
     def create_database(self):
         c = self.conn.cursor()
         c.execute(create_node_info)
@@ -533,49 +689,36 @@ class ChannelDB(SqlDB):
         c.execute(create_channel_info)
         self.conn.commit()
 
-    @sql
+    # note: writes are queued (write-behind), and executed in batches by the sql thread
+
     def _db_save_policy(self, key: bytes, msg: bytes):
         # 'msg' is a 'channel_update' message
-        c = self.conn.cursor()
-        c.execute("""REPLACE INTO policy (key, msg) VALUES (?,?)""", [key, msg])
+        self.queue_write("REPLACE INTO policy (key, msg) VALUES (?,?)", (key, msg))
 
-    @sql
     def _db_delete_policy(self, node_id: bytes, short_channel_id: ShortChannelID):
         key = short_channel_id + node_id
-        c = self.conn.cursor()
-        c.execute("""DELETE FROM policy WHERE key=?""", (key,))
+        self.queue_write("DELETE FROM policy WHERE key=?", (key,))
 
-    @sql
     def _db_save_channel(self, short_channel_id: ShortChannelID, msg: bytes):
         # 'msg' is a 'channel_announcement' message
-        c = self.conn.cursor()
-        c.execute("REPLACE INTO channel_info (short_channel_id, msg) VALUES (?,?)", [short_channel_id, msg])
+        self.queue_write("REPLACE INTO channel_info (short_channel_id, msg) VALUES (?,?)", (short_channel_id, msg))
 
-    @sql
     def _db_delete_channel(self, short_channel_id: ShortChannelID):
-        c = self.conn.cursor()
-        c.execute("""DELETE FROM channel_info WHERE short_channel_id=?""", (short_channel_id,))
+        self.queue_write("DELETE FROM channel_info WHERE short_channel_id=?", (short_channel_id,))
 
-    @sql
     def _db_save_node_info(self, node_id: bytes, msg: bytes):
         # 'msg' is a 'node_announcement' message
-        c = self.conn.cursor()
-        c.execute("REPLACE INTO node_info (node_id, msg) VALUES (?,?)", [node_id, msg])
+        self.queue_write("REPLACE INTO node_info (node_id, msg) VALUES (?,?)", (node_id, msg))
 
-    @sql
     def _db_save_node_address(self, peer: LNPeerAddr, timestamp: int):
-        c = self.conn.cursor()
-        c.execute("REPLACE INTO address (node_id, host, port, timestamp) VALUES (?,?,?,?)",
-                  (peer.pubkey, peer.host, peer.port, timestamp))
+        self.queue_write("REPLACE INTO address (node_id, host, port, timestamp) VALUES (?,?,?,?)",
+                         (peer.pubkey, peer.host, peer.port, timestamp))
 
-    @sql
     def _db_save_node_addresses(self, node_addresses: Sequence[LNPeerAddr]):
-        c = self.conn.cursor()
+        # keeps the timestamp of known addresses
         for addr in node_addresses:
-            c.execute("SELECT * FROM address WHERE node_id=? AND host=? AND port=?", (addr.pubkey, addr.host, addr.port))
-            r = c.fetchall()
-            if r == []:
-                c.execute("INSERT INTO address (node_id, host, port, timestamp) VALUES (?,?,?,?)", (addr.pubkey, addr.host, addr.port, 0))
+            self.queue_write("INSERT OR IGNORE INTO address (node_id, host, port, timestamp) VALUES (?,?,?,?)",
+                             (addr.pubkey, addr.host, addr.port, 0))
 
     @classmethod
     def verify_channel_update(cls, payload, *, start_node: bytes = None) -> None:
@@ -589,22 +732,106 @@ class ChannelDB(SqlDB):
             raise InvalidGossipMsg(f'failed verifying channel update for {short_channel_id}')
 
     @classmethod
-    def verify_channel_announcement(cls, payload) -> None:
+    def get_channel_update_sig_checks(cls, payload, start_node: bytes) -> List[GossipSigCheck]:
+        if constants.net.rev_genesis_bytes() != payload['chain_hash']:
+            raise InvalidGossipMsg('wrong chain hash')
+        return [(start_node, payload['signature'], sha256d(payload['raw'][2+64:]))]
+
+    @classmethod
+    def get_channel_announcement_sig_checks(cls, payload) -> List[GossipSigCheck]:
         h = sha256d(payload['raw'][2+256:])
         pubkeys = [payload['node_id_1'], payload['node_id_2'], payload['bitcoin_key_1'], payload['bitcoin_key_2']]
         sigs = [payload['node_signature_1'], payload['node_signature_2'], payload['bitcoin_signature_1'], payload['bitcoin_signature_2']]
-        for pubkey, sig in zip(pubkeys, sigs):
-            if not ecc.verify_signature(pubkey, sig, h):
-                raise InvalidGossipMsg('signature failed')
+        return [(pubkey, sig, h) for pubkey, sig in zip(pubkeys, sigs)]
+
+    @classmethod
+    def verify_channel_announcement(cls, payload) -> None:
+        if verify_gossip_signatures(cls.get_channel_announcement_sig_checks(payload)) is not None:
+            raise InvalidGossipMsg('signature failed')
+
+    @classmethod
+    def get_node_announcement_sig_checks(cls, payload) -> List[GossipSigCheck]:
+        return [(payload['node_id'], payload['signature'], sha256d(payload['raw'][66:]))]
 
     @classmethod
     def verify_node_announcement(cls, payload) -> None:
-        pubkey = payload['node_id']
-        signature = payload['signature']
-        h = sha256d(payload['raw'][66:])
-        if not ecc.verify_signature(pubkey, signature, h):
+        if verify_gossip_signatures(cls.get_node_announcement_sig_checks(payload)) is not None:
             raise InvalidGossipMsg('signature failed')
 
+    def filter_new_channel_announcements(self, msg_payloads) -> List[dict]:
+        """Drops the channel announcements that add_channel_announcements would skip
+        as already known, so that their signatures do not need to be verified.
+        """
+        new = []
+        seen = set()
+        for msg in msg_payloads:
+            short_channel_id = ShortChannelID(msg['short_channel_id'])
+            if short_channel_id in self._channels or short_channel_id in seen:
+                continue
+            new.append(msg)
+            # announcements that will be rejected do not make later ones redundant
+            if constants.net.rev_genesis_bytes() != msg['chain_hash']:
+                continue
+            try:
+                validate_features(int.from_bytes(msg['features'], 'big'))
+            except IncompatibleOrInsaneFeatures:
+                continue
+            seen.add(short_channel_id)
+        return new
+
+    def filter_new_node_announcements(self, msg_payloads) -> List[dict]:
+        """Drops the node announcements that add_node_announcements would skip
+        (orphaned, or not newer than what we have), so that their signatures do not need to be verified.
+        """
+        new = []
+        timestamps = {}  # type: Dict[bytes, int]
+        for msg in msg_payloads:
+            node_id = msg['node_id']
+            if node_id not in timestamps:
+                if not self.graph.has_channels(node_id):
+                    continue
+                node = self._nodes.get(node_id)
+                timestamps[node_id] = node.timestamp if node else -1
+            if msg['timestamp'] <= timestamps[node_id]:
+                continue
+            new.append(msg)
+            try:
+                validate_features(int.from_bytes(msg['features'], 'big'))
+            except IncompatibleOrInsaneFeatures:
+                continue
+            timestamps[node_id] = msg['timestamp']
+        return new
+
+    def get_channel_updates_to_verify(self, payloads, *, max_age=None) -> List[Tuple[dict, bytes]]:
+        """Returns (payload, start_node) for the channel updates that add_channel_updates
+        would add, i.e. not expired, orphaned, deprecated or superseded within payloads.
+        """
+        now = int(time.time())
+        to_verify = []
+        timestamps = {}  # type: Dict[Tuple[ShortChannelID, bytes], int]
+        for payload in payloads:
+            short_channel_id = ShortChannelID(payload['short_channel_id'])
+            timestamp = payload['timestamp']
+            if max_age and now - timestamp > max_age:
+                continue
+            if timestamp - now > 60:
+                continue
+            channel_info = self._channels.get(short_channel_id)
+            if not channel_info:
+                continue
+            direction = int.from_bytes(payload['channel_flags'], 'big') & FLAG_DIRECTION
+            start_node = channel_info.node1_id if direction == 0 else channel_info.node2_id
+            key = short_channel_id, start_node
+            if key not in timestamps:
+                old_policy = self.graph.get_policy(short_channel_id, start_node)
+                timestamps[key] = old_policy.timestamp if old_policy else None
+            old_timestamp = timestamps[key]
+            if old_timestamp is not None and timestamp <= old_timestamp + 60:
+                continue
+            timestamps[key] = timestamp
+            to_verify.append((payload, start_node))
+        return to_verify
+
     def add_node_announcements(self, msg_payloads):
         # note: signatures have already been verified.
         if type(msg_payloads) is dict:
@@ -617,7 +844,7 @@ class ChannelDB(SqlDB):
                 continue
             node_id = node_info.node_id
             # Ignore node if it has no associated channel (DoS protection)
-            if node_id not in self._channels_for_node:
+            if not self.graph.has_channels(node_id):
                 #self.logger.info('ignoring orphan node_announcement')
                 continue
             node = self._nodes.get(node_id)
@@ -629,6 +856,8 @@ class ChannelDB(SqlDB):
             # save
             with self.lock:
                 self._nodes[node_id] = node_info
+                self.graph.set_node_features(node_id, node_info.features)
+                self.graph_version += 1
             if 'raw' in msg_payload:
                 self._db_save_node_info(node_id, msg_payload['raw'])
             with self.lock:
@@ -642,9 +871,9 @@ class ChannelDB(SqlDB):
 
     def get_old_policies(self, delta) -> Sequence[Tuple[bytes, ShortChannelID]]:
         with self.lock:
-            _policies = self._policies.copy()
+            policies = list(self.graph.get_policies())
         now = int(time.time())
-        return list(k for k, v in _policies.items() if v.timestamp <= now - delta)
+        return list((p.start_node, p.short_channel_id) for p in policies if p.timestamp <= now - delta)
 
     def prune_old_policies(self, delta):
         old_policies = self.get_old_policies(delta)
@@ -652,7 +881,8 @@ class ChannelDB(SqlDB):
             for key in old_policies:
                 node_id, scid = key
                 with self.lock:
-                    self._policies.pop(key)
+                    self.graph.remove_policy(scid, node_id)
+                    self.graph_version += 1
                 self._db_delete_policy(*key)
                 self._update_num_policies_for_chan(scid)
             self.update_counts()
@@ -679,19 +909,23 @@ class ChannelDB(SqlDB):
         prev_chanupd = self._channel_updates_for_private_channels.get(key)
         if prev_chanupd == msg_payload:
             return False
-        self._channel_updates_for_private_channels[key] = msg_payload
+        with self.lock:
+            self._channel_updates_for_private_channels[key] = msg_payload
+            self.graph_version += 1
         return True
 
     def remove_channel(self, short_channel_id: ShortChannelID):
-        # FIXME what about rm-ing policies?
         with self.lock:
             channel_info = self._channels.pop(short_channel_id, None)
-            if channel_info:
-                self._channels_for_node[channel_info.node1_id].remove(channel_info.short_channel_id)
-                self._channels_for_node[channel_info.node2_id].remove(channel_info.short_channel_id)
+            # note: this also removes the policies of the channel
+            self.graph.remove_channel(short_channel_id)
+            self.graph_version += 1
         self._update_num_policies_for_chan(short_channel_id)
         # delete from database
         self._db_delete_channel(short_channel_id)
+        if channel_info:
+            self._db_delete_policy(channel_info.node1_id, short_channel_id)
+            self._db_delete_policy(channel_info.node2_id, short_channel_id)
 
     def get_node_addresses(self, node_id: bytes) -> Sequence[Tuple[str, int, int]]:
         """Returns list of (host, port, timestamp)."""
@@ -706,7 +940,6 @@ class ChannelDB(SqlDB):
     def load_data(self):
         if self.data_loaded.is_set():
             return
-        # Note: this method takes several seconds... mostly due to lnmsg.decode_msg being slow.
         c = self.conn.cursor()
         c.execute("""SELECT * FROM address""")
         for x in c:
@@ -723,6 +956,38 @@ class ChannelDB(SqlDB):
             return newest_ts
         sorted_node_ids = sorted(self._addresses.keys(), key=newest_ts_for_node_id, reverse=True)
         self._recent_peers = sorted_node_ids[:self.NUM_MAX_RECENT_PEERS]
+        policies = self._load_snapshot()
+        if policies is not None:
+            self.logger.info('graph loaded from snapshot')
+        else:
+            policies = self._load_graph_from_db(c)
+        self._build_graph(policies)
+        for channel_info in self._channels.values():
+            self._update_num_policies_for_chan(channel_info.short_channel_id)
+        self.logger.info(f'data loaded. {len(self._channels)} chans. {self.graph.num_policies} policies. '
+                         f'{self.graph.get_num_nodes_with_channels()} nodes.')
+        self.update_counts()
+        (nchans_with_0p, nchans_with_1p, nchans_with_2p) = self.get_num_channels_partitioned_by_policy_count()
+        self.logger.info(f'num_channels_partitioned_by_policy_count. '
+                         f'0p: {nchans_with_0p}, 1p: {nchans_with_1p}, 2p: {nchans_with_2p}')
+        self.asyncio_loop.call_soon_threadsafe(self.data_loaded.set)
+        util.trigger_callback('gossip_db_loaded')
+
+    def _build_graph(self, policies: Sequence[Policy]) -> None:
+        graph = CompactGraph()
+        for channel_info in self._channels.values():
+            graph.add_channel(channel_info)
+        # policies of channels we do not know are not kept in memory
+        for p in policies:
+            graph.set_policy(p)
+        for node_info in self._nodes.values():
+            graph.set_node_features(node_info.node_id, node_info.features)
+        with self.lock:
+            self.graph = graph
+            self.graph_version += 1
+
+    def _load_graph_from_db(self, c) -> List[Policy]:
+        # Note: this can take a few seconds for the mainnet graph, as all raw messages need to be decoded.
         c.execute("""SELECT * FROM channel_info""")
         for short_channel_id, msg in c:
             try:
@@ -743,24 +1008,14 @@ class ChannelDB(SqlDB):
             # don't load node_addresses because they dont have timestamps
             self._nodes[node_id] = node_info
         c.execute("""SELECT * FROM policy""")
+        policies = []
         for key, msg in c:
             try:
                 p = Policy.from_raw_msg(key, msg)
             except FailedToParseMsg:
                 continue
-            self._policies[(p.start_node, p.short_channel_id)] = p
-        for channel_info in self._channels.values():
-            self._channels_for_node[channel_info.node1_id].add(channel_info.short_channel_id)
-            self._channels_for_node[channel_info.node2_id].add(channel_info.short_channel_id)
-            self._update_num_policies_for_chan(channel_info.short_channel_id)
-        self.logger.info(f'data loaded. {len(self._channels)} chans. {len(self._policies)} policies. '
-                         f'{len(self._channels_for_node)} nodes.')
-        self.update_counts()
-        (nchans_with_0p, nchans_with_1p, nchans_with_2p) = self.get_num_channels_partitioned_by_policy_count()
-        self.logger.info(f'num_channels_partitioned_by_policy_count. '
-                         f'0p: {nchans_with_0p}, 1p: {nchans_with_1p}, 2p: {nchans_with_2p}')
-        self.asyncio_loop.call_soon_threadsafe(self.data_loaded.set)
-        util.trigger_callback('gossip_db_loaded')
+            policies.append(p)
+        return policies
 
     def _update_num_policies_for_chan(self, short_channel_id: ShortChannelID) -> None:
         channel_info = self.get_channel_info(short_channel_id)
@@ -799,7 +1054,7 @@ class ChannelDB(SqlDB):
     ) -> Optional['Policy']:
         channel_info = self.get_channel_info(short_channel_id)
         if channel_info is not None:  # publicly announced channel
-            policy = self._policies.get((node_id, short_channel_id))
+            policy = self.graph.get_policy(short_channel_id, node_id)
             if policy:
                 return policy
         else:  # private channel
@@ -846,8 +1101,7 @@ class ChannelDB(SqlDB):
         """Returns the set of short channel IDs where node_id is one of the channel participants."""
         if not self.data_loaded.is_set():
             raise ChannelDBNotLoaded("channelDB data not loaded yet!")
-        relevant_channels = self._channels_for_node.get(node_id) or set()
-        relevant_channels = set(relevant_channels)  # copy
+        relevant_channels = self.graph.get_channels_for_node(node_id)
         # add our own channels  # TODO maybe slow?
         if my_channels:
             for chan in my_channels.values():
@@ -882,7 +1136,7 @@ class ChannelDB(SqlDB):
 
     def get_node_policies(self) -> Dict[Tuple[bytes, ShortChannelID], Policy]:
         with self.lock:
-            return self._policies.copy()
+            return {(p.start_node, p.short_channel_id): p for p in self.graph.get_policies()}
 
     def get_node_by_prefix(self, prefix):
         with self.lock:
@@ -916,10 +1170,8 @@ class ChannelDB(SqlDB):
                 graph['channels'].append(
                     channelinfo._asdict(),
                 )
-                policy1 = self._policies.get(
-                    (channelinfo.node1_id, channelinfo.short_channel_id))
-                policy2 = self._policies.get(
-                    (channelinfo.node2_id, channelinfo.short_channel_id))
+                policy1 = self.graph.get_policy(channelinfo.short_channel_id, channelinfo.node1_id)
+                policy2 = self.graph.get_policy(channelinfo.short_channel_id, channelinfo.node2_id)
                 graph['channels'][-1]['policy1'] = policy1._asdict() if policy1 else None
                 graph['channels'][-1]['policy2'] = policy2._asdict() if policy2 else None
 
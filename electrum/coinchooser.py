@@ -22,9 +22,10 @@
 # ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import random
 from collections import defaultdict
 from math import floor, log10
-from typing import NamedTuple, List, Callable, Sequence, Union, Dict, Tuple, Mapping, Type, TYPE_CHECKING
+from typing import NamedTuple, List, Callable, Sequence, Union, Dict, Tuple, Mapping, Type, Optional, TYPE_CHECKING
 from decimal import Decimal
 
 from .bitcoin import sha256, COIN, is_address
@@ -303,6 +304,13 @@ class CoinChooserBase(Logger):
         def fee_estimator_w(weight):
             return fee_estimator_vb(Transaction.virtual_size_from_weight(weight))
 
+        # For choosers that select on effective values: the effective value the
+        # buckets need to add up to, and the excess below which change is not worth it.
+        self.target_effective_value = spent_amount - input_value + fee_estimator_w(base_weight)
+        change_addr = change_addrs[0] if change_addrs else (coins[0].address if coins else None)
+        change_weight = 4 * Transaction.estimated_output_size_for_address(change_addr) if change_addr else 0
+        self.cost_of_change = fee_estimator_w(base_weight + change_weight) - fee_estimator_w(base_weight) + dust_threshold
+
         def sufficient_funds(buckets, *, bucket_value_sum):
             '''Given a list of buckets, return True if it has enough
             value to pay for the transaction'''
@@ -483,8 +491,133 @@ class CoinChooserPrivacy(CoinChooserRandom):
         return penalty
 
 
+class CoinChooserBnB(CoinChooserPrivacy):
+    """Looks for a set of coins that pays for the transaction without
+    change, wasting as little as possible to fees (branch and bound).
+    If there is none, it picks coins that leave enough change to be
+    worth keeping. Like Privacy, if any coin is spent from an address,
+    all coins of that address are, and confirmed coins are preferred.
+    """
+
+    BNB_MAX_TRIES = 100_000
+    KNAPSACK_MAX_STEPS = 100_000
+
+    def select_bnb(self, buckets: List[Bucket], target: int, cost_of_change: int,
+                   sufficient_funds) -> Optional[List[Bucket]]:
+        """Returns the set of buckets with an effective value in [target, target + cost_of_change]
+        with the least excess, or None. The search is depth-first, over buckets sorted
+        by decreasing effective value, and gives up after BNB_MAX_TRIES steps.
+        """
+        buckets = sorted(buckets, key=lambda b: b.effective_value, reverse=True)
+        values = [b.effective_value for b in buckets]
+        available = sum(values)
+        if available < target:
+            return None
+        best = None
+        best_waste = None
+        selection = []  # type: List[bool]  # whether buckets[i] is selected, for i < len(selection)
+        value = 0
+        for tries in range(self.BNB_MAX_TRIES):
+            backtrack = False
+            if value + available < target or value > target + cost_of_change:
+                backtrack = True
+            elif value >= target:
+                waste = value - target
+                if best_waste is None or waste < best_waste:
+                    selected = [b for b, is_selected in zip(buckets, selection) if is_selected]
+                    if sufficient_funds(selected, bucket_value_sum=sum(b.value for b in selected)):
+                        best, best_waste = selected, waste
+                        if waste == 0:
+                            break
+                backtrack = True
+            if backtrack:
+                # undo the last inclusion, and try without it
+                while selection and not selection[-1]:
+                    selection.pop()
+                    available += values[len(selection)]
+                if not selection:
+                    break
+                selection[-1] = False
+                value -= values[len(selection) - 1]
+            else:
+                i = len(selection)
+                available -= values[i]
+                if selection and not selection[-1] and values[i] == values[i - 1]:
+                    # same value as an excluded bucket: including this one was already explored
+                    selection.append(False)
+                else:
+                    selection.append(True)
+                    value += values[i]
+        return best
+
+    def select_knapsack(self, buckets: List[Bucket], target: int) -> Optional[List[Bucket]]:
+        """Returns a set of buckets with an effective value of at least target, trying
+        to get close to it with random subsets of the smaller buckets, or the smallest
+        bucket that is enough by itself, whichever is closer.
+        """
+        rand = random.Random(self.p.get_bytes(32))
+        smaller = [b for b in buckets if b.effective_value < target]
+        lowest_larger = min((b for b in buckets if b.effective_value >= target),
+                            key=lambda b: b.effective_value, default=None)
+        total_smaller = sum(b.effective_value for b in smaller)
+        if total_smaller < target:
+            return [lowest_larger] if lowest_larger else None
+        smaller.sort(key=lambda b: b.effective_value, reverse=True)
+        values = [b.effective_value for b in smaller]
+        best_included = [True] * len(smaller)
+        best_value = total_smaller
+        for rep in range(max(10, min(1000, self.KNAPSACK_MAX_STEPS // len(smaller)))):
+            if best_value == target:
+                break
+            included = [False] * len(smaller)
+            total = 0
+            reached_target = False
+            for npass in range(2):
+                if reached_target:
+                    break
+                for i, v in enumerate(values):
+                    # first pass: random subset; second pass: add what was left out
+                    if (rand.getrandbits(1) if npass == 0 else not included[i]):
+                        total += v
+                        included[i] = True
+                        if total >= target:
+                            reached_target = True
+                            if total < best_value:
+                                best_value = total
+                                best_included = included[:]
+                            total -= v
+                            included[i] = False
+        if lowest_larger and lowest_larger.effective_value <= best_value:
+            return [lowest_larger]
+        return [b for b, is_included in zip(smaller, best_included) if is_included]
+
+    def choose_buckets(self, buckets, sufficient_funds, penalty_func):
+        if sufficient_funds([], bucket_value_sum=0):
+            return penalty_func([])
+        target = self.target_effective_value
+        # prefer confirmed coins, then unconfirmed ones, then the others
+        pools = [
+            [bkt for bkt in buckets if bkt.min_height > 0],
+            [bkt for bkt in buckets if bkt.min_height >= 0],
+            buckets,
+        ]
+        for pool in pools:
+            if sum(bkt.effective_value for bkt in pool) < target:
+                continue
+            selected = self.select_bnb(pool, target, self.cost_of_change, sufficient_funds)
+            if selected is None:
+                selected = self.select_knapsack(pool, target + self.cost_of_change)
+                if selected is None or not sufficient_funds(selected, bucket_value_sum=sum(b.value for b in selected)):
+                    continue
+            self.logger.info(f"Total number of buckets: {len(buckets)}. Selected: {len(selected)}")
+            return penalty_func(selected)
+        # e.g. not enough for change: let the random chooser find a solution, or raise NotEnoughFunds
+        return super().choose_buckets(buckets, sufficient_funds, penalty_func)
+
+
 COIN_CHOOSERS = {
     'Privacy': CoinChooserPrivacy,
+    'BranchAndBound': CoinChooserBnB,
 }  # type: Mapping[str, Type[CoinChooserBase]]
 
 def get_name(config: 'SimpleConfig') -> str:
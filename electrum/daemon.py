@@ -538,6 +538,8 @@ class Daemon(Logger):
 
     def delete_wallet(self, path: str) -> bool:
         self.stop_wallet(path)
+        if os.path.exists(path + '.sqlite'):
+            os.unlink(path + '.sqlite')
         if os.path.exists(path):
             os.unlink(path)
             return True
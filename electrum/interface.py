@@ -29,7 +29,8 @@ import sys
 import traceback
 import asyncio
 import socket
-from typing import Tuple, Union, List, TYPE_CHECKING, Optional, Set, NamedTuple, Any, Sequence, Dict
+from typing import (Tuple, Union, List, TYPE_CHECKING, Optional, Set, NamedTuple, Any, Sequence, Dict,
+                    Callable, Awaitable)
 from collections import defaultdict
 from ipaddress import IPv4Network, IPv6Network, ip_address, IPv6Address, IPv4Address
 import itertools
@@ -40,7 +41,7 @@ import functools
 import aiorpcx
 from aiorpcx import RPCSession, Notification, NetAddress, NewlineFramer
 from aiorpcx.curio import timeout_after, TaskTimeout
-from aiorpcx.jsonrpc import JSONRPC, CodeMessageError
+from aiorpcx.jsonrpc import JSONRPC, CodeMessageError, RPCError
 from aiorpcx.rawsocket import RSClient
 import certifi
 
@@ -52,7 +53,7 @@ from . import x509
 from . import pem
 from . import version
 from . import blockchain
-from .blockchain import Blockchain, HEADER_SIZE
+from .blockchain import Blockchain, HEADER_SIZE, verify_raw_headers
 from . import bitcoin
 from . import constants
 from .i18n import _
@@ -70,6 +71,9 @@ BUCKET_NAME_OF_ONION_SERVERS = 'onion'
 
 _KNOWN_NETWORK_PROTOCOLS = {'t', 's'}
 PREFERRED_NETWORK_PROTOCOL = 's'
+
+# when catching up from far behind, this many chunks of headers are requested at once
+CATCHUP_CHUNKS_PER_BATCH = 8
 assert PREFERRED_NETWORK_PROTOCOL in _KNOWN_NETWORK_PROTOCOLS
 
 
@@ -178,6 +182,25 @@ class NotificationSession(RPCSession):
             self.maybe_log(f"--> {response} (id: {msg_id})")
             return response
 
+    async def send_batch_request(self, requests: Sequence[Tuple[str, Sequence]], *, timeout=None) -> Sequence[Any]:
+        """Sends requests as a single JSON-RPC batch. Returns the results in the same order.
+        If the server returned an error for a request, its item is an RPCError instead of it being raised.
+        """
+        msg_id = next(self._msg_counter)
+        self.maybe_log(f"<-- batch of {len(requests)}: {requests} (id: {msg_id})")
+
+        async def send():
+            async with self.send_batch(raise_errors=False) as batch:
+                for method, params in requests:
+                    batch.add_request(method, params)
+            return batch.results
+        try:
+            results = await asyncio.wait_for(send(), timeout)
+        except (TaskTimeout, asyncio.TimeoutError) as e:
+            raise RequestTimedOut(f'batch request timed out: {len(requests)} requests (id: {msg_id})') from e
+        self.maybe_log(f"--> {results} (id: {msg_id})")
+        return results
+
     def set_default_timeout(self, timeout):
         self.sent_request_timeout = timeout
         self.max_send_delay = timeout
@@ -258,6 +281,82 @@ class InvalidOptionCombination(Exception): pass
 class ConnectError(NetworkException): pass
 
 
+class RequestBatcher:
+    """Coalesces concurrent requests of the same kind into batches.
+
+    Arguments passed to request() by concurrent callers are collected, and sent
+    together with a single call to send_batch, at most max_batch_size at a time.
+    send_batch must return one result per argument, in order; results that are
+    exceptions are raised in the corresponding caller.
+    run() must be running (e.g. in the taskgroup of a NetworkJob) for requests to be sent.
+    """
+
+    def __init__(
+            self,
+            send_batch: Callable[[List[Any]], Awaitable[Sequence[Any]]],
+            *,
+            max_batch_size: int,
+            delay: float = 0.01,  # seconds to wait for more requests to coalesce
+    ):
+        self._send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.delay = delay
+        self._queue = asyncio.Queue()  # type: asyncio.Queue[Tuple[Any, asyncio.Future]]
+        # metrics
+        self.num_batches = 0
+        self.num_requests = 0
+        self.largest_batch = 0
+
+    async def request(self, arg: Any) -> Any:
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((arg, fut))
+        return await fut
+
+    async def run(self, *, taskgroup: 'OldTaskGroup') -> None:
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self.max_batch_size - 1:
+                await asyncio.sleep(self.delay)
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            # callers might have been cancelled in the meantime
+            batch = [(arg, fut) for arg, fut in batch if not fut.done()]
+            if batch:
+                await taskgroup.spawn(self._send(batch))
+
+    async def _send(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        self.num_batches += 1
+        self.num_requests += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        try:
+            results = await self._send_batch([arg for arg, fut in batch])
+        except asyncio.CancelledError:
+            for arg, fut in batch:
+                fut.cancel()
+            raise
+        except Exception as e:
+            for arg, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        assert len(results) == len(batch), f"{len(results)=} != {len(batch)=}"
+        for (arg, fut), result in zip(batch, results):
+            if fut.done():
+                continue
+            if isinstance(result, Exception):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'num_requests': self.num_requests,
+            'num_batches': self.num_batches,
+            'avg_batch_size': self.num_requests / self.num_batches if self.num_batches else 0,
+            'largest_batch': self.largest_batch,
+        }
+
+
 class _RSClient(RSClient):
     async def create_connection(self):
         try:
@@ -640,6 +739,47 @@ class Interface(Logger):
             res = await self.session.send_request('blockchain.block.headers', [index * 2016, size])
         finally:
             self._requested_chunks.discard(index)
+        self._check_chunk_response(res, size)
+        conn = self.blockchain.connect_chunk(index, res['hex'])
+        if not conn:
+            return conn, 0
+        return conn, res['count']
+
+    async def request_chunks(self, height: int, num_chunks: int) -> int:
+        """Requests num_chunks full chunks starting at height, concurrently,
+        and connects them. Returns the number of chunks that could be connected.
+        The chunks are verified in worker processes, if enabled in the config.
+        """
+        if not is_non_negative_integer(height) or height % 2016 != 0:
+            raise Exception(f"{repr(height)} is not the height of a chunk")
+        start_index = height // 2016
+        indexes = range(start_index, start_index + num_chunks)
+        self.logger.info(f"requesting chunks {indexes[0]}..{indexes[-1]}")
+        try:
+            self._requested_chunks.update(indexes)
+            results = await asyncio.gather(*[
+                self.session.send_request('blockchain.block.headers', [index * 2016, 2016])
+                for index in indexes])
+        finally:
+            self._requested_chunks.difference_update(indexes)
+        for res in results:
+            self._check_chunk_response(res, 2016)
+        chain = self.blockchain
+        chunks = chain.prepare_chunks(start_index, [res['hex'] for res in results])
+        executor = self.network.get_headers_verification_executor()
+        hashes = None
+        if executor is not None:
+            # verify the chunks in the worker processes, without blocking the event loop
+            loop = asyncio.get_running_loop()
+            hashes = await asyncio.gather(
+                *[loop.run_in_executor(executor, functools.partial(
+                    verify_raw_headers, chunk.data, prev_hash=chunk.prev_hash, target=chunk.target,
+                    check_pow=chunk.check_pow))
+                  for chunk in chunks],
+                return_exceptions=True)
+        return chain.connect_chunks(chunks, hashes)
+
+    def _check_chunk_response(self, res, size: int) -> None:
         assert_dict_contains_field(res, field_name='count')
         assert_dict_contains_field(res, field_name='hex')
         assert_dict_contains_field(res, field_name='max')
@@ -653,10 +793,6 @@ class Interface(Logger):
             raise RequestCorrupted(f"server uses too low 'max' count for block.headers: {res['max']} < 2016")
         if res['count'] != size:
             raise RequestCorrupted(f"expected {size} headers but only got {res['count']}")
-        conn = self.blockchain.connect_chunk(index, res['hex'])
-        if not conn:
-            return conn, 0
-        return conn, res['count']
 
     def is_main_server(self) -> bool:
         return (self.network.interface == self or
@@ -785,7 +921,18 @@ class Interface(Logger):
         last = None
         while last is None or height <= next_height:
             prev_last, prev_height = last, height
-            if next_height > height + 10:
+            num_chunks = min(CATCHUP_CHUNKS_PER_BATCH, (next_height + 1 - height) // 2016)
+            if height % 2016 == 0 and num_chunks > 1:
+                num_connected = await self.request_chunks(height, num_chunks)
+                if num_connected == 0:
+                    if height <= constants.net.max_checkpoint():
+                        raise GracefulDisconnect('server chain conflicts with checkpoints or genesis')
+                    last, height = await self.step(height)
+                    continue
+                util.trigger_callback('network_updated')
+                height += num_connected * 2016
+                last = 'catchup'
+            elif next_height > height + 10:
                 could_connect, num_headers = await self.request_chunk(height, next_height)
                 if not could_connect:
                     if height <= constants.net.max_checkpoint():
@@ -955,13 +1102,35 @@ class Interface(Logger):
         return self._ipaddr_bucket
 
     async def get_merkle_for_transaction(self, tx_hash: str, tx_height: int) -> dict:
+        self._check_merkle_request(tx_hash, tx_height)
+        # do request
+        res = await self.session.send_request('blockchain.transaction.get_merkle', [tx_hash, tx_height])
+        # check response
+        self._check_merkle_response(res)
+        return res
+
+    async def get_merkles_for_transactions(self, txs: Sequence[Tuple[str, int]]) -> List[Union[dict, RPCError]]:
+        """Batched get_merkle_for_transaction. txs is a list of (tx_hash, tx_height).
+        Errors returned by the server for individual txs are returned as RPCError items.
+        """
+        for tx_hash, tx_height in txs:
+            self._check_merkle_request(tx_hash, tx_height)
+        results = await self.session.send_batch_request(
+            [('blockchain.transaction.get_merkle', [tx_hash, tx_height]) for tx_hash, tx_height in txs])
+        for res in results:
+            if not isinstance(res, RPCError):
+                self._check_merkle_response(res)
+        return list(results)
+
+    @classmethod
+    def _check_merkle_request(cls, tx_hash: str, tx_height: int) -> None:
         if not is_hash256_str(tx_hash):
             raise Exception(f"{repr(tx_hash)} is not a txid")
         if not is_non_negative_integer(tx_height):
             raise Exception(f"{repr(tx_height)} is not a block height")
-        # do request
-        res = await self.session.send_request('blockchain.transaction.get_merkle', [tx_hash, tx_height])
-        # check response
+
+    @classmethod
+    def _check_merkle_response(cls, res: Any) -> None:
         block_height = assert_dict_contains_field(res, field_name='block_height')
         merkle = assert_dict_contains_field(res, field_name='merkle')
         pos = assert_dict_contains_field(res, field_name='pos')
@@ -971,13 +1140,31 @@ class Interface(Logger):
         assert_list_or_tuple(merkle)
         for item in merkle:
             assert_hash256_str(item)
-        return res
 
     async def get_transaction(self, tx_hash: str, *, timeout=None) -> str:
         if not is_hash256_str(tx_hash):
             raise Exception(f"{repr(tx_hash)} is not a txid")
         raw = await self.session.send_request('blockchain.transaction.get', [tx_hash], timeout=timeout)
         # validate response
+        self._check_transaction_response(tx_hash, raw)
+        return raw
+
+    async def get_transactions(self, tx_hashes: Sequence[str]) -> List[Union[Transaction, RPCError]]:
+        """Batched get_transaction. Returns the already validated (deserialized, txid checked)
+        Transaction objects, so that callers don't need to parse and hash them again.
+        Errors returned by the server for individual txs are returned as RPCError items.
+        """
+        for tx_hash in tx_hashes:
+            if not is_hash256_str(tx_hash):
+                raise Exception(f"{repr(tx_hash)} is not a txid")
+        results = await self.session.send_batch_request(
+            [('blockchain.transaction.get', [tx_hash]) for tx_hash in tx_hashes])
+        return [raw if isinstance(raw, RPCError) else self._check_transaction_response(tx_hash, raw)
+                for tx_hash, raw in zip(tx_hashes, results)]
+
+    @classmethod
+    def _check_transaction_response(cls, tx_hash: str, raw: Any) -> Transaction:
+        """Returns the deserialized tx, with its txid cached."""
         if not is_hex_str(raw):
             raise RequestCorrupted(f"received garbage (non-hex) as tx data (txid {tx_hash}): {raw!r}")
         tx = Transaction(raw)
@@ -987,7 +1174,7 @@ class Interface(Logger):
             raise RequestCorrupted(f"cannot deserialize received transaction (txid {tx_hash})") from e
         if tx.txid() != tx_hash:
             raise RequestCorrupted(f"received tx does not match expected txid {tx_hash} (got {tx.txid()})")
-        return raw
+        return tx
 
     async def get_history_for_scripthash(self, sh: str) -> List[dict]:
         if not is_hash256_str(sh):
@@ -995,6 +1182,25 @@ class Interface(Logger):
         # do request
         res = await self.session.send_request('blockchain.scripthash.get_history', [sh])
         # check response
+        self._check_history_response(sh, res)
+        return res
+
+    async def get_history_for_scripthashes(self, shs: Sequence[str]) -> List[Union[List[dict], RPCError]]:
+        """Batched get_history_for_scripthash.
+        Errors returned by the server for individual scripthashes are returned as RPCError items.
+        """
+        for sh in shs:
+            if not is_hash256_str(sh):
+                raise Exception(f"{repr(sh)} is not a scripthash")
+        results = await self.session.send_batch_request(
+            [('blockchain.scripthash.get_history', [sh]) for sh in shs])
+        for sh, res in zip(shs, results):
+            if not isinstance(res, RPCError):
+                self._check_history_response(sh, res)
+        return list(results)
+
+    @classmethod
+    def _check_history_response(cls, sh: str, res: Any) -> None:
         assert_list_or_tuple(res)
         prev_height = 1
         for tx_item in res:
@@ -1017,7 +1223,6 @@ class Interface(Logger):
             # a recently mined tx could be included in both last block and mempool?
             # Still, it's simplest to just disregard the response.
             raise RequestCorrupted(f"server history has non-unique txids for sh={sh}")
-        return res
 
     async def listunspent_for_scripthash(self, sh: str) -> List[dict]:
         if not is_hash256_str(sh):
@@ -25,7 +25,7 @@
 import threading
 import copy
 import json
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional, Sequence, Union, List
 
 from . import util
 from .util import WalletFileException
@@ -82,18 +82,76 @@ def stored_in(name, _type=dict):
     return decorator
 
 
+def key_path(path: Sequence[Union[str, int]], key: Optional[Union[str, int]] = None) -> str:
+    """Returns the JSON pointer (RFC 6901) of path/key, as used in patch records."""
+    def to_str(x):
+        if isinstance(x, int):
+            x = str(int(x))  # note: also handles IntEnum keys
+        assert isinstance(x, str), repr(x)
+        return x.replace('~', '~0').replace('/', '~1')
+    items = list(path)
+    if key is not None:
+        items.append(key)
+    return '/' + '/'.join(to_str(x) for x in items)
+
+
+def apply_patch(data: dict, patch: dict) -> None:
+    """Applies a patch record (subset of RFC 6902: add, replace, remove) to raw json data."""
+    op = patch['op']
+    keys = [x.replace('~1', '/').replace('~0', '~') for x in patch['path'].split('/')[1:]]
+    if not keys:
+        raise WalletFileException(f"invalid patch path: {patch['path']!r}")
+    parent = data
+    for k in keys[:-1]:
+        parent = parent[int(k)] if isinstance(parent, list) else parent[k]
+    k = keys[-1]
+    if isinstance(parent, list):
+        if op == 'add':
+            if k == '-':
+                parent.append(patch['value'])
+            else:
+                parent.insert(int(k), patch['value'])
+        elif op == 'replace':
+            parent[int(k)] = patch['value']
+        elif op == 'remove':
+            parent.pop(int(k))
+        else:
+            raise WalletFileException(f"unknown patch op: {op!r}")
+    else:
+        if op in ('add', 'replace'):
+            parent[k] = patch['value']
+        elif op == 'remove':
+            parent.pop(k, None)
+        else:
+            raise WalletFileException(f"unknown patch op: {op!r}")
+
+
+def _child_path(path: Optional[list], key) -> Optional[list]:
+    return path + [key] if path is not None else None
+
+
+def _detach(v) -> None:
+    """Called on values removed from the db, so that later changes to them
+    no longer produce patch records."""
+    if isinstance(v, (StoredDict, StoredList)):
+        v._set_db_and_path(v.db, None)
+    elif isinstance(v, StoredObject):
+        v.set_db(v.db, None)
+
 
 class StoredObject:
 
     db = None
+    _path = None  # type: Optional[list]
 
     def __setattr__(self, key, value):
-        if self.db:
-            self.db.set_modified(True)
         object.__setattr__(self, key, value)
+        if self.db:
+            self.db.add_patch('replace', self._path, self)
 
-    def set_db(self, db):
-        self.db = db
+    def set_db(self, db, path=None):
+        object.__setattr__(self, 'db', db)
+        object.__setattr__(self, '_path', path)
 
     def to_json(self):
         d = dict(vars(self))
@@ -108,61 +166,276 @@ _RaiseKeyError = object() # singleton for no-default behavior
 
 class StoredDict(dict):
 
-    def __init__(self, data, db, path):
+    def __init__(self, data, db, path, *, lazy: bool = False, items_key=None):
         self.db = db
         self.lock = self.db.lock if self.db else threading.RLock()
+        # path is None for dicts that are not (yet) attached to the db tree
         self.path = path
-        # recursively convert dicts to StoredDict
+        # lazy mode: keys whose value is still raw json. They are converted
+        # on first access, and dumped as they are if never accessed.
+        self._pending = set()
+        # name of the registered dict our values are elements of (lazy mode)
+        self._items_key = items_key
+        if lazy and items_key is not None:
+            dict.update(self, data)
+            self._pending.update(data)
+            return
         for k, v in list(data.items()):
-            self.__setitem__(k, v)
+            if lazy and (isinstance(v, (dict, list)) or k in registered_names):
+                dict.__setitem__(self, k, v)
+                self._pending.add(k)
+            else:
+                # recursively convert dicts to StoredDict
+                self._setitem(k, v, patch=False)
+
+    def _set_db_and_path(self, db, path):
+        self._materialize_all()
+        self.db = db
+        self.path = path
+        for k, v in dict.items(self):
+            if isinstance(v, (StoredDict, StoredList)):
+                v._set_db_and_path(db, _child_path(path, k))
+            elif isinstance(v, StoredObject):
+                v.set_db(db, _child_path(path, k))
+
+    def _materialize(self, key):
+        with self.lock:
+            if key not in self._pending:
+                return
+            v = dict.__getitem__(self, key)
+            self._pending.discard(key)
+            if self._items_key is not None:
+                v = self.db._convert_dict_item(self._items_key, v)
+            self._convert_and_set(key, v, lazy=True)
+
+    def _materialize_all(self):
+        while self._pending:
+            self._materialize(next(iter(self._pending)))
+
+    def raw_data(self) -> dict:
+        """Returns the contents as a plain dict for serialization.
+        Values that were never accessed are returned as they were loaded."""
+        with self.lock:
+            return {k: v.raw_data() if isinstance(v, StoredDict) else v
+                    for k, v in dict.items(self)}
+
+    def __getitem__(self, key):
+        if self._pending and key in self._pending:
+            self._materialize(key)
+        return dict.__getitem__(self, key)
+
+    def __iter__(self):
+        # note: overriding this also keeps dict(self) and {**self} from reading raw values
+        return dict.__iter__(self)
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self[key]
+
+    def items(self):
+        self._materialize_all()
+        return dict.items(self)
+
+    def values(self):
+        self._materialize_all()
+        return dict.values(self)
+
+    def copy(self):
+        self._materialize_all()
+        return dict.copy(self)
+
+    def __eq__(self, other):
+        self._materialize_all()
+        if isinstance(other, StoredDict):
+            other._materialize_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        r = self.__eq__(other)
+        return r if r is NotImplemented else not r
+
+    __hash__ = None
 
     @locked
     def __setitem__(self, key, v):
+        self._setitem(key, v, patch=True)
+
+    def _setitem(self, key, v, *, patch: bool):
         is_new = key not in self
         # early return to prevent unnecessary disk writes
         if not is_new and self[key] == v:
             return
+        if patch and self.db:
+            self.db.add_patch('add' if is_new else 'replace', _child_path(self.path, key), v)
+            if not is_new:
+                _detach(self[key])
+        self._pending.discard(key)
+        self._convert_and_set(key, v)
+
+    def _convert_and_set(self, key, v, *, lazy: bool = False):
         # recursively set db and path
-        if isinstance(v, StoredDict):
-            v.db = self.db
-            v.path = self.path + [key]
-            for k, vv in v.items():
-                v[k] = vv
+        if isinstance(v, (StoredDict, StoredList)):
+            v._set_db_and_path(self.db, _child_path(self.path, key))
         # recursively convert dict to StoredDict.
         # _convert_dict is called breadth-first
         elif isinstance(v, dict):
-            if self.db:
-                v = self.db._convert_dict(self.path, key, v)
-            if not self.db or self.db._should_convert_to_stored_dict(key):
-                v = StoredDict(v, self.db, self.path + [key])
+            if lazy and self.db and key not in registered_names and self.db._should_convert_to_stored_dict(key):
+                # keep the elements raw, they get converted on access
+                v = self.db._convert_dict_keys(self.path, key, v)
+                v = StoredDict(v, self.db, _child_path(self.path, key), lazy=True,
+                               items_key=key if key in registered_dicts else None)
+            else:
+                if self.db:
+                    v = self.db._convert_dict(self.path, key, v)
+                if not self.db or self.db._should_convert_to_stored_dict(key):
+                    v = StoredDict(v, self.db, _child_path(self.path, key))
+        elif type(v) is list:
+            v = StoredList(v, self.db, _child_path(self.path, key))
         # convert_value is called depth-first
         if isinstance(v, dict) or isinstance(v, str) or isinstance(v, int):
             if self.db:
                 v = self.db._convert_value(self.path, key, v)
         # set parent of StoredObject
         if isinstance(v, StoredObject):
-            v.set_db(self.db)
+            v.set_db(self.db, _child_path(self.path, key))
         # set item
         dict.__setitem__(self, key, v)
-        if self.db:
-            self.db.set_modified(True)
 
     @locked
     def __delitem__(self, key):
+        r = dict.__getitem__(self, key)
         dict.__delitem__(self, key)
+        if key in self._pending:
+            self._pending.discard(key)
+        else:
+            _detach(r)
         if self.db:
-            self.db.set_modified(True)
+            self.db.add_patch('remove', _child_path(self.path, key))
 
     @locked
     def pop(self, key, v=_RaiseKeyError):
-        if v is _RaiseKeyError:
-            r = dict.pop(self, key)
-        else:
-            r = dict.pop(self, key, v)
+        if key not in self:
+            if v is _RaiseKeyError:
+                raise KeyError(key)
+            return v
+        self._materialize(key)
+        r = dict.pop(self, key)
+        _detach(r)
         if self.db:
-            self.db.set_modified(True)
+            self.db.add_patch('remove', _child_path(self.path, key))
         return r
 
+    @locked
+    def clear(self):
+        for k, v in dict.items(self):
+            if k not in self._pending:
+                _detach(v)
+        dict.clear(self)
+        self._pending.clear()
+        if self.db:
+            self.db.add_patch('replace', self.path, {})
+
+    @locked
+    def update(self, *args, **kwargs):
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    @locked
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    @locked
+    def popitem(self):
+        key = next(reversed(self.keys()))
+        return key, self.pop(key)
+
+
+class StoredList(list):
+    """list in the db tree. Appends are recorded as small patches,
+    other in-place changes replace the whole list.
+    """
+
+    def __init__(self, data, db, path):
+        list.__init__(self, data)
+        self.db = db
+        self.lock = self.db.lock if self.db else threading.RLock()
+        self.path = path
+
+    def _set_db_and_path(self, db, path):
+        self.db = db
+        self.path = path
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(list(self), memo)
+
+    def _replaced(self):
+        if self.db:
+            self.db.add_patch('replace', self.path, list(self))
+
+    @locked
+    def append(self, item):
+        list.append(self, item)
+        if self.db:
+            self.db.add_patch('add', _child_path(self.path, '-'), item)
+
+    @locked
+    def extend(self, items):
+        list.extend(self, items)
+        self._replaced()
+
+    @locked
+    def __iadd__(self, items):
+        list.extend(self, items)
+        self._replaced()
+        return self
+
+    @locked
+    def insert(self, i, item):
+        list.insert(self, i, item)
+        self._replaced()
+
+    @locked
+    def remove(self, item):
+        list.remove(self, item)
+        self._replaced()
+
+    @locked
+    def pop(self, *args):
+        r = list.pop(self, *args)
+        self._replaced()
+        return r
+
+    @locked
+    def clear(self):
+        list.clear(self)
+        self._replaced()
+
+    @locked
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._replaced()
+
+    @locked
+    def reverse(self):
+        list.reverse(self)
+        self._replaced()
+
+    @locked
+    def __setitem__(self, i, item):
+        list.__setitem__(self, i, item)
+        self._replaced()
+
+    @locked
+    def __delitem__(self, i):
+        list.__delitem__(self, i)
+        self._replaced()
+
 
 
 
@@ -172,6 +445,11 @@ class JsonDB(Logger):
         Logger.__init__(self)
         self.lock = threading.RLock()
         self._modified = False
+        # journal: changes are appended to the file as patch records,
+        # instead of rewriting the whole file on every write
+        self._journal_enabled = False
+        self._needs_consolidation = False
+        self.pending_changes = []  # type: List[str]
         # load data
         if data:
             self.load_data(data)
@@ -180,11 +458,33 @@ class JsonDB(Logger):
 
     def load_data(self, s):
         try:
-            self.data = json.loads(s)
+            self.data, patches = self._parse_journal(s)
         except Exception:
             raise WalletFileException("Cannot read wallet file. (parsing failed)")
         if not isinstance(self.data, dict):
             raise WalletFileException("Malformed wallet file (not dict)")
+        if patches:
+            self.logger.info(f"replaying {len(patches)} patches")
+            for patch in patches:
+                apply_patch(self.data, patch)
+
+    def _parse_journal(self, s: str):
+        """Splits the file contents into the snapshot and the list of patch records
+        appended after it. A record at the end of the file that was only partially
+        written (e.g. crash during append) is discarded.
+        """
+        try:
+            items = json.loads('[' + s + ']')
+        except json.JSONDecodeError:
+            # records are written on a single line each, and start with ',\n{'
+            i = s.rfind(',\n{')
+            if i == -1:
+                raise
+            items = json.loads('[' + s[:i] + ']')
+            self.logger.warning(f"discarding incomplete patch record at end of file ({len(s) - i} bytes)")
+            # the discarded bytes are still in the file; new records must not be appended after them
+            self._needs_consolidation = True
+        return items[0], items[1:]
 
     def set_modified(self, b):
         with self.lock:
@@ -193,6 +493,28 @@ class JsonDB(Logger):
     def modified(self):
         return self._modified
 
+    def set_journal_enabled(self, b: bool) -> None:
+        with self.lock:
+            if b and not self._journal_enabled and self.modified():
+                # changes made so far were not recorded as patches
+                self._needs_consolidation = True
+            self._journal_enabled = b
+            if not b:
+                self.pending_changes = []
+
+    def add_patch(self, op: str, path: Optional[Sequence], value=None) -> None:
+        """Records a change of the data tree. 'path' is None for objects
+        that are not attached to the tree.
+        """
+        with self.lock:
+            self._modified = True
+            if not self._journal_enabled or path is None:
+                return
+            patch = {'op': op, 'path': key_path(path)}
+            if op != 'remove':
+                patch['value'] = value
+            self.pending_changes.append(json.dumps(patch, cls=JsonDBJsonEncoder))
+
     @locked
     def get(self, key, default=None):
         v = self.data.get(key)
@@ -212,6 +534,10 @@ class JsonDB(Logger):
             if self.data.get(key) != value:
                 self.data[key] = copy.deepcopy(value)
                 return True
+            if isinstance(value, (dict, list)) and not isinstance(self.data.get(key), (StoredDict, StoredList)):
+                # the stored value might have been changed in place (see get_dict),
+                # which cannot be detected here
+                self.add_patch('replace', [key] if isinstance(self.data, StoredDict) else None, value)
         elif key in self.data:
             self.data.pop(key)
             return True
@@ -230,8 +556,9 @@ class JsonDB(Logger):
         """Serializes the DB as a string.
         'human_readable': makes the json indented and sorted, but this is ~2x slower
         """
+        data = self.data.raw_data() if isinstance(self.data, StoredDict) else self.data
         return json.dumps(
-            self.data,
+            data,
             indent=4 if human_readable else None,
             sort_keys=bool(human_readable),
             cls=JsonDBJsonEncoder,
@@ -242,13 +569,19 @@ class JsonDB(Logger):
 
     def _convert_dict(self, path, key, v):
         if key in registered_dicts:
-            constructor, _type = registered_dicts[key]
-            if _type == dict:
-                v = dict((k, constructor(**x)) for k, x in v.items())
-            elif _type == tuple:
-                v = dict((k, constructor(*x)) for k, x in v.items())
-            else:
-                v = dict((k, constructor(x)) for k, x in v.items())
+            v = dict((k, self._convert_dict_item(key, x)) for k, x in v.items())
+        return self._convert_dict_keys(path, key, v)
+
+    def _convert_dict_item(self, key, x):
+        constructor, _type = registered_dicts[key]
+        if _type == dict:
+            return constructor(**x)
+        elif _type == tuple:
+            return constructor(*x)
+        else:
+            return constructor(x)
+
+    def _convert_dict_keys(self, path, key, v):
         if key in registered_dict_keys:
             convert_key = registered_dict_keys[key]
         elif path and path[-1] in registered_parent_keys:
@@ -278,7 +611,29 @@ class JsonDB(Logger):
             return
         if not self.modified():
             return
+        if self._can_append(storage):
+            self._append_pending_changes(storage)
+        else:
+            self._write_and_consolidate(storage)
+        self.set_modified(False)
+
+    def _can_append(self, storage: 'WalletStorage') -> bool:
+        return (self._journal_enabled
+                and not self._needs_consolidation
+                and isinstance(self.data, StoredDict)
+                and storage.file_exists()
+                and not storage.needs_consolidation())
+
+    def _append_pending_changes(self, storage: 'WalletStorage'):
+        if not self.pending_changes:
+            return
+        s = ''.join(',\n' + x for x in self.pending_changes)
+        storage.append(s)
+        self.pending_changes = []
+
+    def _write_and_consolidate(self, storage: 'WalletStorage'):
         json_str = self.dump(human_readable=not storage.is_encrypted())
         storage.write(json_str)
-        self.set_modified(False)
+        self.pending_changes = []
+        self._needs_consolidation = False
 
@@ -25,6 +25,7 @@
 # SOFTWARE.
 
 from unicodedata import normalize
+import concurrent.futures
 import hashlib
 import re
 from typing import Tuple, TYPE_CHECKING, Union, Sequence, Optional, Dict, List, NamedTuple
@@ -222,7 +223,7 @@ class Software_KeyStore(KeyStore):
         decrypted = ec.decrypt_message(message)
         return decrypted
 
-    def sign_transaction(self, tx, password):
+    def sign_transaction(self, tx, password, *, executor: concurrent.futures.Executor = None):
         if self.is_watching_only():
             return
         # Raise if password is not correct.
@@ -233,7 +234,7 @@ class Software_KeyStore(KeyStore):
             keypairs[k] = self.get_private_key(v, password)
         # Sign
         if keypairs:
-            tx.sign(keypairs)
+            tx.sign(keypairs, executor=executor)
 
     @abstractmethod
     def update_password(self, old_password, new_password):
@@ -19,7 +19,7 @@
 # THE SOFTWARE.
 import enum
 import os
-from collections import namedtuple, defaultdict
+from collections import namedtuple, defaultdict, OrderedDict
 import binascii
 import json
 from enum import IntEnum, Enum
@@ -45,7 +45,7 @@ from .lnonion import decode_onion_error, OnionFailureCode, OnionRoutingFailure
 from . import lnutil
 from .lnutil import (Outpoint, LocalConfig, RemoteConfig, Keypair, OnlyPubkeyKeypair, ChannelConstraints,
                      get_per_commitment_secret_from_seed, secret_to_pubkey, derive_privkey, make_closing_tx,
-                     sign_and_get_sig_string, RevocationStore, derive_blinded_pubkey, Direction, derive_pubkey,
+                     RevocationStore, derive_blinded_pubkey, Direction, derive_pubkey,
                      make_htlc_tx_with_open_channel, make_commitment, make_received_htlc, make_offered_htlc,
                      HTLC_TIMEOUT_WEIGHT, HTLC_SUCCESS_WEIGHT, extract_ctn_from_tx_and_chan, UpdateAddHtlc,
                      funding_output_script, SENT, RECEIVED, LOCAL, REMOTE, HTLCOwner, make_commitment_outputs,
@@ -53,7 +53,7 @@ from .lnutil import (Outpoint, LocalConfig, RemoteConfig, Keypair, OnlyPubkeyKey
                      ShortChannelID, map_htlcs_to_ctx_output_idxs, LNPeerAddr,
                      fee_for_htlc_output, offered_htlc_trim_threshold_sat,
                      received_htlc_trim_threshold_sat, make_commitment_output_to_remote_address,
-                     ChannelType, LNProtocolWarning)
+                     ChannelType, LNProtocolWarning, sign_htlc_sighashes, verify_htlc_sigs)
 from .lnsweep import create_sweeptxs_for_our_ctx, create_sweeptxs_for_their_ctx
 from .lnsweep import create_sweeptx_for_their_revoked_htlc, SweepInfo
 from .lnhtlc import HTLCManager
@@ -163,6 +163,11 @@ class RevokeAndAck(NamedTuple):
 class RemoteCtnTooFarInFuture(Exception): pass
 
 
+class _CachedCommitment(NamedTuple):
+    ctx: PartialTransaction
+    sighash: bytes  # of the funding input
+
+
 def htlcsum(htlcs: Iterable[UpdateAddHtlc]):
     return sum([x.amount_msat for x in htlcs])
 
@@ -621,6 +626,9 @@ class Channel(AbstractChannel):
     forwarding_fee_base_msat = 1000
     forwarding_fee_proportional_millionths = 1
 
+    # max number of commitment txs cached per channel
+    COMMITMENT_CACHE_SIZE = 8
+
     def __repr__(self):
         return "Channel(%s)"%self.get_id_for_log()
 
@@ -653,6 +661,9 @@ class Channel(AbstractChannel):
         self._receive_fail_reasons = {}  # type: Dict[int, (bytes, OnionRoutingFailure)]
         self.should_request_force_close = False
         self.unconfirmed_closing_txid = None # not a state, only for GUI
+        # (subject, ctn, feerate) -> commitment tx. see _get_cached_commitment
+        self._commitment_cache = OrderedDict()  # type: OrderedDict[Tuple[HTLCOwner, int, int], _CachedCommitment]
+        self._commitment_cache_log_version = self.hm.log_version
 
     def get_local_scid_alias(self, *, create_new_if_needed: bool = False) -> Optional[bytes]:
         """Get scid_alias to be used for *outgoing* HTLCs.
@@ -848,7 +859,17 @@ class Channel(AbstractChannel):
 
     def get_payments(self, status=None) -> Mapping[bytes, List[HTLCWithStatus]]:
         out = defaultdict(list)
-        for direction, htlc in self.hm.all_htlcs_ever():
+        def add(direction, htlc, _status):
+            if status and status != _status:
+                return
+            htlc_with_status = HTLCWithStatus(
+                channel_id=self.channel_id, htlc=htlc, direction=direction, status=_status)
+            out[htlc.payment_hash].append(htlc_with_status)
+        # archived htlcs are never inflight
+        if status != 'inflight':
+            for direction, htlc, is_settled in self.hm.get_archived_htlcs():
+                add(direction, htlc, 'settled' if is_settled else 'failed')
+        for direction, htlc in self.hm.all_htlcs_ever(include_archived=False):
             htlc_proposer = LOCAL if direction is SENT else REMOTE
             if self.hm.was_htlc_failed(htlc_id=htlc.htlc_id, htlc_proposer=htlc_proposer):
                 _status = 'failed'
@@ -856,11 +877,7 @@ class Channel(AbstractChannel):
                 _status = 'settled'
             else:
                 _status = 'inflight'
-            if status and status != _status:
-                continue
-            htlc_with_status = HTLCWithStatus(
-                channel_id=self.channel_id, htlc=htlc, direction=direction, status=_status)
-            out[htlc.payment_hash].append(htlc_with_status)
+            add(direction, htlc, _status)
         return out
 
     def open_with_first_pcp(self, remote_pcp: bytes, remote_sig: bytes) -> None:
@@ -1045,8 +1062,9 @@ class Channel(AbstractChannel):
         next_remote_ctn = self.get_next_ctn(REMOTE)
         self.logger.info(f"sign_next_commitment. ctn={next_remote_ctn}")
 
-        pending_remote_commitment = self.get_next_commitment(REMOTE)
-        sig_64 = sign_and_get_sig_string(pending_remote_commitment, self.config[LOCAL], self.config[REMOTE])
+        cached = self._get_cached_commitment(REMOTE, next_remote_ctn)
+        pending_remote_commitment = cached.ctx
+        sig_64 = ecc.ECPrivkey(self.config[LOCAL].multisig_key.privkey).sign(cached.sighash, ecc.sig_string_from_r_and_s)
         self.logger.debug(f"sign_next_commitment. {pending_remote_commitment.serialize()=}. {sig_64.hex()=}")
 
         their_remote_htlc_privkey_number = derive_privkey(
@@ -1054,26 +1072,10 @@ class Channel(AbstractChannel):
             self.config[REMOTE].next_per_commitment_point)
         their_remote_htlc_privkey = their_remote_htlc_privkey_number.to_bytes(32, 'big')
 
-        htlcsigs = []
-        htlc_to_ctx_output_idx_map = map_htlcs_to_ctx_output_idxs(chan=self,
-                                                                  ctx=pending_remote_commitment,
-                                                                  pcp=self.config[REMOTE].next_per_commitment_point,
-                                                                  subject=REMOTE,
-                                                                  ctn=next_remote_ctn)
-        for (direction, htlc), (ctx_output_idx, htlc_relative_idx) in htlc_to_ctx_output_idx_map.items():
-            _script, htlc_tx = make_htlc_tx_with_open_channel(chan=self,
-                                                              pcp=self.config[REMOTE].next_per_commitment_point,
-                                                              subject=REMOTE,
-                                                              ctn=next_remote_ctn,
-                                                              htlc_direction=direction,
-                                                              commit=pending_remote_commitment,
-                                                              ctx_output_idx=ctx_output_idx,
-                                                              htlc=htlc)
-            sig = bfh(htlc_tx.sign_txin(0, their_remote_htlc_privkey))
-            htlc_sig = ecc.sig_string_from_der_sig(sig[:-1])
-            htlcsigs.append((ctx_output_idx, htlc_sig))
-        htlcsigs.sort()
-        htlcsigs = [x[1] for x in htlcsigs]
+        htlc_txs = self._make_htlc_txs(subject=REMOTE, ctn=next_remote_ctn, ctx=pending_remote_commitment,
+                                       pcp=self.config[REMOTE].next_per_commitment_point)
+        htlcsigs = sign_htlc_sighashes(their_remote_htlc_privkey,
+                                       [htlc_tx.calc_sighash(0) for _, _, _, htlc_tx in htlc_txs])
         with self.db_lock:
             self.hm.send_ctx()
         return sig_64, htlcsigs
@@ -1090,9 +1092,9 @@ class Channel(AbstractChannel):
 
         assert len(htlc_sigs) == 0 or type(htlc_sigs[0]) is bytes
 
-        pending_local_commitment = self.get_next_commitment(LOCAL)
-        preimage_hex = pending_local_commitment.serialize_preimage(0)
-        pre_hash = sha256d(bfh(preimage_hex))
+        cached = self._get_cached_commitment(LOCAL, next_local_ctn)
+        pending_local_commitment = cached.ctx
+        pre_hash = cached.sighash
         if not ecc.verify_signature(self.config[REMOTE].multisig_key.pubkey, sig, pre_hash):
             raise LNProtocolWarning(
                 f'failed verifying signature for our updated commitment transaction. '
@@ -1106,51 +1108,48 @@ class Channel(AbstractChannel):
 
         _secret, pcp = self.get_secret_and_point(subject=LOCAL, ctn=next_local_ctn)
 
-        htlc_to_ctx_output_idx_map = map_htlcs_to_ctx_output_idxs(chan=self,
-                                                                  ctx=pending_local_commitment,
-                                                                  pcp=pcp,
-                                                                  subject=LOCAL,
-                                                                  ctn=next_local_ctn)
-        if len(htlc_to_ctx_output_idx_map) != len(htlc_sigs):
-            raise LNProtocolWarning(f'htlc sigs failure. recv {len(htlc_sigs)} sigs, expected {len(htlc_to_ctx_output_idx_map)}')
-        for (direction, htlc), (ctx_output_idx, htlc_relative_idx) in htlc_to_ctx_output_idx_map.items():
-            htlc_sig = htlc_sigs[htlc_relative_idx]
-            self._verify_htlc_sig(htlc=htlc,
-                                  htlc_sig=htlc_sig,
-                                  htlc_direction=direction,
-                                  pcp=pcp,
-                                  ctx=pending_local_commitment,
-                                  ctx_output_idx=ctx_output_idx,
-                                  ctn=next_local_ctn)
-        with self.db_lock:
-            self.hm.recv_ctx()
-            self.config[LOCAL].current_commitment_signature=sig
-            self.config[LOCAL].current_htlc_signatures=htlc_sigs_string
-
-    def _verify_htlc_sig(self, *, htlc: UpdateAddHtlc, htlc_sig: bytes, htlc_direction: Direction,
-                         pcp: bytes, ctx: Transaction, ctx_output_idx: int, ctn: int) -> None:
-        _script, htlc_tx = make_htlc_tx_with_open_channel(chan=self,
-                                                          pcp=pcp,
-                                                          subject=LOCAL,
-                                                          ctn=ctn,
-                                                          htlc_direction=htlc_direction,
-                                                          commit=ctx,
-                                                          ctx_output_idx=ctx_output_idx,
-                                                          htlc=htlc)
-        preimage_hex = htlc_tx.serialize_preimage(0)
-        pre_hash = sha256d(bfh(preimage_hex))
+        htlc_txs = self._make_htlc_txs(subject=LOCAL, ctn=next_local_ctn, ctx=pending_local_commitment, pcp=pcp)
+        if len(htlc_txs) != len(htlc_sigs):
+            raise LNProtocolWarning(f'htlc sigs failure. recv {len(htlc_sigs)} sigs, expected {len(htlc_txs)}')
         remote_htlc_pubkey = derive_pubkey(self.config[REMOTE].htlc_basepoint.pubkey, pcp)
-        if not ecc.verify_signature(remote_htlc_pubkey, htlc_sig, pre_hash):
+        sighashes = [htlc_tx.calc_sighash(0) for _, _, _, htlc_tx in htlc_txs]
+        bad_idx = verify_htlc_sigs(remote_htlc_pubkey, htlc_sigs, sighashes)
+        if bad_idx is not None:
+            htlc_direction, htlc, ctx_output_idx, htlc_tx = htlc_txs[bad_idx]
             raise LNProtocolWarning(
                 f'failed verifying HTLC signatures: {htlc=}, {htlc_direction=}. '
                 f'htlc_tx={htlc_tx.serialize()}. '
-                f'htlc_sig={htlc_sig.hex()}. '
+                f'htlc_sig={htlc_sigs[bad_idx].hex()}. '
                 f'remote_htlc_pubkey={remote_htlc_pubkey.hex()}. '
-                f'pre_hash={pre_hash.hex()}. '
-                f'ctx={ctx.serialize()}. '
+                f'pre_hash={sighashes[bad_idx].hex()}. '
+                f'ctx={pending_local_commitment.serialize()}. '
                 f'ctx_output_idx={ctx_output_idx}. '
-                f'ctn={ctn}. '
+                f'ctn={next_local_ctn}. '
             )
+        with self.db_lock:
+            self.hm.recv_ctx()
+            self.config[LOCAL].current_commitment_signature=sig
+            self.config[LOCAL].current_htlc_signatures=htlc_sigs_string
+
+    def _make_htlc_txs(self, *, subject: HTLCOwner, ctn: int, ctx: Transaction, pcp: bytes,
+                       ) -> List[Tuple[Direction, UpdateAddHtlc, int, PartialTransaction]]:
+        """Returns the second-stage txs spending the HTLC outputs of ctx, in the order of their signatures,
+        as (htlc_direction, htlc, ctx_output_idx, htlc_tx) tuples.
+        """
+        htlc_to_ctx_output_idx_map = map_htlcs_to_ctx_output_idxs(chan=self, ctx=ctx, pcp=pcp, subject=subject, ctn=ctn)
+        htlc_txs = []
+        for (direction, htlc), (ctx_output_idx, htlc_relative_idx) in sorted(
+                htlc_to_ctx_output_idx_map.items(), key=lambda item: item[1][1]):
+            _script, htlc_tx = make_htlc_tx_with_open_channel(chan=self,
+                                                              pcp=pcp,
+                                                              subject=subject,
+                                                              ctn=ctn,
+                                                              htlc_direction=direction,
+                                                              commit=ctx,
+                                                              ctx_output_idx=ctx_output_idx,
+                                                              htlc=htlc)
+            htlc_txs.append((direction, htlc, ctx_output_idx, htlc_tx))
+        return htlc_txs
 
     def get_remote_htlc_sig_for_htlc(self, *, htlc_relative_idx: int) -> bytes:
         data = self.config[LOCAL].current_htlc_signatures
@@ -1162,8 +1161,8 @@ class Channel(AbstractChannel):
     def revoke_current_commitment(self):
         self.logger.info("revoke_current_commitment")
         new_ctn = self.get_latest_ctn(LOCAL)
-        new_ctx = self.get_latest_commitment(LOCAL)
-        if not self.signature_fits(new_ctx):
+        new_ctx = self._get_cached_commitment(LOCAL, new_ctn)
+        if not self._signature_fits_sighash(new_ctx.sighash):
             # this should never fail; as receive_new_commitment already did this test
             raise Exception("refusing to revoke as remote sig does not fit")
         with self.db_lock:
@@ -1381,14 +1380,36 @@ class Channel(AbstractChannel):
             point = secret_to_pubkey(int.from_bytes(secret, 'big'))
         return secret, point
 
+    def _get_cached_commitment(self, subject: HTLCOwner, ctn: int) -> _CachedCommitment:
+        feerate = self.get_feerate(subject, ctn=ctn)
+        key = (subject, ctn, feerate)
+        with self.db_lock:
+            if self._commitment_cache_log_version != self.hm.log_version:
+                # commitments up to the latest ctn are signed, so the log changes only the next ones
+                for k in list(self._commitment_cache):
+                    if k[1] > self.hm.ctn_latest(k[0]):
+                        del self._commitment_cache[k]
+                self._commitment_cache_log_version = self.hm.log_version
+            cached = self._commitment_cache.get(key)
+            if cached is not None:
+                self._commitment_cache.move_to_end(key)
+                return cached
+            secret, point = self.get_secret_and_point(subject, ctn)
+            ctx = self.make_commitment(subject, point, ctn)
+            cached = _CachedCommitment(ctx=ctx, sighash=ctx.calc_sighash(0))
+            self._commitment_cache[key] = cached
+            if len(self._commitment_cache) > self.COMMITMENT_CACHE_SIZE:
+                self._commitment_cache.popitem(last=False)
+            return cached
+
     def get_secret_and_commitment(self, subject: HTLCOwner, *, ctn: int) -> Tuple[Optional[bytes], PartialTransaction]:
+        """Note: the returned ctx is cached, and must not be modified."""
+        # the secret is not cached: the one of a remote ctx becomes known when it is revoked
         secret, point = self.get_secret_and_point(subject, ctn)
-        ctx = self.make_commitment(subject, point, ctn)
-        return secret, ctx
+        return secret, self._get_cached_commitment(subject, ctn).ctx
 
     def get_commitment(self, subject: HTLCOwner, *, ctn: int) -> PartialTransaction:
-        secret, ctx = self.get_secret_and_commitment(subject, ctn=ctn)
-        return ctx
+        return self._get_cached_commitment(subject, ctn).ctx
 
     def get_next_commitment(self, subject: HTLCOwner) -> PartialTransaction:
         ctn = self.get_next_ctn(subject)
@@ -1419,7 +1440,7 @@ class Channel(AbstractChannel):
     def total_msat(self, direction: Direction) -> int:
         """Return the cumulative total msat amount received/sent so far."""
         assert type(direction) is Direction
-        return htlcsum(self.hm.all_settled_htlcs_ever_by_direction(LOCAL, direction))
+        return self.hm.get_settled_msat_by_direction(LOCAL, direction)
 
     def settle_htlc(self, preimage: bytes, htlc_id: int) -> None:
         """Settle/fulfill a pending received HTLC.
@@ -1597,15 +1618,19 @@ class Channel(AbstractChannel):
         return sig, closing_tx
 
     def signature_fits(self, tx: PartialTransaction) -> bool:
+        return self._signature_fits_sighash(tx.calc_sighash(0))
+
+    def _signature_fits_sighash(self, msg_hash: bytes) -> bool:
         remote_sig = self.config[LOCAL].current_commitment_signature
-        preimage_hex = tx.serialize_preimage(0)
-        msg_hash = sha256d(bfh(preimage_hex))
         assert remote_sig
         res = ecc.verify_signature(self.config[REMOTE].multisig_key.pubkey, remote_sig, msg_hash)
         return res
 
     def force_close_tx(self) -> PartialTransaction:
-        tx = self.get_latest_commitment(LOCAL)
+        # note: not the cached ctx, as we sign it
+        ctn = self.get_latest_ctn(LOCAL)
+        secret, point = self.get_secret_and_point(LOCAL, ctn)
+        tx = self.make_commitment(LOCAL, point, ctn)
         assert self.signature_fits(tx)
         tx.sign({self.config[LOCAL].multisig_key.pubkey.hex(): (self.config[LOCAL].multisig_key.privkey, True)})
         remote_sig = self.config[LOCAL].current_commitment_signature
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#
+# Electrum - lightweight Bitcoin client
+# Copyright (C) 2024 The Electrum developers
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from array import array
+from typing import Optional, Iterator, List, Dict, Set, TYPE_CHECKING
+
+from .lnutil import ShortChannelID, LnFeatures
+
+if TYPE_CHECKING:
+    from .channel_db import ChannelInfo, Policy
+
+
+class CompactGraph:
+    """The public channel graph, with integer indices for nodes and channels.
+
+    Channel policies are kept in packed arrays indexed by directed edge,
+    e = 2 * channel_index + direction, where direction 0 is the edge starting
+    at node1 of the channel (as in channel_update.channel_flags).
+    The channels of each node are stored in CSR form: the channel indices of
+    node n are adj_chans[adj_offsets[n]:adj_offsets[n+1]]. The CSR arrays are
+    rebuilt lazily, by get_adjacency, when they are needed for pathfinding; during
+    gossip ingestion, only the number of channels of each node is kept up to date.
+
+    Channel indices are not reused when channels are removed.
+    Note: modifications must be done with the lock of the ChannelDB.
+    """
+
+    def __init__(self):
+        # nodes
+        self.node_ids = []  # type: List[bytes]
+        self.node_index = {}  # type: Dict[bytes, int]
+        self.node_var_onion = array('b')  # 1/0: node_announcement does/doesn't have var_onion_optin, -1: unknown
+        self.node_num_channels = array('i')
+        # channels
+        self.scids = []  # type: List[Optional[ShortChannelID]]  # None if removed
+        self.chan_index = {}  # type: Dict[ShortChannelID, int]
+        self.chan_nodes = array('i')  # 2*c: node1 index, 2*c+1: node2 index
+        self.capacity_sat = array('q')  # -1 if unknown
+        # policies, indexed by directed edge
+        self.has_policy = array('B')
+        self.cltv_expiry_delta = array('H')
+        self.htlc_minimum_msat = array('Q')
+        self.htlc_maximum_msat = array('q')  # -1 if not set
+        self.fee_base_msat = array('I')
+        self.fee_proportional_millionths = array('I')
+        self.channel_flags = array('B')
+        self.message_flags = array('B')
+        self.timestamp = array('Q')
+        self.num_policies = 0
+        # adjacency
+        self.adj_offsets = array('i', [0])
+        self.adj_chans = array('i')
+        self._adj_dirty = False
+        self.num_channels = 0
+
+    def _get_or_add_node(self, node_id: bytes) -> int:
+        n = self.node_index.get(node_id)
+        if n is None:
+            n = len(self.node_ids)
+            self.node_ids.append(node_id)
+            self.node_index[node_id] = n
+            self.node_var_onion.append(-1)
+            self.node_num_channels.append(0)
+            self._adj_dirty = True
+        return n
+
+    def add_channel(self, channel_info: 'ChannelInfo') -> None:
+        scid = channel_info.short_channel_id
+        if scid in self.chan_index:
+            c = self.chan_index[scid]
+            self.capacity_sat[c] = channel_info.capacity_sat if channel_info.capacity_sat is not None else -1
+            return
+        n1 = self._get_or_add_node(channel_info.node1_id)
+        n2 = self._get_or_add_node(channel_info.node2_id)
+        c = len(self.scids)
+        self.scids.append(scid)
+        self.chan_index[scid] = c
+        self.chan_nodes.append(n1)
+        self.chan_nodes.append(n2)
+        self.node_num_channels[n1] += 1
+        self.node_num_channels[n2] += 1
+        self.capacity_sat.append(channel_info.capacity_sat if channel_info.capacity_sat is not None else -1)
+        for direction in (0, 1):
+            self.has_policy.append(0)
+            self.cltv_expiry_delta.append(0)
+            self.htlc_minimum_msat.append(0)
+            self.htlc_maximum_msat.append(-1)
+            self.fee_base_msat.append(0)
+            self.fee_proportional_millionths.append(0)
+            self.channel_flags.append(0)
+            self.message_flags.append(0)
+            self.timestamp.append(0)
+        self.num_channels += 1
+        self._adj_dirty = True
+
+    def remove_channel(self, scid: ShortChannelID) -> None:
+        c = self.chan_index.pop(scid, None)
+        if c is None:
+            return
+        self.scids[c] = None
+        self.node_num_channels[self.chan_nodes[2 * c]] -= 1
+        self.node_num_channels[self.chan_nodes[2 * c + 1]] -= 1
+        for e in (2 * c, 2 * c + 1):
+            if self.has_policy[e]:
+                self.has_policy[e] = 0
+                self.num_policies -= 1
+        self.num_channels -= 1
+        self._adj_dirty = True
+
+    def directed_edge(self, scid: ShortChannelID, start_node: bytes) -> Optional[int]:
+        """Returns the index of the edge of channel scid starting at start_node."""
+        c = self.chan_index.get(scid)
+        if c is None:
+            return None
+        n = self.node_index.get(start_node)
+        if n == self.chan_nodes[2 * c]:
+            return 2 * c
+        if n == self.chan_nodes[2 * c + 1]:
+            return 2 * c + 1
+        return None
+
+    def set_policy(self, policy: 'Policy') -> bool:
+        """Returns False if the channel of the policy is not in the graph."""
+        e = self.directed_edge(policy.short_channel_id, policy.start_node)
+        if e is None:
+            return False
+        if not self.has_policy[e]:
+            self.has_policy[e] = 1
+            self.num_policies += 1
+        self.cltv_expiry_delta[e] = policy.cltv_expiry_delta
+        self.htlc_minimum_msat[e] = policy.htlc_minimum_msat
+        self.htlc_maximum_msat[e] = policy.htlc_maximum_msat if policy.htlc_maximum_msat is not None else -1
+        self.fee_base_msat[e] = policy.fee_base_msat
+        self.fee_proportional_millionths[e] = policy.fee_proportional_millionths
+        self.channel_flags[e] = policy.channel_flags
+        self.message_flags[e] = policy.message_flags
+        self.timestamp[e] = policy.timestamp
+        return True
+
+    def remove_policy(self, scid: ShortChannelID, start_node: bytes) -> None:
+        e = self.directed_edge(scid, start_node)
+        if e is not None and self.has_policy[e]:
+            self.has_policy[e] = 0
+            self.num_policies -= 1
+
+    def _make_policy(self, e: int) -> 'Policy':
+        from .channel_db import Policy
+        htlc_maximum_msat = self.htlc_maximum_msat[e]
+        return Policy(
+            key=self.scids[e >> 1] + self.node_ids[self.chan_nodes[e]],
+            cltv_expiry_delta=self.cltv_expiry_delta[e],
+            htlc_minimum_msat=self.htlc_minimum_msat[e],
+            htlc_maximum_msat=htlc_maximum_msat if htlc_maximum_msat >= 0 else None,
+            fee_base_msat=self.fee_base_msat[e],
+            fee_proportional_millionths=self.fee_proportional_millionths[e],
+            channel_flags=self.channel_flags[e],
+            message_flags=self.message_flags[e],
+            timestamp=self.timestamp[e],
+        )
+
+    def get_policy(self, scid: ShortChannelID, start_node: bytes) -> Optional['Policy']:
+        e = self.directed_edge(scid, start_node)
+        if e is None or not self.has_policy[e]:
+            return None
+        return self._make_policy(e)
+
+    def get_policies(self) -> Iterator['Policy']:
+        for e in range(len(self.has_policy)):
+            if self.has_policy[e] and self.scids[e >> 1] is not None:
+                yield self._make_policy(e)
+
+    def set_node_features(self, node_id: bytes, features: int) -> None:
+        n = self._get_or_add_node(node_id)
+        self.node_var_onion[n] = 1 if LnFeatures(features).supports(LnFeatures.VAR_ONION_OPT) else 0
+
+    def _build_adjacency(self) -> None:
+        self._adj_dirty = False
+        num_nodes = len(self.node_ids)
+        chan_nodes = self.chan_nodes
+        live = [c for c, scid in enumerate(self.scids) if scid is not None]
+        offsets = [0] * (num_nodes + 1)
+        for c in live:
+            offsets[chan_nodes[2 * c] + 1] += 1
+            offsets[chan_nodes[2 * c + 1] + 1] += 1
+        for n in range(num_nodes):
+            offsets[n + 1] += offsets[n]
+        pos = offsets[:-1]
+        adj = [0] * offsets[-1]
+        for c in live:
+            for n in (chan_nodes[2 * c], chan_nodes[2 * c + 1]):
+                adj[pos[n]] = c
+                pos[n] += 1
+        self.adj_offsets = array('i', offsets)
+        self.adj_chans = array('i', adj)
+
+    def get_adjacency(self):
+        """Returns (adj_offsets, adj_chans), rebuilding them if the graph was modified."""
+        if self._adj_dirty:
+            self._build_adjacency()
+        return self.adj_offsets, self.adj_chans
+
+    def has_channels(self, node_id: bytes) -> bool:
+        n = self.node_index.get(node_id)
+        if n is None:
+            return False
+        return self.node_num_channels[n] > 0
+
+    def get_channels_for_node(self, node_id: bytes) -> Set[ShortChannelID]:
+        n = self.node_index.get(node_id)
+        if n is None:
+            return set()
+        adj_offsets, adj_chans = self.get_adjacency()
+        scids = self.scids
+        return {scids[c] for c in adj_chans[adj_offsets[n]:adj_offsets[n + 1]]}
+
+    def get_num_nodes_with_channels(self) -> int:
+        return sum(1 for num in self.node_num_channels if num > 0)
@@ -1,16 +1,38 @@
 from copy import deepcopy
-from typing import Optional, Sequence, Tuple, List, Dict, TYPE_CHECKING, Set
+from typing import Optional, Sequence, Tuple, List, Dict, TYPE_CHECKING, Set, Iterator
 import threading
 
-from .lnutil import SENT, RECEIVED, LOCAL, REMOTE, HTLCOwner, UpdateAddHtlc, Direction, FeeUpdate
+from .lnutil import (SENT, RECEIVED, LOCAL, REMOTE, HTLCOwner, UpdateAddHtlc, Direction, FeeUpdate,
+                     HtlcArchiveCheckpoint)
 from .util import bfh, with_lock
 
 if TYPE_CHECKING:
     from .json_db import StoredDict
 
 
+# An archived HTLC is stored as a list: the fields of UpdateAddHtlc.to_json(),
+# followed by the ctns at which it was added to and removed from the local
+# and remote ctx, and whether it was settled (or failed).
+_ROW_AMOUNT_MSAT = 0
+_ROW_HTLC_ID = 3
+_ROW_ADDED = {LOCAL: 5, REMOTE: 6}
+_ROW_REMOVED = {LOCAL: 7, REMOTE: 8}
+_ROW_SETTLED = 9
+
+
+def _htlc_from_archived_row(row: Sequence) -> UpdateAddHtlc:
+    return UpdateAddHtlc.from_tuple(*row[:5])
+
+
 class HTLCManager:
 
+    # number of irrevocably removed HTLCs that are moved to the archive at once
+    ARCHIVE_CHUNK_SIZE = 1000
+    # max number of chunks archived per revocation, per htlc proposer. A large log
+    # (e.g. of a channel that was opened before the archive existed) is archived
+    # over several revocations, instead of blocking when the channel is loaded.
+    ARCHIVE_CHUNKS_PER_UPDATE = 1
+
     def __init__(self, log:'StoredDict', *, initial_feerate=None):
 
         if len(log) == 0:
@@ -23,6 +45,8 @@ class HTLCManager:
                 'revack_pending': False,
                 'next_htlc_id': 0,
                 'ctn': -1,               # oldest unrevoked ctx of sub
+                'archived_htlcs': {},    # "side who offered htlc" -> chunk_idx -> list of archived htlcs
+                'archive_checkpoints': {},  # "side who offered htlc" -> chunk_idx -> HtlcArchiveCheckpoint
             }
             # note: "htlc_id" keys in dict are str! but due to json_db magic they can *almost* be treated as int...
             log[LOCAL] = deepcopy(initial)
@@ -43,6 +67,8 @@ class HTLCManager:
         # and we ourselves often take log.lock (via StoredDict.__getitem__).
         # Hence, to avoid deadlocks, we reuse this same lock.
         self.lock = log.lock
+        # incremented on every change of the log. Used to invalidate what was computed from it.
+        self.log_version = 0
 
         self._init_maybe_active_htlc_ids()
 
@@ -71,6 +97,7 @@ class HTLCManager:
 
     @with_lock
     def channel_open_finished(self):
+        self.log_version += 1
         self.log[LOCAL]['ctn'] = 0
         self.log[REMOTE]['ctn'] = 0
         self._set_revack_pending(LOCAL, False)
@@ -78,6 +105,7 @@ class HTLCManager:
 
     @with_lock
     def send_htlc(self, htlc: UpdateAddHtlc) -> UpdateAddHtlc:
+        self.log_version += 1
         htlc_id = htlc.htlc_id
         if htlc_id != self.get_next_htlc_id(LOCAL):
             raise Exception(f"unexpected local htlc_id. next should be "
@@ -90,6 +118,7 @@ class HTLCManager:
 
     @with_lock
     def recv_htlc(self, htlc: UpdateAddHtlc) -> None:
+        self.log_version += 1
         htlc_id = htlc.htlc_id
         if htlc_id != self.get_next_htlc_id(REMOTE):
             raise Exception(f"unexpected remote htlc_id. next should be "
@@ -101,6 +130,7 @@ class HTLCManager:
 
     @with_lock
     def send_settle(self, htlc_id: int) -> None:
+        self.log_version += 1
         next_ctn = self.ctn_latest(REMOTE) + 1
         if not self.is_htlc_active_at_ctn(ctx_owner=REMOTE, ctn=next_ctn, htlc_proposer=REMOTE, htlc_id=htlc_id):
             raise Exception(f"(local) cannot remove htlc that is not there...")
@@ -108,6 +138,7 @@ class HTLCManager:
 
     @with_lock
     def recv_settle(self, htlc_id: int) -> None:
+        self.log_version += 1
         next_ctn = self.ctn_latest(LOCAL) + 1
         if not self.is_htlc_active_at_ctn(ctx_owner=LOCAL, ctn=next_ctn, htlc_proposer=LOCAL, htlc_id=htlc_id):
             raise Exception(f"(remote) cannot remove htlc that is not there...")
@@ -115,6 +146,7 @@ class HTLCManager:
 
     @with_lock
     def send_fail(self, htlc_id: int) -> None:
+        self.log_version += 1
         next_ctn = self.ctn_latest(REMOTE) + 1
         if not self.is_htlc_active_at_ctn(ctx_owner=REMOTE, ctn=next_ctn, htlc_proposer=REMOTE, htlc_id=htlc_id):
             raise Exception(f"(local) cannot remove htlc that is not there...")
@@ -122,6 +154,7 @@ class HTLCManager:
 
     @with_lock
     def recv_fail(self, htlc_id: int) -> None:
+        self.log_version += 1
         next_ctn = self.ctn_latest(LOCAL) + 1
         if not self.is_htlc_active_at_ctn(ctx_owner=LOCAL, ctn=next_ctn, htlc_proposer=LOCAL, htlc_id=htlc_id):
             raise Exception(f"(remote) cannot remove htlc that is not there...")
@@ -141,6 +174,7 @@ class HTLCManager:
 
     @with_lock
     def _new_feeupdate(self, fee_update: FeeUpdate, subject: HTLCOwner) -> None:
+        self.log_version += 1
         # overwrite last fee update if not yet committed to by anyone; otherwise append
         d = self.log[subject]['fee_updates']
         #assert type(d) is StoredDict
@@ -154,17 +188,20 @@ class HTLCManager:
 
     @with_lock
     def send_ctx(self) -> None:
+        self.log_version += 1
         assert self.ctn_latest(REMOTE) == self.ctn_oldest_unrevoked(REMOTE), (self.ctn_latest(REMOTE), self.ctn_oldest_unrevoked(REMOTE))
         self._set_revack_pending(REMOTE, True)
         self.log[LOCAL]['was_revoke_last'] = False
 
     @with_lock
     def recv_ctx(self) -> None:
+        self.log_version += 1
         assert self.ctn_latest(LOCAL) == self.ctn_oldest_unrevoked(LOCAL), (self.ctn_latest(LOCAL), self.ctn_oldest_unrevoked(LOCAL))
         self._set_revack_pending(LOCAL, True)
 
     @with_lock
     def send_rev(self) -> None:
+        self.log_version += 1
         self.log[LOCAL]['ctn'] += 1
         self._set_revack_pending(LOCAL, False)
         self.log[LOCAL]['was_revoke_last'] = True
@@ -187,6 +224,7 @@ class HTLCManager:
 
     @with_lock
     def recv_rev(self) -> None:
+        self.log_version += 1
         self.log[REMOTE]['ctn'] += 1
         self._set_revack_pending(REMOTE, False)
         # htlcs
@@ -210,13 +248,15 @@ class HTLCManager:
         self.log[LOCAL]['unacked_updates'].pop(self.log[REMOTE]['ctn'], None)
 
     @with_lock
-    def _update_maybe_active_htlc_ids(self) -> None:
+    def _update_maybe_active_htlc_ids(self, *, max_chunks_to_archive: int = None) -> None:
         # - Loosely, we want a set that contains the htlcs that are
         #   not "removed and revoked from all ctxs of both parties". (self._maybe_active_htlc_ids)
         #   It is guaranteed that those htlcs are in the set, but older htlcs might be there too:
         #   there is a sanity margin of 1 ctn -- this relaxes the care needed re order of method calls.
         # - balance_delta is in sync with maybe_active_htlc_ids. When htlcs are removed from the latter,
         #   balance_delta is updated to reflect that htlc.
+        # - htlcs removed from maybe_active_htlc_ids are moved to the archive, in chunks,
+        #   at most max_chunks_to_archive (default ARCHIVE_CHUNKS_PER_UPDATE) per htlc proposer.
         sanity_margin = 1
         for htlc_proposer in (LOCAL, REMOTE):
             for log_action in ('settles', 'fails'):
@@ -228,35 +268,128 @@ class HTLCManager:
                             and ctns[REMOTE] is not None
                             and ctns[REMOTE] <= self.ctn_oldest_unrevoked(REMOTE) - sanity_margin):
                         self._maybe_active_htlc_ids[htlc_proposer].remove(htlc_id)
+                        self._resolved_htlc_ids[htlc_proposer].add(htlc_id)
                         if log_action == 'settles':
                             htlc = self.log[htlc_proposer]['adds'][htlc_id]  # type: UpdateAddHtlc
                             self._balance_delta -= htlc.amount_msat * htlc_proposer
+        if max_chunks_to_archive is None:
+            max_chunks_to_archive = self.ARCHIVE_CHUNKS_PER_UPDATE
+        for htlc_proposer in (LOCAL, REMOTE):
+            resolved = self._resolved_htlc_ids[htlc_proposer]
+            num_chunks = min(len(resolved) // self.ARCHIVE_CHUNK_SIZE, max_chunks_to_archive)
+            if num_chunks <= 0:
+                continue
+            htlc_ids = sorted(resolved)[:num_chunks * self.ARCHIVE_CHUNK_SIZE]
+            for i in range(0, len(htlc_ids), self.ARCHIVE_CHUNK_SIZE):
+                self._archive_htlcs(htlc_proposer, htlc_ids[i:i + self.ARCHIVE_CHUNK_SIZE])
+            resolved.difference_update(htlc_ids)
 
     @with_lock
     def _init_maybe_active_htlc_ids(self):
         # first idx is "side who offered htlc":
         self._maybe_active_htlc_ids = {LOCAL: set(), REMOTE: set()}  # type: Dict[HTLCOwner, Set[int]]
+        # htlcs that are not in maybe_active_htlc_ids, and not yet archived
+        self._resolved_htlc_ids = {LOCAL: set(), REMOTE: set()}  # type: Dict[HTLCOwner, Set[int]]
         # add all htlcs
         self._balance_delta = 0  # the balance delta of LOCAL since channel open
         for htlc_proposer in (LOCAL, REMOTE):
             for htlc_id in self.log[htlc_proposer]['adds']:
                 self._maybe_active_htlc_ids[htlc_proposer].add(htlc_id)
-        # remove old htlcs
-        self._update_maybe_active_htlc_ids()
+            for checkpoint in self.log[htlc_proposer]['archive_checkpoints'].values():
+                self._balance_delta -= checkpoint.settled_msat * htlc_proposer
+        # remove old htlcs. they are archived later, by send_rev/recv_rev, so that loading is fast
+        self._update_maybe_active_htlc_ids(max_chunks_to_archive=0)
+
+    @with_lock
+    def _archive_htlcs(self, htlc_proposer: HTLCOwner, htlc_ids: Sequence[int]) -> None:
+        """Moves irrevocably removed htlcs from the log to a new chunk of the archive.
+        In the archive, an htlc takes a single list instead of several dicts,
+        and chunks are only read (and converted) when a query needs them.
+        The checkpoint of the chunk is enough to compute balances
+        at ctns after the last htlc of the chunk was removed.
+        """
+        log = self.log[htlc_proposer]
+        rows = []
+        for htlc_id in htlc_ids:
+            htlc = log['adds'][htlc_id]  # type: UpdateAddHtlc
+            added = log['locked_in'][htlc_id]
+            settled = htlc_id in log['settles']
+            removed = log['settles'][htlc_id] if settled else log['fails'][htlc_id]
+            rows.append([htlc.amount_msat, htlc.payment_hash.hex(), htlc.cltv_expiry, htlc.htlc_id, htlc.timestamp,
+                         added[LOCAL], added[REMOTE], removed[LOCAL], removed[REMOTE], settled])
+        chunk_idx = len(log['archive_checkpoints'])
+        log['archived_htlcs'][chunk_idx] = rows
+        log['archive_checkpoints'][chunk_idx] = HtlcArchiveCheckpoint(
+            num_htlcs=len(rows),
+            settled_msat=sum(row[_ROW_AMOUNT_MSAT] for row in rows if row[_ROW_SETTLED]),
+            min_htlc_id=min(htlc_ids),
+            max_htlc_id=max(htlc_ids),
+            min_ctn_local=min(row[_ROW_ADDED[LOCAL]] for row in rows),
+            min_ctn_remote=min(row[_ROW_ADDED[REMOTE]] for row in rows),
+            max_ctn_local=max(row[_ROW_REMOVED[LOCAL]] for row in rows),
+            max_ctn_remote=max(row[_ROW_REMOVED[REMOTE]] for row in rows),
+        )
+        for htlc_id in htlc_ids:
+            del log['adds'][htlc_id]
+            del log['locked_in'][htlc_id]
+            log['settles'].pop(htlc_id, None)
+            log['fails'].pop(htlc_id, None)
+
+    def _get_archived_htlc(self, htlc_proposer: HTLCOwner, htlc_id: int) -> Optional[Sequence]:
+        """Returns the archived row of the htlc, or None if it is not archived."""
+        log = self.log[htlc_proposer]
+        if htlc_id in log['locked_in'] or htlc_id >= log['next_htlc_id']:
+            return None
+        for chunk_idx, checkpoint in log['archive_checkpoints'].items():
+            if checkpoint.min_htlc_id <= htlc_id <= checkpoint.max_htlc_id:
+                for row in log['archived_htlcs'][chunk_idx]:
+                    if row[_ROW_HTLC_ID] == htlc_id:
+                        return row
+        return None
+
+    def _iter_archived_htlcs(self, htlc_proposer: HTLCOwner, *,
+                             ctx_owner: HTLCOwner = None, ctn: int = None) -> Iterator[Sequence]:
+        """Yields the archived rows of htlcs offered by htlc_proposer.
+        If ctn is given, chunks that have no htlc in ctx_owner's ctx at ctn,
+        and no htlc removed at ctn, are skipped.
+        """
+        log = self.log[htlc_proposer]
+        for chunk_idx, checkpoint in log['archive_checkpoints'].items():
+            if ctn is not None and not (checkpoint.first_ctn(ctx_owner) <= ctn <= checkpoint.last_ctn(ctx_owner)):
+                continue
+            yield from log['archived_htlcs'][chunk_idx]
+
+    def _get_archived_settled_msat(self, htlc_proposer: HTLCOwner, ctx_owner: HTLCOwner, ctn: int) -> int:
+        """Returns the sum of archived htlcs offered by htlc_proposer
+        that were settled in ctx_owner's ctx at or before ctn.
+        """
+        log = self.log[htlc_proposer]
+        total = 0
+        for chunk_idx, checkpoint in log['archive_checkpoints'].items():
+            if checkpoint.last_ctn(ctx_owner) <= ctn:
+                total += checkpoint.settled_msat
+            elif checkpoint.first_ctn(ctx_owner) <= ctn:
+                for row in log['archived_htlcs'][chunk_idx]:
+                    if row[_ROW_SETTLED] and row[_ROW_REMOVED[ctx_owner]] <= ctn:
+                        total += row[_ROW_AMOUNT_MSAT]
+        return total
 
     @with_lock
     def discard_unsigned_remote_updates(self):
         """Discard updates sent by the remote, that the remote itself
         did not yet sign (i.e. there was no corresponding commitment_signed msg)
         """
+        self.log_version += 1
         # htlcs added
         for htlc_id, ctns in list(self.log[REMOTE]['locked_in'].items()):
             if ctns[LOCAL] > self.ctn_latest(LOCAL):
                 del self.log[REMOTE]['locked_in'][htlc_id]
                 del self.log[REMOTE]['adds'][htlc_id]
                 self._maybe_active_htlc_ids[REMOTE].discard(htlc_id)
-        if self.log[REMOTE]['locked_in']:
-            self.log[REMOTE]['next_htlc_id'] = max([int(x) for x in self.log[REMOTE]['locked_in'].keys()]) + 1
+        htlc_ids = [int(x) for x in self.log[REMOTE]['locked_in'].keys()]
+        htlc_ids += [checkpoint.max_htlc_id for checkpoint in self.log[REMOTE]['archive_checkpoints'].values()]
+        if htlc_ids:
+            self.log[REMOTE]['next_htlc_id'] = max(htlc_ids) + 1
         else:
             self.log[REMOTE]['next_htlc_id'] = 0
         # htlcs removed
@@ -297,7 +430,10 @@ class HTLCManager:
 
     ##### Queries re HTLCs:
 
+    @with_lock
     def get_htlc_by_id(self, htlc_proposer: HTLCOwner, htlc_id: int) -> UpdateAddHtlc:
+        if (row := self._get_archived_htlc(htlc_proposer, htlc_id)) is not None:
+            return _htlc_from_archived_row(row)
         return self.log[htlc_proposer]['adds'][htlc_id]
 
     @with_lock
@@ -306,9 +442,12 @@ class HTLCManager:
         htlc_id = int(htlc_id)
         if htlc_id >= self.get_next_htlc_id(htlc_proposer):
             return False
+        ctns = self.log[htlc_proposer]['locked_in'].get(htlc_id)
+        if ctns is None:  # archived
+            row = self._get_archived_htlc(htlc_proposer, htlc_id)
+            return row is not None and row[_ROW_ADDED[ctx_owner]] <= ctn < row[_ROW_REMOVED[ctx_owner]]
         settles = self.log[htlc_proposer]['settles']
         fails = self.log[htlc_proposer]['fails']
-        ctns = self.log[htlc_proposer]['locked_in'][htlc_id]
         if ctns[ctx_owner] is not None and ctns[ctx_owner] <= ctn:
             not_settled = htlc_id not in settles or settles[htlc_id][ctx_owner] is None or settles[htlc_id][ctx_owner] > ctn
             not_failed = htlc_id not in fails or fails[htlc_id][ctx_owner] is None or fails[htlc_id][ctx_owner] > ctn
@@ -350,6 +489,8 @@ class HTLCManager:
     ) -> bool:
         if htlc_id >= self.get_next_htlc_id(htlc_proposer):
             return False
+        if htlc_id not in self.log[htlc_proposer]['locked_in']:  # archived
+            return True
         ctns = self.log[htlc_proposer]['locked_in'][htlc_id]
         if ctns[ctx_owner] is None:
             return False
@@ -390,6 +531,8 @@ class HTLCManager:
     ) -> bool:
         if htlc_id >= self.get_next_htlc_id(htlc_proposer):
             return False
+        if htlc_id not in self.log[htlc_proposer]['locked_in']:  # archived
+            return True
         if htlc_id in self.log[htlc_proposer]['settles']:
             ctn_of_settle = self.log[htlc_proposer]['settles'][htlc_id][ctx_owner]
         else:
@@ -423,6 +566,9 @@ class HTLCManager:
             considered_htlc_ids = self._maybe_active_htlc_ids[party]
         else:  # ctn is too old; need to consider full log (slow...)
             considered_htlc_ids = self.log[party]['locked_in']
+            for row in self._iter_archived_htlcs(party, ctx_owner=subject, ctn=ctn):
+                if row[_ROW_ADDED[subject]] <= ctn < row[_ROW_REMOVED[subject]]:
+                    d[row[_ROW_HTLC_ID]] = _htlc_from_archived_row(row)
         for htlc_id in considered_htlc_ids:
             htlc_id = int(htlc_id)
             if self.is_htlc_active_at_ctn(ctx_owner=subject, ctn=ctn, htlc_proposer=party, htlc_id=htlc_id):
@@ -461,14 +607,16 @@ class HTLCManager:
     def was_htlc_preimage_released(self, *, htlc_id: int, htlc_proposer: HTLCOwner) -> bool:
         settles = self.log[htlc_proposer]['settles']
         if htlc_id not in settles:
-            return False
+            row = self._get_archived_htlc(htlc_proposer, htlc_id)
+            return row is not None and bool(row[_ROW_SETTLED])
         return settles[htlc_id][htlc_proposer] is not None
 
     def was_htlc_failed(self, *, htlc_id: int, htlc_proposer: HTLCOwner) -> bool:
         """Returns whether an HTLC has been (or will be if we already know) failed."""
         fails = self.log[htlc_proposer]['fails']
         if htlc_id not in fails:
-            return False
+            row = self._get_archived_htlc(htlc_proposer, htlc_id)
+            return row is not None and not row[_ROW_SETTLED]
         return fails[htlc_id][htlc_proposer] is not None
 
     @with_lock
@@ -484,11 +632,30 @@ class HTLCManager:
         # party is the proposer of the HTLCs
         party = subject if direction == SENT else subject.inverted()
         d = []
+        for row in self._iter_archived_htlcs(party):
+            if row[_ROW_SETTLED] and row[_ROW_REMOVED[subject]] <= ctn:
+                d.append(_htlc_from_archived_row(row))
         for htlc_id, ctns in self.log[party]['settles'].items():
             if ctns[subject] is not None and ctns[subject] <= ctn:
                 d.append(self.log[party]['adds'][htlc_id])
         return d
 
+    @with_lock
+    def get_settled_msat_by_direction(self, subject: HTLCOwner, direction: Direction, ctn: int = None) -> int:
+        """Return the sum of all HTLCs that have been ever settled in subject's
+        ctx up to ctn, filtered to only "direction".
+        Unlike all_settled_htlcs_ever_by_direction, archived htlcs are not read.
+        """
+        assert type(subject) is HTLCOwner
+        if ctn is None:
+            ctn = self.ctn_oldest_unrevoked(subject)
+        party = subject if direction == SENT else subject.inverted()
+        total = self._get_archived_settled_msat(party, subject, ctn)
+        for htlc_id, ctns in self.log[party]['settles'].items():
+            if ctns[subject] is not None and ctns[subject] <= ctn:
+                total += self.log[party]['adds'][htlc_id].amount_msat
+        return total
+
     @with_lock
     def all_settled_htlcs_ever(self, subject: HTLCOwner, ctn: int = None) \
             -> Sequence[Tuple[Direction, UpdateAddHtlc]]:
@@ -503,10 +670,21 @@ class HTLCManager:
         return sent + received
 
     @with_lock
-    def all_htlcs_ever(self) -> Sequence[Tuple[Direction, UpdateAddHtlc]]:
+    def all_htlcs_ever(self, *, include_archived: bool = True) -> Sequence[Tuple[Direction, UpdateAddHtlc]]:
         sent = [(SENT, htlc) for htlc in self.log[LOCAL]['adds'].values()]
         received = [(RECEIVED, htlc) for htlc in self.log[REMOTE]['adds'].values()]
-        return sent + received
+        archived = [(direction, htlc) for direction, htlc, is_settled in self.get_archived_htlcs()] \
+            if include_archived else []
+        return archived + sent + received
+
+    @with_lock
+    def get_archived_htlcs(self) -> Sequence[Tuple[Direction, UpdateAddHtlc, bool]]:
+        """Returns the archived htlcs, which are all irrevocably removed,
+        with whether they were settled (or failed).
+        """
+        return [(direction, _htlc_from_archived_row(row), bool(row[_ROW_SETTLED]))
+                for htlc_proposer, direction in ((LOCAL, SENT), (REMOTE, RECEIVED))
+                for row in self._iter_archived_htlcs(htlc_proposer)]
 
     @with_lock
     def get_balance_msat(self, whose: HTLCOwner, *, ctx_owner=HTLCOwner.LOCAL, ctn: int = None,
@@ -521,7 +699,9 @@ class HTLCManager:
             balance += self._balance_delta * whose
             considered_sent_htlc_ids = self._maybe_active_htlc_ids[whose]
             considered_recv_htlc_ids = self._maybe_active_htlc_ids[-whose]
-        else:  # ctn is too old; need to consider full log (slow...)
+        else:  # ctn is too old; need to consider full log (archived htlcs via checkpoints)
+            balance -= self._get_archived_settled_msat(whose, ctx_owner, ctn)
+            balance += self._get_archived_settled_msat(-whose, ctx_owner, ctn)
             considered_sent_htlc_ids = self.log[whose]['settles']
             considered_recv_htlc_ids = self.log[-whose]['settles']
         # sent htlcs
@@ -544,11 +724,14 @@ class HTLCManager:
     def _get_htlcs_that_got_removed_exactly_at_ctn(
             self, ctn: int, *, ctx_owner: HTLCOwner, htlc_proposer: HTLCOwner, log_action: str,
     ) -> Sequence[UpdateAddHtlc]:
+        htlcs = []
         if ctn >= self.ctn_oldest_unrevoked(ctx_owner):
             considered_htlc_ids = self._maybe_active_htlc_ids[htlc_proposer]
         else:  # ctn is too old; need to consider full log (slow...)
             considered_htlc_ids = self.log[htlc_proposer][log_action]
-        htlcs = []
+            for row in self._iter_archived_htlcs(htlc_proposer, ctx_owner=ctx_owner, ctn=ctn):
+                if row[_ROW_REMOVED[ctx_owner]] == ctn and bool(row[_ROW_SETTLED]) == (log_action == 'settles'):
+                    htlcs.append(_htlc_from_archived_row(row))
         for htlc_id in considered_htlc_ids:
             ctns = self.log[htlc_proposer][log_action].get(htlc_id, None)
             if ctns is None: continue
@@ -1,6 +1,7 @@
 import os
 import csv
 import io
+import struct
 from typing import Callable, Tuple, Any, Dict, List, Sequence, Union, Optional
 from collections import OrderedDict
 
@@ -241,22 +242,6 @@ def _write_field(*, fd: io.BytesIO, field_type: str, count: Union[int, str],
         raise Exception(f"tried to write {len(value)} bytes, but only wrote {nbytes_written}!?")
 
 
-def _read_tlv_record(*, fd: io.BytesIO) -> Tuple[int, bytes]:
-    if not fd: raise Exception()
-    tlv_type = _read_field(fd=fd, field_type="bigsize", count=1)
-    tlv_len = _read_field(fd=fd, field_type="bigsize", count=1)
-    tlv_val = _read_field(fd=fd, field_type="byte", count=tlv_len)
-    return tlv_type, tlv_val
-
-
-def _write_tlv_record(*, fd: io.BytesIO, tlv_type: int, tlv_val: bytes) -> None:
-    if not fd: raise Exception()
-    tlv_len = len(tlv_val)
-    _write_field(fd=fd, field_type="bigsize", count=1, value=tlv_type)
-    _write_field(fd=fd, field_type="bigsize", count=1, value=tlv_len)
-    _write_field(fd=fd, field_type="byte", count=tlv_len, value=tlv_val)
-
-
 def _resolve_field_count(field_count_str: str, *, vars_dict: dict, allow_any=False) -> Union[int, str]:
     """Returns an evaluated field count, typically an int.
     If allow_any is True, the return value can be a str with value=="...".
@@ -288,6 +273,272 @@ def _parse_msgtype_intvalue_for_onion_wire(value: str) -> int:
     return msg_type_int
 
 
+# Message and TLV record schemes are compiled into decoders/encoders when the
+# LNSerializer is created, so that we don't have to interpret the csv rows
+# for every message. Runs of fields with a fixed size are decoded with a
+# single struct.unpack_from, reading in place from the message at an offset.
+# Fields we don't have a specialized codec for use _read_field/_write_field,
+# so that the semantics (and raised exceptions) are those of the generic code.
+
+_INT_FIELD_STRUCT_FORMAT = {'u8': 'B', 'u16': 'H', 'u32': 'I', 'u64': 'Q'}
+_BYTES_FIELD_TYPE_LEN = {
+    'byte': 1,
+    'chain_hash': 32,
+    'channel_id': 32,
+    'sha256': 32,
+    'signature': 64,
+    'point': 33,
+    'short_channel_id': 8,
+}
+_TRUNCATED_INT_FIELD_LEN = {'tu16': 2, 'tu32': 4, 'tu64': 8}
+_FIELD_TYPE_LEN = {'u8': 1, 'u16': 2, 'u32': 4, 'u64': 8, **_BYTES_FIELD_TYPE_LEN}
+
+# (data, pos, parsed) -> new pos
+_FieldsDecoder = Callable[[bytes, int, Dict[str, Any]], int]
+# (values) -> bytes
+_FieldsEncoder = Callable[[Dict[str, Any]], bytes]
+
+
+def _read_bigsize_int_at(data: bytes, pos: int) -> Tuple[Optional[int], int]:
+    """Same as read_bigsize_int, for a buffer and offset instead of a file."""
+    try:
+        first = data[pos]
+    except IndexError:
+        return None, pos  # end of data
+    if first < 0xfd:
+        return first, pos + 1
+    elif first == 0xfd:
+        size, min_val = 2, 0xfd
+    elif first == 0xfe:
+        size, min_val = 4, 0x1_0000
+    else:
+        size, min_val = 8, 0x1_0000_0000
+    end = pos + 1 + size
+    if end > len(data):
+        raise UnexpectedEndOfStream()
+    val = int.from_bytes(data[pos+1:end], byteorder="big", signed=False)
+    if val < min_val:
+        raise FieldEncodingNotMinimal()
+    return val, end
+
+
+def _var_field_count(vars_dict: dict, count_name: str) -> int:
+    field_count = vars_dict[count_name]
+    if isinstance(field_count, (bytes, bytearray)):
+        field_count = int.from_bytes(field_count, byteorder="big")
+    assert isinstance(field_count, int)
+    return field_count
+
+
+def _static_field_count(field_count_str: str) -> Optional[int]:
+    if field_count_str == "":
+        return 1
+    if field_count_str.isdigit():
+        return int(field_count_str)
+    return None
+
+
+def _field_value_to_bytes(value: Union[bytes, int], *, total_len: int, int_ok: bool) -> bytes:
+    if isinstance(value, int) and int_ok:
+        value = int.to_bytes(value, length=total_len, byteorder="big", signed=False)
+    if not isinstance(value, (bytes, bytearray)):
+        raise Exception(f"can only write bytes into fd. got: {value!r}")
+    if total_len != len(value):
+        raise UnexpectedFieldSizeForEncoder(f"expected: {total_len}, got {len(value)}")
+    return value
+
+
+def _compile_fields_decoder(
+        fields: Sequence[Tuple[str, str, str]],
+        *,
+        allow_any: bool,
+        read_tlv_stream: Callable[[bytes, int, str], Dict[str, Dict[str, Any]]] = None,
+) -> _FieldsDecoder:
+    """Returns a decoder for fields, given as (field_name, field_type, field_count_str).
+    If read_tlv_stream is set, a field named "tlvs" is a TLV stream, till the end of data.
+    """
+    steps = []  # type: List[_FieldsDecoder]
+    fixed_names = []  # type: List[str]
+    fixed_formats = []  # type: List[str]
+
+    def flush_fixed():
+        if not fixed_names:
+            return
+        names = tuple(fixed_names)
+        st = struct.Struct(">" + "".join(fixed_formats))
+        size = st.size
+        unpack_from = st.unpack_from
+        def read_fixed(data, pos, parsed):
+            end = pos + size
+            if end > len(data):
+                raise UnexpectedEndOfStream()
+            parsed.update(zip(names, unpack_from(data, pos)))
+            return end
+        steps.append(read_fixed)
+        fixed_names.clear()
+        fixed_formats.clear()
+
+    for field_name, field_type, field_count_str in fields:
+        count = _static_field_count(field_count_str)
+        if read_tlv_stream and field_name == "tlvs":
+            def read_tlvs(data, pos, parsed, tlv_stream_name=field_type):
+                parsed[tlv_stream_name] = read_tlv_stream(data, pos, tlv_stream_name)
+                return len(data)
+            step = read_tlvs
+        elif count is not None and (count == 0 or count == 1 and field_type in _INT_FIELD_STRUCT_FORMAT):
+            fixed_names.append(field_name)
+            fixed_formats.append(_INT_FIELD_STRUCT_FORMAT[field_type] if count else "0s")
+            continue
+        elif count is not None and field_type in _BYTES_FIELD_TYPE_LEN:
+            fixed_names.append(field_name)
+            fixed_formats.append(f"{count * _BYTES_FIELD_TYPE_LEN[field_type]}s")
+            continue
+        elif count == 1 and field_type in _TRUNCATED_INT_FIELD_LEN:
+            def read_truncated_int(data, pos, parsed, name=field_name, type_len=_TRUNCATED_INT_FIELD_LEN[field_type]):
+                raw = data[pos:pos+type_len]
+                if len(raw) > 0 and raw[0] == 0x00:
+                    raise FieldEncodingNotMinimal()
+                parsed[name] = int.from_bytes(raw, byteorder="big", signed=False)
+                return pos + len(raw)
+            step = read_truncated_int
+        elif count == 1 and field_type == "bigsize":
+            def read_bigsize(data, pos, parsed, name=field_name):
+                val, pos = _read_bigsize_int_at(data, pos)
+                if val is None:
+                    raise UnexpectedEndOfStream()
+                parsed[name] = val
+                return pos
+            step = read_bigsize
+        elif field_count_str == "..." and allow_any and field_type not in _INT_FIELD_STRUCT_FORMAT \
+                and field_type not in _TRUNCATED_INT_FIELD_LEN and field_type != "bigsize":
+            def read_remaining(data, pos, parsed, name=field_name):
+                parsed[name] = data[pos:]
+                return len(data)
+            step = read_remaining
+        elif count is None and field_count_str != "..." and field_type in _BYTES_FIELD_TYPE_LEN:
+            def read_var_len(data, pos, parsed, name=field_name, count_name=field_count_str,
+                             type_len=_BYTES_FIELD_TYPE_LEN[field_type]):
+                end = pos + _var_field_count(parsed, count_name) * type_len
+                if end > len(data):
+                    raise UnexpectedEndOfStream()
+                parsed[name] = data[pos:end]
+                return end
+            step = read_var_len
+        else:
+            def read_generic(data, pos, parsed, name=field_name, field_type=field_type, field_count_str=field_count_str):
+                field_count = _resolve_field_count(field_count_str, vars_dict=parsed, allow_any=allow_any)
+                with io.BytesIO(data) as fd:
+                    fd.seek(pos)
+                    parsed[name] = _read_field(fd=fd, field_type=field_type, count=field_count)
+                    return fd.tell()
+            step = read_generic
+        flush_fixed()
+        steps.append(step)
+    flush_fixed()
+
+    if len(steps) == 1:
+        return steps[0]
+    steps = tuple(steps)
+    def decode(data, pos, parsed):
+        for step in steps:
+            pos = step(data, pos, parsed)
+        return pos
+    return decode
+
+
+def _compile_fields_encoder(
+        fields: Sequence[Tuple[str, str, str]],
+        *,
+        allow_any: bool,
+        default_to_zero: bool,
+        write_tlv_stream: Callable[[str, Dict[str, Dict[str, Any]]], bytes] = None,
+) -> _FieldsEncoder:
+    """Returns an encoder for fields, given as (field_name, field_type, field_count_str).
+    If default_to_zero is set, missing fields are encoded as zero, otherwise they raise KeyError.
+    If write_tlv_stream is set, a field named "tlvs" is a TLV stream.
+    """
+    steps = []  # type: List[Callable[[Dict[str, Any], List[bytes]], None]]
+    fixed_fields = []  # type: List[Tuple[str, int, bool]]
+
+    def get_value(values, name):
+        if default_to_zero:
+            return values.get(name, 0)  # default mandatory fields to zero
+        return values[name]
+
+    def flush_fixed():
+        if not fixed_fields:
+            return
+        fields_ = tuple(fixed_fields)
+        def write_fixed(values, out):
+            for name, total_len, int_ok in fields_:
+                value = values.get(name, 0) if default_to_zero else values[name]
+                if type(value) is bytes and len(value) == total_len:
+                    out.append(value)
+                elif type(value) is int and int_ok:
+                    out.append(value.to_bytes(total_len, "big"))
+                else:
+                    out.append(_field_value_to_bytes(value, total_len=total_len, int_ok=int_ok))
+        steps.append(write_fixed)
+        fixed_fields.clear()
+
+    for field_name, field_type, field_count_str in fields:
+        count = _static_field_count(field_count_str)
+        if write_tlv_stream and field_name == "tlvs":
+            def write_tlvs(values, out, tlv_stream_name=field_type):
+                if tlv_stream_name in values:
+                    out.append(write_tlv_stream(tlv_stream_name, values[tlv_stream_name]))
+            step = write_tlvs
+        elif count is not None and count > 0 and field_type in _FIELD_TYPE_LEN:
+            fixed_fields.append((field_name, count * _FIELD_TYPE_LEN[field_type], count == 1 or field_type == 'byte'))
+            continue
+        elif count == 1 and field_type in _TRUNCATED_INT_FIELD_LEN:
+            def write_truncated_int(values, out, name=field_name, type_len=_TRUNCATED_INT_FIELD_LEN[field_type]):
+                value = get_value(values, name)
+                if isinstance(value, int):
+                    value = int.to_bytes(value, length=type_len, byteorder="big", signed=False)
+                if not isinstance(value, (bytes, bytearray)):
+                    raise Exception(f"can only write bytes into fd. got: {value!r}")
+                out.append(value.lstrip(b"\x00"))
+            step = write_truncated_int
+        elif field_count_str == "..." and allow_any and field_type not in _TRUNCATED_INT_FIELD_LEN \
+                and field_type != "bigsize":
+            def write_remaining(values, out, name=field_name):
+                value = get_value(values, name)
+                if not isinstance(value, (bytes, bytearray)):
+                    raise Exception(f"can only write bytes into fd. got: {value!r}")
+                out.append(value)
+            step = write_remaining
+        elif count is None and field_count_str != "..." and field_type in _BYTES_FIELD_TYPE_LEN:
+            def write_var_len(values, out, name=field_name, count_name=field_count_str,
+                              type_len=_BYTES_FIELD_TYPE_LEN[field_type], is_byte=field_type == 'byte'):
+                field_count = _var_field_count(values, count_name)
+                value = get_value(values, name)
+                if field_count == 0:
+                    return
+                out.append(_field_value_to_bytes(value, total_len=field_count * type_len,
+                                                 int_ok=field_count == 1 or is_byte))
+            step = write_var_len
+        else:
+            def write_generic(values, out, name=field_name, field_type=field_type, field_count_str=field_count_str):
+                field_count = _resolve_field_count(field_count_str, vars_dict=values, allow_any=allow_any)
+                value = get_value(values, name)
+                with io.BytesIO() as fd:
+                    _write_field(fd=fd, field_type=field_type, count=field_count, value=value)
+                    out.append(fd.getvalue())
+            step = write_generic
+        flush_fixed()
+        steps.append(step)
+    flush_fixed()
+
+    steps = tuple(steps)
+    def encode(values):
+        out = []  # type: List[bytes]
+        for step in steps:
+            step(values, out)
+        return b"".join(out)
+    return encode
+
+
 class LNSerializer:
 
     def __init__(self, *, for_onion_wire: bool = False):
@@ -351,47 +602,63 @@ class LNSerializer:
                 else:
                     pass  # TODO
 
-    def write_tlv_stream(self, *, fd: io.BytesIO, tlv_stream_name: str, **kwargs) -> None:
-        scheme_map = self.in_tlv_stream_get_tlv_record_scheme_from_type[tlv_stream_name]
-        for tlv_record_type, scheme in scheme_map.items():  # note: tlv_record_type is monotonically increasing
-            tlv_record_name = self.in_tlv_stream_get_record_name_from_type[tlv_stream_name][tlv_record_type]
-            if tlv_record_name not in kwargs:
+        # compile schemes
+        self._msg_codec_from_type = {}  # type: Dict[bytes, Tuple[str, _FieldsDecoder, _FieldsEncoder]]
+        for msg_type_bytes, scheme in self.msg_scheme_from_type.items():
+            fields = [row[2:5] for row in scheme if row[0] == "msgdata"]
+            self._msg_codec_from_type[msg_type_bytes] = (
+                scheme[0][1],
+                _compile_fields_decoder(fields, allow_any=False, read_tlv_stream=self._read_tlv_stream),
+                _compile_fields_encoder(fields, allow_any=False, default_to_zero=True,
+                                        write_tlv_stream=self._write_tlv_stream),
+            )
+        # tlv_stream_name -> tlv_record_type -> (tlv_record_name, decoder, encoder)
+        self._tlv_record_codecs_in_stream = {}  # type: Dict[str, Dict[int, Tuple[str, _FieldsDecoder, _FieldsEncoder]]]
+        for tlv_stream_name, scheme_map in self.in_tlv_stream_get_tlv_record_scheme_from_type.items():
+            codecs = self._tlv_record_codecs_in_stream[tlv_stream_name] = OrderedDict()
+            for tlv_record_type, scheme in scheme_map.items():
+                fields = [row[3:6] for row in scheme if row[0] == "tlvdata"]
+                codecs[tlv_record_type] = (
+                    self.in_tlv_stream_get_record_name_from_type[tlv_stream_name][tlv_record_type],
+                    _compile_fields_decoder(fields, allow_any=True),
+                    _compile_fields_encoder(fields, allow_any=True, default_to_zero=False),
+                )
+
+    def _write_tlv_stream(self, tlv_stream_name: str, records: Dict[str, Dict[str, Any]]) -> bytes:
+        parts = []
+        codecs = self._tlv_record_codecs_in_stream[tlv_stream_name]
+        for tlv_record_type, (tlv_record_name, _, encode) in codecs.items():  # note: tlv_record_type is monotonically increasing
+            if tlv_record_name not in records:
                 continue
-            with io.BytesIO() as tlv_record_fd:
-                for row in scheme:
-                    if row[0] == "tlvtype":
-                        pass
-                    elif row[0] == "tlvdata":
-                        # tlvdata,<tlvstreamname>,<tlvname>,<fieldname>,<typename>,[<count>][,<option>]
-                        assert tlv_stream_name == row[1]
-                        assert tlv_record_name == row[2]
-                        field_name = row[3]
-                        field_type = row[4]
-                        field_count_str = row[5]
-                        field_count = _resolve_field_count(field_count_str,
-                                                           vars_dict=kwargs[tlv_record_name],
-                                                           allow_any=True)
-                        field_value = kwargs[tlv_record_name][field_name]
-                        _write_field(fd=tlv_record_fd,
-                                     field_type=field_type,
-                                     count=field_count,
-                                     value=field_value)
-                    else:
-                        raise Exception(f"unexpected row in scheme: {row!r}")
-                _write_tlv_record(fd=fd, tlv_type=tlv_record_type, tlv_val=tlv_record_fd.getvalue())
+            tlv_record_val = encode(records[tlv_record_name])
+            parts.append(write_bigsize_int(tlv_record_type))
+            parts.append(write_bigsize_int(len(tlv_record_val)))
+            parts.append(tlv_record_val)
+        return b"".join(parts)
 
-    def read_tlv_stream(self, *, fd: io.BytesIO, tlv_stream_name: str) -> Dict[str, Dict[str, Any]]:
+    def write_tlv_stream(self, *, fd: io.BytesIO, tlv_stream_name: str, **kwargs) -> None:
+        fd.write(self._write_tlv_stream(tlv_stream_name, kwargs))
+
+    def _read_tlv_stream(self, data: bytes, pos: int, tlv_stream_name: str) -> Dict[str, Dict[str, Any]]:
+        """Reads the TLV stream in data[pos:]."""
         parsed = {}  # type: Dict[str, Dict[str, Any]]
-        scheme_map = self.in_tlv_stream_get_tlv_record_scheme_from_type[tlv_stream_name]
+        codecs = self._tlv_record_codecs_in_stream[tlv_stream_name]
         last_seen_tlv_record_type = -1  # type: int
-        while _num_remaining_bytes_to_read(fd) > 0:
-            tlv_record_type, tlv_record_val = _read_tlv_record(fd=fd)
+        end = len(data)
+        while pos < end:
+            tlv_record_type, pos = _read_bigsize_int_at(data, pos)
+            tlv_len, pos = _read_bigsize_int_at(data, pos)
+            if tlv_len is None:
+                raise UnexpectedEndOfStream()
+            record_start, pos = pos, pos + tlv_len
+            if pos > end:
+                raise UnexpectedEndOfStream()
             if not (tlv_record_type > last_seen_tlv_record_type):
                 raise MsgInvalidFieldOrder(f"TLV records must be monotonically increasing by type. "
                                            f"cur: {tlv_record_type}. prev: {last_seen_tlv_record_type}")
             last_seen_tlv_record_type = tlv_record_type
             try:
-                scheme = scheme_map[tlv_record_type]
+                tlv_record_name, decode, _ = codecs[tlv_record_type]
             except KeyError:
                 if tlv_record_type % 2 == 0:
                     # unknown "even" type: hard fail
@@ -399,71 +666,23 @@ class LNSerializer:
                 else:
                     # unknown "odd" type: skip it
                     continue
-            tlv_record_name = self.in_tlv_stream_get_record_name_from_type[tlv_stream_name][tlv_record_type]
+            tlv_record_val = data[record_start:pos]
             parsed[tlv_record_name] = {}
-            with io.BytesIO(tlv_record_val) as tlv_record_fd:
-                for row in scheme:
-                    #print(f"row: {row!r}")
-                    if row[0] == "tlvtype":
-                        pass
-                    elif row[0] == "tlvdata":
-                        # tlvdata,<tlvstreamname>,<tlvname>,<fieldname>,<typename>,[<count>][,<option>]
-                        assert tlv_stream_name == row[1]
-                        assert tlv_record_name == row[2]
-                        field_name = row[3]
-                        field_type = row[4]
-                        field_count_str = row[5]
-                        field_count = _resolve_field_count(field_count_str,
-                                                           vars_dict=parsed[tlv_record_name],
-                                                           allow_any=True)
-                        #print(f">> count={field_count}. parsed={parsed}")
-                        parsed[tlv_record_name][field_name] = _read_field(fd=tlv_record_fd,
-                                                                          field_type=field_type,
-                                                                          count=field_count)
-                    else:
-                        raise Exception(f"unexpected row in scheme: {row!r}")
-                if _num_remaining_bytes_to_read(tlv_record_fd) > 0:
-                    raise MsgTrailingGarbage(f"TLV record ({tlv_stream_name}/{tlv_record_name}) has extra trailing garbage")
+            if decode(tlv_record_val, 0, parsed[tlv_record_name]) < tlv_len:
+                raise MsgTrailingGarbage(f"TLV record ({tlv_stream_name}/{tlv_record_name}) has extra trailing garbage")
         return parsed
 
+    def read_tlv_stream(self, *, fd: io.BytesIO, tlv_stream_name: str) -> Dict[str, Dict[str, Any]]:
+        return self._read_tlv_stream(fd.read(), 0, tlv_stream_name)
+
     def encode_msg(self, msg_type: str, **kwargs) -> bytes:
         """
         Encode kwargs into a Lightning message (bytes)
         of the type given in the msg_type string
         """
-        #print(f">>> encode_msg. msg_type={msg_type}, payload={kwargs!r}")
         msg_type_bytes = self.msg_type_from_name[msg_type]
-        scheme = self.msg_scheme_from_type[msg_type_bytes]
-        with io.BytesIO() as fd:
-            fd.write(msg_type_bytes)
-            for row in scheme:
-                if row[0] == "msgtype":
-                    pass
-                elif row[0] == "msgdata":
-                    # msgdata,<msgname>,<fieldname>,<typename>,[<count>][,<option>]
-                    field_name = row[2]
-                    field_type = row[3]
-                    field_count_str = row[4]
-                    #print(f">>> encode_msg. msgdata. field_name={field_name!r}. field_type={field_type!r}. field_count_str={field_count_str!r}")
-                    field_count = _resolve_field_count(field_count_str, vars_dict=kwargs)
-                    if field_name == "tlvs":
-                        tlv_stream_name = field_type
-                        if tlv_stream_name in kwargs:
-                            self.write_tlv_stream(fd=fd, tlv_stream_name=tlv_stream_name, **(kwargs[tlv_stream_name]))
-                        continue
-                    try:
-                        field_value = kwargs[field_name]
-                    except KeyError:
-                        field_value = 0  # default mandatory fields to zero
-                    #print(f">>> encode_msg. writing field: {field_name}. value={field_value!r}. field_type={field_type!r}. count={field_count!r}")
-                    _write_field(fd=fd,
-                                 field_type=field_type,
-                                 count=field_count,
-                                 value=field_value)
-                    #print(f">>> encode_msg. so far: {fd.getvalue().hex()}")
-                else:
-                    raise Exception(f"unexpected row in scheme: {row!r}")
-            return fd.getvalue()
+        _, _, encode = self._msg_codec_from_type[msg_type_bytes]
+        return msg_type_bytes + encode(kwargs)
 
     def decode_msg(self, data: bytes) -> Tuple[str, dict]:
         """
@@ -473,50 +692,25 @@ class LNSerializer:
         Returns message type string and parsed message contents dict,
         or raises FailedToParseMsg.
         """
-        #print(f"decode_msg >>> {data.hex()}")
         assert len(data) >= 2
         msg_type_bytes = data[:2]
         msg_type_int = int.from_bytes(msg_type_bytes, byteorder="big", signed=False)
         try:
-            scheme = self.msg_scheme_from_type[msg_type_bytes]
+            msg_type_name, decode, _ = self._msg_codec_from_type[msg_type_bytes]
         except KeyError:
             if msg_type_int % 2 == 0:  # even types must be understood: "mandatory"
                 raise UnknownMandatoryMsgType(f"msg_type={msg_type_int}")
             else:  # odd types are ok not to understand: "optional"
                 raise UnknownOptionalMsgType(f"msg_type={msg_type_int}")
-        assert scheme[0][2] == msg_type_int
-        msg_type_name = scheme[0][1]
         parsed = {}
         try:
-            with io.BytesIO(data[2:]) as fd:
-                for row in scheme:
-                    #print(f"row: {row!r}")
-                    if row[0] == "msgtype":
-                        pass
-                    elif row[0] == "msgdata":
-                        field_name = row[2]
-                        field_type = row[3]
-                        field_count_str = row[4]
-                        field_count = _resolve_field_count(field_count_str, vars_dict=parsed)
-                        if field_name == "tlvs":
-                            tlv_stream_name = field_type
-                            d = self.read_tlv_stream(fd=fd, tlv_stream_name=tlv_stream_name)
-                            parsed[tlv_stream_name] = d
-                            continue
-                        #print(f">> count={field_count}. parsed={parsed}")
-                        parsed[field_name] = _read_field(
-                            fd=fd,
-                            field_type=field_type,
-                            count=field_count)
-                    else:
-                        raise Exception(f"unexpected row in scheme: {row!r}")
+            decode(data, 2, parsed)
         except FailedToParseMsg as e:
             e.msg_type_int = msg_type_int
             e.msg_type_name = msg_type_name
             raise
         return msg_type_name, parsed
 
-
 _inst = LNSerializer()
 encode_msg = _inst.encode_msg
 decode_msg = _inst.decode_msg
@@ -897,7 +897,7 @@ class Peer(Logger):
             "revocation_store": {},
             "channel_type": channel_type,
         }
-        return StoredDict(chan_dict, self.lnworker.db if self.lnworker else None, [])
+        return StoredDict(chan_dict, self.lnworker.db if self.lnworker else None, None)
 
     async def on_open_channel(self, payload):
         """Implements the channel acceptance flow.
@@ -1430,6 +1430,8 @@ class Peer(Logger):
         if not chan.has_pending_changes(REMOTE):
             return False
         self.logger.info(f'send_commitment. chan {chan.short_channel_id}. ctn: {chan.get_next_ctn(REMOTE)}.')
+        # note: the HTLC signatures are created on the event loop. Awaiting them would let other
+        #       updates of the channel be processed in between, and the order of updates matters.
         sig_64, htlc_sigs = chan.sign_next_commitment()
         self.send_message("commitment_signed", channel_id=chan.channel_id, signature=sig_64, num_htlcs=len(htlc_sigs), htlc_signature=b"".join(htlc_sigs))
         return True
@@ -1521,6 +1523,7 @@ class Peer(Logger):
             raise RemoteMisbehaving('received commitment_signed before we revoked previous ctx')
         data = payload["htlc_signature"]
         htlc_sigs = list(chunks(data, 64))
+        # note: the HTLC signatures are verified on the event loop, see maybe_send_commitment
         chan.receive_new_commitment(payload["signature"], htlc_sigs)
         self.send_revoke_and_ack(chan)
         self.received_commitsig_event.set()
@@ -23,9 +23,9 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import queue
-from collections import defaultdict
-from typing import Sequence, Tuple, Optional, Dict, TYPE_CHECKING, Set
+import heapq
+from collections import defaultdict, OrderedDict
+from typing import Sequence, Tuple, Optional, Dict, TYPE_CHECKING, Set, Callable, Hashable
 import time
 from threading import RLock
 import attr
@@ -35,7 +35,7 @@ from .util import profiler, with_lock
 from .logging import Logger
 from .lnutil import (NUM_MAX_EDGES_IN_PAYMENT_PATH, ShortChannelID, LnFeatures,
                      NBLOCK_CLTV_EXPIRY_TOO_FAR_INTO_FUTURE)
-from .channel_db import ChannelDB, Policy, NodeInfo
+from .channel_db import ChannelDB, ChannelDBNotLoaded, Policy, NodeInfo, FLAG_DISABLE
 
 if TYPE_CHECKING:
     from .lnchannel import Channel
@@ -44,6 +44,8 @@ DEFAULT_PENALTY_BASE_MSAT = 500  # how much base fee we apply for unknown sendin
 DEFAULT_PENALTY_PROPORTIONAL_MILLIONTH = 100  # how much relative fee we apply for unknown sending capability of a channel
 BLACKLIST_DURATION = 3600  # how long (in seconds) a channel remains blacklisted
 HINT_DURATION = 3600  # how long (in seconds) a liquidity hint remains valid
+PATH_CACHE_SIZE = 100  # how many paths LNPathFinder remembers
+PATH_CACHE_MAX_AGE = 60  # how long (in seconds) a cached path is used; hints and blacklist also expire with time
 
 
 class NoChannelPolicy(Exception):
@@ -60,6 +62,16 @@ def fee_for_edge_msat(forwarded_amount_msat: int, fee_base_msat: int, fee_propor
            + (forwarded_amount_msat * fee_proportional_millionths // 1_000_000)
 
 
+def is_edge_sane_to_use(cltv_expiry_delta: int, fee_msat: int, amount_msat: int) -> bool:
+    # TODO revise ad-hoc heuristics
+    # cltv cannot be more than 2 weeks
+    if cltv_expiry_delta > 14 * 144:
+        return False
+    if not is_fee_sane(fee_msat, payment_amount_msat=amount_msat):
+        return False
+    return True
+
+
 @attr.s(slots=True)
 class PathEdge:
     start_node = attr.ib(type=bytes, kw_only=True, repr=lambda val: val.hex())
@@ -106,14 +118,10 @@ class RouteEdge(PathEdge):
             node_features=node_info.features if node_info else 0)
 
     def is_sane_to_use(self, amount_msat: int) -> bool:
-        # TODO revise ad-hoc heuristics
-        # cltv cannot be more than 2 weeks
-        if self.cltv_expiry_delta > 14 * 144:
-            return False
-        total_fee = self.fee_for_edge(amount_msat)
-        if not is_fee_sane(total_fee, payment_amount_msat=amount_msat):
-            return False
-        return True
+        return is_edge_sane_to_use(
+            cltv_expiry_delta=self.cltv_expiry_delta,
+            fee_msat=self.fee_for_edge(amount_msat),
+            amount_msat=amount_msat)
 
     def has_feature_varonion(self) -> bool:
         features = LnFeatures(self.node_features)
@@ -312,6 +320,8 @@ class LiquidityHintMgr:
     def __init__(self):
         self.lock = RLock()
         self._liquidity_hints: Dict[ShortChannelID, LiquidityHint] = {}
+        # incremented whenever the hints or the blacklist change
+        self.version = 0
 
     @with_lock
     def get_hint(self, channel_id: ShortChannelID) -> LiquidityHint:
@@ -325,21 +335,25 @@ class LiquidityHintMgr:
     def update_can_send(self, node_from: bytes, node_to: bytes, channel_id: ShortChannelID, amount: int):
         hint = self.get_hint(channel_id)
         hint.update_can_send(node_from < node_to, amount)
+        self.version += 1
 
     @with_lock
     def update_cannot_send(self, node_from: bytes, node_to: bytes, channel_id: ShortChannelID, amount: int):
         hint = self.get_hint(channel_id)
         hint.update_cannot_send(node_from < node_to, amount)
+        self.version += 1
 
     @with_lock
     def add_htlc(self, node_from: bytes, node_to: bytes, channel_id: ShortChannelID):
         hint = self.get_hint(channel_id)
         hint.add_htlc(node_from < node_to)
+        self.version += 1
 
     @with_lock
     def remove_htlc(self, node_from: bytes, node_to: bytes, channel_id: ShortChannelID):
         hint = self.get_hint(channel_id)
         hint.remove_htlc(node_from < node_to)
+        self.version += 1
 
     def penalty(self, node_from: bytes, node_to: bytes, channel_id: ShortChannelID, amount: int) -> float:
         """Gives a penalty when sending from node1 to node2 over channel_id with an
@@ -384,6 +398,7 @@ class LiquidityHintMgr:
         hint = self.get_hint(channel_id)
         now = int(time.time())
         hint.blacklist_timestamp = now
+        self.version += 1
 
     @with_lock
     def get_blacklist(self) -> Set[ShortChannelID]:
@@ -394,11 +409,13 @@ class LiquidityHintMgr:
     def clear_blacklist(self):
         for k, v in self._liquidity_hints.items():
             v.blacklist_timestamp = 0
+        self.version += 1
 
     @with_lock
     def reset_liquidity_hints(self):
         for k, v in self._liquidity_hints.items():
             v.hint_timestamp = 0
+        self.version += 1
 
     def __repr__(self):
         string = "liquidity hints:\n"
@@ -408,12 +425,55 @@ class LiquidityHintMgr:
         return string
 
 
+class PathCache:
+    """LRU cache of the paths found by LNPathFinder.
+
+    A path is only returned for the versions (of the channel db and of the
+    liquidity hints) it was found with, and if it passes the is_valid check
+    of the caller, since the key does not contain the exact amount.
+    """
+
+    def __init__(self, maxsize: int = PATH_CACHE_SIZE):
+        self.lock = RLock()
+        self.maxsize = maxsize
+        self._paths = OrderedDict()  # type: OrderedDict[Hashable, Tuple[tuple, float, LNPaymentPath]]
+        self.hits = 0
+        self.misses = 0
+
+    @with_lock
+    def get(self, key: Hashable, versions: tuple, is_valid: Callable[[LNPaymentPath], bool]) -> Optional[LNPaymentPath]:
+        item = self._paths.pop(key, None)
+        if item is not None:
+            path_versions, timestamp, path = item
+            if path_versions == versions and time.time() - timestamp < PATH_CACHE_MAX_AGE and is_valid(path):
+                self._paths[key] = item  # most recently used
+                self.hits += 1
+                return list(path)
+        self.misses += 1
+        return None
+
+    @with_lock
+    def put(self, key: Hashable, versions: tuple, path: LNPaymentPath) -> None:
+        self._paths.pop(key, None)
+        self._paths[key] = versions, time.time(), list(path)
+        while len(self._paths) > self.maxsize:
+            self._paths.popitem(last=False)
+
+    @with_lock
+    def clear(self) -> None:
+        self._paths.clear()
+
+    def __len__(self):
+        return len(self._paths)
+
+
 class LNPathFinder(Logger):
 
     def __init__(self, channel_db: ChannelDB):
         Logger.__init__(self)
         self.channel_db = channel_db
         self.liquidity_hints = LiquidityHintMgr()
+        self.path_cache = PathCache()
 
     def update_liquidity_hints(
             self,
@@ -444,65 +504,102 @@ class LNPathFinder(Logger):
             else:
                 self.liquidity_hints.remove_htlc(r.start_node, r.end_node, r.short_channel_id)
 
-    def _edge_cost(
+    @staticmethod
+    def _is_policy_usable(
+            *,
+            is_disabled: bool,
+            has_policy_backwards: bool,
+            end_node_has_varonion: Optional[bool],
+    ) -> bool:
+        """The checks of a channel policy that do not depend on the payment amount.
+        end_node_has_varonion is None if we do not have the node_announcement of the end node.
+        """
+        # channels that did not publish both policies often return temporary channel failure
+        if not has_policy_backwards:
+            return False
+        if is_disabled:
+            return False
+        # it's ok if we are missing the node_announcement (node_info) for this node,
+        # but if we have it, we enforce that they support var_onion_optin
+        if end_node_has_varonion is False:
+            return False
+        return True
+
+    def _get_edge_data(
             self,
             *,
             short_channel_id: bytes,
             start_node: bytes,
             end_node: bytes,
-            payment_amt_msat: int,
-            ignore_costs=False,
             is_mine=False,
             my_channels: Dict[ShortChannelID, 'Channel'] = None,
             private_route_edges: Dict[ShortChannelID, RouteEdge] = None,
-    ) -> Tuple[float, int]:
-        """Heuristic cost (distance metric) of going through a channel.
-        Returns (heuristic_cost, fee_for_edge_msat).
+    ) -> Optional[Tuple[RouteEdge, int, Optional[int], Optional[int]]]:
+        """The part of the edge data that does not depend on the payment amount:
+        (route_edge, htlc_minimum_msat, htlc_maximum_msat, capacity_sat).
+        Returns None if the edge cannot be used.
         """
         if private_route_edges is None:
             private_route_edges = {}
         channel_info = self.channel_db.get_channel_info(
             short_channel_id, my_channels=my_channels, private_route_edges=private_route_edges)
         if channel_info is None:
-            return float('inf'), 0
+            return None
         channel_policy = self.channel_db.get_policy_for_node(
             short_channel_id, start_node, my_channels=my_channels, private_route_edges=private_route_edges)
         if channel_policy is None:
-            return float('inf'), 0
-        # channels that did not publish both policies often return temporary channel failure
+            return None
         channel_policy_backwards = self.channel_db.get_policy_for_node(
             short_channel_id, end_node, my_channels=my_channels, private_route_edges=private_route_edges)
-        if (channel_policy_backwards is None
-                and not is_mine
-                and short_channel_id not in private_route_edges):
-            return float('inf'), 0
-        if channel_policy.is_disabled():
-            return float('inf'), 0
-        if payment_amt_msat < channel_policy.htlc_minimum_msat:
-            return float('inf'), 0  # payment amount too little
-        if channel_info.capacity_sat is not None and \
-                payment_amt_msat // 1000 > channel_info.capacity_sat:
-            return float('inf'), 0  # payment amount too large
-        if channel_policy.htlc_maximum_msat is not None and \
-                payment_amt_msat > channel_policy.htlc_maximum_msat:
-            return float('inf'), 0  # payment amount too large
         route_edge = private_route_edges.get(short_channel_id, None)
+        node_info = None
         if route_edge is None:
             node_info = self.channel_db.get_node_info_for_node_id(node_id=end_node)
-            if node_info:
-                # it's ok if we are missing the node_announcement (node_info) for this node,
-                # but if we have it, we enforce that they support var_onion_optin
-                node_features = LnFeatures(node_info.features)
-                if not node_features.supports(LnFeatures.VAR_ONION_OPT):
-                    return float('inf'), 0
+        if not self._is_policy_usable(
+                is_disabled=channel_policy.is_disabled(),
+                has_policy_backwards=(channel_policy_backwards is not None
+                                      or is_mine
+                                      or short_channel_id in private_route_edges),
+                end_node_has_varonion=(LnFeatures(node_info.features).supports(LnFeatures.VAR_ONION_OPT)
+                                       if node_info else None)):
+            return None
+        if route_edge is None:
             route_edge = RouteEdge.from_channel_policy(
                 channel_policy=channel_policy,
                 short_channel_id=short_channel_id,
                 start_node=start_node,
                 end_node=end_node,
                 node_info=node_info)
-        if not route_edge.is_sane_to_use(payment_amt_msat):
-            return float('inf'), 0  # thanks but no thanks
+        return (route_edge, channel_policy.htlc_minimum_msat, channel_policy.htlc_maximum_msat,
+                channel_info.capacity_sat)
+
+    def _edge_cost_for_amount(
+            self,
+            *,
+            short_channel_id: bytes,
+            start_node: bytes,
+            end_node: bytes,
+            payment_amt_msat: int,
+            htlc_minimum_msat: int,
+            htlc_maximum_msat: Optional[int],
+            capacity_sat: Optional[int],
+            fee_base_msat: int,
+            fee_proportional_millionths: int,
+            cltv_expiry_delta: int,
+            ignore_costs=False,
+    ) -> Tuple[float, int]:
+        """The checks of an edge that depend on the payment amount, and its cost.
+        Returns (heuristic_cost, fee_for_edge_msat).
+        """
+        if payment_amt_msat < htlc_minimum_msat:
+            return inf, 0  # payment amount too little
+        if capacity_sat is not None and payment_amt_msat // 1000 > capacity_sat:
+            return inf, 0  # payment amount too large
+        if htlc_maximum_msat is not None and payment_amt_msat > htlc_maximum_msat:
+            return inf, 0  # payment amount too large
+        fee_msat = fee_for_edge_msat(payment_amt_msat, fee_base_msat, fee_proportional_millionths)
+        if not is_edge_sane_to_use(cltv_expiry_delta, fee_msat, payment_amt_msat):
+            return inf, 0  # thanks but no thanks
         # Distance metric notes:  # TODO constants are ad-hoc
         # ( somewhat based on https://github.com/lightningnetwork/lnd/pull/1358 )
         # - Edges have a base cost. (more edges -> less likely none will fail)
@@ -511,14 +608,107 @@ class LNPathFinder(Logger):
         # - Paying lower fees is better. :)
         if ignore_costs:
             return DEFAULT_PENALTY_BASE_MSAT, 0
-        fee_msat = route_edge.fee_for_edge(payment_amt_msat)
-        cltv_cost = route_edge.cltv_expiry_delta * payment_amt_msat * 15 / 1_000_000_000
+        cltv_cost = cltv_expiry_delta * payment_amt_msat * 15 / 1_000_000_000
         # the liquidty penalty takes care we favor edges that should be able to forward
         # the payment and penalize edges that cannot
         liquidity_penalty = self.liquidity_hints.penalty(start_node, end_node, short_channel_id, payment_amt_msat)
         overall_cost = fee_msat + cltv_cost + liquidity_penalty
         return overall_cost, fee_msat
 
+    def _edge_cost_from_data(
+            self,
+            edge_data: Tuple[RouteEdge, int, Optional[int], Optional[int]],
+            *,
+            short_channel_id: bytes,
+            start_node: bytes,
+            end_node: bytes,
+            payment_amt_msat: int,
+            ignore_costs=False,
+    ) -> Tuple[float, int]:
+        route_edge, htlc_minimum_msat, htlc_maximum_msat, capacity_sat = edge_data
+        return self._edge_cost_for_amount(
+            short_channel_id=short_channel_id,
+            start_node=start_node,
+            end_node=end_node,
+            payment_amt_msat=payment_amt_msat,
+            htlc_minimum_msat=htlc_minimum_msat,
+            htlc_maximum_msat=htlc_maximum_msat,
+            capacity_sat=capacity_sat,
+            fee_base_msat=route_edge.fee_base_msat,
+            fee_proportional_millionths=route_edge.fee_proportional_millionths,
+            cltv_expiry_delta=route_edge.cltv_expiry_delta,
+            ignore_costs=ignore_costs)
+
+    def _edge_cost(
+            self,
+            *,
+            short_channel_id: bytes,
+            start_node: bytes,
+            end_node: bytes,
+            payment_amt_msat: int,
+            ignore_costs=False,
+            is_mine=False,
+            my_channels: Dict[ShortChannelID, 'Channel'] = None,
+            private_route_edges: Dict[ShortChannelID, RouteEdge] = None,
+    ) -> Tuple[float, int]:
+        """Heuristic cost (distance metric) of going through a channel.
+        Returns (heuristic_cost, fee_for_edge_msat).
+        """
+        edge_data = self._get_edge_data(
+            short_channel_id=short_channel_id,
+            start_node=start_node,
+            end_node=end_node,
+            is_mine=is_mine,
+            my_channels=my_channels,
+            private_route_edges=private_route_edges)
+        if edge_data is None:
+            return inf, 0
+        return self._edge_cost_from_data(
+            edge_data,
+            short_channel_id=short_channel_id,
+            start_node=start_node,
+            end_node=end_node,
+            payment_amt_msat=payment_amt_msat,
+            ignore_costs=ignore_costs)
+
+    def _public_edge_cost(
+            self,
+            e: int,
+            *,
+            short_channel_id: bytes,
+            start_node: bytes,
+            end_node: bytes,
+            payment_amt_msat: int,
+            ignore_costs=False,
+    ) -> Tuple[float, int]:
+        """Same as _edge_cost, for a public channel that is neither ours
+        nor in private_route_edges. e is the directed edge in the compact graph.
+        The policy is read from the compact graph, without creating Policy and RouteEdge objects.
+        """
+        graph = self.channel_db.graph
+        if not graph.has_policy[e]:
+            return inf, 0
+        var_onion = graph.node_var_onion[graph.chan_nodes[e ^ 1]]
+        if not self._is_policy_usable(
+                is_disabled=bool(graph.channel_flags[e] & FLAG_DISABLE),
+                has_policy_backwards=bool(graph.has_policy[e ^ 1]),
+                end_node_has_varonion=bool(var_onion) if var_onion >= 0 else None):
+            return inf, 0
+        capacity_sat = graph.capacity_sat[e >> 1]
+        htlc_maximum_msat = graph.htlc_maximum_msat[e]
+        return self._edge_cost_for_amount(
+            short_channel_id=short_channel_id,
+            start_node=start_node,
+            end_node=end_node,
+            payment_amt_msat=payment_amt_msat,
+            htlc_minimum_msat=graph.htlc_minimum_msat[e],
+            htlc_maximum_msat=htlc_maximum_msat if htlc_maximum_msat >= 0 else None,
+            capacity_sat=capacity_sat if capacity_sat >= 0 else None,
+            fee_base_msat=graph.fee_base_msat[e],
+            fee_proportional_millionths=graph.fee_proportional_millionths[e],
+            cltv_expiry_delta=graph.cltv_expiry_delta[e],
+            ignore_costs=ignore_costs)
+
     def get_shortest_path_hops(
             self,
             *,
@@ -530,76 +720,140 @@ class LNPathFinder(Logger):
     ) -> Dict[bytes, PathEdge]:
         # note: we don't lock self.channel_db, so while the path finding runs,
         #       the underlying graph could potentially change... (not good but maybe ~OK?)
+        if not self.channel_db.data_loaded.is_set():
+            raise ChannelDBNotLoaded("channelDB data not loaded yet!")
+        if my_sending_channels is None:
+            my_sending_channels = {}
+        if private_route_edges is None:
+            private_route_edges = {}
+        blacklist = self.liquidity_hints.get_blacklist()
+        graph = self.channel_db.graph
+        adj_offsets, adj_chans = graph.get_adjacency()
+        node_index = graph.node_index
+        node_ids = graph.node_ids
+        chan_nodes = graph.chan_nodes
+        scids = graph.scids
+        # our own channels and private channels, which are not read from the compact graph
+        my_chans_for_node = defaultdict(set)  # type: Dict[bytes, Set[ShortChannelID]]
+        for chan in my_sending_channels.values():
+            my_chans_for_node[chan.node_id].add(chan.short_channel_id)
+            my_chans_for_node[chan.get_local_pubkey()].add(chan.short_channel_id)
+        private_chans_for_node = defaultdict(set)  # type: Dict[bytes, Set[ShortChannelID]]
+        for route_edge in private_route_edges.values():
+            private_chans_for_node[route_edge.start_node].add(route_edge.short_channel_id)
+            private_chans_for_node[route_edge.end_node].add(route_edge.short_channel_id)
+        # (short_channel_id, end_node) -> (start_node, edge data), for edges not in the compact graph
+        edge_data_cache = {}  # type: Dict[Tuple[bytes, bytes], Tuple[Optional[bytes], Optional[tuple]]]
+        is_circular = nodeA == nodeB
 
         # run Dijkstra
         # The search is run in the REVERSE direction, from nodeB to nodeA,
         # to properly calculate compound routing fees.
-        blacklist = self.liquidity_hints.get_blacklist()
-        distance_from_start = defaultdict(lambda: float('inf'))
-        distance_from_start[nodeB] = 0
+        distance_from_start = {nodeB: 0}  # type: Dict[bytes, float]
+        num_hops = {nodeB: 0}  # type: Dict[bytes, int]
         previous_hops = {}  # type: Dict[bytes, PathEdge]
-        nodes_to_explore = queue.PriorityQueue()
-        nodes_to_explore.put((0, invoice_amount_msat, nodeB))  # order of fields (in tuple) matters!
+        nodes_to_explore = [(0, invoice_amount_msat, nodeB)]  # order of fields (in tuple) matters!
 
         # main loop of search
-        while nodes_to_explore.qsize() > 0:
-            dist_to_edge_endnode, amount_msat, edge_endnode = nodes_to_explore.get()
+        while nodes_to_explore:
+            dist_to_edge_endnode, amount_msat, edge_endnode = heapq.heappop(nodes_to_explore)
             if edge_endnode == nodeA and previous_hops:  # previous_hops check for circular paths
                 self.logger.info("found a path")
                 break
-            if dist_to_edge_endnode != distance_from_start[edge_endnode]:
-                # queue.PriorityQueue does not implement decrease_priority,
+            if dist_to_edge_endnode != distance_from_start.get(edge_endnode, inf):
+                # heapq does not implement decrease_priority,
                 # so instead of decreasing priorities, we add items again into the queue.
                 # so there are duplicates in the queue, that we discard now:
                 continue
+            hops = num_hops[edge_endnode] + 1
+            if hops > NUM_MAX_EDGES_IN_PAYMENT_PATH:
+                continue  # the path would not fit into the onion packet
 
-            if nodeA == nodeB:  # we want circular paths
+            if is_circular:  # we want circular paths
                 if not previous_hops:  # in the first node exploration step, we only take receiving channels
-                    channels_for_endnode = self.channel_db.get_channels_for_node(
-                        edge_endnode, my_channels={}, private_route_edges=private_route_edges)
+                    extra_chans = private_chans_for_node.get(edge_endnode, ())
                 else:  # in the next steps, we only take sending channels
-                    channels_for_endnode = self.channel_db.get_channels_for_node(
-                        edge_endnode, my_channels=my_sending_channels, private_route_edges={})
+                    extra_chans = my_chans_for_node.get(edge_endnode, ())
             else:
-                channels_for_endnode = self.channel_db.get_channels_for_node(
-                    edge_endnode, my_channels=my_sending_channels, private_route_edges=private_route_edges)
-
-            for edge_channel_id in channels_for_endnode:
-                assert isinstance(edge_channel_id, bytes)
+                extra_chans = my_chans_for_node.get(edge_endnode, set()) | private_chans_for_node.get(edge_endnode, set())
+            # edges as (short_channel_id, e), where e is the directed edge in the compact graph, or -1
+            edges = []
+            n = node_index.get(edge_endnode)
+            if n is not None:
+                for c in adj_chans[adj_offsets[n]:adj_offsets[n + 1]]:
+                    edge_channel_id = scids[c]
+                    if edge_channel_id in my_sending_channels or edge_channel_id in private_route_edges:
+                        edges.append((edge_channel_id, -1))
+                    else:
+                        edges.append((edge_channel_id, 2 * c if chan_nodes[2 * c + 1] == n else 2 * c + 1))
+            for edge_channel_id in extra_chans:
+                if edge_channel_id not in graph.chan_index:
+                    edges.append((edge_channel_id, -1))
+
+            best_dist_to_nodeA = inf if is_circular else distance_from_start.get(nodeA, inf)
+            for edge_channel_id, e in edges:
                 if blacklist and edge_channel_id in blacklist:
                     continue
-                channel_info = self.channel_db.get_channel_info(
-                    edge_channel_id, my_channels=my_sending_channels, private_route_edges=private_route_edges)
-                if channel_info is None:
-                    continue
-                edge_startnode = channel_info.node2_id if channel_info.node1_id == edge_endnode else channel_info.node1_id
-                is_mine = edge_channel_id in my_sending_channels
-                if is_mine:
-                    if edge_startnode == nodeA:  # payment outgoing, on our channel
-                        if not my_sending_channels[edge_channel_id].can_pay(amount_msat, check_frozen=True):
-                            continue
-                edge_cost, fee_for_edge_msat = self._edge_cost(
-                    short_channel_id=edge_channel_id,
-                    start_node=edge_startnode,
-                    end_node=edge_endnode,
-                    payment_amt_msat=amount_msat,
-                    ignore_costs=(edge_startnode == nodeA),
-                    is_mine=is_mine,
-                    my_channels=my_sending_channels,
-                    private_route_edges=private_route_edges)
-                alt_dist_to_neighbour = distance_from_start[edge_endnode] + edge_cost
-                if alt_dist_to_neighbour < distance_from_start[edge_startnode]:
+                if e >= 0:
+                    edge_startnode = node_ids[chan_nodes[e]]
+                    edge_cost, fee_for_edge_msat = self._public_edge_cost(
+                        e,
+                        short_channel_id=edge_channel_id,
+                        start_node=edge_startnode,
+                        end_node=edge_endnode,
+                        payment_amt_msat=amount_msat,
+                        ignore_costs=(edge_startnode == nodeA))
+                else:
+                    is_mine = edge_channel_id in my_sending_channels
+                    key = (edge_channel_id, edge_endnode)
+                    if key not in edge_data_cache:
+                        channel_info = self.channel_db.get_channel_info(
+                            edge_channel_id, my_channels=my_sending_channels, private_route_edges=private_route_edges)
+                        if channel_info is None:
+                            edge_data_cache[key] = None, None
+                        else:
+                            start_node = channel_info.node2_id if channel_info.node1_id == edge_endnode else channel_info.node1_id
+                            edge_data_cache[key] = start_node, self._get_edge_data(
+                                short_channel_id=edge_channel_id,
+                                start_node=start_node,
+                                end_node=edge_endnode,
+                                is_mine=is_mine,
+                                my_channels=my_sending_channels,
+                                private_route_edges=private_route_edges)
+                    edge_startnode, edge_data = edge_data_cache[key]
+                    if edge_startnode is None:
+                        continue
+                    if is_mine:
+                        if edge_startnode == nodeA:  # payment outgoing, on our channel
+                            if not my_sending_channels[edge_channel_id].can_pay(amount_msat, check_frozen=True):
+                                continue
+                    if edge_data is None:
+                        continue
+                    edge_cost, fee_for_edge_msat = self._edge_cost_from_data(
+                        edge_data,
+                        short_channel_id=edge_channel_id,
+                        start_node=edge_startnode,
+                        end_node=edge_endnode,
+                        payment_amt_msat=amount_msat,
+                        ignore_costs=(edge_startnode == nodeA))
+                alt_dist_to_neighbour = dist_to_edge_endnode + edge_cost
+                if alt_dist_to_neighbour >= best_dist_to_nodeA:
+                    continue  # cannot improve on the path we already have
+                if alt_dist_to_neighbour < distance_from_start.get(edge_startnode, inf):
                     distance_from_start[edge_startnode] = alt_dist_to_neighbour
+                    num_hops[edge_startnode] = hops
                     previous_hops[edge_startnode] = PathEdge(
                         start_node=edge_startnode,
                         end_node=edge_endnode,
                         short_channel_id=ShortChannelID(edge_channel_id))
                     amount_to_forward_msat = amount_msat + fee_for_edge_msat
-                    nodes_to_explore.put((alt_dist_to_neighbour, amount_to_forward_msat, edge_startnode))
+                    heapq.heappush(nodes_to_explore, (alt_dist_to_neighbour, amount_to_forward_msat, edge_startnode))
+                    if edge_startnode == nodeA and not is_circular:
+                        best_dist_to_nodeA = alt_dist_to_neighbour
             # for circular paths, we already explored the end node, but this
             # is also our start node, so set it to unexplored
-            if edge_endnode == nodeB and nodeA == nodeB:
-                distance_from_start[edge_endnode] = float('inf')
+            if edge_endnode == nodeB and is_circular:
+                distance_from_start[edge_endnode] = inf
         return previous_hops
 
     @profiler
@@ -618,6 +872,26 @@ class LNPathFinder(Logger):
         assert type(invoice_amount_msat) is int
         if my_sending_channels is None:
             my_sending_channels = {}
+        if private_route_edges is None:
+            private_route_edges = {}
+
+        # payments of similar amounts (same power of two) share cache entries
+        cache_key = (
+            nodeA, nodeB, invoice_amount_msat.bit_length(),
+            frozenset(my_sending_channels),
+            frozenset((e.short_channel_id, e.start_node, e.end_node, e.fee_base_msat,
+                       e.fee_proportional_millionths, e.cltv_expiry_delta, e.node_features)
+                      for e in private_route_edges.values()))
+        versions = (self.channel_db.graph_version, self.liquidity_hints.version)
+        def is_valid(path: LNPaymentPath) -> bool:
+            return self._is_path_usable(
+                path,
+                invoice_amount_msat=invoice_amount_msat,
+                my_sending_channels=my_sending_channels,
+                private_route_edges=private_route_edges)
+        path = self.path_cache.get(cache_key, versions, is_valid)
+        if path is not None:
+            return path
 
         previous_hops = self.get_shortest_path_hops(
             nodeA=nodeA,
@@ -630,15 +904,48 @@ class LNPathFinder(Logger):
             return None  # no path found
 
         # backtrack from search_end (nodeA) to search_start (nodeB)
-        # FIXME paths cannot be longer than 20 edges (onion packet)...
+        # note: the search does not return paths longer than NUM_MAX_EDGES_IN_PAYMENT_PATH
         edge_startnode = nodeA
         path = []
         while edge_startnode != nodeB or not path:  # second condition for circular paths
             edge = previous_hops[edge_startnode]
             path += [edge]
             edge_startnode = edge.node_id
+        self.path_cache.put(cache_key, versions, path)
         return path
 
+    def _is_path_usable(
+            self,
+            path: LNPaymentPath,
+            *,
+            invoice_amount_msat: int,
+            my_sending_channels: Dict[ShortChannelID, 'Channel'],
+            private_route_edges: Dict[ShortChannelID, RouteEdge],
+    ) -> bool:
+        """Checks that every edge of a path found for a similar amount
+        can forward invoice_amount_msat, as in get_shortest_path_hops.
+        """
+        nodeA = path[0].start_node
+        amount_msat = invoice_amount_msat
+        for edge in reversed(path):
+            is_mine = edge.short_channel_id in my_sending_channels
+            if is_mine and edge.start_node == nodeA:
+                if not my_sending_channels[edge.short_channel_id].can_pay(amount_msat, check_frozen=True):
+                    return False
+            edge_cost, fee_for_edge_msat = self._edge_cost(
+                short_channel_id=edge.short_channel_id,
+                start_node=edge.start_node,
+                end_node=edge.end_node,
+                payment_amt_msat=amount_msat,
+                ignore_costs=(edge.start_node == nodeA),
+                is_mine=is_mine,
+                my_channels=my_sending_channels,
+                private_route_edges=private_route_edges)
+            if edge_cost == inf:
+                return False
+            amount_msat += fee_for_edge_msat
+        return True
+
     def create_route_from_path(
             self,
             path: Optional[LNPaymentPath],
@@ -6,6 +6,7 @@ from enum import IntFlag, IntEnum
 import enum
 import json
 from collections import namedtuple, defaultdict
+from functools import lru_cache
 from typing import NamedTuple, List, Tuple, Mapping, Optional, TYPE_CHECKING, Union, Dict, Set, Sequence
 import re
 import sys
@@ -551,6 +552,9 @@ def secret_to_pubkey(secret: int) -> bytes:
 def privkey_to_pubkey(priv: bytes) -> bytes:
     return ecc.ECPrivkey(priv[:32]).get_public_key_bytes()
 
+# note: the keys of a commitment tx are derived from the same few (basepoint, per_commitment_point)
+#       pairs, for each of its HTLCs
+@lru_cache(maxsize=256)
 def derive_pubkey(basepoint: bytes, per_commitment_point: bytes) -> bytes:
     p = ecc.ECPubkey(basepoint) + ecc.GENERATOR * ecc.string_to_number(sha256(per_commitment_point + basepoint))
     return p.get_public_key_bytes()
@@ -562,6 +566,7 @@ def derive_privkey(secret: int, per_commitment_point: bytes) -> int:
     basepoint %= CURVE_ORDER
     return basepoint
 
+@lru_cache(maxsize=256)
 def derive_blinded_pubkey(basepoint: bytes, per_commitment_point: bytes) -> bytes:
     k1 = ecc.ECPubkey(basepoint) * ecc.string_to_number(sha256(basepoint + per_commitment_point))
     k2 = ecc.ECPubkey(per_commitment_point) * ecc.string_to_number(sha256(per_commitment_point + basepoint))
@@ -585,13 +590,12 @@ def make_htlc_tx_output(amount_msat, local_feerate, revocationpubkey, local_dela
         delayed_pubkey=local_delayedpubkey,
     )
 
-    p2wsh = bitcoin.redeem_script_to_address('p2wsh', script.hex())
     weight = HTLC_SUCCESS_WEIGHT if success else HTLC_TIMEOUT_WEIGHT
     fee = local_feerate * weight
     fee = fee // 1000 * 1000
     final_amount_sat = (amount_msat - fee) // 1000
     assert final_amount_sat > 0, final_amount_sat
-    output = PartialTxOutput.from_address_and_value(p2wsh, final_amount_sat)
+    output = PartialTxOutput(scriptpubkey=bfh(bitcoin.p2wsh_nested_script(script.hex())), value=final_amount_sat)
     return script, output
 
 def make_htlc_tx_witness(remotehtlcsig: bytes, localhtlcsig: bytes,
@@ -797,8 +801,7 @@ def possible_output_idxs_of_htlc_in_ctx(*, chan: 'Channel', pcp: bytes, subject:
                                                       local_htlc_pubkey=htlc_pubkey,
                                                       payment_hash=payment_hash,
                                                       cltv_expiry=cltv_expiry)
-    htlc_address = redeem_script_to_address('p2wsh', preimage_script.hex())
-    candidates = ctx.get_output_idxs_from_address(htlc_address)
+    candidates = ctx.get_output_idxs_from_scriptpubkey(bitcoin.p2wsh_nested_script(preimage_script.hex()))
     return {output_idx for output_idx in candidates
             if ctx.outputs()[output_idx].value == htlc.amount_msat // 1000}
 
@@ -917,8 +920,7 @@ def make_commitment_outputs(*, fees_per_participant: Mapping[HTLCOwner, int], lo
     non_htlc_outputs = [to_local, to_remote]
     htlc_outputs = []
     for script, htlc in htlcs:
-        addr = bitcoin.redeem_script_to_address('p2wsh', script.hex())
-        htlc_outputs.append(PartialTxOutput(scriptpubkey=bfh(address_to_script(addr)),
+        htlc_outputs.append(PartialTxOutput(scriptpubkey=bfh(bitcoin.p2wsh_nested_script(script.hex())),
                                             value=htlc.amount_msat // 1000))
 
     # trim outputs
@@ -1054,6 +1056,25 @@ def sign_and_get_sig_string(tx: PartialTransaction, local_config, remote_config)
     sig_64 = sig_string_from_der_sig(sig[:-1])
     return sig_64
 
+
+def sign_htlc_sighashes(privkey: bytes, sighashes: Sequence[bytes]) -> List[bytes]:
+    """Returns the 64 byte signatures of sighashes.
+    Note: this runs on the asyncio thread, from the commitment_signed handlers of lnpeer.
+    """
+    key = ecc.ECPrivkey(privkey)
+    return [key.sign(sighash, ecc.sig_string_from_r_and_s) for sighash in sighashes]
+
+
+def verify_htlc_sigs(pubkey: bytes, sigs: Sequence[bytes], sighashes: Sequence[bytes]) -> Optional[int]:
+    """Returns the index of the first invalid signature, or None if all are valid."""
+    assert len(sigs) == len(sighashes)
+    key = ECPubkey(pubkey)
+    for i, (sig, sighash) in enumerate(zip(sigs, sighashes)):
+        if not key.verify_message_hash(sig, sighash):
+            return i
+    return None
+
+
 def funding_output_script(local_config, remote_config) -> str:
     return funding_output_script_from_keys(local_config.multisig_key.pubkey, remote_config.multisig_key.pubkey)
 
@@ -1607,6 +1628,25 @@ class UpdateAddHtlc:
         return (self.amount_msat, self.payment_hash, self.cltv_expiry, self.htlc_id, self.timestamp)
 
 
+@stored_in('archive_checkpoints', tuple)
+class HtlcArchiveCheckpoint(NamedTuple):
+    """Summary of a chunk of archived HTLCs (see HTLCManager._archive_htlcs)."""
+    num_htlcs: int
+    settled_msat: int       # sum of the settled HTLCs of the chunk
+    min_htlc_id: int
+    max_htlc_id: int
+    min_ctn_local: int      # first ctn of the local ctx that has an HTLC of the chunk
+    min_ctn_remote: int
+    max_ctn_local: int      # ctn of the local ctx at which the last HTLC of the chunk was removed
+    max_ctn_remote: int
+
+    def first_ctn(self, ctx_owner: HTLCOwner) -> int:
+        return self.min_ctn_local if ctx_owner == LOCAL else self.min_ctn_remote
+
+    def last_ctn(self, ctx_owner: HTLCOwner) -> int:
+        return self.max_ctn_local if ctx_owner == LOCAL else self.max_ctn_remote
+
+
 class OnionFailureCodeMetaFlag(IntFlag):
     BADONION = 0x8000
     PERM     = 0x4000
@@ -4,6 +4,7 @@
 
 import asyncio
 import os
+import sys
 from decimal import Decimal
 import random
 import time
@@ -81,6 +82,7 @@ from .lnutil import ImportedChannelBackupStorage, OnchainChannelBackupStorage
 from .lnchannel import ChannelBackup
 from .channel_db import UpdateStatus, ChannelDBNotLoaded
 from .channel_db import get_mychannel_info, get_mychannel_policy
+from .channel_db import verify_gossip_signatures, GossipSigCheck
 from .submarine_swaps import SwapManager
 from .channel_db import ChannelInfo, Policy
 from .mpp_split import suggest_splits
@@ -536,9 +538,40 @@ class LNWorker(Logger, EventListener, NetworkRetryManager[LNPeerAddr]):
         return peer
 
 
+class GossipStats:
+    """Counts gossip messages and time spent per processing stage."""
+
+    STAGES = ('dedupe', 'verify', 'add')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.num_in = defaultdict(int)  # type: Dict[str, int]
+        self.num_out = defaultdict(int)  # type: Dict[str, int]
+        self.seconds = defaultdict(float)  # type: Dict[str, float]
+
+    def add(self, stage: str, *, num_in: int, num_out: int, seconds: float) -> None:
+        self.num_in[stage] += num_in
+        self.num_out[stage] += num_out
+        self.seconds[stage] += seconds
+
+    def get_throughput(self, stage: str) -> float:
+        """Returns the number of messages per second going into stage."""
+        seconds = self.seconds[stage]
+        return self.num_in[stage] / seconds if seconds else 0
+
+    def __str__(self):
+        return ', '.join(
+            f'{stage}: {self.num_in[stage]} -> {self.num_out[stage]} msgs, {self.get_throughput(stage):.0f} msg/s'
+            for stage in self.STAGES)
+
+
 class LNGossip(LNWorker):
     max_age = 14*24*3600
     LOGGING_SHORTCUT = 'g'
+    # number of signatures per job sent to the verification processes
+    VERIFICATION_BATCH_SIZE = 256
 
     def __init__(self):
         seed = os.urandom(32)
@@ -546,6 +579,8 @@ class LNGossip(LNWorker):
         xprv = node.to_xprv()
         super().__init__(xprv, LNGOSSIP_FEATURES)
         self.unknown_ids = set()
+        self.gossip_stats = GossipStats()
+        self._verification_executor = None  # type: Optional[concurrent.futures.ProcessPoolExecutor]
 
     def start_network(self, network: 'Network'):
         super().start_network(network)
@@ -556,12 +591,25 @@ class LNGossip(LNWorker):
             tg_coro = self.taskgroup.spawn(coro)
             asyncio.run_coroutine_threadsafe(tg_coro, self.network.asyncio_loop)
 
+    async def stop(self):
+        await super().stop()
+        if self._verification_executor is not None:
+            if sys.version_info >= (3, 9):
+                self._verification_executor.shutdown(wait=False, cancel_futures=True)
+            else:  # pending verifications are waited for
+                self._verification_executor.shutdown(wait=False)
+            self._verification_executor = None
+
     async def maintain_db(self):
         await self.channel_db.data_loaded.wait()
         while True:
             if len(self.unknown_ids) == 0:
                 self.channel_db.prune_old_policies(self.max_age)
                 self.channel_db.prune_orphaned_channels()
+            if self.gossip_stats.num_in['dedupe']:
+                self.logger.info(f'gossip processed: {self.gossip_stats}')
+                self.gossip_stats.reset()
+                self.logger.info(f'gossip db writes: {self.channel_db.get_metrics()}')
             await asyncio.sleep(120)
 
     async def add_new_ids(self, ids: Iterable[bytes]):
@@ -603,28 +651,99 @@ class LNGossip(LNWorker):
             progress_percent = 0
         return current_est, total_est, progress_percent
 
+    def get_verification_executor(self) -> Optional[concurrent.futures.Executor]:
+        """Returns the process pool used to verify gossip signatures,
+        or None if they should be verified in a thread."""
+        num_processes = self.config.LIGHTNING_GOSSIP_VERIFICATION_PROCESSES
+        if not num_processes or num_processes <= 0:
+            return None
+        if self._verification_executor is None:
+            self._verification_executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_processes)
+        return self._verification_executor
+
+    async def verify_gossip_signatures(self, sig_checks: Sequence[GossipSigCheck]) -> Optional[int]:
+        """Returns the index of the first invalid signature in sig_checks, or None if all are valid.
+        The signatures are verified in batches in the process pool, if any.
+        """
+        executor = self.get_verification_executor()
+        if executor is None:
+            return await run_in_thread(verify_gossip_signatures, sig_checks)
+        n = self.VERIFICATION_BATCH_SIZE
+        starts = range(0, len(sig_checks), n)
+        results = await asyncio.gather(*[
+            asyncio.wrap_future(executor.submit(verify_gossip_signatures, sig_checks[i:i+n]))
+            for i in starts])
+        for start, res in zip(starts, results):
+            if res is not None:
+                return start + res
+        return None
+
+    async def _verify_gossip_stage(self, msgs: Sequence[dict], get_sig_checks, error_msg) -> None:
+        """Verifies the signatures of msgs, raising InvalidGossipMsg(error_msg(msg)) for the first invalid one."""
+        t0 = time.monotonic()
+        sig_checks = []  # type: List[GossipSigCheck]
+        owners = []  # type: List[int]  # index in msgs, for each sig check
+        def collect_sig_checks():
+            for i, msg in enumerate(msgs):
+                checks = get_sig_checks(msg)
+                sig_checks.extend(checks)
+                owners.extend([i] * len(checks))
+        await run_in_thread(collect_sig_checks)
+        if sig_checks:
+            bad = await self.verify_gossip_signatures(sig_checks)
+            if bad is not None:
+                raise InvalidGossipMsg(error_msg(msgs[owners[bad]]))
+        self.gossip_stats.add('verify', num_in=len(msgs), num_out=len(msgs), seconds=time.monotonic() - t0)
+
+    async def _run_gossip_stage(self, stage: str, msgs: Sequence[dict], func, *args, **kwargs):
+        """Runs func in a thread, as stage of processing msgs.
+        For the 'dedupe' stage, func returns the remaining messages.
+        """
+        t0 = time.monotonic()
+        res = await run_in_thread(partial(func, *args, **kwargs))
+        num_out = len(res) if stage == 'dedupe' else len(msgs)
+        self.gossip_stats.add(stage, num_in=len(msgs), num_out=num_out, seconds=time.monotonic() - t0)
+        return res
+
     async def process_gossip(self, chan_anns, node_anns, chan_upds):
         # note: we run in the originating peer's TaskGroup, so we can safely raise here
         #       and disconnect only from that peer
         await self.channel_db.data_loaded.wait()
+        # backpressure: wait for the sql thread to catch up with db writes
+        await self.channel_db.throttle_writes()
         self.logger.debug(f'process_gossip {len(chan_anns)} {len(node_anns)} {len(chan_upds)}')
+        # Each kind of message goes through three stages: we drop the messages that
+        # would not change the db (already known, older than what we have),
+        # verify the signatures of the remaining ones, and add them to the db.
         # channel announcements
-        def process_chan_anns():
-            for payload in chan_anns:
-                self.channel_db.verify_channel_announcement(payload)
-            self.channel_db.add_channel_announcements(chan_anns)
-        await run_in_thread(process_chan_anns)
+        new_chan_anns = await self._run_gossip_stage(
+            'dedupe', chan_anns, self.channel_db.filter_new_channel_announcements, chan_anns)
+        await self._verify_gossip_stage(
+            new_chan_anns, self.channel_db.get_channel_announcement_sig_checks,
+            lambda payload: 'signature failed')
+        await self._run_gossip_stage(
+            'add', new_chan_anns, self.channel_db.add_channel_announcements, new_chan_anns)
         # node announcements
-        def process_node_anns():
-            for payload in node_anns:
-                self.channel_db.verify_node_announcement(payload)
-            self.channel_db.add_node_announcements(node_anns)
-        await run_in_thread(process_node_anns)
+        new_node_anns = await self._run_gossip_stage(
+            'dedupe', node_anns, self.channel_db.filter_new_node_announcements, node_anns)
+        await self._verify_gossip_stage(
+            new_node_anns, self.channel_db.get_node_announcement_sig_checks,
+            lambda payload: 'signature failed')
+        await self._run_gossip_stage(
+            'add', new_node_anns, self.channel_db.add_node_announcements, new_node_anns)
         # channel updates
-        categorized_chan_upds = await run_in_thread(partial(
-            self.channel_db.add_channel_updates,
-            chan_upds,
-            max_age=self.max_age))
+        # note: updates that are dropped here are still passed to add_channel_updates,
+        #       which categorizes them (e.g. orphaned), and verifies them if it does add them.
+        upds_to_verify = await self._run_gossip_stage(
+            'dedupe', chan_upds, self.channel_db.get_channel_updates_to_verify, chan_upds, max_age=self.max_age)
+        start_nodes = {id(payload): start_node for payload, start_node in upds_to_verify}
+        await self._verify_gossip_stage(
+            [payload for payload, start_node in upds_to_verify],
+            lambda payload: self.channel_db.get_channel_update_sig_checks(payload, start_nodes[id(payload)]),
+            lambda payload: f'failed verifying channel update for {ShortChannelID(payload["short_channel_id"])}')
+        categorized_chan_upds = await self._run_gossip_stage(
+            'add', chan_upds, self.channel_db.add_channel_updates,
+            chan_upds, max_age=self.max_age, verified_ids=set(start_nodes))
         orphaned = categorized_chan_upds.orphaned
         if orphaned:
             self.logger.info(f'adding {len(orphaned)} unknown channel ids')
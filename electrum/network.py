@@ -303,6 +303,7 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self._init_parameters_from_config()
 
         self.taskgroup = None
+        self._headers_verification_executor = None  # type: Optional[concurrent.futures.ProcessPoolExecutor]
 
         # locks
         self.restart_lock = asyncio.Lock()
@@ -794,6 +795,16 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
             return request_type.RELAXED
         return request_type.NORMAL
 
+    def get_headers_verification_executor(self) -> Optional[concurrent.futures.Executor]:
+        """Returns the process pool used to verify chunks of headers,
+        or None if they should be verified in the network thread."""
+        num_processes = self.config.NETWORK_HEADERS_VERIFICATION_PROCESSES
+        if not num_processes or num_processes <= 0:
+            return None
+        if self._headers_verification_executor is None:
+            self._headers_verification_executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_processes)
+        return self._headers_verification_executor
+
     @ignore_exceptions  # do not kill outer taskgroup
     @log_exceptions
     async def _run_new_interface(self, server: ServerAddr):
@@ -1288,6 +1299,12 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
                 if full_shutdown:
                     await group.spawn(self.stop_gossip(full_shutdown=full_shutdown))
         self.taskgroup = None
+        if full_shutdown and self._headers_verification_executor is not None:
+            if sys.version_info >= (3, 9):
+                self._headers_verification_executor.shutdown(wait=False, cancel_futures=True)
+            else:  # pending verifications are waited for
+                self._headers_verification_executor.shutdown(wait=False)
+            self._headers_verification_executor = None
         self.interface = None
         self.interfaces = {}
         self._connecting_ifaces.clear()
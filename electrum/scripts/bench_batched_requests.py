@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+#
+# Benchmark: blockchain.scripthash.get_history requests against a local
+# aiorpcx server, one request per scripthash vs. coalesced by RequestBatcher
+# into JSON-RPC batches. The server delays sending each response message,
+# to emulate the round trip time.
+#
+# usage: bench_batched_requests.py [num_scripthashes] [delay_ms]
+
+import asyncio
+import hashlib
+import sys
+import time
+
+from aiorpcx import RPCSession, serve_rs, connect_rs
+
+from electrum.interface import NotificationSession, RequestBatcher
+from electrum.util import OldTaskGroup
+
+
+NUM_SCRIPTHASHES = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+DELAY = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+CONCURRENCY = 100  # as NetworkJobOnDefaultServer._network_request_semaphore
+
+
+class ServerSession(RPCSession):
+    num_messages = 0
+
+    async def _process_messages_loop(self, recv_message):
+        async def counting_recv_message():
+            message = await recv_message()
+            ServerSession.num_messages += 1
+            return message
+        return await super()._process_messages_loop(counting_recv_message)
+
+    async def _send_message(self, message):
+        await asyncio.sleep(DELAY)
+        return await super()._send_message(message)
+
+    async def handle_request(self, request):
+        return [{'tx_hash': hashlib.sha256(request.args[0].encode()).hexdigest(), 'height': 800_000}]
+
+
+class FakeInterface:
+    debug = False
+
+    class network:
+        debug = False
+
+        class config:
+            NETWORK_MAX_INCOMING_MSG_SIZE = 10_000_000
+
+
+async def main():
+    server = await serve_rs(ServerSession, 'localhost', 0)
+    port = server.sockets[0].getsockname()[1]
+    scripthashes = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(NUM_SCRIPTHASHES)]
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    def session_factory(*args, **kwargs):
+        return NotificationSession(*args, interface=FakeInterface(), **kwargs)
+
+    async with connect_rs('localhost', port, session_factory=session_factory) as session:
+        async def get_history(sh):
+            async with semaphore:
+                return await session.send_request('blockchain.scripthash.get_history', [sh])
+
+        ServerSession.num_messages = 0
+        t0 = time.perf_counter()
+        single = await asyncio.gather(*[get_history(sh) for sh in scripthashes])
+        dt_single = time.perf_counter() - t0
+        print(f"{NUM_SCRIPTHASHES} histories, {DELAY * 1000:.0f} ms round trip, {CONCURRENCY} requests in flight")
+        print(f"one request per scripthash: {dt_single * 1000:8.1f} ms, {ServerSession.num_messages} messages")
+
+        async def get_histories(shs):
+            async with semaphore:
+                return await session.send_batch_request(
+                    [('blockchain.scripthash.get_history', [sh]) for sh in shs])
+
+        batcher = RequestBatcher(get_histories, max_batch_size=50)
+        ServerSession.num_messages = 0
+        async with OldTaskGroup() as group:
+            run_task = await group.spawn(batcher.run(taskgroup=group))
+            t0 = time.perf_counter()
+            batched = await asyncio.gather(*[batcher.request(sh) for sh in scripthashes])
+            dt_batched = time.perf_counter() - t0
+            run_task.cancel()
+        assert batched == single
+        print(f"batched:                    {dt_batched * 1000:8.1f} ms, {ServerSession.num_messages} messages, "
+              f"{batcher.get_metrics()}")
+    server.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
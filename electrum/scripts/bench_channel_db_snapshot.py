@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#
+# Benchmark: ChannelDB.load_data from the gossip sql db (decoding raw messages)
+# vs from the binary graph snapshot, on a synthetic mainnet-sized gossip db.
+#
+# usage: bench_channel_db_snapshot.py [num_nodes] [num_channels]
+
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import shutil
+import tempfile
+import time
+
+from electrum import constants
+from electrum.channel_db import (ChannelDB, create_channel_info, create_policy, create_node_info,
+                                 create_address)
+from electrum.lnmsg import encode_msg
+from electrum.simple_config import SimpleConfig
+from electrum.util import create_and_start_event_loop
+
+
+NUM_NODES = int(sys.argv[1]) if len(sys.argv) > 1 else 15_000
+NUM_CHANNELS = int(sys.argv[2]) if len(sys.argv) > 2 else 60_000
+
+
+def node_id(i: int) -> bytes:
+    return b'\x02' + i.to_bytes(32, 'big')
+
+
+def create_gossip_db(path: str) -> None:
+    rand = random.Random(0)
+    chain_hash = constants.net.rev_genesis_bytes()
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    for stmt in (create_node_info, create_address, create_policy, create_channel_info):
+        c.execute(stmt)
+    for i in range(NUM_NODES):
+        msg = encode_msg(
+            'node_announcement', signature=bytes(64), flen=2, features=b'\x0a\x82',
+            timestamp=1_700_000_000 + i, node_id=node_id(i), rgb_color=b'\x00\x00\x00',
+            alias=(b'node%d' % i).ljust(32, b'\x00'), addrlen=7,
+            addresses=b'\x01\x7f\x00\x00\x01\x26\x07')
+        c.execute("INSERT INTO node_info (node_id, msg) VALUES (?,?)", (node_id(i), msg))
+    for i in range(NUM_CHANNELS):
+        scid = (600_000 + i // 100).to_bytes(3, 'big') + (i % 100).to_bytes(3, 'big') + b'\x00\x01'
+        node1, node2 = sorted(node_id(x) for x in rand.sample(range(NUM_NODES), 2))
+        msg = encode_msg(
+            'channel_announcement', node_signature_1=bytes(64), node_signature_2=bytes(64),
+            bitcoin_signature_1=bytes(64), bitcoin_signature_2=bytes(64), len=0, features=b'',
+            chain_hash=chain_hash, short_channel_id=scid, node_id_1=node1, node_id_2=node2,
+            bitcoin_key_1=node1, bitcoin_key_2=node2)
+        c.execute("INSERT INTO channel_info (short_channel_id, msg) VALUES (?,?)", (scid, msg))
+        for direction, start_node in enumerate((node1, node2)):
+            msg = encode_msg(
+                'channel_update', signature=bytes(64), chain_hash=chain_hash, short_channel_id=scid,
+                timestamp=1_700_000_000 + i, message_flags=b'\x01', channel_flags=bytes([direction]),
+                cltv_expiry_delta=rand.choice([40, 80, 144]), htlc_minimum_msat=1000,
+                fee_base_msat=rand.randrange(0, 2000), fee_proportional_millionths=rand.randrange(0, 1000),
+                htlc_maximum_msat=rand.randrange(10**6, 10**10))
+            c.execute("INSERT INTO policy (key, msg) VALUES (?,?)", (scid + start_node, msg))
+    conn.commit()
+    conn.close()
+
+
+def main():
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    tmpdir = tempfile.mkdtemp()
+
+    class fake_network:
+        config = SimpleConfig({'electrum_path': tmpdir})
+        asyncio_loop = loop
+        interface = None
+
+    def run(coro):
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def load(cdb: ChannelDB) -> float:
+        t0 = time.perf_counter()
+        await cdb.load_data()
+        return time.perf_counter() - t0
+
+    async def stop(cdb: ChannelDB) -> float:
+        t0 = time.perf_counter()
+        cdb.stop()
+        await cdb.stopped_event.wait()
+        return time.perf_counter() - t0
+
+    try:
+        path = ChannelDB.get_file_path(fake_network.config)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        print(f"creating gossip db: {NUM_NODES} nodes, {NUM_CHANNELS} channels, {2 * NUM_CHANNELS} policies")
+        create_gossip_db(path)
+        # cold start: no snapshot yet
+        cdb = ChannelDB(fake_network())
+        dt_sql = run(load(cdb))
+        graph = cdb._channels, cdb.get_node_policies(), cdb._nodes
+        dt_write = run(stop(cdb))
+        print(f"load_data from sql db:   {dt_sql * 1000:8.1f} ms")
+        print(f"write snapshot:          {dt_write * 1000:8.1f} ms, "
+              f"{os.path.getsize(cdb.get_snapshot_path()) / 1e6:.1f} MB")
+        cdb = ChannelDB(fake_network())
+        dt_snapshot = run(load(cdb))
+        assert (cdb._channels, cdb.get_node_policies(), cdb._nodes) == graph
+        run(stop(cdb))
+        print(f"load_data from snapshot: {dt_snapshot * 1000:8.1f} ms")
+        print(f"speedup: {dt_sql / dt_snapshot:.1f}x")
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
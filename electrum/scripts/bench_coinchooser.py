@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#
+# Benchmark: coin selection time and waste of CoinChooserPrivacy and
+# CoinChooserBnB on synthetic UTXO sets (one coin per address).
+# Waste is the fee paid above what the tx size requires, plus the fee
+# of the change output and of spending it later.
+#
+# usage: bench_coinchooser.py [num_utxos ...]
+
+import random
+import sys
+import time
+
+from electrum import descriptor
+from electrum.bitcoin import address_to_script
+from electrum.coinchooser import CoinChooserPrivacy, CoinChooserBnB
+from electrum.simple_config import SimpleConfig
+from electrum.transaction import PartialTxInput, PartialTxOutput, TxOutpoint, TxOutput
+
+
+NUM_UTXOS = [int(x) for x in sys.argv[1:]] or [1000, 5000, 20000]
+NUM_PAYMENTS = 5
+FEE_PER_KB = 10_000  # 10 sat/vbyte
+DUST_THRESHOLD = 546
+CHANGE_ADDR = 'bc1qq2tmmcngng78nllq2pvrkchcdukemtj56uyue0'
+CHANGE_COST_VB = 31 + 68  # p2wpkh output, and input spending it
+
+
+def fee_estimator(size):
+    return SimpleConfig.estimate_fee_for_feerate(FEE_PER_KB, size)
+
+
+def make_coins(rand: random.Random, num_utxos: int):
+    coins = []
+    for i in range(num_utxos):
+        pubkey = (b'\x02' + i.to_bytes(32, 'big')).hex()
+        desc = descriptor.get_singlesig_descriptor_from_legacy_leaf(pubkey=pubkey, script_type='p2wpkh')
+        value = int(rand.lognormvariate(13, 2)) + 1000
+        txin = PartialTxInput(prevout=TxOutpoint(txid=rand.randbytes(32), out_idx=0))
+        txin.script_descriptor = desc
+        txin.witness_utxo = TxOutput(scriptpubkey=desc.expand().output_script, value=value)
+        txin.block_height = 100_000 + i
+        coins.append(txin)
+    return coins
+
+
+def run(name: str, chooser, coins, amount: int):
+    outputs = [PartialTxOutput(scriptpubkey=bytes.fromhex(address_to_script(CHANGE_ADDR)), value=amount)]
+    t0 = time.perf_counter()
+    tx = chooser.make_tx(coins=coins, inputs=[], outputs=outputs, change_addrs=[CHANGE_ADDR],
+                         fee_estimator_vb=fee_estimator, dust_threshold=DUST_THRESHOLD)
+    dt = time.perf_counter() - t0
+    has_change = len(tx.outputs()) > 1
+    waste = tx.get_fee() - fee_estimator(tx.estimated_size())
+    if has_change:
+        waste += fee_estimator(CHANGE_COST_VB)
+    return dt, waste, has_change, len(tx.inputs())
+
+
+def main():
+    rand = random.Random(0)
+    for num_utxos in NUM_UTXOS:
+        coins = make_coins(rand, num_utxos)
+        amounts = [int(rand.lognormvariate(15, 1.5)) for i in range(NUM_PAYMENTS)]
+        print(f"{num_utxos} utxos, {NUM_PAYMENTS} payments")
+        for name, klass in (('Privacy', CoinChooserPrivacy), ('BranchAndBound', CoinChooserBnB)):
+            results = [run(name, klass(enable_output_value_rounding=False), coins, amount) for amount in amounts]
+            dt = sum(r[0] for r in results) / len(results)
+            waste = sum(r[1] for r in results) / len(results)
+            changeless = sum(not r[2] for r in results)
+            num_inputs = sum(r[3] for r in results) / len(results)
+            print(f"  {name:15s} {dt * 1000:9.1f} ms/tx, waste {waste:8.0f} sat, "
+                  f"changeless {changeless}/{len(results)}, {num_inputs:.1f} inputs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#
+# Benchmark: ChannelDB gossip db writes, as done during initial sync:
+# for every channel, the channel announcement and two channel updates
+# are saved, and a node announcement for every fourth channel.
+# Measures the time until all writes are on disk.
+#
+# usage: bench_gossip_db_writes.py [num_channels]
+
+import asyncio
+import random
+import sys
+import shutil
+import tempfile
+import time
+
+from electrum.channel_db import ChannelDB
+from electrum.lnutil import ShortChannelID
+from electrum.simple_config import SimpleConfig
+from electrum.sql_db import sql
+from electrum.util import create_and_start_event_loop
+
+
+NUM_CHANNELS = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+
+
+class BenchChannelDB(ChannelDB):
+
+    @sql
+    def _barrier(self):
+        """Returns once all previously queued requests are executed."""
+        pass
+
+
+def main():
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    tmpdir = tempfile.mkdtemp()
+    rand = random.Random(0)
+    node_ids = [b'\x02' + rand.randbytes(32) for i in range(NUM_CHANNELS // 4)]
+
+    async def run():
+        config = SimpleConfig({'electrum_path': tmpdir})
+
+        class fake_network:
+            asyncio_loop = loop
+            interface = None
+        fake_network.config = config
+        cdb = BenchChannelDB(fake_network())
+        t0 = time.perf_counter()
+        for i in range(NUM_CHANNELS):
+            scid = ShortChannelID.from_components(600_000 + i // 100, i % 100, 1)
+            cdb._db_save_channel(scid, rand.randbytes(430))
+            cdb._db_save_policy(scid + node_ids[i // 4], rand.randbytes(138))
+            cdb._db_save_policy(scid + node_ids[(i + 1) // 4 % len(node_ids)], rand.randbytes(138))
+            if i % 4 == 0:
+                cdb._db_save_node_info(node_ids[i // 4], rand.randbytes(180))
+        t_queue = time.perf_counter() - t0
+        await cdb._barrier()
+        cdb.stop()
+        await cdb.stopped_event.wait()
+        dt = time.perf_counter() - t0
+        num_writes = NUM_CHANNELS * 3 + len(node_ids)
+        print(f"{num_writes} writes: queued in {t_queue * 1000:8.1f} ms, on disk after {dt * 1000:8.1f} ms "
+              f"({dt / num_writes * 1e6:5.1f} us/write)")
+        if hasattr(cdb, 'get_metrics'):
+            print(f"    {cdb.get_metrics()}")
+
+    try:
+        asyncio.run_coroutine_threadsafe(run(), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
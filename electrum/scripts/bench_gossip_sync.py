@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+#
+# Benchmark: LNGossip.process_gossip on synthetic, signed gossip, as received
+# during initial sync: every message is received from two peers.
+# Signatures are verified in a thread, and in a pool of worker processes.
+#
+# usage: bench_gossip_sync.py [num_channels] [num_processes]
+
+import asyncio
+import random
+import sys
+import shutil
+import tempfile
+import time
+
+from electrum import constants, ecc
+from electrum.channel_db import ChannelDB
+from electrum.crypto import sha256d
+from electrum.lnmsg import encode_msg, decode_msg
+from electrum.lnworker import LNGossip
+from electrum.simple_config import SimpleConfig
+from electrum.util import create_and_start_event_loop
+
+
+NUM_CHANNELS = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+NUM_PROCESSES = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+NUM_NODES = NUM_CHANNELS // 4
+BATCH_SIZE = 2_000
+
+
+def sign(privkey: ecc.ECPrivkey, msg: bytes, offset: int) -> bytes:
+    return privkey.sign(sha256d(msg[offset:]), ecc.sig_string_from_r_and_s)
+
+
+def make_gossip():
+    rand = random.Random(0)
+    chain_hash = constants.net.rev_genesis_bytes()
+    now = int(time.time())
+    privkeys = [ecc.ECPrivkey(rand.randbytes(32)) for i in range(NUM_NODES)]
+    pubkeys = [k.get_public_key_bytes() for k in privkeys]
+    chan_anns, chan_upds, node_anns = [], [], []
+    for i in range(NUM_CHANNELS):
+        a, b = sorted(rand.sample(range(NUM_NODES), 2), key=lambda x: pubkeys[x])
+        scid = (600_000 + i // 100).to_bytes(3, 'big') + (i % 100).to_bytes(3, 'big') + b'\x00\x01'
+        fields = dict(
+            chain_hash=chain_hash, short_channel_id=scid, node_id_1=pubkeys[a], node_id_2=pubkeys[b],
+            bitcoin_key_1=pubkeys[a], bitcoin_key_2=pubkeys[b], len=0, features=b'')
+        raw = encode_msg('channel_announcement', **fields)
+        sigs = [sign(privkeys[x], raw, 2 + 256) for x in (a, b, a, b)]
+        raw = encode_msg('channel_announcement', node_signature_1=sigs[0], node_signature_2=sigs[1],
+                         bitcoin_signature_1=sigs[2], bitcoin_signature_2=sigs[3], **fields)
+        chan_anns.append(raw)
+        for direction, x in enumerate((a, b)):
+            fields = dict(
+                chain_hash=chain_hash, short_channel_id=scid, timestamp=now - rand.randrange(3600),
+                message_flags=b'\x01', channel_flags=bytes([direction]), cltv_expiry_delta=144,
+                htlc_minimum_msat=1000, fee_base_msat=rand.randrange(2000),
+                fee_proportional_millionths=rand.randrange(1000), htlc_maximum_msat=10**9)
+            raw = encode_msg('channel_update', **fields)
+            chan_upds.append(encode_msg('channel_update', signature=sign(privkeys[x], raw, 2 + 64), **fields))
+    for x in range(NUM_NODES):
+        fields = dict(flen=0, features=b'', timestamp=now, node_id=pubkeys[x], rgb_color=b'\x00\x00\x00',
+                      alias=(b'node%d' % x).ljust(32, b'\x00'), addrlen=0, addresses=b'')
+        raw = encode_msg('node_announcement', **fields)
+        node_anns.append(encode_msg('node_announcement', signature=sign(privkeys[x], raw, 2 + 64), **fields))
+    return chan_anns, node_anns, chan_upds
+
+
+def to_payloads(raw_msgs):
+    payloads = []
+    for raw in raw_msgs:
+        payload = decode_msg(raw)[1]
+        payload['raw'] = raw
+        payloads.append(payload)
+    return payloads
+
+
+def main():
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    tmpdir = tempfile.mkdtemp()
+    print(f"creating gossip: {NUM_CHANNELS} channels, {2 * NUM_CHANNELS} updates, {NUM_NODES} nodes")
+    chan_anns, node_anns, chan_upds = make_gossip()
+
+    async def sync(num_processes: int) -> float:
+        config = SimpleConfig({'electrum_path': tempfile.mkdtemp(dir=tmpdir),
+                               'gossip_verification_processes': num_processes})
+
+        class fake_network:
+            asyncio_loop = loop
+            interface = None
+        fake_network.config = config
+        cdb = ChannelDB(fake_network())
+        cdb.data_loaded.set()
+        fake_network.channel_db = cdb
+        lngossip = LNGossip()
+        lngossip.network = fake_network
+        lngossip.config = config
+        t0 = time.perf_counter()
+        # two peers send us the same gossip
+        for peer in range(2):
+            for i in range(0, NUM_CHANNELS, BATCH_SIZE // 2):
+                await lngossip.process_gossip(
+                    to_payloads(chan_anns[i:i + BATCH_SIZE // 2]),
+                    to_payloads(node_anns[i // 4:(i + BATCH_SIZE // 2) // 4]),
+                    to_payloads(chan_upds[2 * i:2 * i + BATCH_SIZE]))
+        dt = time.perf_counter() - t0
+        assert cdb.num_channels == NUM_CHANNELS, cdb.num_channels
+        assert cdb.num_policies == 2 * NUM_CHANNELS, cdb.num_policies
+        stats = getattr(lngossip, 'gossip_stats', None)
+        await lngossip.stop()
+        cdb.stop()
+        await cdb.stopped_event.wait()
+        mode = f"{num_processes} processes" if num_processes else "thread"
+        print(f"verification in {mode:12s}: {dt * 1000:8.1f} ms")
+        if stats is not None:
+            print(f"    {stats}")
+        return dt
+
+    try:
+        for num_processes in (0, NUM_PROCESSES):
+            asyncio.run_coroutine_threadsafe(sync(num_processes), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
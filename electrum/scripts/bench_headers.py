@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+#
+# Benchmark: Blockchain header access on a synthetic regtest chain:
+# header sync (can_connect + save_header), SPV proof checks at random
+# heights (read_header + verify_tx_is_in_block), and get_hash/get_chainwork.
+# Also counts the headers file opens done by each phase.
+#
+# usage: bench_headers.py [chain_length] [num_proofs] [num_synced_headers]
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from electrum import blockchain, constants
+from electrum.blockchain import Blockchain, serialize_header, hash_header, HEADER_SIZE
+from electrum.simple_config import SimpleConfig
+from electrum.util import bfh, make_dir
+from electrum.verifier import verify_tx_is_in_block
+
+
+CHAIN_LENGTH = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+NUM_PROOFS = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+NUM_SYNCED = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+
+REGTEST_GENESIS_HEADER = bfh("0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4adae5494dffff7f2002000000")
+
+
+def make_headers(rand: random.Random, count: int):
+    headers = [blockchain.deserialize_header(REGTEST_GENESIS_HEADER, 0)]
+    txids = [headers[0]['merkle_root']]
+    for height in range(1, count):
+        txid = rand.randbytes(32).hex()
+        headers.append({
+            'version': 0x20000000, 'prev_block_hash': hash_header(headers[-1]), 'merkle_root': txid,
+            'timestamp': 1_600_000_000 + 600 * height, 'bits': 0x207fffff, 'nonce': rand.randrange(2**32),
+            'block_height': height})
+        txids.append(txid)
+    return headers, txids
+
+
+class OpenCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+        return open(*args, **kwargs)
+
+
+def main():
+    constants.set_regtest()
+    tmpdir = tempfile.mkdtemp()
+    counter = OpenCounter()
+    blockchain.open = counter  # shadows the builtin in the blockchain module
+    try:
+        make_dir(os.path.join(tmpdir, 'forks'))
+        config = SimpleConfig({'electrum_path': tmpdir})
+        rand = random.Random(0)
+        headers, txids = make_headers(rand, CHAIN_LENGTH + NUM_SYNCED)
+        chain = Blockchain(config=config, forkpoint=0, parent=None,
+                           forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        blockchain.blockchains = {constants.net.GENESIS: chain}
+        open(chain.path(), 'w+').close()
+        chain.write(b''.join(bfh(serialize_header(h)) for h in headers[:CHAIN_LENGTH]), 0)
+        print(f"chain of {CHAIN_LENGTH} headers")
+
+        def run(name, func):
+            counter.count = 0
+            t0 = time.perf_counter()
+            n = func()
+            dt = time.perf_counter() - t0
+            print(f"{name:32s} {dt * 1000:8.1f} ms ({dt / n * 1e6:7.1f} us each), {counter.count} file opens")
+
+        def sync():
+            for header in headers[CHAIN_LENGTH:]:
+                assert chain.can_connect(header)
+                chain.save_header(header)
+            return NUM_SYNCED
+
+        def proofs():
+            for i in range(NUM_PROOFS):
+                height = rand.randrange(1, CHAIN_LENGTH)
+                header = chain.read_header(height)
+                verify_tx_is_in_block(txids[height], [], 0, header, height)
+            return NUM_PROOFS
+
+        def get_hashes():
+            for height in range(CHAIN_LENGTH):
+                chain.get_hash(height)
+            return CHAIN_LENGTH
+
+        def check_hashes():
+            for i in range(NUM_PROOFS):
+                height = rand.randrange(1, CHAIN_LENGTH)
+                assert chain.check_hash(height, headers[height]['prev_block_hash']) is False
+            return NUM_PROOFS
+
+        run(f"sync {NUM_SYNCED} headers", sync)
+        run(f"{NUM_PROOFS} merkle proofs", proofs)
+        run(f"get_hash, all heights", get_hashes)
+        run(f"get_hash, all heights (again)", get_hashes)
+        run(f"{NUM_PROOFS} check_hash", check_hashes)
+    finally:
+        del blockchain.open
+        constants.set_mainnet()
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
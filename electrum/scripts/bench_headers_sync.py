@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+#
+# Benchmark: header sync from genesis, with checkpoints disabled, against a
+# local stand-in server that serves blockchain.block.headers chunks.
+# The chain is synthetic: mainnet rules, but with an easy max target
+# (blockchain.MAX_TARGET is patched), so that its PoW can be ground quickly.
+#
+# usage: bench_headers_sync.py [num_chunks] [num_workers]
+
+import asyncio
+import concurrent.futures
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from aiorpcx import RPCSession, serve_rs, connect_rs
+
+from electrum import blockchain, constants
+from electrum.blockchain import Blockchain, HEADER_SIZE
+from electrum.crypto import sha256d
+from electrum.simple_config import SimpleConfig
+from electrum.util import make_dir
+
+
+NUM_CHUNKS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+NUM_WORKERS = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+EASY_MAX_TARGET = 0x7fffff << 232  # compact: 0x207fffff
+
+
+def grind_header(prev_hash: bytes, timestamp: int, bits: int, target: int, i: int) -> bytes:
+    merkle_root = sha256d(i.to_bytes(8, 'little'))
+    for nonce in range(2**32):
+        raw = ((0x20000000).to_bytes(4, 'little') + prev_hash + merkle_root + timestamp.to_bytes(4, 'little')
+               + bits.to_bytes(4, 'little') + nonce.to_bytes(4, 'little'))
+        h = sha256d(raw)
+        if int.from_bytes(h, 'little') <= target:
+            return raw
+
+
+def make_chain(num_chunks: int) -> bytes:
+    """Returns the raw headers of a chain that follows the mainnet retargeting rules."""
+    headers = []
+    prev_hash = bytes(32)
+    target = EASY_MAX_TARGET
+    for height in range(num_chunks * 2016):
+        if height % 2016 == 0 and height > 0:
+            # same as Blockchain.get_target
+            first = int.from_bytes(headers[height - 2016][68:72], 'little')
+            last = int.from_bytes(headers[height - 1][68:72], 'little')
+            timespan = min(max(last - first, 14 * 24 * 3600 // 4), 14 * 24 * 3600 * 4)
+            target = min(EASY_MAX_TARGET, target * timespan // (14 * 24 * 3600))
+            target = Blockchain.bits_to_target(Blockchain.target_to_bits(target))
+        # blocks come a bit slower than every 10 minutes, so that the target goes up and down
+        timestamp = 1_231_006_505 + height * (590 + 30 * (height // 2016 % 2))
+        raw = grind_header(prev_hash, timestamp, Blockchain.target_to_bits(target), target, height)
+        headers.append(raw)
+        prev_hash = sha256d(raw)
+    return b''.join(headers)
+
+
+class BenchNet(constants.BitcoinMainnet):
+    CHECKPOINTS = []
+
+
+class ServerSession(RPCSession):
+    chain = b''
+
+    async def handle_request(self, request):
+        assert request.method == 'blockchain.block.headers', request.method
+        start, count = request.args
+        data = self.chain[start * HEADER_SIZE:(start + count) * HEADER_SIZE]
+        return {'count': len(data) // HEADER_SIZE, 'hex': data.hex(), 'max': 2016}
+
+
+async def sync(chain: Blockchain, session, num_chunks: int, *, batched: bool, executor=None) -> float:
+    t0 = time.perf_counter()
+    if not batched:
+        for index in range(num_chunks):
+            res = await session.send_request('blockchain.block.headers', [index * 2016, 2016])
+            assert chain.connect_chunk(index, res['hex'])
+    else:
+        # several chunks per round trip, verified in parallel
+        batch_size = 2 * NUM_WORKERS
+        for index in range(0, num_chunks, batch_size):
+            indexes = range(index, min(index + batch_size, num_chunks))
+            results = await asyncio.gather(*[
+                session.send_request('blockchain.block.headers', [i * 2016, 2016]) for i in indexes])
+            chunks = chain.prepare_chunks(index, [res['hex'] for res in results])
+            hashes = None
+            if executor is not None:
+                loop = asyncio.get_running_loop()
+                hashes = await asyncio.gather(*[loop.run_in_executor(executor, chunk.verify) for chunk in chunks])
+            assert chain.connect_chunks(chunks, hashes) == len(indexes)
+    return time.perf_counter() - t0
+
+
+async def main():
+    t0 = time.perf_counter()
+    ServerSession.chain = make_chain(NUM_CHUNKS)
+    print(f"generated {NUM_CHUNKS} chunks ({NUM_CHUNKS * 2016} headers) in {time.perf_counter() - t0:.1f} s")
+    BenchNet.GENESIS = sha256d(ServerSession.chain[:HEADER_SIZE])[::-1].hex()
+    constants.net = BenchNet
+    blockchain.MAX_TARGET = EASY_MAX_TARGET
+    tmpdir = tempfile.mkdtemp()
+    server = await serve_rs(ServerSession, 'localhost', 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        async with connect_rs('localhost', port) as session:
+            modes = [('chunk by chunk', False, None)]
+            if hasattr(Blockchain, 'connect_chunks'):
+                modes.append(('batched', True, None))
+                modes.append((f'batched, {NUM_WORKERS} processes', True,
+                               concurrent.futures.ProcessPoolExecutor(max_workers=NUM_WORKERS)))
+            for name, batched, executor in modes:
+                datadir = tempfile.mkdtemp(dir=tmpdir)
+                make_dir(os.path.join(datadir, 'forks'))
+                config = SimpleConfig({'electrum_path': datadir})
+                chain = Blockchain(config=config, forkpoint=0, parent=None,
+                                   forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+                blockchain.blockchains = {constants.net.GENESIS: chain}
+                open(chain.path(), 'w+').close()
+                dt = await sync(chain, session, NUM_CHUNKS, batched=batched, executor=executor)
+                assert chain.height() == NUM_CHUNKS * 2016 - 1
+                print(f"{name:24s} sync from genesis: {dt * 1000:8.1f} ms ({dt / NUM_CHUNKS * 1000:.1f} ms/chunk)")
+                if executor is not None:
+                    executor.shutdown()
+    finally:
+        server.close()
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
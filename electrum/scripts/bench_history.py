@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+#
+# Benchmark: AddressSynchronizer.get_history of a wallet with a long history,
+# when nothing changed, after a new tx, and for one page of the history.
+#
+# usage: bench_history.py [num_txs] [num_addresses] [num_queries]
+
+import random
+import sys
+import time
+
+from electrum.address_synchronizer import AddressSynchronizer
+from electrum.bitcoin import address_to_script, pubkey_to_address
+from electrum.simple_config import SimpleConfig
+from electrum.transaction import PartialTransaction, PartialTxInput, PartialTxOutput, Transaction, TxOutpoint
+from electrum.util import TxMinedInfo, create_and_start_event_loop
+from electrum.wallet_db import WalletDB
+
+
+NUM_TXS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+NUM_ADDRESSES = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+NUM_QUERIES = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+PAGE_SIZE = 50
+
+
+def make_tx(rand: random.Random, addresses, locktime: int) -> Transaction:
+    inputs = [PartialTxInput(prevout=TxOutpoint(txid=rand.randbytes(32), out_idx=0))]
+    outputs = [PartialTxOutput(scriptpubkey=bytes.fromhex(address_to_script(rand.choice(addresses))),
+                               value=rand.randrange(10**5, 10**7))]
+    tx = PartialTransaction.from_io(inputs, outputs, locktime=locktime, BIP69_sort=False)
+    return Transaction(tx.serialize_to_network(include_sigs=False))
+
+
+def timeit(name: str, f) -> None:
+    t0 = time.perf_counter()
+    for i in range(NUM_QUERIES):
+        result = f(i)
+    dt = (time.perf_counter() - t0) / NUM_QUERIES
+    print(f"{name:36s} {dt * 1000:8.2f} ms")
+    return result
+
+
+def main():
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        run()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
+
+
+def run():
+    rand = random.Random(0)
+    config = SimpleConfig({'electrum_path': '/nonexistent'})
+    db = WalletDB('', manual_upgrades=False)
+    db.put('stored_height', 100_000 + NUM_TXS // 10 + 10)
+    adb = AddressSynchronizer(db, config)
+    addresses = [pubkey_to_address('p2wpkh', (b'\x02' + i.to_bytes(32, 'big')).hex()) for i in range(NUM_ADDRESSES)]
+    for addr in addresses:
+        adb.add_address(addr)
+    for i in range(NUM_TXS):
+        tx = make_tx(rand, addresses, i)
+        db.add_verified_tx(tx.txid(), TxMinedInfo(height=100_000 + i // 10, timestamp=1_600_000_000 + i,
+                                                  txpos=i % 10, header_hash='00' * 32))
+        assert adb.add_transaction(tx)
+    print(f"{NUM_TXS} txs, {NUM_ADDRESSES} addresses")
+    domain = adb.get_addresses()
+    history = timeit("get_history, first call", lambda i: adb.get_history(domain))
+    timeit("get_history, no change", lambda i: adb.get_history(domain))
+
+    def after_new_tx(i):
+        adb.add_transaction(make_tx(rand, addresses, NUM_TXS + i))
+        return adb.get_history(domain)
+    timeit("get_history, after a new tx", after_new_tx)
+    timeit(f"get_history, last {PAGE_SIZE} items", lambda i: adb.get_history(domain, offset=len(history) - PAGE_SIZE))
+    timeit(f"get_history, {PAGE_SIZE} items by height",
+           lambda i: adb.get_history(domain, from_height=100_000 + NUM_TXS // 20, limit=PAGE_SIZE))
+    print(f"balance {history[-1].balance}")
+
+
+if __name__ == '__main__':
+    main()
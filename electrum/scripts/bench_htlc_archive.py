@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+#
+# Benchmark: HTLCManager of a long-lived channel, with many irrevocably
+# removed HTLCs in its log. Measures wallet db open + HTLCManager init,
+# memory use, balance queries at old ctns, the cumulative settled amount,
+# and serializing the wallet db; with and without the HTLC archive.
+#
+# usage: bench_htlc_archive.py [num_htlcs]
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from electrum.lnhtlc import HTLCManager
+from electrum.lnutil import LOCAL, REMOTE, SENT, RECEIVED
+from electrum.storage import WalletStorage
+from electrum.wallet_db import WalletDB
+
+
+NUM_HTLCS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000  # per direction
+CHANNEL_ID = '00' * 32
+
+
+def channel_json() -> dict:
+    log = {}
+    for sub in ('1', '-1'):
+        d = {'adds': {}, 'locked_in': {}, 'settles': {}, 'fails': {},
+             'fee_updates': {'0': {'rate': 253, 'ctn_local': 0, 'ctn_remote': 0}},
+             'revack_pending': False, 'next_htlc_id': NUM_HTLCS, 'ctn': NUM_HTLCS + 3,
+             'archived_htlcs': {}, 'archive_checkpoints': {}}
+        # htlc i is added at ctn i+1, and removed at ctn i+2. every fourth one is failed
+        for htlc_id in range(NUM_HTLCS):
+            d['adds'][str(htlc_id)] = [1000 * (htlc_id + 1), (htlc_id + (sub == '1') * 2**40).to_bytes(32, 'big').hex(),
+                                       800_000 + htlc_id, htlc_id, 1_700_000_000 + htlc_id]
+            d['locked_in'][str(htlc_id)] = {'1': htlc_id + 1, '-1': htlc_id + 1}
+            d['fails' if htlc_id % 4 == 0 else 'settles'][str(htlc_id)] = {'1': htlc_id + 2, '-1': htlc_id + 2}
+        log[sub] = d
+    log['1'].update({'unacked_updates': {}, 'was_revoke_last': False})
+    return {'log': log}
+
+
+def open_hm(path: str):
+    s = WalletStorage(path).read()
+    t0 = time.perf_counter()
+    db = WalletDB(s, manual_upgrades=False)
+    hm = HTLCManager(db.get_dict('channels')[CHANNEL_ID]['log'])
+    return db, hm, time.perf_counter() - t0
+
+
+def run(name: str, path: str, archive_chunk_size: int) -> None:
+    HTLCManager.ARCHIVE_CHUNK_SIZE = archive_chunk_size
+    db, hm, t_open = open_hm(path)
+    t0 = time.perf_counter()
+    for ctn in range(1, NUM_HTLCS, NUM_HTLCS // 10):
+        hm.get_balance_msat(LOCAL, ctn=ctn, initial_balance_msat=0)
+    t_balance = (time.perf_counter() - t0) / 10
+    t0 = time.perf_counter()
+    settled = hm.get_settled_msat_by_direction(LOCAL, SENT) + hm.get_settled_msat_by_direction(LOCAL, RECEIVED)
+    t_settled = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    size = len(db.dump(human_readable=False))
+    t_dump = time.perf_counter() - t0
+    tracemalloc.start()
+    db, hm, _ = open_hm(path)
+    mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{name:9s} open+init {t_open * 1000:8.1f} ms, old-ctn balance {t_balance * 1000:7.2f} ms, "
+          f"settled total {t_settled * 1000:7.2f} ms, dump {t_dump * 1000:7.1f} ms ({size // 1024} kB), "
+          f"memory {mem / 2**20:6.1f} MB  [{settled}]")
+
+
+def main():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print(f"{NUM_HTLCS} htlcs per direction")
+        path = os.path.join(tmpdir, 'wallet')
+        db = WalletDB('', manual_upgrades=False)
+        db.get_dict('channels')[CHANNEL_ID] = channel_json()
+        db.write(WalletStorage(path))
+        run("no archive", path, archive_chunk_size=10**12)
+        if hasattr(HTLCManager, '_archive_htlcs'):
+            # move the htlcs to the archive, once. (in a wallet, this is spread over revocations)
+            HTLCManager.ARCHIVE_CHUNK_SIZE = 1000
+            db, hm, _ = open_hm(path)
+            t0 = time.perf_counter()
+            hm._update_maybe_active_htlc_ids(max_chunks_to_archive=NUM_HTLCS)
+            db.write(WalletStorage(path))
+            print(f"archiving {(time.perf_counter() - t0) * 1000:8.1f} ms")
+            run("archive", path, archive_chunk_size=1000)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+#
+# Benchmark: worst case commitment_signed, with the max number of HTLCs
+# (483) in the commitment tx. Measures creating the commitment and HTLC
+# signatures (sign_next_commitment), and verifying them (receive_new_commitment).
+#
+# usage: bench_htlc_sigs.py [num_htlcs]
+
+import random
+import sys
+import time
+
+from electrum.crypto import sha256
+from electrum.lnutil import LOCAL, REMOTE
+from electrum.tests.test_lnchannel import create_test_channels
+
+
+NUM_HTLCS = int(sys.argv[1]) if len(sys.argv) > 1 else 483
+
+
+def make_channels():
+    rand = random.Random(0)
+    alice, bob = create_test_channels(random_seed=b'\x00' * 32)
+    for chan in (alice, bob):
+        for subject in (LOCAL, REMOTE):
+            chan.config[subject].max_accepted_htlcs = NUM_HTLCS
+            chan.config[subject].max_htlc_value_in_flight_msat = 10**12
+    for i in range(NUM_HTLCS):
+        htlc = {'payment_hash': sha256(rand.randbytes(32)), 'amount_msat': rand.randrange(10**7, 10**8),
+                'cltv_expiry': 500 + rand.randrange(100), 'timestamp': 0}
+        alice.add_htlc(htlc)
+        bob.receive_htlc(htlc)
+    return alice, bob
+
+
+def main():
+    alice, bob = make_channels()
+    t0 = time.perf_counter()
+    sig, htlc_sigs = alice.sign_next_commitment()
+    t_sign = time.perf_counter() - t0
+    assert len(htlc_sigs) == NUM_HTLCS
+    t0 = time.perf_counter()
+    bob.receive_new_commitment(sig, htlc_sigs)
+    t_verify = time.perf_counter() - t0
+    print(f"{NUM_HTLCS} htlcs: sign_next_commitment {t_sign * 1000:8.1f} ms, "
+          f"receive_new_commitment {t_verify * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
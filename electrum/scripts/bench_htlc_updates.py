@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+#
+# Benchmark: channel state updates of a forwarding node. On each of many
+# channels, an HTLC is added, and then settled or failed, each followed
+# by an exchange of commitment_signed and revoke_and_ack.
+#
+# usage: bench_htlc_updates.py [num_channels] [num_htlcs_per_channel]
+
+import random
+import sys
+import time
+
+from electrum.crypto import sha256
+from electrum.tests.test_lnchannel import create_test_channels
+
+
+NUM_CHANNELS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+NUM_HTLCS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+
+def state_transition(chan_a, chan_b):
+    chan_b.receive_new_commitment(*chan_a.sign_next_commitment())
+    rev = chan_b.revoke_current_commitment()
+    sig, htlc_sigs = chan_b.sign_next_commitment()
+    chan_a.receive_revocation(rev)
+    chan_a.receive_new_commitment(sig, htlc_sigs)
+    chan_b.receive_revocation(chan_a.revoke_current_commitment())
+
+
+def main():
+    rand = random.Random(0)
+    channels = [create_test_channels() for i in range(NUM_CHANNELS)]
+    num_updates = 0
+    t0 = time.perf_counter()
+    for i in range(NUM_HTLCS):
+        for alice, bob in channels:
+            preimage = rand.randbytes(32)
+            htlc = {'payment_hash': sha256(preimage), 'amount_msat': rand.randrange(10**6, 10**8),
+                    'cltv_expiry': 5, 'timestamp': 0}
+            htlc_id = alice.add_htlc(htlc).htlc_id
+            bob.receive_htlc(htlc)
+            state_transition(alice, bob)
+            if i % 4 == 0:
+                bob.fail_htlc(htlc_id)
+                alice.receive_fail_htlc(htlc_id, error_bytes=b'')
+            else:
+                bob.settle_htlc(preimage, htlc_id)
+                alice.receive_htlc_settle(preimage, htlc_id)
+            state_transition(bob, alice)
+            num_updates += 2
+    dt = time.perf_counter() - t0
+    print(f"{NUM_CHANNELS} channels, {num_updates} htlc updates: {dt * 1000:8.1f} ms "
+          f"({num_updates / dt:6.1f} updates/s)")
+
+
+if __name__ == '__main__':
+    main()
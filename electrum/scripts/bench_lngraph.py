@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+#
+# Benchmark: memory of the in-memory gossip graph (ChannelDB) and
+# route query latency (LNPathFinder) on a synthetic graph.
+#
+# usage: bench_lngraph.py [num_nodes] [num_channels] [num_queries]
+
+import asyncio
+import random
+import sys
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from electrum import constants
+from electrum.channel_db import ChannelDB
+from electrum.lnrouter import LNPathFinder
+from electrum.lnutil import ShortChannelID
+from electrum.simple_config import SimpleConfig
+from electrum.util import create_and_start_event_loop
+
+
+NUM_NODES = int(sys.argv[1]) if len(sys.argv) > 1 else 15_000
+NUM_CHANNELS = int(sys.argv[2]) if len(sys.argv) > 2 else 80_000
+NUM_QUERIES = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+
+def node_id(i: int) -> bytes:
+    return b'\x02' + i.to_bytes(32, 'big')
+
+
+def scid(i: int) -> ShortChannelID:
+    return ShortChannelID.from_components(600_000 + i // 1000, i % 1000, 0)
+
+
+def populate(cdb: ChannelDB) -> None:
+    rand = random.Random(0)
+    chain_hash = constants.net.rev_genesis_bytes()
+    now = int(time.time())
+    # preferential attachment, so that the graph looks a bit like the real one (few hubs)
+    endpoints = list(range(NUM_NODES))
+    announcements = []
+    updates = []
+    for i in range(NUM_CHANNELS):
+        n1 = i % NUM_NODES if i < NUM_NODES else rand.choice(endpoints)
+        n2 = rand.choice(endpoints)
+        if n1 == n2:
+            n2 = (n1 + 1) % NUM_NODES
+        endpoints += [n1, n2]
+        node1, node2 = sorted([node_id(n1), node_id(n2)])
+        announcements.append({
+            'node_id_1': node1, 'node_id_2': node2, 'bitcoin_key_1': node1, 'bitcoin_key_2': node2,
+            'short_channel_id': scid(i), 'chain_hash': chain_hash, 'len': 0, 'features': b''})
+        for direction in (0, 1):
+            updates.append({
+                'short_channel_id': scid(i), 'chain_hash': chain_hash, 'timestamp': now,
+                'message_flags': b'\x01', 'channel_flags': bytes([direction]),
+                'cltv_expiry_delta': rand.choice([40, 80, 144]), 'htlc_minimum_msat': 1000,
+                'htlc_maximum_msat': rand.randrange(10**7, 10**10),
+                'fee_base_msat': rand.randrange(0, 2000), 'fee_proportional_millionths': rand.randrange(0, 1000)})
+    cdb.add_channel_announcements(announcements)
+    for payload in updates:
+        cdb.add_channel_update(payload, verify=False, verbose=False)
+    cdb.add_node_announcements([
+        {'node_id': node_id(i), 'features': b'\x02\x00', 'addresses': b'', 'alias': b'', 'timestamp': now}
+        for i in range(NUM_NODES)])
+
+
+def main():
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    tmpdir = tempfile.mkdtemp()
+
+    class fake_network:
+        config = SimpleConfig({'electrum_path': tmpdir})
+        asyncio_loop = loop
+        interface = None
+
+    async def stop(cdb: ChannelDB):
+        cdb.stop()
+        await cdb.stopped_event.wait()
+
+    try:
+        cdb = ChannelDB(fake_network())
+        cdb.data_loaded.set()
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        populate(cdb)
+        dt_populate = time.perf_counter() - t0
+        mem = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{NUM_NODES} nodes, {NUM_CHANNELS} channels: "
+              f"graph memory {mem / 1e6:.1f} MB, populated in {dt_populate:.1f} s")
+        path_finder = LNPathFinder(cdb)
+        rand = random.Random(1)
+        found = 0
+        t0 = time.perf_counter()
+        for i in range(NUM_QUERIES):
+            a, b = rand.sample(range(NUM_NODES), 2)
+            path = path_finder.find_path_for_payment(
+                nodeA=node_id(a), nodeB=node_id(b), invoice_amount_msat=rand.choice([10**6, 10**7, 10**8]))
+            found += path is not None
+        dt = (time.perf_counter() - t0) / NUM_QUERIES
+        print(f"route queries: {dt * 1000:.1f} ms/query ({found}/{NUM_QUERIES} paths found)")
+        # payment bursts: similar amounts to a few merchants
+        payer = node_id(rand.randrange(NUM_NODES))
+        merchants = [node_id(rand.randrange(NUM_NODES)) for i in range(5)]
+        hits, misses = path_finder.path_cache.hits, path_finder.path_cache.misses
+        t0 = time.perf_counter()
+        for i in range(NUM_QUERIES):
+            path_finder.find_path_for_payment(
+                nodeA=payer, nodeB=rand.choice(merchants), invoice_amount_msat=rand.randrange(2 * 10**7, 4 * 10**7))
+        dt = (time.perf_counter() - t0) / NUM_QUERIES
+        hits, misses = path_finder.path_cache.hits - hits, path_finder.path_cache.misses - misses
+        print(f"payment bursts: {dt * 1000:.1f} ms/query (path cache: {hits} hits, {misses} misses)")
+        asyncio.run_coroutine_threadsafe(stop(cdb), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
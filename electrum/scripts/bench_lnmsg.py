@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+#
+# Benchmark: lnmsg.decode_msg and lnmsg.encode_msg on a synthetic corpus of
+# gossip messages (as stored in the gossip db) and channel messages.
+#
+# usage: bench_lnmsg.py [num_gossip_msgs] [num_channel_msgs]
+
+import random
+import sys
+import time
+
+from electrum import constants
+from electrum.lnmsg import decode_msg, encode_msg
+
+
+NUM_GOSSIP_MSGS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+NUM_CHANNEL_MSGS = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+
+
+def make_gossip_msg(rand: random.Random, i: int) -> bytes:
+    chain_hash = constants.net.rev_genesis_bytes()
+    scid = (600_000 + i // 100).to_bytes(3, 'big') + (i % 100).to_bytes(3, 'big') + b'\x00\x01'
+    node1, node2 = sorted(b'\x02' + rand.randbytes(32) for _ in range(2))
+    # roughly the mix of a gossip db: two policies per channel, fewer nodes than channels
+    kind = i % 8
+    if kind < 2:
+        return encode_msg(
+            'channel_announcement', node_signature_1=rand.randbytes(64), node_signature_2=rand.randbytes(64),
+            bitcoin_signature_1=rand.randbytes(64), bitcoin_signature_2=rand.randbytes(64), len=0, features=b'',
+            chain_hash=chain_hash, short_channel_id=scid, node_id_1=node1, node_id_2=node2,
+            bitcoin_key_1=node1, bitcoin_key_2=node2)
+    elif kind < 7:
+        return encode_msg(
+            'channel_update', signature=rand.randbytes(64), chain_hash=chain_hash, short_channel_id=scid,
+            timestamp=1_700_000_000 + i, message_flags=b'\x01', channel_flags=bytes([i % 2]),
+            cltv_expiry_delta=rand.choice([40, 80, 144]), htlc_minimum_msat=1000,
+            fee_base_msat=rand.randrange(0, 2000), fee_proportional_millionths=rand.randrange(0, 1000),
+            htlc_maximum_msat=rand.randrange(10**6, 10**10))
+    else:
+        return encode_msg(
+            'node_announcement', signature=rand.randbytes(64), flen=2, features=b'\x0a\x82',
+            timestamp=1_700_000_000 + i, node_id=node1, rgb_color=b'\x00\x00\x00',
+            alias=(b'node%d' % i).ljust(32, b'\x00'), addrlen=7,
+            addresses=b'\x01\x7f\x00\x00\x01\x26\x07')
+
+
+def make_channel_msg(rand: random.Random, i: int) -> bytes:
+    channel_id = rand.randbytes(32)
+    kind = i % 4
+    if kind == 0:
+        return encode_msg(
+            'update_add_htlc', channel_id=channel_id, id=i, amount_msat=rand.randrange(10**9),
+            payment_hash=rand.randbytes(32), cltv_expiry=800_000 + i, onion_routing_packet=rand.randbytes(1366))
+    elif kind == 1:
+        num_htlcs = rand.randrange(5)
+        return encode_msg(
+            'commitment_signed', channel_id=channel_id, signature=rand.randbytes(64),
+            num_htlcs=num_htlcs, htlc_signature=rand.randbytes(64 * num_htlcs))
+    elif kind == 2:
+        return encode_msg(
+            'revoke_and_ack', channel_id=channel_id, per_commitment_secret=rand.randbytes(32),
+            next_per_commitment_point=b'\x02' + rand.randbytes(32))
+    else:
+        return encode_msg(
+            'init', gflen=0, flen=2, features=b'\x20\xc2',
+            init_tlvs={'networks': {'chains': constants.net.rev_genesis_bytes()}})
+
+
+def run(name: str, corpus) -> None:
+    t0 = time.perf_counter()
+    decoded = [decode_msg(msg) for msg in corpus]
+    t_decode = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    encoded = [encode_msg(msg_type, **payload) for msg_type, payload in decoded]
+    t_encode = time.perf_counter() - t0
+    assert encoded == corpus
+    print(f"{name:16s} {len(corpus):7d} msgs: decode {t_decode * 1000:8.1f} ms "
+          f"({t_decode / len(corpus) * 1e6:5.2f} us/msg), "
+          f"encode {t_encode * 1000:8.1f} ms ({t_encode / len(corpus) * 1e6:5.2f} us/msg)")
+
+
+def main():
+    rand = random.Random(0)
+    gossip = [make_gossip_msg(rand, i) for i in range(NUM_GOSSIP_MSGS)]
+    channel = [make_channel_msg(rand, i) for i in range(NUM_CHANNEL_MSGS)]
+    run("gossip", gossip)
+    run("channel", channel)
+
+
+if __name__ == '__main__':
+    main()
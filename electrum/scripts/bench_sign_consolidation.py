@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+#
+# Benchmark: PartialTransaction.sign on consolidation transactions
+# (many inputs of the same key, one output), for legacy and segwit inputs.
+#
+# usage: bench_sign_consolidation.py [num_inputs ...]
+
+import random
+import sys
+import time
+
+from electrum import descriptor, ecc
+from electrum.bitcoin import address_to_script
+from electrum.transaction import (PartialTransaction, PartialTxInput, PartialTxOutput, Transaction,
+                                  TxOutpoint, TxOutput)
+
+
+NUM_INPUTS = [int(x) for x in sys.argv[1:]] or [500, 1000, 2000]
+
+
+def make_consolidation(num_inputs: int, script_type: str, privkey: ecc.ECPrivkey) -> PartialTransaction:
+    rand = random.Random(num_inputs)
+    pubkey = privkey.get_public_key_hex(compressed=True)
+    desc = descriptor.get_singlesig_descriptor_from_legacy_leaf(pubkey=pubkey, script_type=script_type)
+    scriptpubkey = desc.expand().output_script
+    # a single funding tx, whose outputs are all spent
+    funding_tx = PartialTransaction.from_io(
+        [PartialTxInput(prevout=TxOutpoint(txid=rand.randbytes(32), out_idx=0))],
+        [PartialTxOutput(scriptpubkey=scriptpubkey, value=10_000 + i) for i in range(num_inputs)],
+        locktime=0)
+    funding_tx = Transaction(funding_tx.serialize_to_network(include_sigs=False))
+    funding_txid = bytes.fromhex(funding_tx.txid())
+    inputs = []
+    for i in range(num_inputs):
+        txin = PartialTxInput(prevout=TxOutpoint(txid=funding_txid, out_idx=i))
+        txin.script_descriptor = desc
+        if script_type == 'p2pkh':
+            txin.utxo = funding_tx
+        else:
+            txin.witness_utxo = TxOutput(scriptpubkey=scriptpubkey, value=10_000 + i)
+        inputs.append(txin)
+    outputs = [PartialTxOutput(scriptpubkey=bytes.fromhex(address_to_script('bc1qq2tmmcngng78nllq2pvrkchcdukemtj56uyue0')),
+                               value=num_inputs * 9_000)]
+    return PartialTransaction.from_io(inputs, outputs, locktime=0)
+
+
+def main():
+    privkey = ecc.ECPrivkey(bytes(31) + b'\x01')
+    keypairs = {privkey.get_public_key_hex(compressed=True): (privkey.get_secret_bytes(), True)}
+    for script_type in ('p2pkh', 'p2wpkh'):
+        for num_inputs in NUM_INPUTS:
+            tx = make_consolidation(num_inputs, script_type, privkey)
+            t0 = time.perf_counter()
+            tx.sign(keypairs)
+            dt = time.perf_counter() - t0
+            assert tx.is_complete()
+            print(f"{script_type:7s} {num_inputs:5d} inputs: sign {dt * 1000:8.1f} ms "
+                  f"({dt / num_inputs * 1e6:6.1f} us/input)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+#
+# Benchmark: PartialTransaction.sign on 2-of-3 multisig (p2wsh) transactions,
+# serial vs. fanned out over a thread pool and a process pool.
+#
+# usage: bench_sign_parallel.py [num_workers] [num_inputs ...]
+
+import concurrent.futures
+import os
+import random
+import sys
+import time
+
+from electrum import descriptor, ecc
+from electrum.transaction import PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint, TxOutput
+
+
+NUM_WORKERS = int(sys.argv[1]) if len(sys.argv) > 1 else (os.cpu_count() or 1)
+NUM_INPUTS = [int(x) for x in sys.argv[2:]] or [250, 1000, 4000]
+
+
+def make_tx(num_inputs: int, privkeys) -> PartialTransaction:
+    rand = random.Random(num_inputs)
+    pubkeys = [privkey.get_public_key_hex(compressed=True) for privkey in privkeys]
+    desc = descriptor.parse_descriptor(f"wsh(multi(2,{','.join(pubkeys)}))")
+    scriptpubkey = desc.expand().output_script
+    inputs = []
+    for i in range(num_inputs):
+        txin = PartialTxInput(prevout=TxOutpoint(txid=rand.randbytes(32), out_idx=i % 4))
+        txin.script_descriptor = desc
+        txin.witness_utxo = TxOutput(scriptpubkey=scriptpubkey, value=10_000 + i)
+        inputs.append(txin)
+    outputs = [PartialTxOutput(scriptpubkey=scriptpubkey, value=num_inputs * 9_000)]
+    return PartialTransaction.from_io(inputs, outputs, locktime=0)
+
+
+def run(num_inputs: int, keypairs, privkeys, executor=None):
+    tx = make_tx(num_inputs, privkeys)
+    t0 = time.perf_counter()
+    tx.sign(keypairs, executor=executor)
+    dt = time.perf_counter() - t0
+    assert tx.is_complete()
+    return dt, tx.serialize()
+
+
+def main():
+    privkeys = [ecc.ECPrivkey(bytes(31) + bytes([i + 1])) for i in range(3)]
+    # we hold two of the three keys
+    keypairs = {privkey.get_public_key_hex(compressed=True): (privkey.get_secret_bytes(), True)
+                for privkey in privkeys[:2]}
+    print(f"{NUM_WORKERS} workers, {os.cpu_count()} cpus")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=NUM_WORKERS) as threads, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=NUM_WORKERS) as processes:
+        # start the worker processes before timing
+        list(processes.map(abs, range(NUM_WORKERS)))
+        for num_inputs in NUM_INPUTS:
+            dt_serial, raw = run(num_inputs, keypairs, privkeys)
+            dt_threads, raw_threads = run(num_inputs, keypairs, privkeys, threads)
+            dt_processes, raw_processes = run(num_inputs, keypairs, privkeys, processes)
+            assert raw == raw_threads == raw_processes
+            print(f"{num_inputs:5d} inputs: "
+                  f"serial {num_inputs / dt_serial:7.0f} inputs/s, "
+                  f"threads {num_inputs / dt_threads:7.0f} inputs/s, "
+                  f"processes {num_inputs / dt_processes:7.0f} inputs/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+#
+# Benchmark: SPV verification of the history of a freshly restored wallet
+# (many txs, in many blocks), and undoing verifications after a reorg.
+# Merkle proofs are served by a fake interface (no network), on a synthetic
+# regtest chain whose headers commit to the wallet txs.
+#
+# usage: bench_spv.py [num_blocks] [wallet_txs_per_block] [reorg_depth]
+
+import asyncio
+import hashlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from electrum import blockchain, constants
+from electrum.address_synchronizer import AddressSynchronizer
+from electrum.blockchain import Blockchain, HEADER_SIZE
+from electrum.bitcoin import hash_encode
+from electrum.crypto import sha256d
+from electrum.simple_config import SimpleConfig
+from electrum.util import create_and_start_event_loop
+from electrum.verifier import SPV
+from electrum.wallet_db import WalletDB
+
+
+NUM_BLOCKS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+TXS_PER_BLOCK = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+REORG_DEPTH = int(sys.argv[3]) if len(sys.argv) > 3 else 6
+BLOCK_SIZE = 2000  # txs per block, most of them not ours
+GENESIS_HEADER = bytes.fromhex(
+    "0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4adae5494dffff7f2002000000")
+
+
+def merkle_tree(leaves):
+    """Returns the levels of the merkle tree, from the leaves to the root."""
+    levels = [leaves]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        if len(level) % 2:
+            level = level + [level[-1]]
+        levels.append([sha256d(level[i] + level[i + 1]) for i in range(0, len(level), 2)])
+    return levels
+
+
+def merkle_branch(levels, pos):
+    branch = []
+    for level in levels[:-1]:
+        sibling = pos ^ 1
+        branch.append(hash_encode(level[sibling] if sibling < len(level) else level[pos]))
+        pos >>= 1
+    return branch
+
+
+def make_chain(rand: random.Random):
+    """Returns the raw headers, and the merkle proofs of the wallet txs: txid -> proof."""
+    headers = [GENESIS_HEADER]
+    proofs = {}
+    for height in range(1, NUM_BLOCKS + 1):
+        leaves = [rand.randbytes(32) for i in range(BLOCK_SIZE)]
+        levels = merkle_tree(leaves)
+        for pos in rand.sample(range(BLOCK_SIZE), TXS_PER_BLOCK):
+            proofs[hash_encode(leaves[pos])] = {
+                'block_height': height, 'pos': pos, 'merkle': merkle_branch(levels, pos)}
+        headers.append(b'\x00\x00\x00\x20' + sha256d(headers[-1]) + levels[-1][0]
+                       + (1_600_000_000 + 600 * height).to_bytes(4, 'little') + bytes.fromhex('ffff7f20') + bytes(4))
+    return headers, proofs
+
+
+class FakeInterface:
+    def __init__(self, proofs):
+        self.proofs = proofs
+        self.num_calls = 0
+
+    async def get_merkle_for_transaction(self, tx_hash, tx_height):
+        self.num_calls += 1
+        await asyncio.sleep(0)
+        return self.proofs[tx_hash]
+
+    async def get_merkles_for_transactions(self, txs):
+        self.num_calls += 1
+        await asyncio.sleep(0)
+        return [self.proofs[tx_hash] for tx_hash, tx_height in txs]
+
+
+async def verify(spv: SPV, adb: AddressSynchronizer) -> float:
+    t0 = time.perf_counter()
+    task = asyncio.create_task(spv._run_tasks(taskgroup=spv.taskgroup))
+    while adb.unverified_tx:
+        await asyncio.sleep(0.001)
+    dt = time.perf_counter() - t0
+    task.cancel()
+    await spv.taskgroup.cancel_remaining()
+    return dt
+
+
+def main():
+    constants.set_regtest()
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    rand = random.Random(0)
+    headers, proofs = make_chain(rand)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(tmpdir, 'regtest', 'forks'))
+        config = SimpleConfig({'electrum_path': tmpdir, 'regtest': True})
+        chain = Blockchain(config=config, forkpoint=0, parent=None,
+                           forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        blockchain.blockchains = {constants.net.GENESIS: chain}
+        open(chain.path(), 'w+').close()
+        chain.write(b''.join(headers), 0)
+        assert chain.height() == NUM_BLOCKS
+
+        class FakeNetwork:
+            asyncio_loop = loop
+            interface = None
+            blockchain = lambda self: chain
+
+        FakeNetwork.config = config
+        FakeNetwork.bhi_lock = asyncio.run_coroutine_threadsafe(_make_lock(), loop).result()
+        adb = AddressSynchronizer(WalletDB('', manual_upgrades=False), config)
+        for txid, proof in proofs.items():
+            adb.add_unverified_or_unconfirmed_tx(txid, proof['block_height'])
+        spv = asyncio.run_coroutine_threadsafe(_make_spv(FakeNetwork(), adb), loop).result()
+        spv.interface = FakeInterface(proofs)
+        dt_verify = asyncio.run_coroutine_threadsafe(verify(spv, adb), loop).result()
+        assert len(adb.db.list_verified_tx()) == len(proofs)
+        print(f"{len(proofs)} txs in {NUM_BLOCKS} blocks: verified in {dt_verify * 1000:8.1f} ms "
+              f"({dt_verify / len(proofs) * 1e6:.1f} us/tx, {spv.interface.num_calls} interface calls)")
+
+        # reorg: replace the last headers
+        fork_height = NUM_BLOCKS - REORG_DEPTH + 1
+        new_headers = headers[:fork_height]
+        for height in range(fork_height, NUM_BLOCKS + 1):
+            new_headers.append(b'\x00\x00\x00\x20' + sha256d(new_headers[-1]) + rand.randbytes(32) + headers[height][68:])
+        chain.write(b''.join(new_headers[fork_height:]), fork_height * HEADER_SIZE)
+        t0 = time.perf_counter()
+        undone = adb.undo_verifications(chain, fork_height - 1)
+        dt_undo = time.perf_counter() - t0
+        assert len(undone) == REORG_DEPTH * TXS_PER_BLOCK, len(undone)
+        print(f"undo verifications of the last {REORG_DEPTH} blocks: {dt_undo * 1000:8.1f} ms")
+        chain.close_headers_file()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
+        shutil.rmtree(tmpdir)
+
+
+async def _make_lock():
+    return asyncio.Lock()
+
+
+async def _make_spv(network, adb) -> SPV:
+    return SPV(network, adb)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#
+# Benchmark: Transaction.deserialize, txid and wtxid on a synthetic corpus
+# of large transactions (many inputs) and a block's worth of regular ones.
+#
+# usage: bench_tx_deserialize.py [num_large_txs] [num_inputs_per_large_tx] [num_block_txs]
+
+import random
+import sys
+import time
+
+from electrum.bitcoin import var_int
+from electrum.transaction import Transaction
+
+
+NUM_LARGE_TXS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+NUM_INPUTS = int(sys.argv[2]) if len(sys.argv) > 2 else 1500
+NUM_BLOCK_TXS = int(sys.argv[3]) if len(sys.argv) > 3 else 3000
+
+
+def compact_size(n: int) -> bytes:
+    return bytes.fromhex(var_int(n))
+
+
+def make_tx(rand: random.Random, num_inputs: int, num_outputs: int, *, segwit: bool) -> bytes:
+    parts = [(2).to_bytes(4, 'little')]
+    if segwit:
+        parts.append(b'\x00\x01')
+    parts.append(compact_size(num_inputs))
+    for i in range(num_inputs):
+        parts.append(rand.randbytes(32) + rand.randrange(10).to_bytes(4, 'little'))
+        script_sig = b'' if segwit else b'\x47' + rand.randbytes(71) + b'\x21' + rand.randbytes(33)
+        parts.append(compact_size(len(script_sig)) + script_sig)
+        parts.append(b'\xfd\xff\xff\xff')
+    parts.append(compact_size(num_outputs))
+    for i in range(num_outputs):
+        script = b'\x00\x14' + rand.randbytes(20)
+        parts.append(rand.randrange(10**8).to_bytes(8, 'little') + compact_size(len(script)) + script)
+    if segwit:
+        for i in range(num_inputs):
+            parts.append(b'\x02' + b'\x47' + rand.randbytes(71) + b'\x21' + rand.randbytes(33))
+    parts.append((0).to_bytes(4, 'little'))
+    return b''.join(parts)
+
+
+def run(name: str, corpus, make):
+    t0 = time.perf_counter()
+    for raw in corpus:
+        tx = make(raw)
+        tx.inputs()
+    t_deser = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for raw in corpus:
+        tx = make(raw)
+        tx.txid()
+        tx.wtxid()
+    t_ids = time.perf_counter() - t0
+    print(f"{name:28s} deserialize {t_deser * 1000:8.1f} ms,   deserialize+txid+wtxid {t_ids * 1000:8.1f} ms")
+
+
+def main():
+    rand = random.Random(0)
+    large = [make_tx(rand, NUM_INPUTS, 2, segwit=i % 2 == 0) for i in range(NUM_LARGE_TXS)]
+    block = [make_tx(rand, rand.randrange(1, 4), rand.randrange(1, 4), segwit=rand.random() < 0.8)
+             for i in range(NUM_BLOCK_TXS)]
+    # sanity check: round trip
+    for raw in large[:2] + block[:10]:
+        assert Transaction(raw).serialize_to_network() == raw.hex()
+    print(f"{NUM_LARGE_TXS} txs with {NUM_INPUTS} inputs, {sum(map(len, large)) / 1e6:.1f} MB; "
+          f"{NUM_BLOCK_TXS} block txs, {sum(map(len, block)) / 1e6:.1f} MB")
+    large_hex = [raw.hex() for raw in large]
+    block_hex = [raw.hex() for raw in block]
+    run("large txs, from hex", large_hex, Transaction)
+    run("large txs, from bytes", large, Transaction)
+    run("block txs, from hex", block_hex, Transaction)
+    run("block txs, from bytes", block, Transaction)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+#
+# Benchmark: CPU time to hand fetched transactions from the network to the
+# WalletDB: validate the server response, then store it.
+# "old" repeats what the code used to do: Interface validation, Synchronizer
+# re-parsing and re-hashing, and WalletDB round-tripping through tx_from_any.
+#
+# usage: bench_tx_handoff.py [num_txs]
+
+import random
+import sys
+import time
+
+from electrum.bitcoin import var_int
+from electrum.interface import Interface
+from electrum.transaction import Transaction, tx_from_any
+from electrum.wallet_db import WalletDB
+
+
+NUM_TXS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+
+
+def make_tx(rand: random.Random) -> str:
+    num_inputs, num_outputs = rand.randrange(1, 4), rand.randrange(1, 4)
+    parts = [(2).to_bytes(4, 'little'), b'\x00\x01', bytes.fromhex(var_int(num_inputs))]
+    for i in range(num_inputs):
+        parts.append(rand.randbytes(32) + rand.randrange(10).to_bytes(4, 'little') + b'\x00' + b'\xfd\xff\xff\xff')
+    parts.append(bytes.fromhex(var_int(num_outputs)))
+    for i in range(num_outputs):
+        parts.append(rand.randrange(10**8).to_bytes(8, 'little') + b'\x16\x00\x14' + rand.randbytes(20))
+    for i in range(num_inputs):
+        parts.append(b'\x02' + b'\x47' + rand.randbytes(71) + b'\x21' + rand.randbytes(33))
+    parts.append((0).to_bytes(4, 'little'))
+    return b''.join(parts).hex()
+
+
+def old_handoff(db: WalletDB, tx_hash: str, raw: str) -> None:
+    # Interface.get_transaction
+    tx = Transaction(raw)
+    tx.deserialize()
+    assert tx.txid() == tx_hash
+    # Synchronizer._get_transaction
+    tx = Transaction(raw)
+    assert tx.txid() == tx_hash
+    # WalletDB.add_transaction
+    tx = tx_from_any(str(tx))
+    assert tx.txid() == tx_hash
+    db.transactions[tx_hash] = tx
+
+
+def new_handoff(db: WalletDB, tx_hash: str, raw: str) -> None:
+    tx = Interface._check_transaction_response(tx_hash, raw)
+    db.add_transaction(tx_hash, tx)
+
+
+def main():
+    rand = random.Random(0)
+    raws = [make_tx(rand) for i in range(NUM_TXS)]
+    txids = [Transaction(raw).txid() for raw in raws]
+    for name, handoff in (('old', old_handoff), ('new', new_handoff)):
+        db = WalletDB('', manual_upgrades=False)
+        t0 = time.process_time()
+        for tx_hash, raw in zip(txids, raws):
+            handoff(db, tx_hash, raw)
+        dt = time.process_time() - t0
+        assert len(db.transactions) == NUM_TXS
+        print(f"{name}: {dt * 1000:8.1f} ms cpu for {NUM_TXS} txs ({dt / NUM_TXS * 1e6:.1f} us/tx)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#
+# Benchmark: Abstract_Wallet.get_tx_parents for the funding txs of all utxos
+# (as in the utxo list), on a watch-only wallet with heavy address reuse,
+# after each new tx.
+#
+# usage: bench_tx_parents.py [num_txs] [num_addresses] [num_new_txs]
+
+import random
+import sys
+import time
+
+from electrum.bitcoin import address_to_script, pubkey_to_address
+from electrum.simple_config import SimpleConfig
+from electrum.transaction import PartialTransaction, PartialTxInput, PartialTxOutput, Transaction, TxOutpoint
+from electrum.util import TxMinedInfo, create_and_start_event_loop
+from electrum.wallet import restore_wallet_from_text
+
+
+NUM_TXS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+NUM_ADDRESSES = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+NUM_NEW_TXS = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+
+def make_tx(rand: random.Random, addresses, utxos, locktime: int) -> Transaction:
+    if len(utxos) < 20 or rand.random() < 0.1:
+        inputs = [PartialTxInput(prevout=TxOutpoint(txid=rand.randbytes(32), out_idx=0))]
+        value = rand.randrange(10**5, 10**7)
+    else:
+        inputs = []
+        value = 0
+        for j in range(rand.randrange(1, 3)):
+            prevout, v = utxos.pop(rand.randrange(len(utxos)))
+            inputs.append(PartialTxInput(prevout=prevout))
+            value += v
+        value = value // 2
+    outputs = [PartialTxOutput(scriptpubkey=bytes.fromhex(address_to_script(rand.choice(addresses))), value=value),
+               PartialTxOutput(scriptpubkey=b'\x00\x14' + rand.randbytes(20), value=10_000)]
+    tx = PartialTransaction.from_io(inputs, outputs, locktime=locktime, BIP69_sort=False)
+    tx = Transaction(tx.serialize_to_network(include_sigs=False))
+    utxos.append((TxOutpoint(txid=bytes.fromhex(tx.txid()), out_idx=0), value))
+    return tx
+
+
+def main():
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        run()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
+
+
+def run():
+    rand = random.Random(0)
+    config = SimpleConfig({'electrum_path': '/nonexistent'})
+    addresses = [pubkey_to_address('p2wpkh', (b'\x02' + i.to_bytes(32, 'big')).hex()) for i in range(NUM_ADDRESSES)]
+    wallet = restore_wallet_from_text(' '.join(addresses), path=None, config=config)['wallet']
+    wallet.db.put('stored_height', 100_000 + NUM_TXS // 10 + 10)
+    utxos = []
+    for i in range(NUM_TXS):
+        tx = make_tx(rand, addresses, utxos, i)
+        wallet.db.add_verified_tx(tx.txid(), TxMinedInfo(height=100_000 + i // 10, timestamp=1_600_000_000 + i,
+                                                         txpos=i % 10, header_hash='00' * 32))
+        assert wallet.adb.add_transaction(tx)
+    coins = wallet.get_utxos()
+    print(f"{NUM_TXS} txs, {NUM_ADDRESSES} addresses, {len(coins)} utxos")
+    t_total = 0
+    for i in range(NUM_NEW_TXS + 1):
+        if i > 0:
+            # a new (unconfirmed) tx invalidates the caches
+            wallet.adb.add_transaction(make_tx(rand, addresses, utxos, NUM_TXS + i))
+            coins = wallet.get_utxos()
+        t0 = time.perf_counter()
+        num_parents = sum(len(wallet.get_tx_parents(coin.prevout.txid.hex())) for coin in coins)
+        dt = time.perf_counter() - t0
+        if i == 0:
+            print(f"first query:       {dt * 1000:8.1f} ms ({num_parents} parents in total)")
+        else:
+            t_total += dt
+    print(f"after each new tx: {t_total / NUM_NEW_TXS * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+#
+# Benchmark: get_balance, get_utxos and get_addr_utxo of an AddressSynchronizer
+# whose history has heavy address reuse: many txs, few addresses, and a
+# small UTXO set (most coins are spent).
+#
+# usage: bench_utxo_index.py [num_txs] [num_addresses] [num_queries]
+
+import random
+import sys
+import time
+
+from electrum import constants
+from electrum.address_synchronizer import AddressSynchronizer
+from electrum.bitcoin import address_to_script, pubkey_to_address
+from electrum.simple_config import SimpleConfig
+from electrum.transaction import PartialTransaction, PartialTxInput, PartialTxOutput, Transaction, TxOutpoint
+from electrum.util import TxMinedInfo, create_and_start_event_loop
+from electrum.wallet_db import WalletDB
+
+
+NUM_TXS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+NUM_ADDRESSES = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+NUM_QUERIES = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+
+def make_history(adb: AddressSynchronizer, rand: random.Random) -> None:
+    addresses = [pubkey_to_address('p2wpkh', (b'\x02' + i.to_bytes(32, 'big')).hex()) for i in range(NUM_ADDRESSES)]
+    for addr in addresses:
+        adb.add_address(addr)
+    utxos = []  # (prevout, value)
+    for i in range(NUM_TXS):
+        if len(utxos) < 50 or rand.random() < 0.1:
+            # incoming payment
+            inputs = [PartialTxInput(prevout=TxOutpoint(txid=rand.randbytes(32), out_idx=0))]
+            value = rand.randrange(10**5, 10**7)
+        else:
+            # spend some of our coins: a payment, and change
+            inputs = []
+            value = 0
+            for j in range(rand.randrange(1, 3)):
+                prevout, v = utxos.pop(rand.randrange(len(utxos)))
+                inputs.append(PartialTxInput(prevout=prevout))
+                value += v
+            value = value // 2
+        outputs = [PartialTxOutput(scriptpubkey=bytes.fromhex(address_to_script(rand.choice(addresses))), value=value),
+                   PartialTxOutput(scriptpubkey=b'\x00\x14' + rand.randbytes(20), value=10_000)]
+        tx = PartialTransaction.from_io(inputs, outputs, locktime=i, BIP69_sort=False)
+        tx = Transaction(tx.serialize_to_network(include_sigs=False))
+        txid = tx.txid()
+        height = 100_000 + i // 10
+        adb.db.add_verified_tx(txid, TxMinedInfo(height=height, timestamp=0, txpos=i % 10, header_hash='00' * 32))
+        assert adb.add_transaction(tx)
+        utxos.append((TxOutpoint(txid=bytes.fromhex(txid), out_idx=0), value))
+
+
+def timeit(name: str, f) -> None:
+    t0 = time.perf_counter()
+    for i in range(NUM_QUERIES):
+        result = f()
+    dt = (time.perf_counter() - t0) / NUM_QUERIES
+    print(f"{name:30s} {dt * 1000:8.2f} ms")
+    return result
+
+
+def main():
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        run()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
+
+
+def run():
+    config = SimpleConfig({'electrum_path': '/nonexistent'})
+    db = WalletDB('', manual_upgrades=False)
+    db.put('stored_height', 100_000 + NUM_TXS // 10 + 10)
+    adb = AddressSynchronizer(db, config)
+    t0 = time.perf_counter()
+    make_history(adb, random.Random(0))
+    dt = time.perf_counter() - t0
+    domain = adb.get_addresses()
+    num_utxos = len(adb.get_utxos(domain))
+    print(f"{NUM_TXS} txs, {NUM_ADDRESSES} addresses, {num_utxos} utxos: history added in {dt * 1000:.0f} ms")
+
+    def get_balance():
+        adb._get_balance_cache.clear()
+        return adb.get_balance(domain)
+
+    balance = timeit("get_balance", get_balance)
+    utxos = timeit("get_utxos", lambda: adb.get_utxos(domain))
+    timeit("get_utxos(mature_only)", lambda: adb.get_utxos(domain, mature_only=True))
+    timeit("get_addr_utxo (1 address)", lambda: adb.get_addr_utxo(domain[0]))
+    print(f"balance {balance}, {len(utxos)} utxos")
+
+
+if __name__ == '__main__':
+    main()
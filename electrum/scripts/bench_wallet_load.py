@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+#
+# Benchmark: wallet db open time, converting stored values eagerly
+# vs lazily (on first access).
+#
+# usage: bench_wallet_load.py [num_txs] [num_channels]
+
+import json
+import os
+import sys
+import shutil
+import tempfile
+import time
+
+from electrum.storage import WalletStorage
+from electrum.wallet_db import WalletDB
+from electrum.util import MyEncoder
+from electrum.tests.test_lnchannel import create_test_channels
+
+
+NUM_TXS = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+NUM_CHANNELS = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+NUM_HTLCS = 500  # per channel and direction
+
+# an arbitrary segwit tx; the same raw tx is stored under every txid
+RAW_TX = ('02000000000101a5883f3de780d260e6f26cf85144403c7744a65a44cd38f9ff45aecadf010c540100000000fdffffff0220a10700'
+          '0000000016001423cde2eac0e7cd6e8da2d9e7ff3b1c0b79d1b55120a107000000000016001479af8ad8d3b1a4a4ab5c4ea7ea5d73e1'
+          '63a9e8530247304402205f9a1f6a2e5a3e52fa8a9c3b9bf0ef4e0e39ea1c6bd0d5b0e2a0c5c6b8d5e9f202201f6bb01d95cd5e0bba'
+          '4c7f0e4d5ad4b4c2ff9dc0d7ebd8b1a2f5e3e1a2c3d4e50121029d7b5ee0b0b5a3f0a0ce6e2ebc0b1c8c5c7ab3c7c2d1e3f8a4a9c0'
+          'f1e5d5e5b9c100000000')
+
+
+class EagerWalletDB(WalletDB):
+    LAZY_LOAD = False
+
+
+def fake_txid(i: int) -> str:
+    return i.to_bytes(32, 'big').hex()
+
+
+def channel_json(i: int) -> dict:
+    alice, bob = create_test_channels(random_seed=i.to_bytes(32, 'big'))
+    d = json.loads(json.dumps(alice.storage, cls=MyEncoder))
+    # synthetic htlc history
+    for sub in ('1', '-1'):
+        log = d['log'][sub]
+        for htlc_id in range(NUM_HTLCS):
+            log['adds'][str(htlc_id)] = [1000 * htlc_id, fake_txid(htlc_id), 800_000 + htlc_id, htlc_id, 1_700_000_000]
+            log['locked_in'][str(htlc_id)] = {'1': htlc_id, '-1': htlc_id}
+            log['settles'][str(htlc_id)] = {'1': htlc_id + 1, '-1': htlc_id + 1}
+        log['next_htlc_id'] = NUM_HTLCS
+    return d
+
+
+def populate(db: WalletDB) -> None:
+    for i in range(NUM_TXS):
+        txid = fake_txid(i)
+        addr = 'bc1qfakeaddress%06d' % (i % 5000)
+        db.add_txo_addr(txid, addr, 0, 10_000 + i, False)
+        db.transactions[txid] = RAW_TX
+    channels = db.get_dict('channels')
+    for i in range(NUM_CHANNELS):
+        d = channel_json(i)
+        channels[d['channel_id']] = d
+
+
+def open_db(path: str, db_class) -> WalletDB:
+    s = WalletStorage(path).read()
+    t0 = time.perf_counter()
+    db = db_class(s, manual_upgrades=False)
+    dt = time.perf_counter() - t0
+    # what a wallet does on startup: read channels, and the txs of the recent history
+    t0 = time.perf_counter()
+    for chan_dict in db.get_dict('channels').values():
+        chan_dict['log'][1]['adds'].get(0)
+    for i in range(NUM_TXS - 100, NUM_TXS):
+        db.get_transaction(fake_txid(i))
+    dt_access = time.perf_counter() - t0
+    print(f"{'lazy' if db_class.LAZY_LOAD else 'eager':>6}: open {dt * 1000:8.1f} ms, "
+          f"first access {dt_access * 1000:8.1f} ms")
+    return db
+
+
+def main():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print(f"{NUM_TXS} txs, {NUM_CHANNELS} channels")
+        path = os.path.join(tmpdir, 'wallet')
+        db = WalletDB('', manual_upgrades=False)
+        populate(db)
+        db.write(WalletStorage(path))
+        eager = open_db(path, EagerWalletDB)
+        lazy = open_db(path, WalletDB)
+        # unchanged data is dumped as it was loaded
+        dumps = []
+        for db in (eager, lazy):
+            t0 = time.perf_counter()
+            dumps.append(db.dump(human_readable=False))
+            print(f"{'lazy' if db.LAZY_LOAD else 'eager':>6}: dump {(time.perf_counter() - t0) * 1000:8.1f} ms")
+        assert json.loads(dumps[0]) == json.loads(dumps[1])
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
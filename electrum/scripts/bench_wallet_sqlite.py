@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+#
+# Benchmark: open time and memory of a wallet db with a large history,
+# tx tables in the json file vs in sqlite.
+#
+# usage: bench_wallet_sqlite.py [num_txs]
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from electrum.storage import WalletStorage
+from electrum.wallet_db import WalletDB
+from electrum.util import TxMinedInfo
+
+
+NUM_TXS = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+
+
+def fake_txid(i: int) -> str:
+    return i.to_bytes(32, 'big').hex()
+
+
+def populate(db: WalletDB) -> None:
+    for i in range(NUM_TXS):
+        txid = fake_txid(i)
+        addr = 'bc1qfakeaddress%06d' % (i % 5000)
+        db.add_txo_addr(txid, addr, 0, 10_000 + i, False)
+        db.add_txi_addr(txid, addr, fake_txid(i + 1) + ':1', 5_000 + i)
+        db.add_verified_tx(txid, TxMinedInfo(height=100_000 + i, timestamp=1_600_000_000 + i, txpos=i % 2000, header_hash=fake_txid(i)))
+    for j in range(5000):
+        addr = 'bc1qfakeaddress%06d' % j
+        db.set_addr_history(addr, [(fake_txid(i), 100_000 + i) for i in range(j, NUM_TXS, 5000)])
+
+
+def open_db(path: str, use_sqlite: bool):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    db = WalletDB(WalletStorage(path).read(), manual_upgrades=False)
+    if use_sqlite:
+        db.attach_sqlite_tables(path + '.sqlite')
+    dt = time.perf_counter() - t0
+    mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # a few typical lookups
+    t0 = time.perf_counter()
+    for i in range(0, NUM_TXS, max(1, NUM_TXS // 1000)):
+        txid = fake_txid(i)
+        db.get_txo_addr(txid, 'bc1qfakeaddress%06d' % (i % 5000))
+        db.get_verified_tx(txid)
+    dt_lookup = time.perf_counter() - t0
+    print(f"{'sqlite' if use_sqlite else 'json':>7}: open {dt * 1000:8.1f} ms, "
+          f"memory {mem / 1e6:7.1f} MB, 1000 lookups {dt_lookup * 1000:6.1f} ms")
+
+
+def main():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print(f"{NUM_TXS} txs")
+        for use_sqlite in (False, True):
+            path = os.path.join(tmpdir, 'sqlite' if use_sqlite else 'json')
+            db = WalletDB('', manual_upgrades=False)
+            if use_sqlite:
+                db.attach_sqlite_tables(path + '.sqlite')
+            populate(db)
+            db.write(WalletStorage(path))
+            open_db(path, use_sqlite)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
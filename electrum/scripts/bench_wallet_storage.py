@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#
+# Benchmark: saving a large wallet file, journal (append patches) vs full rewrite.
+#
+# usage: bench_wallet_storage.py [num_txs] [--encrypted]
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+
+from electrum.storage import WalletStorage, StorageEncryptionVersion
+from electrum.wallet_db import WalletDB
+from electrum.util import TxMinedInfo
+
+
+NUM_TXS = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 20_000
+ENCRYPTED = '--encrypted' in sys.argv
+NUM_SAVES = 20
+
+
+def fake_txid(i: int) -> str:
+    return i.to_bytes(32, 'big').hex()
+
+
+def populate(db: WalletDB) -> None:
+    for i in range(NUM_TXS):
+        txid = fake_txid(i)
+        addr = 'bc1qfakeaddress%06d' % (i % 1000)
+        db.add_txo_addr(txid, addr, 0, 10_000 + i, False)
+        db.add_txi_addr(txid, addr, fake_txid(i + 1) + ':1', 5_000 + i)
+        db.add_verified_tx(txid, TxMinedInfo(height=100_000 + i, timestamp=1_600_000_000 + i, txpos=i % 2000, header_hash=fake_txid(i)))
+        db.get_dict('labels')[txid] = 'payment %d' % i
+
+
+def run(use_journal: bool, tmpdir: str) -> float:
+    path = os.path.join(tmpdir, 'journal' if use_journal else 'full')
+    storage = WalletStorage(path)
+    if ENCRYPTED:
+        storage.set_password('password', enc_version=StorageEncryptionVersion.USER_PASSWORD)
+    db = WalletDB('', manual_upgrades=False)
+    db.set_journal_enabled(use_journal)
+    populate(db)
+    db.write(storage)
+    t0 = time.perf_counter()
+    for i in range(NUM_SAVES):
+        # a typical small update: new tx gets verified, label edited
+        txid = fake_txid(NUM_TXS + i)
+        db.add_verified_tx(txid, TxMinedInfo(height=200_000 + i, timestamp=1_700_000_000, txpos=1, header_hash=txid))
+        db.get_dict('labels')[fake_txid(i)] = 'edited %d' % i
+        db.write(storage)
+    dt = (time.perf_counter() - t0) / NUM_SAVES
+    size = os.path.getsize(path)
+    # check the file replays to the same state
+    storage2 = WalletStorage(path)
+    if ENCRYPTED:
+        storage2.decrypt('password')
+    t0 = time.perf_counter()
+    db2 = WalletDB(storage2.read(), manual_upgrades=False)
+    dt_load = time.perf_counter() - t0
+    assert db2.dump() == db.dump()
+    print(f"{'journal' if use_journal else 'full rewrite':>13}: {dt * 1000:9.2f} ms/save, "
+          f"file size {size / 1e6:6.2f} MB, load {dt_load * 1000:8.1f} ms")
+    return dt
+
+
+def main():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print(f"{NUM_TXS} txs, {NUM_SAVES} saves, encrypted={ENCRYPTED}")
+        t_full = run(False, tmpdir)
+        t_journal = run(True, tmpdir)
+        print(f"speedup: {t_full / t_journal:.1f}x")
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -863,6 +863,8 @@ class SimpleConfig(Logger):
     NETWORK_SERVERFINGERPRINT = ConfigVar('serverfingerprint', default=None, type_=str)
     NETWORK_MAX_INCOMING_MSG_SIZE = ConfigVar('network_max_incoming_msg_size', default=1_000_000, type_=int)  # in bytes
     NETWORK_TIMEOUT = ConfigVar('network_timeout', default=None, type_=int)
+    # number of worker processes verifying headers when catching up; 0: verify in the network thread
+    NETWORK_HEADERS_VERIFICATION_PROCESSES = ConfigVar('headers_verification_processes', default=0, type_=int)
 
     WALLET_BATCH_RBF = ConfigVar('batch_rbf', default=False, type_=bool)
     WALLET_SPEND_CONFIRMED_ONLY = ConfigVar('confirmed_only', default=False, type_=bool)
@@ -873,6 +875,14 @@ class SimpleConfig(Logger):
     WALLET_BOLT11_FALLBACK = ConfigVar('bolt11_fallback', default=True, type_=bool)
     WALLET_PAYREQ_EXPIRY_SECONDS = ConfigVar('request_expiry', default=invoices.PR_DEFAULT_EXPIRATION_WHEN_CREATING, type_=int)
     WALLET_USE_SINGLE_PASSWORD = ConfigVar('single_password', default=False, type_=bool)
+    # append changes to the wallet file as patches, instead of rewriting it on every save
+    WALLET_USE_STORAGE_JOURNAL = ConfigVar('wallet_storage_journal', default=False, type_=bool)
+    # keep transactions and tx history of the wallet in an sqlite db next to the wallet file (not for encrypted wallets)
+    WALLET_USE_SQLITE_TX_TABLES = ConfigVar('wallet_sqlite_tx_tables', default=False, type_=bool)
+    # number of threads signing the inputs of large transactions with software keystores; 0: sign serially
+    WALLET_SIGNING_THREADS = ConfigVar('wallet_signing_threads', default=0, type_=int)
+    # min number of inputs of a transaction to be signed in threads
+    WALLET_SIGNING_THREADS_MIN_INPUTS = ConfigVar('wallet_signing_threads_min_inputs', default=200, type_=int)
     # note: 'use_change' and 'multiple_change' are per-wallet settings
 
     FX_USE_EXCHANGE_RATE = ConfigVar('use_exchange_rate', default=False, type_=bool)
@@ -885,6 +895,8 @@ class SimpleConfig(Logger):
     LIGHTNING_LISTEN = ConfigVar('lightning_listen', default=None, type_=str)
     LIGHTNING_PEERS = ConfigVar('lightning_peers', default=None)
     LIGHTNING_USE_GOSSIP = ConfigVar('use_gossip', default=False, type_=bool)
+    # number of worker processes verifying gossip signatures; 0: verify in a thread
+    LIGHTNING_GOSSIP_VERIFICATION_PROCESSES = ConfigVar('gossip_verification_processes', default=0, type_=int)
     LIGHTNING_USE_RECOVERABLE_CHANNELS = ConfigVar('use_recoverable_channels', default=True, type_=bool)
     LIGHTNING_ALLOW_INSTANT_SWAPS = ConfigVar('allow_instant_swaps', default=False, type_=bool)
     LIGHTNING_TO_SELF_DELAY_CSV = ConfigVar('lightning_to_self_delay', default=7 * 144, type_=int)
@@ -3,6 +3,8 @@ import queue
 import threading
 import asyncio
 import sqlite3
+import time
+from typing import NamedTuple, Sequence, Any, Dict, Optional
 
 from .logging import Logger
 from .util import test_read_write_permissions
@@ -21,8 +23,20 @@ def sql(func):
     return wrapper
 
 
+class _QueuedWrite(NamedTuple):
+    statement: str
+    params: Sequence[Any]
+
+
 class SqlDB(Logger):
 
+    # pragmas set on the connection, e.g. 'journal_mode=WAL'
+    SQLITE_PRAGMAS = ()  # type: Sequence[str]
+    # max number of queued writes executed in one transaction
+    MAX_WRITE_BATCH_SIZE = 1000
+    # number of queued requests above which producers are throttled (see throttle_writes)
+    MAX_QUEUE_SIZE = 10_000
+
     def __init__(self, asyncio_loop: asyncio.BaseEventLoop, path, commit_interval=None):
         Logger.__init__(self)
         self.asyncio_loop = asyncio_loop
@@ -32,6 +46,12 @@ class SqlDB(Logger):
         test_read_write_permissions(path)
         self.commit_interval = commit_interval
         self.db_requests = queue.Queue()
+        # metrics
+        self.num_commits = 0
+        self.num_rows_written = 0
+        self.commit_seconds_total = 0.0
+        self.commit_seconds_max = 0.0
+        self.throttled_seconds = 0.0
         self.sql_thread = threading.Thread(target=self.run_sql)
         self.sql_thread.start()
 
@@ -41,17 +61,87 @@ class SqlDB(Logger):
     def filesize(self):
         return os.stat(self.path).st_size
 
+    def queue_write(self, statement: str, params: Sequence[Any]) -> None:
+        """Queues a write statement, without waiting for it to be executed (write-behind).
+        Queued writes are executed in the order of all requests. Consecutive ones are
+        executed in a single transaction, using executemany for runs of the same statement.
+        """
+        assert threading.current_thread() != self.sql_thread
+        self.db_requests.put(_QueuedWrite(statement, params))
+
+    async def throttle_writes(self) -> None:
+        """Waits while too many requests are queued, so that producers
+        do not outpace the sql thread.
+        """
+        t0 = time.monotonic()
+        while self.db_requests.qsize() >= self.MAX_QUEUE_SIZE and not self.stopping:
+            await asyncio.sleep(0.05)
+        self.throttled_seconds += time.monotonic() - t0
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'queue_depth': self.db_requests.qsize(),
+            'num_commits': self.num_commits,
+            'num_rows_written': self.num_rows_written,
+            'commit_latency_avg_ms': round(self.commit_seconds_total / self.num_commits * 1000, 2) if self.num_commits else 0,
+            'commit_latency_max_ms': round(self.commit_seconds_max * 1000, 2),
+            'throttled_seconds': round(self.throttled_seconds, 2),
+        }
+
+    def _execute_writes(self, write: _QueuedWrite) -> Optional[tuple]:
+        """Executes write and the writes queued after it, in one transaction.
+        Returns the request that ended the batch, if it is not a write.
+        """
+        t0 = time.monotonic()
+        statement, rows = write.statement, [write.params]
+        num_rows = 1
+        next_request = None
+        c = self.conn.cursor()
+        while True:
+            try:
+                request = self.db_requests.get_nowait() if num_rows < self.MAX_WRITE_BATCH_SIZE else None
+            except queue.Empty:
+                request = None
+            if isinstance(request, _QueuedWrite) and request.statement == statement:
+                rows.append(request.params)
+                num_rows += 1
+                continue
+            try:
+                c.executemany(statement, rows)
+            except Exception as e:
+                self.logger.warning(f'queued write failed: {statement!r}: {e!r}')
+            if isinstance(request, _QueuedWrite):
+                statement, rows = request.statement, [request.params]
+                num_rows += 1
+                continue
+            next_request = request
+            break
+        self.conn.commit()
+        dt = time.monotonic() - t0
+        self.num_commits += 1
+        self.num_rows_written += num_rows
+        self.commit_seconds_total += dt
+        self.commit_seconds_max = max(self.commit_seconds_max, dt)
+        return next_request
+
     def run_sql(self):
         self.logger.info("SQL thread started")
         self.conn = sqlite3.connect(self.path)
+        for pragma in self.SQLITE_PRAGMAS:
+            self.conn.execute(f"PRAGMA {pragma}")
         self.logger.info("Creating database")
         self.create_database()
         i = 0
         while not self.stopping and self.asyncio_loop.is_running():
             try:
-                future, func, args, kwargs = self.db_requests.get(timeout=0.1)
+                request = self.db_requests.get(timeout=0.1)
             except queue.Empty:
                 continue
+            if isinstance(request, _QueuedWrite):
+                request = self._execute_writes(request)
+                if request is None:
+                    continue
+            future, func, args, kwargs = request
             try:
                 result = func(self, *args, **kwargs)
             except BaseException as e:
@@ -65,12 +155,23 @@ class SqlDB(Logger):
                 i = (i + 1) % self.commit_interval
                 if i == 0:
                     self.conn.commit()
+        # flush queued writes. other pending requests are dropped
+        while True:
+            try:
+                request = self.db_requests.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(request, _QueuedWrite):
+                self._execute_writes(request)
         # write
-        self.conn.commit()
-        self.conn.close()
+        self.close_database()
 
         self.logger.info("SQL thread terminated")
         self.asyncio_loop.call_soon_threadsafe(self.stopped_event.set)
 
     def create_database(self):
         raise NotImplementedError()
+
+    def close_database(self):
+        self.conn.commit()
+        self.conn.close()
@@ -75,11 +75,16 @@ class WalletStorage(Logger):
         else:
             self.raw = ''
             self._encryption_version = StorageEncryptionVersion.PLAINTEXT
+        # sizes of the last full write, and of the patches appended since
+        self._snapshot_size = len(self.raw)
+        self._journal_size = 0
+        self._can_append = True
 
     def read(self):
         return self.decrypted if self.is_encrypted() else self.raw
 
     def write(self, data: str) -> None:
+        """Replaces the file with 'data' (full snapshot)."""
         s = self.encrypt_before_writing(data)
         temp_path = "%s.tmp.%s" % (self.path, os.getpid())
         with open(temp_path, "w", encoding='utf-8') as f:
@@ -98,8 +103,30 @@ class WalletStorage(Logger):
         os.replace(temp_path, self.path)
         os_chmod(self.path, mode)
         self._file_exists = True
+        self._snapshot_size = len(s)
+        self._journal_size = 0
+        self._can_append = True
         self.logger.info(f"saved {self.path}")
 
+    def append(self, data: str) -> None:
+        """Appends patch records to the file.
+        If the storage is encrypted, the records are encrypted as a separate chunk.
+        """
+        assert self.file_exists() and self._can_append
+        s = data
+        if self.pubkey:
+            s = '\n' + self.encrypt_before_writing(data)
+        with open(self.path, "a", encoding='utf-8') as f:
+            f.write(s)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_size += len(s)
+        self.logger.info(f"appended {len(s)} bytes to {self.path}")
+
+    def needs_consolidation(self) -> bool:
+        """Whether the next write should be a full write instead of an append."""
+        return not self._can_append or self._journal_size > self._snapshot_size
+
     def file_exists(self) -> bool:
         return self._file_exists
 
@@ -135,7 +162,8 @@ class WalletStorage(Logger):
 
     def _init_encryption_version(self):
         try:
-            magic = base64.b64decode(self.raw)[0:4]
+            # note: appended chunks are on separate lines
+            magic = base64.b64decode(self.raw.split('\n', 1)[0])[0:4]
             if magic == b'BIE1':
                 return StorageEncryptionVersion.USER_PASSWORD
             elif magic == b'BIE2':
@@ -169,8 +197,22 @@ class WalletStorage(Logger):
         ec_key = self.get_eckey_from_password(password)
         if self.raw:
             enc_magic = self._get_encryption_magic()
-            s = zlib.decompress(ec_key.decrypt_message(self.raw, enc_magic))
-            s = s.decode('utf8')
+            chunks = self.raw.split('\n')
+            parts = []
+            for i, chunk in enumerate(chunks):
+                try:
+                    s = zlib.decompress(ec_key.decrypt_message(chunk, enc_magic))
+                except Exception:
+                    # the first chunk tells us if the password is wrong.
+                    # the last chunk might be incomplete (e.g. crash during append)
+                    if i == 0 or i < len(chunks) - 1:
+                        raise
+                    self.logger.warning(f"discarding incomplete chunk at end of file ({len(chunk)} bytes)")
+                    # the file must be rewritten, new chunks must not be appended after it
+                    self._can_append = False
+                    continue
+                parts.append(s.decode('utf8'))
+            s = ''.join(parts)
         else:
             s = ''
         self.pubkey = ec_key.get_public_key_hex()
@@ -212,6 +254,8 @@ class WalletStorage(Logger):
         else:
             self.pubkey = None
             self._encryption_version = StorageEncryptionVersion.PLAINTEXT
+        # the file must be rewritten with the new key
+        self._can_append = False
 
     def basename(self) -> str:
         return os.path.basename(self.path)
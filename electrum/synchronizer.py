@@ -24,7 +24,8 @@
 # SOFTWARE.
 import asyncio
 import hashlib
-from typing import Dict, List, TYPE_CHECKING, Tuple, Set
+import time
+from typing import Dict, List, TYPE_CHECKING, Tuple, Set, Any, Union, Optional
 from collections import defaultdict
 import logging
 
@@ -35,13 +36,18 @@ from .transaction import Transaction, PartialTransaction
 from .util import make_aiohttp_session, NetworkJobOnDefaultServer, random_shuffled_copy, OldTaskGroup
 from .bitcoin import address_to_scripthash, is_address
 from .logging import Logger
-from .interface import GracefulDisconnect, NetworkTimeout
+from .interface import GracefulDisconnect, NetworkTimeout, RequestBatcher
 
 if TYPE_CHECKING:
     from .network import Network
     from .address_synchronizer import AddressSynchronizer
 
 
+# max number of requests in a JSON-RPC batch
+HISTORY_BATCH_SIZE = 50
+TRANSACTION_BATCH_SIZE = 20
+
+
 class SynchronizerFailure(Exception): pass
 
 
@@ -146,6 +152,10 @@ class Synchronizer(SynchronizerBase):
         self.requested_tx = {}
         self.requested_histories = set()
         self._stale_histories = dict()  # type: Dict[str, asyncio.Task]
+        self._history_batcher = RequestBatcher(self._get_histories, max_batch_size=HISTORY_BATCH_SIZE)
+        self._tx_batcher = RequestBatcher(self._get_transactions, max_batch_size=TRANSACTION_BATCH_SIZE)
+        self._start_time = None  # type: Optional[float]
+        self.time_to_up_to_date = None  # type: Optional[float]  # seconds, since last (re)start
 
     def diagnostic_name(self):
         return self.adb.diagnostic_name()
@@ -176,8 +186,7 @@ class Synchronizer(SynchronizerBase):
             self._handling_addr_statuses.discard(addr)
         h = address_to_scripthash(addr)
         self._requests_sent += 1
-        async with self._network_request_semaphore:
-            result = await self.interface.get_history_for_scripthash(h)
+        result = await self._history_batcher.request(h)
         self._requests_answered += 1
         self.logger.info(f"receiving history {addr} {len(result)}")
         hist = list(map(lambda item: (item['tx_hash'], item['height']), result))
@@ -225,8 +234,7 @@ class Synchronizer(SynchronizerBase):
     async def _get_transaction(self, tx_hash, *, allow_server_not_finding_tx=False):
         self._requests_sent += 1
         try:
-            async with self._network_request_semaphore:
-                raw_tx = await self.interface.get_transaction(tx_hash)
+            tx = await self._tx_batcher.request(tx_hash)
         except RPCError as e:
             # most likely, "No such mempool or blockchain transaction"
             if allow_server_not_finding_tx:
@@ -236,14 +244,30 @@ class Synchronizer(SynchronizerBase):
                 raise
         finally:
             self._requests_answered += 1
-        tx = Transaction(raw_tx)
-        if tx_hash != tx.txid():
-            raise SynchronizerFailure(f"received tx does not match expected txid ({tx_hash} != {tx.txid()})")
+        # note: tx was already deserialized and its txid checked by the interface
         tx_height = self.requested_tx.pop(tx_hash)
         self.adb.receive_tx_callback(tx_hash, tx, tx_height)
-        self.logger.info(f"received tx {tx_hash} height: {tx_height} bytes: {len(raw_tx)}")
+        self.logger.info(f"received tx {tx_hash} height: {tx_height} bytes: {len(tx.serialize()) // 2}")
+
+    async def _get_histories(self, scripthashes: List[str]) -> List[Union[List[dict], RPCError]]:
+        async with self._network_request_semaphore:
+            return await self.interface.get_history_for_scripthashes(scripthashes)
+
+    async def _get_transactions(self, tx_hashes: List[str]) -> List[Union[Transaction, RPCError]]:
+        async with self._network_request_semaphore:
+            return await self.interface.get_transactions(tx_hashes)
+
+    def get_batch_metrics(self) -> Dict[str, Any]:
+        return {
+            'history': self._history_batcher.get_metrics(),
+            'transaction': self._tx_batcher.get_metrics(),
+            'time_to_up_to_date': self.time_to_up_to_date,
+        }
 
     async def main(self):
+        self._start_time = time.monotonic()
+        await self.taskgroup.spawn(self._history_batcher.run(taskgroup=self.taskgroup))
+        await self.taskgroup.spawn(self._tx_batcher.run(taskgroup=self.taskgroup))
         self.adb.up_to_date_changed()
         # request missing txns, if any
         for addr in random_shuffled_copy(self.adb.db.get_history()):
@@ -263,6 +287,9 @@ class Synchronizer(SynchronizerBase):
             for addr in self._adding_addrs.copy(): # copy set to ensure iterator stability
                 await self._add_address(addr)
             up_to_date = self.adb.is_up_to_date()
+            if up_to_date and self.time_to_up_to_date is None:
+                self.time_to_up_to_date = time.monotonic() - self._start_time
+                self.logger.info(f"up to date after {self.time_to_up_to_date:.2f} s. {self.get_batch_metrics()}")
             # see if status changed
             if (up_to_date != prev_uptodate
                     or up_to_date and self._processed_some_notifications):
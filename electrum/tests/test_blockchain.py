@@ -1,10 +1,13 @@
+import concurrent.futures
 import shutil
 import tempfile
 import os
 
 from electrum import constants, blockchain
 from electrum.simple_config import SimpleConfig
-from electrum.blockchain import Blockchain, deserialize_header, hash_header, InvalidHeader
+from electrum.blockchain import (Blockchain, deserialize_header, hash_header, InvalidHeader, serialize_header,
+                                 verify_raw_headers, ChunkToVerify)
+from electrum.crypto import sha256d
 from electrum.util import bfh, make_dir
 
 from . import ElectrumTestCase
@@ -384,6 +387,57 @@ class TestBlockchain(ElectrumTestCase):
         self.assertEqual([chain_u], self.get_chains_that_contain_header_helper(self.HEADERS['O']))
         self.assertEqual([chain_z, chain_l], self.get_chains_that_contain_header_helper(self.HEADERS['I']))
 
+    def test_header_cache_coherent_after_writes(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        for name in 'ABCDEFO':
+            self._append_header(chain_u, self.HEADERS[name])
+        self.assertEqual(hash_header(self.HEADERS['O']), chain_u.get_hash(6))
+        self.assertEqual(self.HEADERS['O'], chain_u.read_header(6))
+        # overwrite the tip with a competing header, truncating the file
+        chain_u.write(bfh(blockchain.serialize_header(self.HEADERS['G'])), 6 * 80)
+        self.assertEqual(hash_header(self.HEADERS['G']), chain_u.get_hash(6))
+        self.assertEqual(self.HEADERS['G'], chain_u.read_header(6))
+        # truncate further
+        chain_u.write(b'', 5 * 80)
+        self.assertEqual(4, chain_u.height())
+        self.assertIsNone(chain_u.read_header(5))
+        with self.assertRaises(blockchain.MissingHeader):
+            chain_u.get_hash(5)
+        # the file can be reopened after closing it
+        chain_u.close_headers_file()
+        self.assertEqual(hash_header(self.HEADERS['E']), chain_u.get_hash(4))
+        self._append_header(chain_u, self.HEADERS['F'])
+        self.assertEqual(hash_header(self.HEADERS['F']), chain_u.get_hash(5))
+
+    def test_connect_chunks(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain.path(), 'w+').close()
+        # regtest: proof of work is not checked, so we can make up the headers
+        headers = [bfh(serialize_header(self.HEADERS['A']))]
+        for height in range(1, 2 * 2016 + 10):
+            headers.append(bfh("00000020") + sha256d(headers[-1]) + sha256d(bytes(height)) + bytes(12))
+        chunks = [b''.join(headers[i:i + 2016]).hex() for i in range(0, len(headers), 2016)]
+        bad_chunk = (b''.join(headers[2016:2016 + 100]) + headers[0] + b''.join(headers[2016 + 101:2 * 2016])).hex()
+        # chunks after an invalid one are not connected
+        self.assertEqual(1, chain.connect_chunks(chain.prepare_chunks(0, [chunks[0], bad_chunk, chunks[2]])))
+        self.assertEqual(2015, chain.height())
+        # a chunk conflicting with the stored ones is not connected
+        self.assertEqual(0, chain.connect_chunks(chain.prepare_chunks(0, [chunks[1]])))
+        # chunks verified elsewhere
+        to_verify = chain.prepare_chunks(1, chunks[1:])
+        self.assertEqual(0, chain.connect_chunks(to_verify, [InvalidHeader(), sha256d(bytes(32))]))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(ChunkToVerify.verify, to_verify))
+        self.assertEqual(2, chain.connect_chunks(to_verify, results))
+        self.assertEqual(len(headers) - 1, chain.height())
+        self.assertEqual(sha256d(headers[-1])[::-1].hex(), chain.get_hash(len(headers) - 1))
+        self.assertEqual(b''.join(headers), b''.join(chain._read_raw_header(h) for h in range(len(headers))))
+
     def test_target_to_bits(self):
         # https://github.com/bitcoin/bitcoin/blob/7fcf53f7b4524572d1d0c9a5fdc388e87eb02416/src/arith_uint256.h#L269
         self.assertEqual(0x05123456, Blockchain.target_to_bits(0x1234560000))
@@ -458,3 +512,16 @@ class TestVerifyHeader(ElectrumTestCase):
         with self.assertRaises(InvalidHeader):
             self.header["nonce"] = 42
             Blockchain.verify_header(self.header, self.prev_hash, self.target)
+
+    def test_verify_raw_headers(self):
+        raw_header = bfh(self.valid_header)
+        prev_hash = bfh(self.prev_hash)[::-1]
+        self.assertEqual(sha256d(raw_header), verify_raw_headers(raw_header, prev_hash=prev_hash, target=self.target))
+        with self.assertRaises(InvalidHeader):  # prev hash mismatch
+            verify_raw_headers(raw_header, prev_hash=bytes(32), target=self.target)
+        with self.assertRaises(InvalidHeader):  # target mismatch
+            verify_raw_headers(raw_header, prev_hash=prev_hash, target=Blockchain.bits_to_target(0x1d00eeee))
+        with self.assertRaises(InvalidHeader):  # insufficient pow
+            verify_raw_headers(raw_header[:-4] + bytes(4), prev_hash=prev_hash, target=self.target)
+        # bits and pow are not checked on testnet
+        verify_raw_headers(raw_header[:-4] + bytes(4), prev_hash=prev_hash, target=0, check_pow=False)
@@ -1,4 +1,4 @@
-from electrum.coinchooser import CoinChooserPrivacy
+from electrum.coinchooser import CoinChooserPrivacy, CoinChooserBnB, Bucket, ScoredCandidate, PRNG
 from electrum.util import NotEnoughFunds
 
 from . import ElectrumTestCase
@@ -18,3 +18,51 @@ class TestCoinChooser(ElectrumTestCase):
             coin_chooser.bucket_candidates_any([], sufficient_funds)
         with self.assertRaises(NotEnoughFunds):
             coin_chooser.bucket_candidates_prefer_confirmed([], sufficient_funds)
+
+
+class TestCoinChooserBnB(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.coin_chooser = CoinChooserBnB(enable_output_value_rounding=False)
+        self.coin_chooser.p = PRNG(b'')
+
+    def _buckets(self, values, *, min_height=1):
+        return [Bucket(desc=str(i), weight=272, value=v, effective_value=v, coins=[],
+                       min_height=min_height, witness=True)
+                for i, v in enumerate(values)]
+
+    def _choose(self, buckets, target, cost_of_change):
+        self.coin_chooser.target_effective_value = target
+        self.coin_chooser.cost_of_change = cost_of_change
+        def sufficient_funds(bkts, *, bucket_value_sum):
+            return sum(b.effective_value for b in bkts) >= target
+        def penalty_func(bkts):
+            return ScoredCandidate(0, None, bkts)
+        winner = self.coin_chooser.choose_buckets(buckets, sufficient_funds, penalty_func)
+        return sorted(b.effective_value for b in winner.buckets)
+
+    def test_bnb_finds_changeless_solution(self):
+        buckets = self._buckets([1000, 2000, 3000, 4000, 5000, 70_000])
+        self.assertEqual([2000, 5000], self._choose(buckets, 7000, 100))
+        self.assertEqual([1000, 2000, 3000, 4000, 5000], self._choose(buckets, 14_950, 100))
+        # least excess within the window
+        buckets = self._buckets([6010, 6050, 9000])
+        self.assertEqual([6010], self._choose(buckets, 6000, 100))
+
+    def test_knapsack_leaves_change_above_cost_of_change(self):
+        buckets = self._buckets([1000, 2000, 3000, 4000, 5000, 70_000])
+        self.assertEqual(9000, sum(self._choose(buckets, 8600, 100)))
+        # the smallest coin that is enough by itself
+        self.assertEqual([70_000], self._choose(buckets, 16_000, 100))
+
+    def test_prefers_confirmed_coins(self):
+        buckets = self._buckets([1000, 2000]) + self._buckets([3000], min_height=0)
+        self.assertEqual([1000, 2000], self._choose(buckets, 3000, 0))
+        buckets = self._buckets([3000]) + self._buckets([1000, 2000], min_height=0)
+        self.assertEqual([3000], self._choose(buckets, 3000, 0))
+
+    def test_not_enough_funds(self):
+        buckets = self._buckets([1000, 2000])
+        with self.assertRaises(NotEnoughFunds):
+            self._choose(buckets, 3001, 0)
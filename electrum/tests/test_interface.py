@@ -1,4 +1,9 @@
-from electrum.interface import ServerAddr
+import asyncio
+
+from aiorpcx import RPCError
+
+from electrum.interface import ServerAddr, RequestBatcher, RequestCorrupted
+from electrum.util import OldTaskGroup
 
 from . import ElectrumTestCase
 
@@ -46,3 +51,39 @@ class TestServerAddr(ElectrumTestCase):
                          ServerAddr(host="2400:6180:0:d1::86b:e001", port=50002, protocol="s").to_friendly_name())
         self.assertEqual("[2400:6180:0:d1::86b:e001]:50001:t",
                          ServerAddr(host="2400:6180:0:d1::86b:e001", port=50001, protocol="t").to_friendly_name())
+
+
+class TestRequestBatcher(ElectrumTestCase):
+
+    async def test_requests_are_batched(self):
+        sent_batches = []
+
+        async def send_batch(args):
+            sent_batches.append(args)
+            await asyncio.sleep(0.01)
+            return [RPCError(1, "not found") if arg < 0 else 2 * arg for arg in args]
+
+        batcher = RequestBatcher(send_batch, max_batch_size=4)
+        async with OldTaskGroup() as group:
+            run_task = await group.spawn(batcher.run(taskgroup=group))
+            results = await asyncio.gather(*[batcher.request(i) for i in range(10)])
+            self.assertEqual([2 * i for i in range(10)], results)
+            self.assertEqual([[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]], sent_batches)
+            # errors are raised only for the requests that failed
+            results = await asyncio.gather(batcher.request(5), batcher.request(-1), return_exceptions=True)
+            self.assertEqual(10, results[0])
+            self.assertIsInstance(results[1], RPCError)
+            run_task.cancel()
+        self.assertEqual({'num_requests': 12, 'num_batches': 4, 'avg_batch_size': 3, 'largest_batch': 4},
+                         batcher.get_metrics())
+
+    async def test_failed_batch(self):
+        async def send_batch(args):
+            raise RequestCorrupted("garbage")
+
+        batcher = RequestBatcher(send_batch, max_batch_size=4)
+        async with OldTaskGroup() as group:
+            run_task = await group.spawn(batcher.run(taskgroup=group))
+            results = await asyncio.gather(batcher.request(1), batcher.request(2), return_exceptions=True)
+            self.assertTrue(all(isinstance(res, RequestCorrupted) for res in results))
+            run_task.cancel()
@@ -253,6 +253,42 @@ class TestChannel(ElectrumTestCase):
 
         self.htlc = self.bob_channel.hm.log[REMOTE]['adds'][0]
 
+    def test_commitment_cache(self):
+        alice_channel, bob_channel = self.alice_channel, self.bob_channel
+        latest_ctx = alice_channel.get_latest_commitment(LOCAL)
+        next_ctx = alice_channel.get_next_commitment(REMOTE)
+        self.assertIs(latest_ctx, alice_channel.get_latest_commitment(LOCAL))
+        self.assertIs(next_ctx, alice_channel.get_next_commitment(REMOTE))
+        # a change of the log invalidates the next commitments, but not the signed ones
+        htlc_dict = dict(self.htlc_dict, payment_hash=bitcoin.sha256(b'\x02' * 32))
+        alice_channel.add_htlc(htlc_dict)
+        self.assertIs(latest_ctx, alice_channel.get_latest_commitment(LOCAL))
+        new_next_ctx = alice_channel.get_next_commitment(REMOTE)
+        self.assertEqual(len(next_ctx.outputs()) + 1, len(new_next_ctx.outputs()))
+        self.assertEqual(new_next_ctx.outputs(), alice_channel.make_commitment(
+            REMOTE, alice_channel.config[REMOTE].next_per_commitment_point,
+            alice_channel.get_next_ctn(REMOTE)).outputs())
+        # the next commitment becomes the latest one when it is signed
+        alice_channel.sign_next_commitment()
+        self.assertIs(new_next_ctx, alice_channel.get_latest_commitment(REMOTE))
+        # signing does not modify the cached commitment
+        self.assertFalse(new_next_ctx.inputs()[0].part_sigs)
+        alice_channel.force_close_tx()
+        self.assertFalse(latest_ctx.inputs()[0].part_sigs)
+
+    def test_commitment_cache_secret_of_revoked_ctn(self):
+        alice_channel, bob_channel = self.alice_channel, self.bob_channel
+        ctn = alice_channel.get_latest_ctn(REMOTE)
+        secret, ctx = alice_channel.get_secret_and_commitment(REMOTE, ctn=ctn)
+        self.assertIsNone(secret)
+        force_state_transition(alice_channel, bob_channel)
+        self.assertLess(ctn, alice_channel.get_oldest_unrevoked_ctn(REMOTE))
+        # the ctx is still cached, the secret is the one just revealed by the remote
+        secret, cached_ctx = alice_channel.get_secret_and_commitment(REMOTE, ctn=ctn)
+        self.assertIs(ctx, cached_ctx)
+        self.assertIsNotNone(secret)
+        self.assertEqual(alice_channel.get_secret_and_point(REMOTE, ctn)[0], secret)
+
     def test_concurrent_reversed_payment(self):
         self.htlc_dict['payment_hash'] = bitcoin.sha256(32 * b'\x02')
         self.htlc_dict['amount_msat'] += 1000
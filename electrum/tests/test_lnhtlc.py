@@ -2,7 +2,7 @@ from pprint import pprint
 import unittest
 from typing import NamedTuple
 
-from electrum.lnutil import RECEIVED, LOCAL, REMOTE, SENT, HTLCOwner, Direction
+from electrum.lnutil import RECEIVED, LOCAL, REMOTE, SENT, HTLCOwner, Direction, UpdateAddHtlc
 from electrum.lnhtlc import HTLCManager
 from electrum.json_db import StoredDict
 
@@ -246,3 +246,82 @@ class TestHTLCManager(ElectrumTestCase):
         B.send_rev()
         A.recv_rev()
         self.assertEqual({2: [b"upd_msg2"]}, A.get_unacked_local_updates())
+
+    def test_archived_htlcs(self):
+        def commit(X, Y):
+            X.send_ctx()
+            Y.recv_ctx()
+            Y.send_rev()
+            X.recv_rev()
+
+        def run(archive_chunk_size):
+            A = HTLCManager(StoredDict({}, None, []))
+            B = HTLCManager(StoredDict({}, None, []))
+            A.ARCHIVE_CHUNK_SIZE = B.ARCHIVE_CHUNK_SIZE = archive_chunk_size
+            A.channel_open_finished()
+            B.channel_open_finished()
+            for i in range(10):
+                for X, Y in ((A, B), (B, A)):
+                    htlc = UpdateAddHtlc(amount_msat=1000 * (i + 1), payment_hash=bytes([i]) * 32,
+                                         cltv_expiry=500 + i, timestamp=i, htlc_id=i)
+                    Y.recv_htlc(X.send_htlc(htlc))
+                commit(A, B)
+                commit(B, A)
+                for X, Y in ((A, B), (B, A)):
+                    if i % 3:
+                        Y.send_settle(i)
+                        X.recv_settle(i)
+                    else:
+                        Y.send_fail(i)
+                        X.recv_fail(i)
+                commit(A, B)
+                commit(B, A)
+            return A, B
+
+        ref_A, ref_B = run(archive_chunk_size=1000)
+        A, B = run(archive_chunk_size=3)
+        self.assertEqual(3, len(A.log[LOCAL]['archive_checkpoints']))
+        self.assertEqual(1, len(A.log[LOCAL]['adds']))
+        self.assertEqual(ref_A.get_next_htlc_id(LOCAL), A.get_next_htlc_id(LOCAL))
+
+        key = lambda x: (x[0], x[1].htlc_id)
+        for hm, ref in ((A, ref_A), (B, ref_B)):
+            self.assertEqual(sorted(ref.all_htlcs_ever(), key=key), sorted(hm.all_htlcs_ever(), key=key))
+            for htlc_proposer in (LOCAL, REMOTE):
+                for htlc_id in range(10):
+                    self.assertEqual(ref.get_htlc_by_id(htlc_proposer, htlc_id), hm.get_htlc_by_id(htlc_proposer, htlc_id))
+                    for f in (HTLCManager.was_htlc_failed, HTLCManager.was_htlc_preimage_released,
+                              HTLCManager.is_htlc_irrevocably_added_yet, HTLCManager.is_htlc_irrevocably_removed_yet):
+                        self.assertEqual(f(ref, htlc_proposer=htlc_proposer, htlc_id=htlc_id),
+                                         f(hm, htlc_proposer=htlc_proposer, htlc_id=htlc_id))
+            for subject in (LOCAL, REMOTE):
+                for direction in (SENT, RECEIVED):
+                    self.assertEqual(sum(htlc.amount_msat for htlc in ref.all_settled_htlcs_ever_by_direction(subject, direction)),
+                                     hm.get_settled_msat_by_direction(subject, direction))
+                # old ctns are answered from the archive
+                for ctn in range(hm.ctn_latest(subject) + 2):
+                    self.assertEqual(sorted(ref.htlcs(subject, ctn), key=key), sorted(hm.htlcs(subject, ctn), key=key))
+                    self.assertEqual(sorted(ref.all_settled_htlcs_ever(subject, ctn), key=key),
+                                     sorted(hm.all_settled_htlcs_ever(subject, ctn), key=key))
+                    for whose in (LOCAL, REMOTE):
+                        self.assertEqual(ref.get_balance_msat(whose, ctx_owner=subject, ctn=ctn, initial_balance_msat=10**6),
+                                         hm.get_balance_msat(whose, ctx_owner=subject, ctn=ctn, initial_balance_msat=10**6))
+                    for f in (HTLCManager.received_in_ctn, HTLCManager.sent_in_ctn, HTLCManager.failed_in_ctn):
+                        self.assertEqual(f(ref, ctn), f(hm, ctn))
+            # the balance delta of archived htlcs is restored from the checkpoints
+            reloaded = HTLCManager(hm.log)
+            self.assertEqual(ref.get_balance_msat(LOCAL, initial_balance_msat=10**6),
+                             reloaded.get_balance_msat(LOCAL, initial_balance_msat=10**6))
+
+        # a log that was not archived yet is archived over several revocations, not when it is loaded
+        balance = ref_A.get_balance_msat(LOCAL, initial_balance_msat=10**6)
+        A, B = HTLCManager(ref_A.log), HTLCManager(ref_B.log)
+        A.ARCHIVE_CHUNK_SIZE = B.ARCHIVE_CHUNK_SIZE = 2
+        self.assertEqual(0, len(A.log[LOCAL]['archive_checkpoints']))
+        for num_chunks in range(1, 5):
+            commit(A, B)
+            self.assertEqual(num_chunks, len(A.log[LOCAL]['archive_checkpoints']))
+            self.assertEqual(num_chunks, len(A.log[REMOTE]['archive_checkpoints']))
+            self.assertEqual(balance, A.get_balance_msat(LOCAL, initial_balance_msat=10**6))
+        commit(A, B)
+        self.assertEqual(4, len(A.log[LOCAL]['archive_checkpoints']))
@@ -358,6 +358,21 @@ class TestLNMsg(ElectrumTestCase):
                           }}),
                          decode_msg(bfh("001000022200000302aaa2012043497fd7f826957108f4a30fd9cec3aeba79972084e90ead01ea330900000000")))
 
+    def test_decode_msg__truncated(self):
+        channel_update = bfh("01020000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000043497fd7f826957108f4a30fd9cec3aeba79972084e90ead01ea33090000000000d43100006f00025e6ed0830100009000000000000000c8000001f400000023000000003b9aca00")
+        commitment_signed = bfh("008401010101010101010101010101010101010101010101010101010101010101013b14af0c549dfb1fb287ff57c012371b3932996db5929eda5f251704751fb49d0dc2dcb88e5021575cb572fb71693758543f97d89e9165f913bfb7488d7cc26500012d31103b9f6e71131e4fee86fdfbdeba90e52b43fcfd11e8e53811cd4d59b2575ae6c3c82f85bea144c88cc35e568f1e6bdd0c57337e86de0b5da7cd9994067a")
+        for msg, msg_type_name in ((channel_update, "channel_update"), (commitment_signed, "commitment_signed")):
+            for i in range(2, len(msg)):
+                with self.assertRaises(UnexpectedEndOfStream) as ctx:
+                    decode_msg(msg[:i])
+                self.assertEqual(msg_type_name, ctx.exception.msg_type_name)
+            # trailing data after the last field is ignored
+            self.assertEqual(decode_msg(msg), decode_msg(msg + b"\x00"))
+        # tlv record length that does not fit in the stream
+        lnser = LNSerializer()
+        with self.assertRaises(UnexpectedEndOfStream):
+            lnser.read_tlv_stream(fd=io.BytesIO(bfh("01ffffffffffffffffff00")), tlv_stream_name="n1")
+
     def test_decode_onion_error(self):
         orf = OnionRoutingFailure.from_bytes(bfh("400f0000000017d2d8b0001d9458"))
         self.assertEqual(('incorrect_or_unknown_payment_details', {'htlc_msat': 399694000, 'height': 1938520}),
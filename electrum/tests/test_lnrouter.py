@@ -2,16 +2,22 @@ from math import inf
 import unittest
 import tempfile
 import shutil
+import os
+import time
+import random
 import asyncio
+import sqlite3
 from typing import Optional
 
 from electrum import util
 from electrum.util import bfh
-from electrum.lnutil import ShortChannelID
+from electrum.lnutil import ShortChannelID, NUM_MAX_EDGES_IN_PAYMENT_PATH, LNPeerAddr
+from electrum.channel_db import ChannelInfo, Policy, verify_gossip_signatures
 from electrum.lnonion import (OnionHopsDataSingle, new_onion_packet,
                               process_onion_packet, _decode_onion_error, decode_onion_error,
                               OnionFailureCode, OnionPacket)
-from electrum import bitcoin, lnrouter
+from electrum import bitcoin, ecc, lnrouter
+from electrum.crypto import sha256d
 from electrum.constants import BitcoinTestnet
 from electrum.simple_config import SimpleConfig
 from electrum.lnrouter import PathEdge, LiquidityHintMgr, DEFAULT_PENALTY_PROPORTIONAL_MILLIONTH, DEFAULT_PENALTY_BASE_MSAT, fee_for_edge_msat
@@ -28,6 +34,29 @@ def node(character: str) -> bytes:
     return b'\x02' + f'{character}'.encode() * 32
 
 
+def numbered_node(number: int) -> bytes:
+    return b'\x02' + number.to_bytes(32, 'big')
+
+
+def add_public_channel(cdb: lnrouter.ChannelDB, short_channel_id: ShortChannelID, node1: bytes, node2: bytes, *,
+                       fee_base_msat: int = 100, fee_proportional_millionths: int = 150,
+                       cltv_expiry_delta: int = 10, htlc_maximum_msat: int = None) -> None:
+    """Adds an already validated channel with both policies to the channel db."""
+    cdb._channels[short_channel_id] = ChannelInfo(short_channel_id, node1, node2, None)
+    cdb.graph.add_channel(cdb._channels[short_channel_id])
+    for start_node in (node1, node2):
+        cdb.graph.set_policy(Policy(
+            key=short_channel_id + start_node,
+            cltv_expiry_delta=cltv_expiry_delta,
+            htlc_minimum_msat=250,
+            htlc_maximum_msat=htlc_maximum_msat,
+            fee_base_msat=fee_base_msat,
+            fee_proportional_millionths=fee_proportional_millionths,
+            channel_flags=0 if start_node == node1 else 1,
+            message_flags=0,
+            timestamp=0))
+
+
 class Test_LNRouter(ElectrumTestCase):
     TESTNET = True
 
@@ -45,6 +74,18 @@ class Test_LNRouter(ElectrumTestCase):
             await self.cdb.stopped_event.wait()
         await super().asyncTearDown()
 
+    def prepare_channel_db(self):
+        class fake_network:
+            config = self.config
+            asyncio_loop = util.get_asyncio_loop()
+            trigger_callback = lambda *args: None
+            register_callback = lambda *args: None
+            interface = None
+        fake_network.channel_db = lnrouter.ChannelDB(fake_network())
+        fake_network.channel_db.data_loaded.set()
+        self.cdb = fake_network.channel_db
+        self.path_finder = lnrouter.LNPathFinder(self.cdb)
+
     def prepare_graph(self):
         """
         Network topology with channel ids:
@@ -63,16 +104,7 @@ class Test_LNRouter(ElectrumTestCase):
         A -6-> D -4-> C -1-> B -2-> E
         A -3-> B -1-> C -4-> D -5-> E
         """
-        class fake_network:
-            config = self.config
-            asyncio_loop = util.get_asyncio_loop()
-            trigger_callback = lambda *args: None
-            register_callback = lambda *args: None
-            interface = None
-        fake_network.channel_db = lnrouter.ChannelDB(fake_network())
-        fake_network.channel_db.data_loaded.set()
-        self.cdb = fake_network.channel_db
-        self.path_finder = lnrouter.LNPathFinder(self.cdb)
+        self.prepare_channel_db()
         self.assertEqual(self.cdb.num_channels, 0)
         self.cdb.add_channel_announcements({
             'node_id_1': node('b'), 'node_id_2': node('c'),
@@ -141,6 +173,133 @@ class Test_LNRouter(ElectrumTestCase):
         add_chan_upd({'short_channel_id': channel(7), 'message_flags': b'\x00', 'channel_flags': b'\x00', 'cltv_expiry_delta': 10, 'htlc_minimum_msat': 250, 'fee_base_msat': 100, 'fee_proportional_millionths': 150, 'chain_hash': BitcoinTestnet.rev_genesis_bytes(), 'timestamp': 0})
         add_chan_upd({'short_channel_id': channel(7), 'message_flags': b'\x00', 'channel_flags': b'\x01', 'cltv_expiry_delta': 10, 'htlc_minimum_msat': 250, 'fee_base_msat': 100, 'fee_proportional_millionths': 150, 'chain_hash': BitcoinTestnet.rev_genesis_bytes(), 'timestamp': 0})
 
+    async def test_graph_snapshot(self):
+        self.prepare_graph()
+        self.cdb.add_node_announcements({
+            'node_id': node('a'), 'features': b'', 'addresses': b'', 'alias': b'alice\x00', 'timestamp': 1})
+        network = self.cdb.network
+        channels, policies, nodes = self.cdb._channels, self.cdb.get_node_policies(), self.cdb._nodes
+        self.assertEqual(7, len(channels))
+        # snapshot is written on shutdown
+        self.cdb.stop()
+        await self.cdb.stopped_event.wait()
+        self.assertTrue(os.path.exists(self.cdb.get_snapshot_path()))
+        # note: the graph was never written to the sql db, so it can only be loaded from the snapshot
+        self.cdb = lnrouter.ChannelDB(network)
+        loaded_policies = self.cdb._load_snapshot()
+        self.assertIsNotNone(loaded_policies)
+        self.cdb._build_graph(loaded_policies)
+        self.assertEqual(channels, self.cdb._channels)
+        self.assertEqual(policies, self.cdb.get_node_policies())
+        self.assertEqual(nodes, self.cdb._nodes)
+        self.assertEqual('alice', self.cdb.get_node_info_for_node_id(node('a')).alias)
+        # the snapshot is not used if the sql db changed after it was written
+        db_path = self.cdb.path
+        os.utime(db_path, ns=(time.time_ns(), os.stat(db_path).st_mtime_ns + 1000))
+        self.assertIsNone(self.cdb._load_snapshot())
+
+    async def test_batched_db_writes(self):
+        self.prepare_channel_db()
+        for i in range(1, 101):
+            self.cdb._db_save_policy(channel(i) + node('a'), b'upd%d' % i)
+        self.cdb._db_delete_policy(node('a'), channel(1))
+        self.cdb._db_save_policy(channel(1) + node('a'), b'upd1 again')
+        self.cdb._db_save_node_addresses([LNPeerAddr('127.0.0.1', 9735, node('b'))] * 2)
+        await self.cdb.throttle_writes()  # below MAX_QUEUE_SIZE, does not block
+        # queued writes are flushed on shutdown
+        self.cdb.stop()
+        await self.cdb.stopped_event.wait()
+        metrics = self.cdb.get_metrics()
+        self.assertEqual(0, metrics['queue_depth'])
+        self.assertEqual(104, metrics['num_rows_written'])
+        # the writes are batched, not committed one by one
+        self.assertLessEqual(1, metrics['num_commits'])
+        self.assertGreater(20, metrics['num_commits'])
+        conn = sqlite3.connect(self.cdb.path)
+        try:
+            self.assertEqual(100, conn.execute("SELECT COUNT(*) FROM policy").fetchone()[0])
+            self.assertEqual(b'upd1 again', conn.execute(
+                "SELECT msg FROM policy WHERE key=?", (channel(1) + node('a'),)).fetchone()[0])
+            self.assertEqual(1, conn.execute("SELECT COUNT(*) FROM address").fetchone()[0])
+            self.assertEqual('wal', conn.execute("PRAGMA journal_mode").fetchone()[0])
+        finally:
+            conn.close()
+        self.cdb = None
+
+    async def test_gossip_dedupe_before_verification(self):
+        self.prepare_graph()
+        chain_hash = BitcoinTestnet.rev_genesis_bytes()
+        # channel announcements: known channels and duplicates are dropped
+        def chan_ann(scid, node1, node2):
+            return {'node_id_1': node1, 'node_id_2': node2, 'bitcoin_key_1': node1, 'bitcoin_key_2': node2,
+                    'short_channel_id': scid, 'chain_hash': chain_hash, 'len': 0, 'features': b''}
+        ann8 = chan_ann(channel(8), node('a'), node('c'))
+        self.assertEqual([ann8], self.cdb.filter_new_channel_announcements(
+            [chan_ann(channel(1), node('b'), node('c')), ann8, chan_ann(channel(8), node('a'), node('c'))]))
+        # node announcements: orphaned nodes and those not newer than what we have are dropped
+        def node_ann(node_id, timestamp):
+            return {'node_id': node_id, 'features': b'', 'addresses': b'', 'alias': b'', 'timestamp': timestamp}
+        self.cdb.add_node_announcements(node_ann(node('a'), 10))
+        node_anns = [node_ann(node('a'), 10), node_ann(node('a'), 12), node_ann(node('a'), 11),
+                     node_ann(node('z'), 12), node_ann(node('b'), 1)]
+        self.assertEqual([node_anns[1], node_anns[4]], self.cdb.filter_new_node_announcements(node_anns))
+        # channel updates: orphaned, deprecated and superseded updates are dropped
+        now = int(time.time())
+        def chan_upd(scid, direction, timestamp):
+            return {'short_channel_id': scid, 'message_flags': b'\x00', 'channel_flags': bytes([direction]),
+                    'cltv_expiry_delta': 10, 'htlc_minimum_msat': 250, 'fee_base_msat': 200,
+                    'fee_proportional_millionths': 150, 'chain_hash': chain_hash, 'timestamp': timestamp}
+        chan_upds = [chan_upd(channel(1), 0, now), chan_upd(channel(1), 0, now + 30), chan_upd(channel(1), 1, now),
+                     chan_upd(channel(99), 0, now), chan_upd(channel(2), 0, 0)]
+        self.assertEqual([(chan_upds[0], node('b')), (chan_upds[2], node('c'))],
+                         self.cdb.get_channel_updates_to_verify(chan_upds))
+        # only the unverified updates that get added are verified
+        categorized = self.cdb.add_channel_updates(chan_upds, verified_ids={id(chan_upds[0]), id(chan_upds[2])})
+        self.assertEqual([chan_upds[0], chan_upds[2]], categorized.good)
+        self.assertEqual([chan_upds[3]], categorized.orphaned)
+
+    def test_verify_gossip_signatures(self):
+        privkey = ecc.ECPrivkey(bytes(31) + b'\x01')
+        pubkey = privkey.get_public_key_bytes()
+        sig_checks = []
+        for i in range(5):
+            h = sha256d(bytes([i]))
+            sig_checks.append((pubkey, privkey.sign(h, ecc.sig_string_from_r_and_s), h))
+        self.assertIsNone(verify_gossip_signatures(sig_checks))
+        sig_checks[3] = sig_checks[3][:2] + (sha256d(b'x'),)
+        sig_checks.append((b'\x02' + bytes(32), sig_checks[0][1], sig_checks[0][2]))  # invalid pubkey
+        self.assertEqual(3, verify_gossip_signatures(sig_checks))
+        self.assertEqual(1, verify_gossip_signatures(sig_checks[4:]))
+
+    async def test_compact_graph(self):
+        self.prepare_graph()
+        graph = self.cdb.graph
+        self.assertEqual(7, graph.num_channels)
+        self.assertEqual(14, graph.num_policies)
+        self.assertEqual({channel(1), channel(2), channel(3)}, graph.get_channels_for_node(node('b')))
+        policy = self.cdb.get_policy_for_node(channel(3), node('b'))
+        self.assertEqual(100, policy.fee_base_msat)
+        self.assertEqual(150, policy.fee_proportional_millionths)
+        self.assertEqual(policy, graph.get_policy(channel(3), node('b')))
+        self.assertIsNone(graph.get_policy(channel(3), node('c')))  # c is not an endpoint
+        # removing a channel also removes its policies
+        self.cdb.remove_channel(channel(3))
+        self.assertEqual(6, graph.num_channels)
+        self.assertEqual(12, graph.num_policies)
+        self.assertEqual({channel(1), channel(2)}, graph.get_channels_for_node(node('b')))
+        self.assertIsNone(self.cdb.get_policy_for_node(channel(3), node('b')))
+        self.assertNotIn((node('b'), channel(3)), self.cdb.get_node_policies())
+        # has_channels does not rebuild the adjacency arrays
+        num_nodes_with_channels = graph.get_num_nodes_with_channels()
+        adj_chans = graph.adj_chans
+        self.cdb.remove_channel(channel(1))
+        self.assertTrue(graph.has_channels(node('b')))
+        self.cdb.remove_channel(channel(2))
+        self.assertFalse(graph.has_channels(node('b')))
+        self.assertEqual(num_nodes_with_channels - 1, graph.get_num_nodes_with_channels())
+        self.assertIs(adj_chans, graph.adj_chans)
+        self.assertEqual(set(), graph.get_channels_for_node(node('b')))
+
     async def test_find_path_for_payment(self):
         self.prepare_graph()
         amount_to_send = 100000
@@ -158,6 +317,53 @@ class Test_LNRouter(ElectrumTestCase):
         self.assertEqual(node('b'), route[0].node_id)
         self.assertEqual(channel(3), route[0].short_channel_id)
 
+    async def test_find_path_max_hops(self):
+        self.prepare_channel_db()
+        # a line of nodes: 0 - 1 - 2 - ... - 22
+        for i in range(22):
+            add_public_channel(self.cdb, channel(i + 1), numbered_node(i), numbered_node(i + 1))
+        path = self.path_finder.find_path_for_payment(
+            nodeA=numbered_node(0),
+            nodeB=numbered_node(NUM_MAX_EDGES_IN_PAYMENT_PATH),
+            invoice_amount_msat=100000)
+        self.assertEqual(NUM_MAX_EDGES_IN_PAYMENT_PATH, len(path))
+        # a longer path would not fit into the onion
+        path = self.path_finder.find_path_for_payment(
+            nodeA=numbered_node(0),
+            nodeB=numbered_node(NUM_MAX_EDGES_IN_PAYMENT_PATH + 1),
+            invoice_amount_msat=100000)
+        self.assertIsNone(path)
+
+    async def test_path_cache(self):
+        self.prepare_graph()
+        cache = self.path_finder.path_cache
+        def find_path(amount_msat):
+            path = self.path_finder.find_path_for_payment(
+                nodeA=node('a'),
+                nodeB=node('e'),
+                invoice_amount_msat=amount_msat)
+            return [edge.short_channel_id for edge in path]
+        self.assertEqual([channel(3), channel(2)], find_path(100_000))
+        self.assertEqual((0, 1), (cache.hits, cache.misses))
+        # similar amount
+        self.assertEqual([channel(3), channel(2)], find_path(120_000))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        # different amount bucket
+        self.assertEqual([channel(3), channel(2)], find_path(500_000))
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+        # a new liquidity hint invalidates the cached paths
+        self.path_finder.liquidity_hints.update_can_send(node('a'), node('b'), channel(3), 100_000)
+        self.assertEqual([channel(3), channel(2)], find_path(100_000))
+        self.assertEqual((1, 3), (cache.hits, cache.misses))
+        # a refreshed channel update does not
+        self.cdb.add_channel_update({'short_channel_id': channel(2), 'message_flags': b'\x00', 'channel_flags': b'\x00', 'cltv_expiry_delta': 99, 'htlc_minimum_msat': 250, 'fee_base_msat': 100, 'fee_proportional_millionths': 150, 'chain_hash': BitcoinTestnet.rev_genesis_bytes(), 'timestamp': 1000}, verify=False)
+        self.assertEqual([channel(3), channel(2)], find_path(100_000))
+        self.assertEqual((2, 3), (cache.hits, cache.misses))
+        # but disabling the channel does
+        self.cdb.add_channel_update({'short_channel_id': channel(2), 'message_flags': b'\x00', 'channel_flags': b'\x02', 'cltv_expiry_delta': 99, 'htlc_minimum_msat': 250, 'fee_base_msat': 100, 'fee_proportional_millionths': 150, 'chain_hash': BitcoinTestnet.rev_genesis_bytes(), 'timestamp': 2000}, verify=False)
+        self.assertEqual([channel(6), channel(5)], find_path(100_000))
+        self.assertEqual((2, 4), (cache.hits, cache.misses))
+
     async def test_find_path_liquidity_hints(self):
         self.prepare_graph()
         amount_to_send = 100000
@@ -253,6 +459,39 @@ class Test_LNRouter(ElectrumTestCase):
         self.assertEqual(channel(3), path[0].short_channel_id)
         self.assertEqual(channel(2), path[1].short_channel_id)
 
+    async def test_find_path_benchmark(self):
+        """Route queries on a generated graph of about the size of the public network."""
+        num_nodes, num_channels, num_queries = 15_000, 80_000, 10
+        self.prepare_channel_db()
+        rand = random.Random(0)
+        # preferential attachment, so that there are a few hubs
+        endpoints = list(range(num_nodes))
+        for i in range(num_channels):
+            n1 = i if i < num_nodes else rand.choice(endpoints)
+            n2 = rand.choice(endpoints)
+            if n1 == n2:
+                n2 = (n1 + 1) % num_nodes
+            endpoints += [n1, n2]
+            node1, node2 = sorted([numbered_node(n1), numbered_node(n2)])
+            add_public_channel(
+                self.cdb, channel(i + 1), node1, node2,
+                fee_base_msat=rand.randrange(0, 2000),
+                fee_proportional_millionths=rand.randrange(0, 1000),
+                cltv_expiry_delta=rand.choice([40, 80, 144]),
+                htlc_maximum_msat=rand.randrange(10**7, 10**10))
+        t0 = time.perf_counter()
+        for i in range(num_queries):
+            a, b = rand.sample(range(num_nodes), 2)
+            path = self.path_finder.find_path_for_payment(
+                nodeA=numbered_node(a),
+                nodeB=numbered_node(b),
+                invoice_amount_msat=rand.choice([10**6, 10**7, 10**8]))
+            self.assertIsNotNone(path)
+            self.assertLessEqual(len(path), NUM_MAX_EDGES_IN_PAYMENT_PATH)
+            self.path_finder.create_route_from_path(path)
+        dt = (time.perf_counter() - t0) / num_queries
+        print(f"route query on {num_nodes} nodes, {num_channels} channels: {dt * 1000:.1f} ms")
+
     def test_liquidity_hints(self):
         liquidity_hints = LiquidityHintMgr()
         node_from = bytes(0)
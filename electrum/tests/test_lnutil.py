@@ -11,7 +11,7 @@ from electrum.lnutil import (RevocationStore, get_per_commitment_secret_from_see
                              get_compressed_pubkey_from_bech32, split_host_port, ConnStringFormatError,
                              ScriptHtlc, extract_nodeid, calc_fees_for_commitment_tx, UpdateAddHtlc, LnFeatures,
                              ln_compare_features, IncompatibleLightningFeatures, ChannelType,
-                             ImportedChannelBackupStorage)
+                             ImportedChannelBackupStorage, sign_htlc_sighashes, verify_htlc_sigs)
 from electrum.util import bfh, MyEncoder
 from electrum.transaction import Transaction, PartialTransaction, Sighash
 from electrum.lnworker import LNWallet
@@ -920,6 +920,16 @@ class TestLNUtil(ElectrumTestCase):
         channel_type = ChannelType(0b10000000001000000000010).discard_unknown_and_check()
         self.assertEqual(ChannelType(0b10000000001000000000000), channel_type)
 
+    def test_sign_and_verify_htlc_sigs(self):
+        privkey = bytes(range(1, 33))
+        pubkey = ecc.ECPrivkey(privkey).get_public_key_bytes()
+        sighashes = [bitcoin.sha256(bytes([i])) for i in range(10)]
+        sigs = sign_htlc_sighashes(privkey, sighashes)
+        self.assertIsNone(verify_htlc_sigs(pubkey, sigs, sighashes))
+        bad_sigs = list(sigs)
+        bad_sigs[3], bad_sigs[-1] = sigs[-1], sigs[3]
+        self.assertEqual(3, verify_htlc_sigs(pubkey, bad_sigs, sighashes))
+
     @as_testnet
     async def test_decode_imported_channel_backup_v0(self):
         encrypted_cb = "channel_backup:Adn87xcGIs9H2kfp4VpsOaNKWCHX08wBoqq37l1cLYKGlJamTeoaLEwpJA81l1BXF3GP/mRxqkY+whZG9l51G8izIY/kmMSvnh0DOiZEdwaaT/1/MwEHfsEomruFqs+iW24SFJPHbMM7f80bDtIxcLfZkKmgcKBAOlcqtq+dL3U3yH74S8BDDe2L4snaxxpCjF0JjDMBx1UR/28D+QlIi+lbvv1JMaCGXf+AF1+3jLQf8+lVI+rvFdyArws6Ocsvjf+ANQeSGUwW6Nb2xICQcMRgr1DO7bO4pgGu408eYRr2v3ayJBVtnKwSwd49gF5SDSjTDAO4CCM0uj9H5RxyzH7fqotkd9J80MBr84RiBXAeXKz+Ap8608/FVqgQ9BOcn6LhuAQdE5zXpmbQyw5jUGkPvHuseR+rzthzncy01odUceqTNg=="
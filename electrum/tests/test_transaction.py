@@ -1,3 +1,4 @@
+import concurrent.futures
 from typing import NamedTuple, Union
 
 from electrum import transaction, bitcoin
@@ -9,6 +10,7 @@ from electrum.util import bfh
 from electrum.bitcoin import (deserialize_privkey, opcodes,
                               construct_script, construct_witness)
 from electrum.ecc import ECPrivkey
+from electrum.crypto import sha256d
 from electrum import descriptor
 
 from .test_bitcoin import disable_ecdsa_r_value_grinding
@@ -66,6 +68,19 @@ class TestBCDataStream(ElectrumTestCase):
         self.assertEqual(s.read_bytes(1), b'r')
         self.assertEqual(s.read_bytes(0), b'')
 
+    def test_memoryview(self):
+        buf = bytearray(b'\x03foobar')
+        s = transaction.BCDataStream()
+        s.write(memoryview(buf))
+        self.assertEqual(3, s.read_compact_size())
+        self.assertEqual(b'foo', s.read_bytes(3))
+        self.assertEqual(bytes, type(s.read_bytes(1)))
+        # writing more data copies the input
+        s.write(b'baz')
+        buf[5:] = b'xx'
+        self.assertEqual(b'arbaz', s.read_bytes(5))
+        self.assertFalse(s.can_read_more())
+
     def test_bool(self):
         s = transaction.BCDataStream()
         s.write(b'f\x00\x00b')
@@ -127,6 +142,21 @@ class TestTransaction(ElectrumTestCase):
 
         self.assertEqual(tx.serialize(), signed_blob)
 
+    def test_tx_deserialize_non_canonical_compact_size(self):
+        tx = transaction.Transaction(signed_segwit_blob)
+        # same tx, with the length of the first witness item encoded in 3 bytes
+        non_canonical_blob = signed_segwit_blob.replace('024730440220789c', '02fd470030440220789c')
+        tx2 = transaction.Transaction(bfh(non_canonical_blob))
+        self.assertEqual(tx.inputs()[0].witness, tx2.inputs()[0].witness)
+        self.assertEqual(tx.txid(), tx2.txid())
+        self.assertEqual(tx.wtxid(), tx2.wtxid())
+        self.assertEqual(non_canonical_blob, tx2.serialize())
+        # truncated
+        with self.assertRaises(transaction.SerializationError):
+            transaction.Transaction(signed_segwit_blob[:-10]).inputs()
+        with self.assertRaises(transaction.SerializationError):
+            transaction.Transaction(signed_segwit_blob + '00').inputs()
+
     def test_estimated_tx_size(self):
         tx = transaction.Transaction(signed_blob)
 
@@ -279,6 +309,13 @@ class TestTransaction(ElectrumTestCase):
         self.assertEqual(txid, tx.txid())
         self.assertEqual(raw_tx, tx.serialize())
         self.assertTrue(tx.estimated_size() >= 0)
+        # from bytes, the ids are computed from the raw bytes; they must match the re-serialization
+        tx2 = transaction.Transaction(bfh(raw_tx))
+        self.assertEqual(txid, tx2.txid())
+        self.assertEqual(txid, sha256d(bfh(tx2.serialize_to_network(force_legacy=True)))[::-1].hex())
+        self.assertEqual(tx.wtxid(), tx2.wtxid())
+        self.assertEqual(tx2.wtxid(), sha256d(bfh(tx2.serialize_to_network()))[::-1].hex())
+        self.assertEqual(raw_tx, tx2.serialize())
 
     def test_txid_coinbase_to_p2pk(self):
         raw_tx = '01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff4103400d0302ef02062f503253482f522cfabe6d6dd90d39663d10f8fd25ec88338295d4c6ce1c90d4aeb368d8bdbadcc1da3b635801000000000000000474073e03ffffffff013c25cf2d01000000434104b0bd634234abbb1ba1e986e884185c61cf43e001f9137f23c2c409273eb16e6537a576782eba668a7ef8bd3b3cfb1edb7117ab65129b8a2e681f3c1e0908ef7bac00000000'
@@ -992,3 +1029,53 @@ class TestSighashTypes(ElectrumTestCase):
         sig = tx.sign_txin(0,privkey)
         self.assertEqual('30440220525406a1482936d5a21888260dc165497a90a15669636d8edca6b9fe490d309c022032af0c646a34a44d1f4576bf6a4a74b67940f8faa84c7df9abe12a01a11e2b4783',
                          sig)
+
+    def test_sighash_cache(self):
+        privkey = ECPrivkey(bytes(31) + b'\x01')
+        pubkey = privkey.get_public_key_hex(compressed=True)
+        inputs = []
+        for i in range(300):  # > 0xfd, so var_ints are multi-byte
+            script_type = 'p2wpkh' if i % 3 == 0 else 'p2pkh'
+            txin = PartialTxInput(prevout=TxOutpoint(txid=sha256d(bytes([i % 256, i // 256])), out_idx=i))
+            txin.script_descriptor = descriptor.get_singlesig_descriptor_from_legacy_leaf(
+                pubkey=pubkey, script_type=script_type)
+            txin._trusted_value_sats = 10_000 + i
+            txin.nsequence = 0xffffffff - i % 3
+            inputs.append(txin)
+        outputs = [PartialTxOutput.from_address_and_value('bc1qq2tmmcngng78nllq2pvrkchcdukemtj56uyue0', 2_000_000),
+                   PartialTxOutput.from_address_and_value('1KSezYMhAJMWqFbVFB2JshYg69UpmEXR4D', 1_000_000)]
+        tx = PartialTransaction.from_io(inputs, outputs, locktime=800_000, version=2, BIP69_sort=False)
+        sighash_cache = transaction.SighashCache(tx)
+        for i in range(len(inputs)):
+            expected = sha256d(bfh(tx.serialize_preimage(i)))
+            self.assertEqual(expected, tx.calc_sighash(i, sighash_cache=sighash_cache))
+            self.assertEqual(expected, tx.calc_sighash(i))
+
+    def test_sign_with_executor(self):
+        privkeys = [ECPrivkey(bytes(31) + bytes([i + 1])) for i in range(3)]
+        pubkeys = [privkey.get_public_key_hex(compressed=True) for privkey in privkeys]
+        keypairs = {pubkey: (privkey.get_secret_bytes(), True)
+                    for pubkey, privkey in zip(pubkeys[:2], privkeys[:2])}
+        descs = [descriptor.parse_descriptor(f"wsh(multi(2,{','.join(pubkeys)}))"),
+                 descriptor.get_singlesig_descriptor_from_legacy_leaf(pubkey=pubkeys[1], script_type='p2wpkh'),
+                 descriptor.get_singlesig_descriptor_from_legacy_leaf(pubkey=pubkeys[2], script_type='p2wpkh')]
+
+        def make_tx():
+            inputs = []
+            for i in range(30):
+                desc = descs[i % 3]
+                txin = PartialTxInput(prevout=TxOutpoint(txid=sha256d(bytes([i])), out_idx=i))
+                txin.script_descriptor = desc
+                txin.witness_utxo = transaction.TxOutput(scriptpubkey=desc.expand().output_script, value=10_000 + i)
+                inputs.append(txin)
+            outputs = [PartialTxOutput.from_address_and_value('bc1qq2tmmcngng78nllq2pvrkchcdukemtj56uyue0', 200_000)]
+            return PartialTransaction.from_io(inputs, outputs, locktime=0, BIP69_sort=False)
+
+        tx1 = make_tx()
+        tx1.sign(keypairs)
+        tx2 = make_tx()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            tx2.sign(keypairs, executor=executor)
+        self.assertEqual(tx1.serialize(), tx2.serialize())
+        # we don't have the key of the third descriptor
+        self.assertEqual([i % 3 != 2 for i in range(30)], [txin.is_complete() for txin in tx2.inputs()])
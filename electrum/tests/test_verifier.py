@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from electrum.bitcoin import hash_encode
+from electrum.crypto import sha256d
 from electrum.transaction import Transaction
 from electrum.util import bfh
 from electrum.verifier import SPV, InnerNodeOfSpvProofIsValidTx
@@ -49,3 +50,24 @@ class VerifierTestCase(ElectrumTestCase):
         f_tx_hash = hash_encode(bfh(VALID_64_BYTE_TX[:64]))
         with self.assertRaises(InnerNodeOfSpvProofIsValidTx):
             SPV.hash_merkle_root(fake_mbranch, f_tx_hash, 6)
+
+    def test_shared_inner_nodes(self):
+        """Proofs of txs of the same block give the same roots with and without sharing inner nodes."""
+        leaves = [sha256d(bytes([i])) for i in range(8)]
+        levels = [leaves]
+        while len(levels[-1]) > 1:
+            level = levels[-1]
+            levels.append([sha256d(level[i] + level[i + 1]) for i in range(0, len(level), 2)])
+        merkle_root = hash_encode(levels[-1][0])
+
+        def branch(pos):
+            return [hash_encode(level[(pos >> depth) ^ 1]) for depth, level in enumerate(levels[:-1])]
+
+        inner_nodes = {}
+        for pos in (5, 4, 0, 7):
+            self.assertEqual(merkle_root, SPV.hash_merkle_root(branch(pos), hash_encode(leaves[pos]), pos))
+            self.assertEqual(merkle_root, SPV.hash_merkle_root(branch(pos), hash_encode(leaves[pos]), pos,
+                                                               inner_nodes=inner_nodes))
+        # the position is still checked against the shared part of the tree
+        self.assertNotEqual(merkle_root, SPV.hash_merkle_root(branch(6), hash_encode(leaves[6]), 2,
+                                                              inner_nodes=inner_nodes))
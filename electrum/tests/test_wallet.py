@@ -8,13 +8,15 @@ import time
 from io import StringIO
 import asyncio
 
-from electrum.storage import WalletStorage
+from electrum.storage import WalletStorage, StorageEncryptionVersion
 from electrum.wallet_db import FINAL_SEED_VERSION
 from electrum.wallet import (Abstract_Wallet, Standard_Wallet, create_new_wallet,
                              restore_wallet_from_text, Imported_Wallet, Wallet)
 from electrum.exchange_rate import ExchangeBase, FxThread
 from electrum.util import TxMinedInfo, InvalidPassword
-from electrum.bitcoin import COIN
+from electrum.transaction import Transaction, TxOutpoint, PartialTransaction, PartialTxInput, PartialTxOutput
+from electrum.bitcoin import COIN, address_to_script
+from electrum.address_synchronizer import AddressSynchronizer
 from electrum.wallet_db import WalletDB
 from electrum.simple_config import SimpleConfig
 from electrum import util
@@ -86,6 +88,330 @@ class TestWalletStorage(WalletTestCase):
         for key, value in some_dict.items():
             self.assertEqual(d[key], value)
 
+    def _create_journaled_db(self, storage):
+        db = WalletDB('', manual_upgrades=False)
+        db.set_journal_enabled(True)
+        db.get_dict('labels')['a'] = 'b'
+        db.write(storage)
+        return db
+
+    def test_journal_appends_patches(self):
+        storage = WalletStorage(self.wallet_path)
+        db = self._create_journaled_db(storage)
+        with open(self.wallet_path, "r") as f:
+            snapshot = f.read()
+        labels = db.get_dict('labels')
+        labels['c'] = 'd'
+        labels['a'] = 'x/y'
+        labels.pop('c')
+        db.get_dict('addresses')['receiving'] = []
+        db.get_dict('addresses')['receiving'].append('addr1')
+        db.add_verified_tx('ab' * 32, TxMinedInfo(height=10, timestamp=1, txpos=2, header_hash='cd' * 32))
+        db.write(storage)
+        with open(self.wallet_path, "r") as f:
+            contents = f.read()
+        # file was not rewritten
+        self.assertTrue(contents.startswith(snapshot))
+        self.assertGreater(len(contents), len(snapshot))
+        db2 = WalletDB(WalletStorage(self.wallet_path).read(), manual_upgrades=False)
+        self.assertEqual(db.dump(), db2.dump())
+        self.assertEqual({'a': 'x/y'}, db2.get_dict('labels'))
+        self.assertEqual(['addr1'], db2.get('addresses')['receiving'])
+
+    def test_journal_discards_incomplete_record(self):
+        storage = WalletStorage(self.wallet_path)
+        db = self._create_journaled_db(storage)
+        db.get_dict('labels')['c'] = 'd'
+        db.write(storage)
+        # simulate crash during append
+        with open(self.wallet_path, "a") as f:
+            f.write(',\n{"op": "add", "path": "/labels/e", "val')
+        db2 = WalletDB(WalletStorage(self.wallet_path).read(), manual_upgrades=False)
+        self.assertEqual({'a': 'b', 'c': 'd'}, db2.get_dict('labels'))
+        # writing again after the recovery replaces the incomplete record
+        db2.set_journal_enabled(True)
+        db2.get_dict('labels')['f'] = 'g'
+        db2.write(WalletStorage(self.wallet_path))
+        db3 = WalletDB(WalletStorage(self.wallet_path).read(), manual_upgrades=False)
+        self.assertEqual({'a': 'b', 'c': 'd', 'f': 'g'}, db3.get_dict('labels'))
+
+    def test_journal_discards_incomplete_chunk_with_encrypted_storage(self):
+        storage = WalletStorage(self.wallet_path)
+        storage.set_password('secret', enc_version=StorageEncryptionVersion.USER_PASSWORD)
+        db = self._create_journaled_db(storage)
+        db.get_dict('labels')['c'] = 'd'
+        db.write(storage)
+        # simulate crash during append
+        with open(self.wallet_path, "a") as f:
+            f.write('\nQklFMQ')
+        storage2 = WalletStorage(self.wallet_path)
+        storage2.decrypt('secret')
+        db2 = WalletDB(storage2.read(), manual_upgrades=False)
+        self.assertEqual({'a': 'b', 'c': 'd'}, db2.get_dict('labels'))
+        db2.set_journal_enabled(True)
+        db2.get_dict('labels')['f'] = 'g'
+        db2.write(storage2)
+        storage3 = WalletStorage(self.wallet_path)
+        storage3.decrypt('secret')
+        db3 = WalletDB(storage3.read(), manual_upgrades=False)
+        self.assertEqual({'a': 'b', 'c': 'd', 'f': 'g'}, db3.get_dict('labels'))
+
+    def test_journal_with_encrypted_storage(self):
+        storage = WalletStorage(self.wallet_path)
+        storage.set_password('secret', enc_version=StorageEncryptionVersion.USER_PASSWORD)
+        db = self._create_journaled_db(storage)
+        db.get_dict('labels')['c'] = 'd'
+        db.write(storage)
+        db.get_dict('labels').pop('a')
+        db.write(storage)
+        with open(self.wallet_path, "r") as f:
+            self.assertEqual(2, f.read().count('\n'))
+        storage2 = WalletStorage(self.wallet_path)
+        self.assertTrue(storage2.is_encrypted_with_user_pw())
+        with self.assertRaises(InvalidPassword):
+            storage2.decrypt('wrong')
+        storage2.decrypt('secret')
+        db2 = WalletDB(storage2.read(), manual_upgrades=False)
+        self.assertEqual({'c': 'd'}, db2.get_dict('labels'))
+
+    def test_journal_consolidation(self):
+        storage = WalletStorage(self.wallet_path)
+        db = self._create_journaled_db(storage)
+        labels = db.get_dict('labels')
+        for i in range(100):
+            labels[str(i)] = 'x' * 100
+            db.write(storage)
+        # the journal is compacted once it gets larger than the snapshot
+        self.assertLessEqual(os.path.getsize(self.wallet_path), 2 * len(db.dump()))
+        db2 = WalletDB(WalletStorage(self.wallet_path).read(), manual_upgrades=False)
+        self.assertEqual(db.dump(), db2.dump())
+
+    def test_lazy_load(self):
+        raw_tx = '0100000001' + 'ab' * 32 + '00000000' + '00' + 'ffffffff' + '01' + '10270000' + '00' + '00000000' + '00000000'
+        txid = Transaction(raw_tx).txid()
+        storage = WalletStorage(self.wallet_path)
+        db = WalletDB('', manual_upgrades=False)
+        db.add_txo_addr(txid, 'addr1', 0, 10000, False)
+        db.add_transaction(txid, Transaction(raw_tx))
+        db.add_tx_fee_from_server(txid, 1000)
+        db.write(storage)
+        db2 = WalletDB(WalletStorage(self.wallet_path).read(), manual_upgrades=False)
+        # values are kept raw until accessed
+        self.assertEqual(raw_tx, dict.__getitem__(db2.transactions, txid))
+        self.assertEqual(db.dump(), db2.dump())
+        tx = db2.get_transaction(txid)
+        self.assertIsInstance(tx, Transaction)
+        self.assertIs(tx, dict.__getitem__(db2.transactions, txid))
+        self.assertEqual((1000, False, None), tuple(db2.tx_fees[txid]))
+        self.assertEqual({txid: tx}, dict(db2.transactions))
+        # changes to converted and unconverted values are saved
+        db2.tx_fees.pop(txid)
+        db2.get_dict('txo')[txid]['addr2'] = {}
+        self.assertEqual({'addr1', 'addr2'}, set(db2.get_txo_addresses(txid)))
+        db2.write(WalletStorage(self.wallet_path))
+        db3 = WalletDB(WalletStorage(self.wallet_path).read(), manual_upgrades=False)
+        self.assertEqual(db2.dump(), db3.dump())
+        self.assertNotIn(txid, db3.tx_fees)
+
+    def test_add_transaction_keeps_parsed_tx(self):
+        raw_tx = '0100000001' + 'ab' * 32 + '00000000' + '00' + 'ffffffff' + '01' + '10270000' + '00' + '00000000' + '00000000'
+        for use_sqlite in (False, True):
+            with self.subTest(use_sqlite=use_sqlite):
+                db = WalletDB('', manual_upgrades=False)
+                if use_sqlite:
+                    db.attach_sqlite_tables(self.wallet_path + '.sqlite')
+                # a plain Transaction is stored as-is, not re-parsed
+                tx = Transaction(raw_tx)
+                db.add_transaction(tx.txid(), tx)
+                self.assertIs(tx, db.get_transaction(tx.txid()))
+                with self.assertRaisesRegex(Exception, "trying to add tx to db with inconsistent txid"):
+                    db.add_transaction('cd' * 32, Transaction(raw_tx))
+                if use_sqlite:
+                    db.detach_sqlite_tables()
+
+
+class TestWalletSqliteTables(WalletTestCase):
+
+    RAW_TX = '01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff25033ca0030400001256124d696e656420627920425443204775696c640800000d41000007daffffffff01c00d1298000000001976a91427a1f12771de5cc3b73941664b2537c15316be4388ac00000000'
+
+    def _populate(self, db: WalletDB) -> str:
+        tx = Transaction(self.RAW_TX)
+        txid = tx.txid()
+        db.add_transaction(txid, tx)
+        db.add_txo_addr(txid, 'addr1', 0, 1000, True)
+        db.add_txo_addr(txid, 'addr1', 3, 2000, False)
+        db.add_txi_addr(txid, 'addr2', 'ab' * 32 + ':1', 500)
+        db.set_spent_outpoint('ab' * 32, 1, txid)
+        db.set_addr_history('addr1', [(txid, 100)])
+        db.set_addr_history('addr2', [])
+        db.add_verified_tx(txid, TxMinedInfo(height=100, timestamp=1234, txpos=0, header_hash='cd' * 32))
+        db.add_prevout_by_scripthash('ef' * 32, prevout=TxOutpoint.from_str(txid + ':0'), value=1000)
+        return txid
+
+    def _accessor_values(self, db: WalletDB, txid: str):
+        return [
+            db.get_txi_addresses(txid), db.get_txo_addresses(txid),
+            db.get_txi_addr(txid, 'addr2'), db.get_txo_addr(txid, 'addr1'),
+            db.list_txi(), db.list_txo(), db.list_spent_outpoints(),
+            db.get_spent_outpoints('ab' * 32), db.get_spent_outpoint('ab' * 32, 1), db.get_spent_outpoint('ab' * 32, 2),
+            db.get_prevouts_by_scripthash('ef' * 32), str(db.get_transaction(txid)), db.list_transactions(),
+            db.get_history(), db.is_addr_in_history('addr2'), [tuple(x) for x in db.get_addr_history('addr1')],
+            db.list_verified_tx(), db.get_verified_tx(txid), db.is_in_verified_tx(txid),
+            db.get_verified_txs_above_height(99), db.get_verified_txs_above_height(100),
+            db.get_num_ismine_inputs_of_tx(txid),
+        ]
+
+    def test_parsed_tx_cache(self):
+        db = WalletDB('', manual_upgrades=False)
+        db.attach_sqlite_tables(self.wallet_path + '.sqlite')
+        db.SQLITE_TX_CACHE_SIZE = 2
+        txs = [Transaction('0100000001' + bytes([i]).hex() * 32 + '00000000' + '00' + 'ffffffff'
+                           + '01' + '10270000' + '00' + '00000000' + '00000000') for i in range(3)]
+        for tx in txs:
+            db.add_transaction(tx.txid(), tx)
+        # the oldest one was evicted, and is parsed again
+        self.assertEqual([txs[1].txid(), txs[2].txid()], list(db._sql_tx_cache))
+        tx0 = db.get_transaction(txs[0].txid())
+        self.assertIsNot(txs[0], tx0)
+        self.assertEqual(txs[0].serialize(), tx0.serialize())
+        self.assertIs(tx0, db.get_transaction(txs[0].txid()))
+        # removed txs are not returned from the cache
+        db.remove_transaction(txs[0].txid())
+        self.assertIsNone(db.get_transaction(txs[0].txid()))
+
+    def test_attach_and_detach(self):
+        storage = WalletStorage(self.wallet_path)
+        db = WalletDB('', manual_upgrades=False)
+        txid = self._populate(db)
+        expected = self._accessor_values(db, txid)
+        db.attach_sqlite_tables(self.wallet_path + '.sqlite')
+        self.assertEqual(expected, self._accessor_values(db, txid))
+        self.assertEqual({}, db.get_dict('txo'))
+        db.write(storage)
+        # reopen
+        db2 = WalletDB(WalletStorage(self.wallet_path).read(), manual_upgrades=False)
+        self.assertTrue(db2.uses_sqlite_tables())
+        db2.attach_sqlite_tables(self.wallet_path + '.sqlite')
+        self.assertEqual(expected, self._accessor_values(db2, txid))
+        # changes
+        db2.remove_spent_outpoint('ab' * 32, 1)
+        db2.remove_verified_tx(txid)
+        db2.detach_sqlite_tables()
+        self.assertFalse(os.path.exists(self.wallet_path + '.sqlite'))
+        self.assertFalse(db2.uses_sqlite_tables())
+        self.assertEqual([], db2.list_spent_outpoints())
+        self.assertIsNone(db2.get_verified_tx(txid))
+        self.assertEqual(expected[:6], self._accessor_values(db2, txid)[:6])
+
+    async def test_wallet_uses_sqlite_tables(self):
+        self.config.WALLET_USE_SQLITE_TX_TABLES = True
+        text = 'bitter grass shiver impose acquire brush forget axis eager alone wine silver'
+        d = restore_wallet_from_text(text, path=self.wallet_path, gap_limit=2, config=self.config)
+        wallet = d['wallet']  # type: Standard_Wallet
+        self.assertTrue(wallet.db.uses_sqlite_tables())
+        self.assertTrue(os.path.exists(self.wallet_path + '.sqlite'))
+        addresses = wallet.db.get_history()
+        self.assertEqual(set(wallet.get_addresses()), set(addresses))
+        # encrypting the wallet file moves the tables back into it
+        wallet.update_password(None, "1234", encrypt_storage=True)
+        self.assertFalse(wallet.db.uses_sqlite_tables())
+        self.assertFalse(os.path.exists(self.wallet_path + '.sqlite'))
+        self.assertEqual(addresses, wallet.db.get_history())
+
+
+class TestAddressSynchronizerCoins(WalletTestCase):
+
+    ADDR1 = 'bc1qq2tmmcngng78nllq2pvrkchcdukemtj56uyue0'
+    ADDR2 = 'bc1q2ccr34wzep58d4239tl3x3734ttle92a8srmuw'
+
+    def _make_tx(self, prevouts, outputs) -> Transaction:
+        tx = PartialTransaction.from_io(
+            [PartialTxInput(prevout=TxOutpoint.from_str(prevout)) for prevout in prevouts],
+            [PartialTxOutput(scriptpubkey=bytes.fromhex(address_to_script(addr)), value=value) for addr, value in outputs],
+            locktime=0, BIP69_sort=False)
+        return Transaction(tx.serialize_to_network(include_sigs=False))
+
+    def _utxos(self, adb, addr):
+        return {prevout.to_str(): txin.value_sats() for prevout, txin in adb.get_addr_utxo(addr).items()}
+
+    async def test_coins_index_follows_added_and_removed_txs(self):
+        adb = AddressSynchronizer(WalletDB('', manual_upgrades=False), self.config)
+        adb.add_address(self.ADDR1)
+        adb.add_address(self.ADDR2)
+        tx1 = self._make_tx(['ab' * 32 + ':0'], [(self.ADDR1, 100_000)])
+        adb.add_transaction(tx1)
+        self.assertEqual({tx1.txid() + ':0': 100_000}, self._utxos(adb, self.ADDR1))
+        tx2 = self._make_tx([tx1.txid() + ':0'], [(self.ADDR2, 60_000), (self.ADDR1, 30_000)])
+        adb.add_transaction(tx2)
+        self.assertEqual({tx2.txid() + ':1': 30_000}, self._utxos(adb, self.ADDR1))
+        self.assertEqual({tx2.txid() + ':0': 60_000}, self._utxos(adb, self.ADDR2))
+        self.assertEqual(tx2.txid(), adb.get_addr_outputs(self.ADDR1)[TxOutpoint.from_str(tx1.txid() + ':0')].spent_txid)
+        self.assertEqual(130_000, adb.get_addr_received(self.ADDR1))
+        self.assertEqual((0, 90_000, 0), adb.get_balance([self.ADDR1, self.ADDR2]))
+        adb.remove_transaction(tx2.txid())
+        self.assertEqual({tx1.txid() + ':0': 100_000}, self._utxos(adb, self.ADDR1))
+        self.assertEqual({}, self._utxos(adb, self.ADDR2))
+        # the index is the same as when built from the db
+        adb.add_transaction(tx2)
+        io = [adb.get_addr_io(addr) for addr in (self.ADDR1, self.ADDR2)]
+        adb._addr_coins.clear()
+        self.assertEqual(io, [adb.get_addr_io(addr) for addr in (self.ADDR1, self.ADDR2)])
+
+    async def test_history_index_follows_heights_and_removed_txs(self):
+        adb = AddressSynchronizer(WalletDB('', manual_upgrades=False), self.config)
+        adb.add_address(self.ADDR1)
+        adb.add_address(self.ADDR2)
+        domain = [self.ADDR1, self.ADDR2]
+        tx1 = self._make_tx(['ab' * 32 + ':0'], [(self.ADDR1, 100_000)])
+        tx2 = self._make_tx([tx1.txid() + ':0'], [(self.ADDR2, 60_000), (self.ADDR1, 30_000)])
+        adb.add_transaction(tx1)
+        adb.add_transaction(tx2)
+        adb.add_verified_tx(tx2.txid(), TxMinedInfo(height=200, timestamp=2000, txpos=3, header_hash='00' * 32))
+        self.assertEqual([tx2.txid(), tx1.txid()], [item.txid for item in adb.get_history(domain)])
+        adb.add_verified_tx(tx1.txid(), TxMinedInfo(height=100, timestamp=1000, txpos=1, header_hash='00' * 32))
+        history = adb.get_history(domain)
+        self.assertEqual([(tx1.txid(), 100_000, 100_000, 1000), (tx2.txid(), -10_000, 90_000, 2000)],
+                         [(item.txid, item.delta, item.balance, item.monotonic_timestamp) for item in history])
+        self.assertEqual(history[1:], adb.get_history(domain, from_height=101))
+        self.assertEqual(history[:1], adb.get_history(domain, to_height=200))
+        self.assertEqual(history[1:], adb.get_history(domain, from_timestamp=1001))
+        self.assertEqual(history[1:], adb.get_history(domain, offset=1))
+        self.assertEqual(history[:1], adb.get_history(domain, limit=1))
+        # a domain without all addresses is computed on the fly
+        self.assertEqual([(tx1.txid(), 100_000, 100_000), (tx2.txid(), -70_000, 30_000)],
+                         [(item.txid, item.delta, item.balance) for item in adb.get_history([self.ADDR1])])
+        adb.remove_transaction(tx2.txid())
+        self.assertEqual(history[:1], adb.get_history(domain))
+
+    async def test_tx_parents_follow_address_reuse_order(self):
+        adb = AddressSynchronizer(WalletDB('', manual_upgrades=False), self.config)
+        adb.add_address(self.ADDR1)
+        adb.add_address(self.ADDR2)
+        tx1 = self._make_tx(['ab' * 32 + ':0'], [(self.ADDR1, 100_000)])
+        tx2 = self._make_tx([tx1.txid() + ':0'], [(self.ADDR2, 90_000)])
+        tx3 = self._make_tx(['cd' * 32 + ':0'], [(self.ADDR1, 50_000)])
+        tx4 = self._make_tx([tx3.txid() + ':0'], [(self.ADDR2, 40_000)])
+        for tx in (tx1, tx2, tx3, tx4):
+            adb.add_transaction(tx)
+        adb.add_verified_tx(tx2.txid(), TxMinedInfo(height=200, timestamp=2000, txpos=1, header_hash='00' * 32))
+        adb.add_verified_tx(tx4.txid(), TxMinedInfo(height=300, timestamp=3000, txpos=1, header_hash='00' * 32))
+        # tx2 spent a coin of ADDR1 before tx4 did, so the funding tx of that coin is an uncle of tx4
+        self.assertEqual({
+            tx4.txid(): ([tx3.txid()], [tx1.txid()]),
+            tx3.txid(): (['cd' * 32], []),
+            tx1.txid(): (['ab' * 32], []),
+        }, adb.get_tx_parents(tx4.txid()))
+        self.assertEqual({tx2.txid(): ([tx1.txid()], []), tx1.txid(): (['ab' * 32], [])},
+                         adb.get_tx_parents(tx2.txid()))
+        # tx2 goes back to the mempool: it now comes after tx4
+        adb.add_unverified_or_unconfirmed_tx(tx2.txid(), 0)
+        self.assertEqual({tx4.txid(): ([tx3.txid()], []), tx3.txid(): (['cd' * 32], [])},
+                         adb.get_tx_parents(tx4.txid()))
+        self.assertEqual([tx3.txid()], adb.get_tx_parents(tx2.txid())[tx2.txid()][1])
+        adb.remove_transaction(tx4.txid())
+        self.assertEqual([], adb.get_tx_parents(tx2.txid())[tx2.txid()][1])
+
+
 class FakeExchange(ExchangeBase):
     def __init__(self, rate):
         super().__init__(lambda self: None, lambda self: None)
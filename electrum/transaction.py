@@ -33,19 +33,21 @@ import sys
 import io
 import base64
 from typing import (Sequence, Union, NamedTuple, Tuple, Optional, Iterable,
-                    Callable, List, Dict, Set, TYPE_CHECKING)
+                    Callable, List, Dict, Set, Any, TYPE_CHECKING)
 from collections import defaultdict
 from enum import IntEnum
 import itertools
 import binascii
 import copy
+import hashlib
+import concurrent.futures
 
 from . import ecc, bitcoin, constants, segwit_addr, bip32
 from .bip32 import BIP32Node
 from .util import profiler, to_bytes, bfh, chunks, is_hex_str, parse_max_spend
 from .bitcoin import (TYPE_ADDRESS, TYPE_SCRIPT, hash_160,
                       hash160_to_p2sh, hash160_to_p2pkh, hash_to_segwit_addr,
-                      var_int, TOTAL_COIN_SUPPLY_LIMIT_IN_BTC, COIN,
+                      var_int, var_int_bytes, TOTAL_COIN_SUPPLY_LIMIT_IN_BTC, COIN,
                       int_to_hex, push_script, b58_address_to_hash160,
                       opcodes, add_number_to_script, base_decode,
                       base_encode, construct_witness, construct_script)
@@ -67,6 +69,11 @@ DEBUG_PSBT_PARSING = False
 _NEEDS_RECALC = ...  # sentinel value
 
 
+def _int_to_bytes4(i: int) -> bytes:
+    # like bfh(int_to_hex(i, 4)): little-endian, negative values as two's complement
+    return i.to_bytes(4, byteorder="little", signed=i < 0)
+
+
 class SerializationError(Exception):
     """ Thrown when there's a problem deserializing or serializing """
 
@@ -141,7 +148,7 @@ class TxOutput:
     def serialize_to_network(self) -> bytes:
         buf = int.to_bytes(self.value, 8, byteorder="little", signed=False)
         script = self.scriptpubkey
-        buf += bfh(var_int(len(script.hex()) // 2))
+        buf += var_int_bytes(len(script))
         buf += script
         return buf
 
@@ -209,9 +216,66 @@ class TxOutput:
 
 
 class BIP143SharedTxDigestFields(NamedTuple):
-    hashPrevouts: str
-    hashSequence: str
-    hashOutputs: str
+    hashPrevouts: bytes
+    hashSequence: bytes
+    hashOutputs: bytes
+
+
+class SighashCache:
+    """Intermediate data shared by the sighashes of all inputs of a transaction.
+
+    Holds the BIP143 hashPrevouts/hashSequence/hashOutputs, and for legacy
+    inputs, the sha256 midstate of the preimage up to each input, together with
+    the serialization of everything after it. This makes signing all inputs
+    linear in the size of the transaction, instead of quadratic.
+    Must not be used after the inputs or outputs of the transaction change.
+    """
+
+    def __init__(self, tx: 'Transaction'):
+        self.tx = tx
+        self._bip143_shared_txdigest_fields = None  # type: Optional[BIP143SharedTxDigestFields]
+        self._legacy_midstates = None  # type: Optional[List[Any]]
+        self._legacy_parts = None  # type: Optional[List[bytes]]
+        self._legacy_suffixes = None  # type: Optional[memoryview]
+        self._legacy_offsets = None  # type: Optional[List[int]]
+
+    def get_bip143_shared_txdigest_fields(self) -> BIP143SharedTxDigestFields:
+        if self._bip143_shared_txdigest_fields is None:
+            self._bip143_shared_txdigest_fields = self.tx._calc_bip143_shared_txdigest_fields()
+        return self._bip143_shared_txdigest_fields
+
+    def _calc_legacy_midstates(self) -> None:
+        tx = self.tx
+        inputs = tx.inputs()
+        outputs = tx.outputs()
+        # serialization of each input with an empty scriptSig
+        parts = [txin.serialize_to_network(script_sig=b"") for txin in inputs]
+        offsets = [0]
+        for part in parts:
+            offsets.append(offsets[-1] + len(part))
+        suffix = b"".join(parts) + var_int_bytes(len(outputs)) \
+            + b"".join(o.serialize_to_network() for o in outputs) \
+            + _int_to_bytes4(tx.locktime)
+        h = hashlib.sha256(_int_to_bytes4(tx.version) + var_int_bytes(len(inputs)))
+        midstates = []
+        for part in parts:
+            midstates.append(h.copy())
+            h.update(part)
+        self._legacy_parts = parts
+        self._legacy_offsets = offsets
+        self._legacy_suffixes = memoryview(suffix)
+        self._legacy_midstates = midstates
+
+    def get_legacy_sighash(self, txin_index: int, *, preimage_script: bytes, sighash: int) -> bytes:
+        """Returns sha256d of the legacy preimage of input txin_index."""
+        if self._legacy_midstates is None:
+            self._calc_legacy_midstates()
+        txin = self.tx.inputs()[txin_index]
+        h = self._legacy_midstates[txin_index].copy()
+        h.update(txin.serialize_to_network(script_sig=preimage_script))
+        h.update(self._legacy_suffixes[self._legacy_offsets[txin_index + 1]:])
+        h.update(_int_to_bytes4(sighash))
+        return hashlib.sha256(h.digest()).digest()
 
 
 class TxOutpoint(NamedTuple):
@@ -238,7 +302,7 @@ class TxOutpoint(NamedTuple):
         return [self.txid.hex(), self.out_idx]
 
     def serialize_to_network(self) -> bytes:
-        return self.txid[::-1] + bfh(int_to_hex(self.out_idx, 4))
+        return self.txid[::-1] + self.out_idx.to_bytes(4, byteorder="little", signed=False)
 
     def is_coinbase(self) -> bool:
         return self.txid == bytes(32)
@@ -353,9 +417,9 @@ class TxInput:
         # Prev hash and index
         s = self.prevout.serialize_to_network()
         # Script length, script, sequence
-        s += bytes.fromhex(var_int(len(script_sig)))
+        s += var_int_bytes(len(script_sig))
         s += script_sig
-        s += bytes.fromhex(int_to_hex(self.nsequence, 4))
+        s += self.nsequence.to_bytes(4, byteorder="little", signed=False)
         return s
 
     def witness_elements(self) -> Sequence[bytes]:
@@ -405,19 +469,23 @@ class BCDataStream(object):
     """Workalike python implementation of Bitcoin's CDataStream class."""
 
     def __init__(self):
-        self.input = None  # type: Optional[bytearray]
+        self.input = None  # type: Union[bytes, bytearray, memoryview, None]
         self.read_cursor = 0
 
     def clear(self):
         self.input = None
         self.read_cursor = 0
 
-    def write(self, _bytes: Union[bytes, bytearray]):  # Initialize with string of _bytes
-        assert isinstance(_bytes, (bytes, bytearray))
+    def write(self, _bytes: Union[bytes, bytearray, memoryview]):  # Initialize with string of _bytes
+        assert isinstance(_bytes, (bytes, bytearray, memoryview))
         if self.input is None:
-            self.input = bytearray(_bytes)
+            # bytes are immutable and memoryviews are only read from, so there is no need to copy them.
+            # A bytearray is copied, as the caller might modify it.
+            self.input = bytearray(_bytes) if isinstance(_bytes, bytearray) else _bytes
         else:
-            self.input += bytearray(_bytes)
+            if not isinstance(self.input, bytearray):
+                self.input = bytearray(self.input)
+            self.input += _bytes
 
     def read_string(self, encoding='ascii'):
         # Strings are encoded depending on length:
@@ -448,9 +516,10 @@ class BCDataStream(object):
         read_begin = self.read_cursor
         read_end = read_begin + length
         if 0 <= read_begin <= read_end <= input_len:
-            result = self.input[read_begin:read_end]  # type: bytearray
-            self.read_cursor += length
-            return bytes(result)
+            result = self.input[read_begin:read_end]
+            self.read_cursor = read_end
+            # slicing bytes already gives a (single) copy
+            return result if type(result) is bytes else bytes(result)
         else:
             raise SerializationError('attempt to read past end of buffer')
 
@@ -726,18 +795,22 @@ def multisig_script(public_keys: Sequence[str], m: int) -> str:
 
 class Transaction:
     _cached_network_ser: Optional[str]
+    _cached_network_ser_bytes: Optional[bytes]
 
     def __str__(self):
         return self.serialize()
 
     def __init__(self, raw):
+        # the network serialization is cached as hex and/or as bytes, depending on what we got
+        self._cached_network_ser = None
+        self._cached_network_ser_bytes = None
         if raw is None:
-            self._cached_network_ser = None
+            pass
         elif isinstance(raw, str):
             self._cached_network_ser = raw.strip() if raw else None
             assert is_hex_str(self._cached_network_ser)
         elif isinstance(raw, (bytes, bytearray)):
-            self._cached_network_ser = raw.hex()
+            self._cached_network_ser_bytes = bytes(raw)
         else:
             raise Exception(f"cannot initialize transaction from {raw}")
         self._inputs = None  # type: List[TxInput]
@@ -746,6 +819,10 @@ class Transaction:
         self._version = 2
 
         self._cached_txid = None  # type: Optional[str]
+        # set by deserialize: whether the cached network serialization is exactly what
+        # serialize_to_network would produce, and where its witness data starts (if segwit)
+        self._network_ser_is_canonical = False
+        self._network_ser_witness_start = None  # type: Optional[int]
 
     @property
     def locktime(self):
@@ -787,37 +864,114 @@ class Transaction:
             self.deserialize()
         return self._outputs
 
+    def _get_network_ser_bytes(self) -> Optional[bytes]:
+        if self._cached_network_ser_bytes is not None:
+            return self._cached_network_ser_bytes
+        if self._cached_network_ser is not None:
+            # note: not kept, to not hold the tx twice in memory
+            return bfh(self._cached_network_ser)
+        return None
+
     def deserialize(self) -> None:
-        if self._cached_network_ser is None:
-            return
         if self._inputs is not None:
             return
-
-        raw_bytes = bfh(self._cached_network_ser)
-        vds = BCDataStream()
-        vds.write(raw_bytes)
-        self._version = vds.read_int32()
-        n_vin = vds.read_compact_size()
+        raw = self._get_network_ser_bytes()
+        if raw is None:
+            return
+        try:
+            self._deserialize_from_bytes(raw)
+        except (struct.error, IndexError) as e:
+            raise SerializationError('attempt to read past end of buffer') from e
+
+    def _deserialize_from_bytes(self, raw: bytes) -> None:
+        # Same as reading the tx with parse_input/parse_output/parse_witness from a BCDataStream,
+        # but in a single pass over raw, and witnesses are kept as slices of raw.
+        unpack_from = struct.unpack_from
+        raw_len = len(raw)
+        num_non_canonical = 0  # compact sizes not using the shortest encoding
+
+        def read_compact_size(pos: int) -> Tuple[int, int]:
+            nonlocal num_non_canonical
+            size = raw[pos]
+            if size < 253:
+                return size, pos + 1
+            if size == 253:
+                (size,) = unpack_from('<H', raw, pos + 1)
+                end = pos + 3
+                num_non_canonical += size < 253
+            elif size == 254:
+                (size,) = unpack_from('<I', raw, pos + 1)
+                end = pos + 5
+                num_non_canonical += size < 2**16
+            else:
+                (size,) = unpack_from('<Q', raw, pos + 1)
+                end = pos + 9
+                num_non_canonical += size < 2**32
+            return size, end
+
+        def read_bytes(pos: int, length: int) -> Tuple[bytes, int]:
+            end = pos + length
+            if end > raw_len:
+                raise SerializationError('attempt to read past end of buffer')
+            return raw[pos:end], end
+
+        (self._version,) = unpack_from('<i', raw, 0)
+        n_vin, pos = read_compact_size(4)
         is_segwit = (n_vin == 0)
         if is_segwit:
-            marker = vds.read_bytes(1)
+            marker = raw[pos:pos + 1]
             if marker != b'\x01':
                 raise ValueError('invalid txn marker byte: {}'.format(marker))
-            n_vin = vds.read_compact_size()
+            n_vin, pos = read_compact_size(pos + 1)
         if n_vin < 1:
             raise SerializationError('tx needs to have at least 1 input')
-        txins = [parse_input(vds) for i in range(n_vin)]
-        n_vout = vds.read_compact_size()
+        txins = []
+        for i in range(n_vin):
+            prevout_hash, pos = read_bytes(pos, 32)
+            (prevout_n,) = unpack_from('<I', raw, pos)
+            script_len, pos = read_compact_size(pos + 4)
+            script_sig, pos = read_bytes(pos, script_len)
+            (nsequence,) = unpack_from('<I', raw, pos)
+            pos += 4
+            prevout = TxOutpoint(txid=prevout_hash[::-1], out_idx=prevout_n)
+            txins.append(TxInput(prevout=prevout, script_sig=script_sig, nsequence=nsequence))
+        n_vout, pos = read_compact_size(pos)
         if n_vout < 1:
             raise SerializationError('tx needs to have at least 1 output')
-        self._outputs = [parse_output(vds) for i in range(n_vout)]
+        txouts = []
+        for i in range(n_vout):
+            (value,) = unpack_from('<q', raw, pos)
+            if value > TOTAL_COIN_SUPPLY_LIMIT_IN_BTC * COIN:
+                raise SerializationError('invalid output amount (too large)')
+            if value < 0:
+                raise SerializationError('invalid output amount (negative)')
+            script_len, pos = read_compact_size(pos + 8)
+            scriptpubkey, pos = read_bytes(pos, script_len)
+            txouts.append(TxOutput(value=value, scriptpubkey=scriptpubkey))
+        self._outputs = txouts
+        witness_start = pos
         if is_segwit:
             for txin in txins:
-                parse_witness(vds, txin)
+                start = pos
+                num_non_canonical_before = num_non_canonical
+                n, pos = read_compact_size(pos)
+                for j in range(n):
+                    item_len, pos = read_compact_size(pos)
+                    pos += item_len
+                if pos > raw_len:
+                    raise SerializationError('attempt to read past end of buffer')
+                if num_non_canonical == num_non_canonical_before:
+                    txin.witness = raw[start:pos]
+                else:  # re-encode, like parse_witness
+                    vds = BCDataStream()
+                    vds.write(raw[start:pos])
+                    parse_witness(vds, txin)
         self._inputs = txins  # only expose field after witness is parsed, for sanity
-        self._locktime = vds.read_uint32()
-        if vds.can_read_more():
+        (self._locktime,) = unpack_from('<I', raw, pos)
+        if pos + 4 != raw_len:
             raise SerializationError('extra junk at the end')
+        self._network_ser_is_canonical = num_non_canonical == 0
+        self._network_ser_witness_start = witness_start if is_segwit else None
 
     @classmethod
     def serialize_witness(cls, txin: TxInput, *, estimate_size=False) -> str:
@@ -891,9 +1045,10 @@ class Transaction:
     def _calc_bip143_shared_txdigest_fields(self) -> BIP143SharedTxDigestFields:
         inputs = self.inputs()
         outputs = self.outputs()
-        hashPrevouts = sha256d(b''.join(txin.prevout.serialize_to_network() for txin in inputs)).hex()
-        hashSequence = sha256d(bfh(''.join(int_to_hex(txin.nsequence, 4) for txin in inputs))).hex()
-        hashOutputs = sha256d(bfh(''.join(o.serialize_to_network().hex() for o in outputs))).hex()
+        hashPrevouts = sha256d(b''.join(txin.prevout.serialize_to_network() for txin in inputs))
+        hashSequence = sha256d(b''.join(txin.nsequence.to_bytes(4, byteorder="little", signed=False)
+                                        for txin in inputs))
+        hashOutputs = sha256d(b''.join(o.serialize_to_network() for o in outputs))
         return BIP143SharedTxDigestFields(hashPrevouts=hashPrevouts,
                                           hashSequence=hashSequence,
                                           hashOutputs=hashOutputs)
@@ -904,14 +1059,22 @@ class Transaction:
 
     def invalidate_ser_cache(self):
         self._cached_network_ser = None
+        self._cached_network_ser_bytes = None
         self._cached_txid = None
+        self._network_ser_is_canonical = False
+        self._network_ser_witness_start = None
 
     def serialize(self) -> str:
         if not self._cached_network_ser:
-            self._cached_network_ser = self.serialize_to_network(estimate_size=False, include_sigs=True)
+            if self._cached_network_ser_bytes is not None:
+                self._cached_network_ser = self._cached_network_ser_bytes.hex()
+            else:
+                self._cached_network_ser = self.serialize_to_network(estimate_size=False, include_sigs=True)
         return self._cached_network_ser
 
     def serialize_as_bytes(self) -> bytes:
+        if self._cached_network_ser_bytes is not None:
+            return self._cached_network_ser_bytes
         return bfh(self.serialize())
 
     def serialize_to_network(self, *, estimate_size=False, include_sigs=True, force_legacy=False) -> str:
@@ -963,6 +1126,14 @@ class Transaction:
     def txid(self) -> Optional[str]:
         if self._cached_txid is None:
             self.deserialize()
+            if self._network_ser_is_canonical:
+                # hash the non-witness parts of the network serialization we already have
+                raw = self._get_network_ser_bytes()
+                witness_start = self._network_ser_witness_start
+                if witness_start is not None:
+                    raw = raw[:4] + raw[6:witness_start] + raw[-4:]
+                self._cached_txid = sha256d(raw)[::-1].hex()
+                return self._cached_txid
             all_segwit = all(txin.is_segwit() for txin in self.inputs())
             if not all_segwit and not self.is_complete():
                 return None
@@ -978,6 +1149,8 @@ class Transaction:
         self.deserialize()
         if not self.is_complete():
             return None
+        if self._network_ser_is_canonical:
+            return sha256d(self._get_network_ser_bytes())[::-1].hex()
         try:
             ser = self.serialize_to_network()
         except UnknownTxinType:
@@ -1108,10 +1281,14 @@ class Transaction:
 
     def estimated_total_size(self):
         """Return an estimated total transaction size in bytes."""
-        if not self.is_complete() or self._cached_network_ser is None:
+        if not self.is_complete():
             return len(self.serialize_to_network(estimate_size=True)) // 2
-        else:
+        elif self._cached_network_ser_bytes is not None:
+            return len(self._cached_network_ser_bytes)
+        elif self._cached_network_ser is not None:
             return len(self._cached_network_ser) // 2  # ASCII hex string
+        else:
+            return len(self.serialize_to_network(estimate_size=True)) // 2
 
     def estimated_witness_size(self):
         """Return an estimate of witness size in bytes."""
@@ -1808,6 +1985,13 @@ class PartialTxOutput(TxOutput, PSBTSection):
         self._unknown.update(other_txout._unknown)
 
 
+def _sign_sighash(privkey_bytes: bytes, pre_hash: bytes, sighash: int) -> str:
+    # module-level, so that it can be sent to a process pool
+    privkey = ecc.ECPrivkey(privkey_bytes)
+    sig = privkey.sign_transaction(pre_hash)
+    return sig.hex() + Sighash.to_sigbytes(sighash).hex()
+
+
 class PartialTransaction(Transaction):
 
     def __init__(self):
@@ -2044,50 +2228,83 @@ class PartialTransaction(Transaction):
 
     def serialize_preimage(self, txin_index: int, *,
                            bip143_shared_txdigest_fields: BIP143SharedTxDigestFields = None) -> str:
-        nVersion = int_to_hex(self.version, 4)
-        nLocktime = int_to_hex(self.locktime, 4)
+        return self.serialize_preimage_as_bytes(
+            txin_index, bip143_shared_txdigest_fields=bip143_shared_txdigest_fields).hex()
+
+    def serialize_preimage_as_bytes(self, txin_index: int, *,
+                                    bip143_shared_txdigest_fields: BIP143SharedTxDigestFields = None) -> bytes:
+        nVersion = _int_to_bytes4(self.version)
+        nLocktime = _int_to_bytes4(self.locktime)
         inputs = self.inputs()
         outputs = self.outputs()
         txin = inputs[txin_index]
-        sighash = txin.sighash if txin.sighash is not None else Sighash.ALL
-        if not Sighash.is_valid(sighash):
-            raise Exception(f"SIGHASH_FLAG ({sighash}) not supported!")
-        nHashType = int_to_hex(sighash, 4)
-        preimage_script = self.get_preimage_script(txin)
+        sighash = self._get_txin_sighash(txin)
+        nHashType = _int_to_bytes4(sighash)
+        preimage_script = bfh(self.get_preimage_script(txin))
         if txin.is_segwit():
             if bip143_shared_txdigest_fields is None:
                 bip143_shared_txdigest_fields = self._calc_bip143_shared_txdigest_fields()
             if not (sighash & Sighash.ANYONECANPAY):
                 hashPrevouts = bip143_shared_txdigest_fields.hashPrevouts
             else:
-                hashPrevouts = '00' * 32
+                hashPrevouts = bytes(32)
             if not (sighash & Sighash.ANYONECANPAY) and (sighash & 0x1f) != Sighash.SINGLE and (sighash & 0x1f) != Sighash.NONE:
                 hashSequence = bip143_shared_txdigest_fields.hashSequence
             else:
-                hashSequence = '00' * 32
+                hashSequence = bytes(32)
             if (sighash & 0x1f) != Sighash.SINGLE and (sighash & 0x1f) != Sighash.NONE:
                 hashOutputs = bip143_shared_txdigest_fields.hashOutputs
             elif (sighash & 0x1f) == Sighash.SINGLE and txin_index < len(outputs):
-                hashOutputs = sha256d(outputs[txin_index].serialize_to_network()).hex()
+                hashOutputs = sha256d(outputs[txin_index].serialize_to_network())
             else:
-                hashOutputs = '00' * 32
-            outpoint = txin.prevout.serialize_to_network().hex()
-            scriptCode = var_int(len(preimage_script) // 2) + preimage_script
-            amount = int_to_hex(txin.value_sats(), 8)
-            nSequence = int_to_hex(txin.nsequence, 4)
+                hashOutputs = bytes(32)
+            outpoint = txin.prevout.serialize_to_network()
+            scriptCode = var_int_bytes(len(preimage_script)) + preimage_script
+            amount = txin.value_sats().to_bytes(8, byteorder="little", signed=False)
+            nSequence = txin.nsequence.to_bytes(4, byteorder="little", signed=False)
             preimage = nVersion + hashPrevouts + hashSequence + outpoint + scriptCode + amount + nSequence + hashOutputs + nLocktime + nHashType
         else:
             if sighash != Sighash.ALL:
                 raise Exception(f"SIGHASH_FLAG ({sighash}) not supported! (for legacy sighash)")
-            txins = var_int(len(inputs)) + ''.join(txin.serialize_to_network(script_sig=bfh(preimage_script) if txin_index==k else b"").hex()
-                                                   for k, txin in enumerate(inputs))
-            txouts = var_int(len(outputs)) + ''.join(o.serialize_to_network().hex() for o in outputs)
+            txins = var_int_bytes(len(inputs)) + b''.join(
+                txin.serialize_to_network(script_sig=preimage_script if txin_index == k else b"")
+                for k, txin in enumerate(inputs))
+            txouts = var_int_bytes(len(outputs)) + b''.join(o.serialize_to_network() for o in outputs)
             preimage = nVersion + txins + txouts + nLocktime + nHashType
         return preimage
 
-    def sign(self, keypairs) -> None:
+    @classmethod
+    def _get_txin_sighash(cls, txin: 'PartialTxInput') -> int:
+        sighash = txin.sighash if txin.sighash is not None else Sighash.ALL
+        if not Sighash.is_valid(sighash):
+            raise Exception(f"SIGHASH_FLAG ({sighash}) not supported!")
+        return sighash
+
+    def calc_sighash(self, txin_index: int, *, sighash_cache: SighashCache = None) -> bytes:
+        """Returns the message digest signed by the input, i.e. sha256d of its preimage.
+        sighash_cache, if given, is reused across the inputs of the tx.
+        """
+        if sighash_cache is None:
+            sighash_cache = SighashCache(self)
+        txin = self.inputs()[txin_index]
+        if txin.is_segwit():
+            return sha256d(self.serialize_preimage_as_bytes(
+                txin_index, bip143_shared_txdigest_fields=sighash_cache.get_bip143_shared_txdigest_fields()))
+        sighash = self._get_txin_sighash(txin)
+        if sighash != Sighash.ALL:
+            raise Exception(f"SIGHASH_FLAG ({sighash}) not supported! (for legacy sighash)")
+        preimage_script = bfh(self.get_preimage_script(txin))
+        return sighash_cache.get_legacy_sighash(txin_index, preimage_script=preimage_script, sighash=sighash)
+
+    def sign(self, keypairs, *, executor: concurrent.futures.Executor = None) -> None:
         # keypairs:  pubkey_hex -> (secret_bytes, is_compressed)
-        bip143_shared_txdigest_fields = self._calc_bip143_shared_txdigest_fields()
+        # executor:  optional thread or process pool. If given, the sighashes are computed here,
+        #            and the ECDSA signing is done in the pool (libsecp256k1 releases the GIL).
+        #            The resulting signatures are the same as without it.
+        if executor is not None:
+            self._sign_with_executor(keypairs, executor)
+            return
+        sighash_cache = SighashCache(self)
         for i, txin in enumerate(self.inputs()):
             pubkeys = [pk.hex() for pk in txin.pubkeys]
             for pubkey in pubkeys:
@@ -2097,22 +2314,50 @@ class PartialTransaction(Transaction):
                     continue
                 _logger.info(f"adding signature for {pubkey}. spending utxo {txin.prevout.to_str()}")
                 sec, compressed = keypairs[pubkey]
-                sig = self.sign_txin(i, sec, bip143_shared_txdigest_fields=bip143_shared_txdigest_fields)
+                sig = self.sign_txin(i, sec, sighash_cache=sighash_cache)
                 self.add_signature_to_txin(txin_idx=i, signing_pubkey=pubkey, sig=sig)
 
         _logger.debug(f"is_complete {self.is_complete()}")
         self.invalidate_ser_cache()
 
-    def sign_txin(self, txin_index, privkey_bytes, *, bip143_shared_txdigest_fields=None) -> str:
+    def _sign_with_executor(self, keypairs, executor: concurrent.futures.Executor) -> None:
+        sighash_cache = SighashCache(self)
+        jobs = []  # type: List[Tuple[int, str]]
+        job_args = []  # type: List[Tuple[bytes, bytes, int]]
+        for i, txin in enumerate(self.inputs()):
+            if txin.is_complete():
+                continue
+            pubkeys = [pk.hex() for pk in txin.pubkeys]
+            pubkeys = [pubkey for pubkey in pubkeys if pubkey in keypairs]
+            if not pubkeys:
+                continue
+            txin.validate_data(for_signing=True)
+            sighash = txin.sighash if txin.sighash is not None else Sighash.ALL
+            pre_hash = self.calc_sighash(i, sighash_cache=sighash_cache)
+            for pubkey in pubkeys:
+                sec, compressed = keypairs[pubkey]
+                jobs.append((i, pubkey))
+                job_args.append((sec, pre_hash, sighash))
+        # for multisig, this might compute a few more signatures than needed,
+        # but they are added in the same order as in the serial case.
+        chunksize = max(1, len(job_args) // 64)
+        sigs = executor.map(_sign_sighash, *zip(*job_args), chunksize=chunksize) if job_args else []
+        for (i, pubkey), sig in zip(jobs, sigs):
+            txin = self.inputs()[i]
+            if txin.is_complete():
+                continue
+            _logger.info(f"adding signature for {pubkey}. spending utxo {txin.prevout.to_str()}")
+            self.add_signature_to_txin(txin_idx=i, signing_pubkey=pubkey, sig=sig)
+
+        _logger.debug(f"is_complete {self.is_complete()}")
+        self.invalidate_ser_cache()
+
+    def sign_txin(self, txin_index, privkey_bytes, *, sighash_cache: SighashCache = None) -> str:
         txin = self.inputs()[txin_index]
         txin.validate_data(for_signing=True)
         sighash = txin.sighash if txin.sighash is not None else Sighash.ALL
-        pre_hash = sha256d(bfh(self.serialize_preimage(txin_index,
-                                                       bip143_shared_txdigest_fields=bip143_shared_txdigest_fields)))
-        privkey = ecc.ECPrivkey(privkey_bytes)
-        sig = privkey.sign_transaction(pre_hash)
-        sig = sig.hex() + Sighash.to_sigbytes(sighash).hex()
-        return sig
+        pre_hash = self.calc_sighash(txin_index, sighash_cache=sighash_cache)
+        return _sign_sighash(privkey_bytes, pre_hash, sighash)
 
     def is_complete(self) -> bool:
         return all([txin.is_complete() for txin in self.inputs()])
@@ -22,7 +22,7 @@
 # SOFTWARE.
 
 import asyncio
-from typing import Sequence, Optional, TYPE_CHECKING
+from typing import Sequence, Optional, TYPE_CHECKING, List, Tuple, Union, Dict
 
 import aiorpcx
 
@@ -39,6 +39,10 @@ if TYPE_CHECKING:
     from .address_synchronizer import AddressSynchronizer
 
 
+# max number of merkle proofs requested in a JSON-RPC batch, and verified together
+MERKLE_BATCH_SIZE = 50
+
+
 class MerkleVerificationFailure(Exception): pass
 class MissingBlockHeader(MerkleVerificationFailure): pass
 class MerkleRootMismatch(MerkleVerificationFailure): pass
@@ -76,6 +80,8 @@ class SPV(NetworkJobOnDefaultServer):
         local_height = self.blockchain.height()
         unverified = self.wallet.get_unverified_txs()
 
+        to_request = []  # type: List[Tuple[str, int]]
+        have_header = {}  # type: Dict[int, bool]
         for tx_hash, tx_height in unverified.items():
             # do not request merkle branch if we already requested it
             if tx_hash in self.requested_merkle or tx_hash in self.merkle_roots:
@@ -84,62 +90,89 @@ class SPV(NetworkJobOnDefaultServer):
             if not (0 < tx_height <= local_height):
                 continue
             # if it's in the checkpoint region, we still might not have the header
-            header = self.blockchain.read_header(tx_height)
-            if header is None:
-                if tx_height < constants.net.max_checkpoint():
+            if tx_height not in have_header:
+                have_header[tx_height] = self.blockchain.read_header(tx_height) is not None
+                if not have_header[tx_height] and tx_height < constants.net.max_checkpoint():
                     # FIXME these requests are not counted (self._requests_sent += 1)
                     await self.taskgroup.spawn(self.interface.request_chunk(tx_height, None, can_return_early=True))
+            if not have_header[tx_height]:
                 continue
-            # request now
-            self.logger.info(f'requested merkle {tx_hash}')
-            self.requested_merkle.add(tx_hash)
-            await self.taskgroup.spawn(self._request_and_verify_single_proof, tx_hash, tx_height)
+            to_request.append((tx_hash, tx_height))
+        # request now, grouped by height, so that txs of the same block are verified together
+        to_request.sort(key=lambda x: x[1])
+        for i in range(0, len(to_request), MERKLE_BATCH_SIZE):
+            txs = to_request[i:i + MERKLE_BATCH_SIZE]
+            self.logger.info(f'requested {len(txs)} merkle proofs, heights {txs[0][1]}..{txs[-1][1]}')
+            self.requested_merkle.update(tx_hash for tx_hash, tx_height in txs)
+            await self.taskgroup.spawn(self._request_and_verify_proofs, txs)
 
-    async def _request_and_verify_single_proof(self, tx_hash, tx_height):
+    async def _request_and_verify_proofs(self, txs: List[Tuple[str, int]]):
         try:
-            self._requests_sent += 1
-            async with self._network_request_semaphore:
-                merkle = await self.interface.get_merkle_for_transaction(tx_hash, tx_height)
-        except aiorpcx.jsonrpc.RPCError:
-            self.logger.info(f'tx {tx_hash} not at height {tx_height}')
-            self.wallet.remove_unverified_tx(tx_hash, tx_height)
-            self.requested_merkle.discard(tx_hash)
-            return
+            self._requests_sent += len(txs)
+            merkles = await self._get_merkles(txs)
         finally:
-            self._requests_answered += 1
-        # Verify the hash of the server-provided merkle branch to a
-        # transaction matches the merkle root of its block
-        if tx_height != merkle.get('block_height'):
-            self.logger.info('requested tx_height {} differs from received tx_height {} for txid {}'
-                             .format(tx_height, merkle.get('block_height'), tx_hash))
-        tx_height = merkle.get('block_height')
-        pos = merkle.get('pos')
-        merkle_branch = merkle.get('merkle')
+            self._requests_answered += len(txs)
+        proofs = []  # type: List[Tuple[str, dict]]
+        for (tx_hash, tx_height), merkle in zip(txs, merkles):
+            if isinstance(merkle, aiorpcx.jsonrpc.RPCError):
+                self.logger.info(f'tx {tx_hash} not at height {tx_height}')
+                self.wallet.remove_unverified_tx(tx_hash, tx_height)
+                self.requested_merkle.discard(tx_hash)
+                continue
+            if tx_height != merkle.get('block_height'):
+                self.logger.info('requested tx_height {} differs from received tx_height {} for txid {}'
+                                 .format(tx_height, merkle.get('block_height'), tx_hash))
+            proofs.append((tx_hash, merkle))
         # we need to wait if header sync/reorg is still ongoing, hence lock:
         async with self.network.bhi_lock:
-            header = self.network.blockchain().read_header(tx_height)
-        try:
-            verify_tx_is_in_block(tx_hash, merkle_branch, pos, header, tx_height)
-        except MerkleVerificationFailure as e:
-            if self.network.config.NETWORK_SKIPMERKLECHECK:
-                self.logger.info(f"skipping merkle proof check {tx_hash}")
-            else:
-                self.logger.info(repr(e))
-                raise GracefulDisconnect(e) from e
-        # we passed all the tests
-        self.merkle_roots[tx_hash] = header.get('merkle_root')
-        self.requested_merkle.discard(tx_hash)
-        self.logger.info(f"verified {tx_hash}")
-        header_hash = hash_header(header)
-        tx_info = TxMinedInfo(height=tx_height,
-                              timestamp=header.get('timestamp'),
-                              txpos=pos,
-                              header_hash=header_hash)
-        self.wallet.add_verified_tx(tx_hash, tx_info)
+            chain = self.network.blockchain()
+            headers = {tx_height: chain.read_header(tx_height)
+                       for tx_height in set(merkle.get('block_height') for tx_hash, merkle in proofs)}
+        # Verify the hash of the server-provided merkle branch to a
+        # transaction matches the merkle root of its block.
+        # Proofs of txs in the same block share their upper part, which is only hashed once.
+        inner_nodes = {tx_height: {} for tx_height in headers}
+        header_hashes = {}  # type: Dict[int, str]
+        verified = {}  # type: Dict[str, TxMinedInfo]
+        for tx_hash, merkle in proofs:
+            tx_height = merkle.get('block_height')
+            pos = merkle.get('pos')
+            merkle_branch = merkle.get('merkle')
+            header = headers[tx_height]
+            try:
+                verify_tx_is_in_block(tx_hash, merkle_branch, pos, header, tx_height,
+                                      inner_nodes=inner_nodes[tx_height])
+            except MerkleVerificationFailure as e:
+                if self.network.config.NETWORK_SKIPMERKLECHECK:
+                    self.logger.info(f"skipping merkle proof check {tx_hash}")
+                else:
+                    self.logger.info(repr(e))
+                    raise GracefulDisconnect(e) from e
+            # we passed all the tests
+            self.merkle_roots[tx_hash] = header.get('merkle_root')
+            self.requested_merkle.discard(tx_hash)
+            if tx_height not in header_hashes:
+                header_hashes[tx_height] = hash_header(header)
+            verified[tx_hash] = TxMinedInfo(height=tx_height,
+                                            timestamp=header.get('timestamp'),
+                                            txpos=pos,
+                                            header_hash=header_hashes[tx_height])
+        self.logger.info(f"verified {len(verified)} txs")
+        self.wallet.add_verified_txs(verified)
+
+    async def _get_merkles(self, txs: List[Tuple[str, int]]) -> List[Union[dict, aiorpcx.jsonrpc.RPCError]]:
+        async with self._network_request_semaphore:
+            return await self.interface.get_merkles_for_transactions(txs)
 
     @classmethod
-    def hash_merkle_root(cls, merkle_branch: Sequence[str], tx_hash: str, leaf_pos_in_tree: int):
-        """Return calculated merkle root."""
+    def hash_merkle_root(cls, merkle_branch: Sequence[str], tx_hash: str, leaf_pos_in_tree: int, *,
+                         inner_nodes: Dict[Tuple[bytes, int, int], str] = None):
+        """Return calculated merkle root.
+
+        inner_nodes can be shared between calls for txs of the same block: it maps
+        the nodes already hashed, as (hash, index, number of remaining branch items),
+        to the merkle root they led to.
+        """
         try:
             h = hash_decode(tx_hash)
             merkle_branch_bytes = [hash_decode(item) for item in merkle_branch]
@@ -149,23 +182,39 @@ class SPV(NetworkJobOnDefaultServer):
         if leaf_pos_in_tree < 0:
             raise MerkleVerificationFailure('leaf_pos_in_tree must be non-negative')
         index = leaf_pos_in_tree
-        for item in merkle_branch_bytes:
+        path = []
+        root = None
+        for i, item in enumerate(merkle_branch_bytes):
+            if inner_nodes is not None:
+                node = (h, index, len(merkle_branch_bytes) - i)
+                root = inner_nodes.get(node)
+                if root is not None:
+                    break
+                path.append(node)
             if len(item) != 32:
                 raise MerkleVerificationFailure('all merkle branch items have to 32 bytes long')
             inner_node = (item + h) if (index & 1) else (h + item)
-            cls._raise_if_valid_tx(inner_node.hex())
+            cls._raise_if_valid_tx(inner_node)
             h = sha256d(inner_node)
             index >>= 1
-        if index != 0:
-            raise MerkleVerificationFailure(f'leaf_pos_in_tree too large for branch')
-        return hash_encode(h)
+        if root is None:
+            if index != 0:
+                raise MerkleVerificationFailure(f'leaf_pos_in_tree too large for branch')
+            root = hash_encode(h)
+        for node in path:
+            inner_nodes[node] = root
+        return root
 
     @classmethod
-    def _raise_if_valid_tx(cls, raw_tx: str):
+    def _raise_if_valid_tx(cls, raw_tx: bytes):
         # If an inner node of the merkle proof is also a valid tx, chances are, this is an attack.
         # https://lists.linuxfoundation.org/pipermail/bitcoin-dev/2018-June/016105.html
         # https://lists.linuxfoundation.org/pipermail/bitcoin-dev/attachments/20180609/9f4f5b1f/attachment-0001.pdf
         # https://bitcoin.stackexchange.com/questions/76121/how-is-the-leaf-node-weakness-in-merkle-trees-exploitable/76122#76122
+        if len(raw_tx) == 64 and raw_tx[4] > 1:
+            # shortcut: the input count (or segwit marker) says there are at least two inputs,
+            # which do not fit in 64 bytes (an input is at least 41 bytes)
+            return
         tx = Transaction(raw_tx)
         try:
             tx.deserialize()
@@ -197,14 +246,16 @@ class SPV(NetworkJobOnDefaultServer):
 
 def verify_tx_is_in_block(tx_hash: str, merkle_branch: Sequence[str],
                           leaf_pos_in_tree: int, block_header: Optional[dict],
-                          block_height: int) -> None:
-    """Raise MerkleVerificationFailure if verification fails."""
+                          block_height: int, *,
+                          inner_nodes: Dict[Tuple[bytes, int, int], str] = None) -> None:
+    """Raise MerkleVerificationFailure if verification fails.
+    See SPV.hash_merkle_root for inner_nodes."""
     if not block_header:
         raise MissingBlockHeader("merkle verification failed for {} (missing header {})"
                                  .format(tx_hash, block_height))
     if len(merkle_branch) > 30:
         raise MerkleVerificationFailure(f"merkle branch too long: {len(merkle_branch)}")
-    calc_merkle_root = SPV.hash_merkle_root(merkle_branch, tx_hash, leaf_pos_in_tree)
+    calc_merkle_root = SPV.hash_merkle_root(merkle_branch, tx_hash, leaf_pos_in_tree, inner_nodes=inner_nodes)
     if block_header.get('merkle_root') != calc_merkle_root:
         raise MerkleRootMismatch("merkle verification failed for {} ({} != {})".format(
             tx_hash, block_header.get('merkle_root'), calc_merkle_root))
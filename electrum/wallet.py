@@ -36,11 +36,14 @@ import errno
 import traceback
 import operator
 import math
+import concurrent.futures
+import contextlib
 from functools import partial
 from collections import defaultdict
 from numbers import Number
 from decimal import Decimal
-from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Iterable
+from typing import (TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Iterable,
+                    ContextManager)
 from abc import ABC, abstractmethod
 import itertools
 import threading
@@ -63,7 +66,7 @@ from .bitcoin import COIN, TYPE_ADDRESS
 from .bitcoin import is_address, address_to_script, is_minikey, relayfee, dust_threshold
 from .crypto import sha256d
 from . import keystore
-from .keystore import (load_keystore, Hardware_KeyStore, KeyStore, KeyStoreWithMPK,
+from .keystore import (load_keystore, Hardware_KeyStore, KeyStore, KeyStoreWithMPK, Software_KeyStore,
                        AddressIndexGeneric, CannotDerivePubkey)
 from .util import multisig_type, parse_max_spend
 from .storage import StorageEncryptionVersion, WalletStorage
@@ -315,6 +318,13 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         assert self.config is not None, "config must not be None"
         self.db = db
         self.storage = storage
+        self.db.set_journal_enabled(config.WALLET_USE_STORAGE_JOURNAL)
+        if storage and (db.uses_sqlite_tables()
+                        or (config.WALLET_USE_SQLITE_TX_TABLES and not storage.is_encrypted())):
+            db.attach_sqlite_tables(storage.path + '.sqlite')
+            if storage.is_encrypted():
+                # the sqlite db is not encrypted
+                db.detach_sqlite_tables()
         # load addresses needs to be called before constructor for sanity checks
         db.load_addresses(self.wallet_type)
         self.keystore = None  # type: Optional[KeyStore]  # will be set by load_keystore
@@ -326,8 +336,6 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             self.adb.add_address(addr)
         self.lock = self.adb.lock
         self.transaction_lock = self.adb.transaction_lock
-        self._last_full_history = None
-        self._tx_parents_cache = {}
 
         self.taskgroup = OldTaskGroup()
 
@@ -405,6 +413,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                 channel_backups[chan_id.hex()] = self.lnworker.create_channel_backup(chan_id)
             new_db.put('channels', None)
             new_db.put('lightning_privkey2', None)
+        # tx tables are not part of the backup
+        new_db.put('sqlite_tx_tables', None)
 
         new_path = os.path.join(backup_dir, self.basename() + '.backup')
         new_storage = WalletStorage(new_path)
@@ -474,9 +484,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
 
     def clear_tx_parents_cache(self):
         with self.lock, self.transaction_lock:
-            self._tx_parents_cache.clear()
             self._num_parents.clear()
-            self._last_full_history = None
 
     @event_listener
     async def on_event_adb_set_up_to_date(self, adb):
@@ -902,51 +910,9 @@ class Abstract_Wallet(ABC, Logger, EventListener):
     def get_tx_parents(self, txid: str) -> Dict[str, Tuple[List[str], List[str]]]:
         """
         returns a flat dict:
-        txid -> list of parent txids
+        txid -> (list of parent txids, list of uncle txids)
         """
-        with self.lock, self.transaction_lock:
-            if self._last_full_history is None:
-                self._last_full_history = self.get_full_history(None, include_lightning=False)
-                # populate cache in chronological order (confirmed tx only)
-                # todo: get_full_history should return unconfirmed tx topologically sorted
-                for _txid, tx_item in self._last_full_history.items():
-                    if tx_item['height'] > 0:
-                        self.get_tx_parents(_txid)
-
-            result = self._tx_parents_cache.get(txid, None)
-            if result is not None:
-                return result
-            result = {}   # type: Dict[str, Tuple[List[str], List[str]]]
-            parents = []  # type: List[str]
-            uncles = []   # type: List[str]
-            tx = self.adb.get_transaction(txid)
-            assert tx, f"cannot find {txid} in db"
-            for i, txin in enumerate(tx.inputs()):
-                _txid = txin.prevout.txid.hex()
-                parents.append(_txid)
-                # detect address reuse
-                addr = self.adb.get_txin_address(txin)
-                if addr is None:
-                    continue
-                received, sent = self.adb.get_addr_io(addr)
-                if len(sent) > 1:
-                    my_txid, my_height, my_pos = sent[txin.prevout.to_str()]
-                    assert my_txid == txid
-                    for k, v in sent.items():
-                        if k != txin.prevout.to_str():
-                            reuse_txid, reuse_height, reuse_pos = v
-                            if reuse_height <= 0:  # exclude not-yet-mined (we need topological ordering)
-                                continue
-                            if (reuse_height, reuse_pos) < (my_height, my_pos):
-                                uncle_txid, uncle_index = k.split(':')
-                                uncles.append(uncle_txid)
-
-            for _txid in parents + uncles:
-                if _txid in self._last_full_history.keys():
-                    result.update(self.get_tx_parents(_txid))
-            result[txid] = parents, uncles
-            self._tx_parents_cache[txid] = result
-            return result
+        return self.adb.get_tx_parents(txid)
 
     def get_balance(self, **kwargs):
         domain = self.get_addresses()
@@ -1037,19 +1003,20 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         # return last balance
         return balance
 
-    def get_onchain_history(self, *, domain=None):
+    def get_onchain_history(self, *, domain=None, **kwargs):
+        """Yields the on-chain history as dicts.
+        kwargs restrict the history to a range of heights or timestamps, see adb.get_history.
+        """
         if domain is None:
             domain = self.get_addresses()
-        monotonic_timestamp = 0
-        for hist_item in self.adb.get_history(domain=domain):
-            monotonic_timestamp = max(monotonic_timestamp, (hist_item.tx_mined_status.timestamp or TX_TIMESTAMP_INF))
+        for hist_item in self.adb.get_history(domain=domain, **kwargs):
             d = {
                 'txid': hist_item.txid,
                 'fee_sat': hist_item.fee,
                 'height': hist_item.tx_mined_status.height,
                 'confirmations': hist_item.tx_mined_status.conf,
                 'timestamp': hist_item.tx_mined_status.timestamp,
-                'monotonic_timestamp': monotonic_timestamp,
+                'monotonic_timestamp': hist_item.monotonic_timestamp,
                 'incoming': True if hist_item.delta>0 else False,
                 'bc_value': Satoshis(hist_item.delta),
                 'bc_balance': Satoshis(hist_item.balance),
@@ -1328,17 +1295,12 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         fiat_income = Decimal(0)
         fiat_expenditures = Decimal(0)
         now = time.time()
-        for item in self.get_onchain_history():
+        for item in self.get_onchain_history(from_height=from_height, to_height=to_height):
             timestamp = item['timestamp']
             if from_timestamp and (timestamp or now) < from_timestamp:
                 continue
             if to_timestamp and (timestamp or now) >= to_timestamp:
                 continue
-            height = item['height']
-            if from_height is not None and from_height > height > 0:
-                continue
-            if to_height is not None and (height >= to_height or height <= 0):
-                continue
             tx_hash = item['txid']
             tx = self.db.get_transaction(tx_hash)
             tx_fee = item['fee_sat']
@@ -2393,18 +2355,30 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         # note: ks.ready_to_sign() side-effect: we trigger pairings with potential hw devices.
         #       We only do this once, before the loop, however we could rescan after each iteration,
         #       to see if the user connected/disconnected devices in the meantime.
-        for k in sorted(self.get_keystores(), key=lambda ks: ks.ready_to_sign(), reverse=True):
-            try:
-                if k.can_sign(tmp_tx):
-                    k.sign_transaction(tmp_tx, password)
-            except UserCancelled:
-                continue
+        with self._get_signing_executor(tmp_tx) as executor:
+            for k in sorted(self.get_keystores(), key=lambda ks: ks.ready_to_sign(), reverse=True):
+                try:
+                    if k.can_sign(tmp_tx):
+                        if executor is not None and isinstance(k, Software_KeyStore):
+                            k.sign_transaction(tmp_tx, password, executor=executor)
+                        else:
+                            k.sign_transaction(tmp_tx, password)
+                except UserCancelled:
+                    continue
         # remove sensitive info; then copy back details from temporary tx
         tmp_tx.remove_xpubs_and_bip32_paths()
         tx.combine_with_other_psbt(tmp_tx)
         tx.add_info_from_wallet(self, include_xpubs=False)
         return tx
 
+    def _get_signing_executor(self, tx: PartialTransaction) -> ContextManager[Optional[concurrent.futures.Executor]]:
+        """Returns a thread pool to sign the inputs of tx in, if enabled in the config
+        and tx is large enough. Otherwise, the context manager yields None."""
+        num_threads = self.config.WALLET_SIGNING_THREADS
+        if not num_threads or num_threads <= 0 or len(tx.inputs()) < self.config.WALLET_SIGNING_THREADS_MIN_INPUTS:
+            return contextlib.nullcontext()
+        return concurrent.futures.ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix='tx_signing')
+
     def try_detecting_internal_addresses_corruption(self) -> None:
         pass
 
@@ -2770,6 +2744,9 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             else:
                 enc_version = StorageEncryptionVersion.PLAINTEXT
             self.storage.set_password(new_pw, enc_version)
+            if self.storage.is_encrypted():
+                # the sqlite db is not encrypted
+                self.db.detach_sqlite_tables()
         # make sure next storage.write() saves changes
         self.db.set_modified(True)
 
@@ -28,8 +28,8 @@ import datetime
 import json
 import copy
 import threading
-from collections import defaultdict
-from typing import Dict, Optional, List, Tuple, Set, Iterable, NamedTuple, Sequence, TYPE_CHECKING, Union
+from collections import defaultdict, OrderedDict
+from typing import Dict, Optional, List, Tuple, Set, Iterable, Mapping, NamedTuple, Sequence, TYPE_CHECKING, Union
 import binascii
 import time
 
@@ -45,16 +45,20 @@ from .logging import Logger
 from .lnutil import LOCAL, REMOTE, HTLCOwner, ChannelType
 from . import json_db
 from .json_db import StoredDict, JsonDB, locked, modifier, StoredObject, stored_in, stored_as
+from .wallet_sqlite import WalletSqliteTables
 from .plugin import run_hook, plugin_loaders
 from .version import ELECTRUM_VERSION
 
+if TYPE_CHECKING:
+    from .storage import WalletStorage
+
 
 
 # seed_version is now used for the version of the wallet file
 
 OLD_SEED_VERSION = 4        # electrum versions < 2.0
 NEW_SEED_VERSION = 11       # electrum versions >= 2.0
-FINAL_SEED_VERSION = 52     # electrum >= 2.7 will set this to prevent
+FINAL_SEED_VERSION = 53     # electrum >= 2.7 will set this to prevent
                             # old versions from overwriting new format
 
 
@@ -92,7 +96,8 @@ json_db.register_dict('data_loss_protect_remote_pcp', lambda x: bytes.fromhex(x)
 # register dicts that require key conversion
 for key in [
         'adds', 'locked_in', 'settles', 'fails', 'fee_updates', 'buckets',
-        'unacked_updates', 'unfulfilled_htlcs', 'fail_htlc_reasons', 'onion_keys']:
+        'unacked_updates', 'unfulfilled_htlcs', 'fail_htlc_reasons', 'onion_keys',
+        'archived_htlcs', 'archive_checkpoints']:
     json_db.register_dict_key(key, int)
 for key in ['log']:
     json_db.register_dict_key(key, lambda x: HTLCOwner(int(x)))
@@ -100,9 +105,19 @@ for key in ['locked_in', 'fails', 'settles']:
     json_db.register_parent_key(key, lambda x: HTLCOwner(int(x)))
 
 
+_MULTISIG_KEYSTORE_NAMES = frozenset(('x%d/' % i) for i in range(1, 16))
+
+
 class WalletDB(JsonDB):
 
+    # convert stored values to objects on first access, instead of when the file is loaded
+    LAZY_LOAD = True
+    # number of parsed transactions kept in memory, when transactions are stored in sqlite
+    SQLITE_TX_CACHE_SIZE = 1000
+
     def __init__(self, data, *, manual_upgrades: bool):
+        self._sql = None  # type: Optional[WalletSqliteTables]
+        self._sql_tx_cache = OrderedDict()  # type: OrderedDict[str, Transaction]
         JsonDB.__init__(self, data)
         if not data:
             # create new DB
@@ -238,6 +253,7 @@ class WalletDB(JsonDB):
         self._convert_version_50()
         self._convert_version_51()
         self._convert_version_52()
+        self._convert_version_53()
         self.put('seed_version', FINAL_SEED_VERSION)  # just to be sure
 
         self._after_upgrade_tasks()
@@ -1066,6 +1082,18 @@ class WalletDB(JsonDB):
             raise Exception(f'unsupported wallet file: version_51 with error {error_code}')
         self.data['seed_version'] = 52
 
+    def _convert_version_53(self):
+        # htlc logs get an archive for irrevocably removed htlcs, see HTLCManager._archive_htlcs.
+        # Older versions would ignore it, and get the channel balances wrong.
+        if not self._is_upgrade_method_needed(52, 52):
+            return
+        channels = self.data.get('channels', {})
+        for key, item in channels.items():
+            for sub in item.get('log', {}).values():
+                sub['archived_htlcs'] = {}
+                sub['archive_checkpoints'] = {}
+        self.data['seed_version'] = 53
+
     def _convert_imported(self):
         if not self._is_upgrade_method_needed(0, 13):
             return
@@ -1180,12 +1208,16 @@ class WalletDB(JsonDB):
     def get_txi_addresses(self, tx_hash: str) -> List[str]:
         """Returns list of is_mine addresses that appear as inputs in tx."""
         assert isinstance(tx_hash, str)
+        if self._sql:
+            return self._sql.get_txi_addresses(tx_hash)
         return list(self.txi.get(tx_hash, {}).keys())
 
     @locked
     def get_txo_addresses(self, tx_hash: str) -> List[str]:
         """Returns list of is_mine addresses that appear as outputs in tx."""
         assert isinstance(tx_hash, str)
+        if self._sql:
+            return self._sql.get_txo_addresses(tx_hash)
         return list(self.txo.get(tx_hash, {}).keys())
 
     @locked
@@ -1193,6 +1225,8 @@ class WalletDB(JsonDB):
         """Returns an iterable of (prev_outpoint, value)."""
         assert isinstance(tx_hash, str)
         assert isinstance(address, str)
+        if self._sql:
+            return self._sql.get_txi_addr(tx_hash, address)
         d = self.txi.get(tx_hash, {}).get(address, {})
         return list(d.items())
 
@@ -1201,6 +1235,8 @@ class WalletDB(JsonDB):
         """Returns a dict: output_index -> (value, is_coinbase)."""
         assert isinstance(tx_hash, str)
         assert isinstance(address, str)
+        if self._sql:
+            return self._sql.get_txo_addr(tx_hash, address)
         d = self.txo.get(tx_hash, {}).get(address, {})
         return {int(n): (v, cb) for (n, (v, cb)) in d.items()}
 
@@ -1210,6 +1246,9 @@ class WalletDB(JsonDB):
         assert isinstance(addr, str)
         assert isinstance(ser, str)
         assert isinstance(v, int)
+        if self._sql:
+            self._sql.add_txi_addr(tx_hash, addr, ser, v)
+            return
         if tx_hash not in self.txi:
             self.txi[tx_hash] = {}
         d = self.txi[tx_hash]
@@ -1225,6 +1264,9 @@ class WalletDB(JsonDB):
         assert isinstance(n, str)
         assert isinstance(v, int)
         assert isinstance(is_coinbase, bool)
+        if self._sql:
+            self._sql.add_txo_addr(tx_hash, addr, int(n), v, is_coinbase)
+            return
         if tx_hash not in self.txo:
             self.txo[tx_hash] = {}
         d = self.txo[tx_hash]
@@ -1234,24 +1276,36 @@ class WalletDB(JsonDB):
 
     @locked
     def list_txi(self) -> Sequence[str]:
+        if self._sql:
+            return self._sql.list_txi()
         return list(self.txi.keys())
 
     @locked
     def list_txo(self) -> Sequence[str]:
+        if self._sql:
+            return self._sql.list_txo()
         return list(self.txo.keys())
 
     @modifier
     def remove_txi(self, tx_hash: str) -> None:
         assert isinstance(tx_hash, str)
+        if self._sql:
+            self._sql.remove_txi(tx_hash)
+            return
         self.txi.pop(tx_hash, None)
 
     @modifier
     def remove_txo(self, tx_hash: str) -> None:
         assert isinstance(tx_hash, str)
+        if self._sql:
+            self._sql.remove_txo(tx_hash)
+            return
         self.txo.pop(tx_hash, None)
 
     @locked
     def list_spent_outpoints(self) -> Sequence[Tuple[str, str]]:
+        if self._sql:
+            return self._sql.list_spent_outpoints()
         return [(h, n)
                 for h in self.spent_outpoints.keys()
                 for n in self.get_spent_outpoints(h)
@@ -1260,18 +1314,25 @@ class WalletDB(JsonDB):
     @locked
     def get_spent_outpoints(self, prevout_hash: str) -> Sequence[str]:
         assert isinstance(prevout_hash, str)
+        if self._sql:
+            return self._sql.get_spent_outpoints(prevout_hash)
         return list(self.spent_outpoints.get(prevout_hash, {}).keys())
 
     @locked
     def get_spent_outpoint(self, prevout_hash: str, prevout_n: Union[int, str]) -> Optional[str]:
         assert isinstance(prevout_hash, str)
         prevout_n = str(prevout_n)
+        if self._sql:
+            return self._sql.get_spent_outpoint(prevout_hash, int(prevout_n))
         return self.spent_outpoints.get(prevout_hash, {}).get(prevout_n)
 
     @modifier
     def remove_spent_outpoint(self, prevout_hash: str, prevout_n: Union[int, str]) -> None:
         assert isinstance(prevout_hash, str)
         prevout_n = str(prevout_n)
+        if self._sql:
+            self._sql.remove_spent_outpoint(prevout_hash, int(prevout_n))
+            return
         self.spent_outpoints[prevout_hash].pop(prevout_n, None)
         if not self.spent_outpoints[prevout_hash]:
             self.spent_outpoints.pop(prevout_hash)
@@ -1281,6 +1342,9 @@ class WalletDB(JsonDB):
         assert isinstance(prevout_hash, str)
         assert isinstance(tx_hash, str)
         prevout_n = str(prevout_n)
+        if self._sql:
+            self._sql.set_spent_outpoint(prevout_hash, int(prevout_n), tx_hash)
+            return
         if prevout_hash not in self.spent_outpoints:
             self.spent_outpoints[prevout_hash] = {}
         self.spent_outpoints[prevout_hash][prevout_n] = tx_hash
@@ -1290,6 +1354,9 @@ class WalletDB(JsonDB):
         assert isinstance(scripthash, str)
         assert isinstance(prevout, TxOutpoint)
         assert isinstance(value, int)
+        if self._sql:
+            self._sql.add_prevout_by_scripthash(scripthash, prevout.to_str(), value)
+            return
         if scripthash not in self._prevouts_by_scripthash:
             self._prevouts_by_scripthash[scripthash] = set()
         self._prevouts_by_scripthash[scripthash].add((prevout.to_str(), value))
@@ -1299,6 +1366,9 @@ class WalletDB(JsonDB):
         assert isinstance(scripthash, str)
         assert isinstance(prevout, TxOutpoint)
         assert isinstance(value, int)
+        if self._sql:
+            self._sql.remove_prevout_by_scripthash(scripthash, prevout.to_str(), value)
+            return
         self._prevouts_by_scripthash[scripthash].discard((prevout.to_str(), value))
         if not self._prevouts_by_scripthash[scripthash]:
             self._prevouts_by_scripthash.pop(scripthash)
@@ -1306,28 +1376,45 @@ class WalletDB(JsonDB):
     @locked
     def get_prevouts_by_scripthash(self, scripthash: str) -> Set[Tuple[TxOutpoint, int]]:
         assert isinstance(scripthash, str)
-        prevouts_and_values = self._prevouts_by_scripthash.get(scripthash, set())
+        if self._sql:
+            prevouts_and_values = self._sql.get_prevouts_by_scripthash(scripthash)
+        else:
+            prevouts_and_values = self._prevouts_by_scripthash.get(scripthash, set())
         return {(TxOutpoint.from_str(prevout), value) for prevout, value in prevouts_and_values}
 
     @modifier
     def add_transaction(self, tx_hash: str, tx: Transaction) -> None:
+        """Note: a plain Transaction is stored as-is, not copied: the caller
+        must not modify it afterwards. A PartialTransaction is copied."""
         assert isinstance(tx_hash, str)
         assert isinstance(tx, Transaction), tx
         # note that tx might be a PartialTransaction
-        # serialize and de-serialize tx now. this might e.g. convert a complete PartialTx to a Tx
-        tx = tx_from_any(str(tx))
+        # serialize and de-serialize tx now. this might e.g. convert a complete PartialTx to a Tx.
+        # A plain Transaction (e.g. as fetched and validated by the network) is stored as-is,
+        # so that its parsed form and cached txid are reused.
+        if isinstance(tx, PartialTransaction):
+            tx = tx_from_any(str(tx))
         if not tx_hash:
             raise Exception("trying to add tx to db without txid")
         if tx_hash != tx.txid():
             raise Exception(f"trying to add tx to db with inconsistent txid: {tx_hash} != {tx.txid()}")
         # don't allow overwriting complete tx with partial tx
-        tx_we_already_have = self.transactions.get(tx_hash, None)
+        tx_we_already_have = self.get_transaction(tx_hash)
         if tx_we_already_have is None or isinstance(tx_we_already_have, PartialTransaction):
-            self.transactions[tx_hash] = tx
+            if self._sql:
+                self._sql.add_transaction(tx_hash, tx.serialize())
+                self._cache_sql_tx(tx_hash, tx)
+            else:
+                self.transactions[tx_hash] = tx
 
     @modifier
     def remove_transaction(self, tx_hash: str) -> Optional[Transaction]:
         assert isinstance(tx_hash, str)
+        if self._sql:
+            tx = self.get_transaction(tx_hash)
+            self._sql.remove_transaction(tx_hash)
+            self._sql_tx_cache.pop(tx_hash, None)
+            return tx
         return self.transactions.pop(tx_hash, None)
 
     @locked
@@ -1335,65 +1422,128 @@ class WalletDB(JsonDB):
         if tx_hash is None:
             return None
         assert isinstance(tx_hash, str)
+        if self._sql:
+            tx = self._sql_tx_cache.get(tx_hash)
+            if tx is not None:
+                self._sql_tx_cache.move_to_end(tx_hash)
+                return tx
+            raw = self._sql.get_transaction(tx_hash)
+            if raw is None:
+                return None
+            tx = tx_from_any(raw, deserialize=False)
+            self._cache_sql_tx(tx_hash, tx)
+            return tx
         return self.transactions.get(tx_hash)
 
+    def _cache_sql_tx(self, tx_hash: str, tx: Transaction) -> None:
+        self._sql_tx_cache[tx_hash] = tx
+        self._sql_tx_cache.move_to_end(tx_hash)
+        while len(self._sql_tx_cache) > self.SQLITE_TX_CACHE_SIZE:
+            self._sql_tx_cache.popitem(last=False)
+
     @locked
     def list_transactions(self) -> Sequence[str]:
+        if self._sql:
+            return self._sql.list_transactions()
         return list(self.transactions.keys())
 
     @locked
     def get_history(self) -> Sequence[str]:
+        if self._sql:
+            return self._sql.get_history()
         return list(self.history.keys())
 
+    @locked
     def is_addr_in_history(self, addr: str) -> bool:
         # does not mean history is non-empty!
         assert isinstance(addr, str)
+        if self._sql:
+            return self._sql.is_addr_in_history(addr)
         return addr in self.history
 
     @locked
     def get_addr_history(self, addr: str) -> Sequence[Tuple[str, int]]:
         assert isinstance(addr, str)
+        if self._sql:
+            return self._sql.get_addr_history(addr)
         return self.history.get(addr, [])
 
     @modifier
     def set_addr_history(self, addr: str, hist) -> None:
         assert isinstance(addr, str)
+        if self._sql:
+            self._sql.set_addr_history(addr, hist)
+            return
         self.history[addr] = hist
 
     @modifier
     def remove_addr_history(self, addr: str) -> None:
         assert isinstance(addr, str)
+        if self._sql:
+            self._sql.remove_addr_history(addr)
+            return
         self.history.pop(addr, None)
 
     @locked
     def list_verified_tx(self) -> Sequence[str]:
+        if self._sql:
+            return self._sql.list_verified_tx()
         return list(self.verified_tx.keys())
 
     @locked
     def get_verified_tx(self, txid: str) -> Optional[TxMinedInfo]:
         assert isinstance(txid, str)
-        if txid not in self.verified_tx:
+        if self._sql:
+            row = self._sql.get_verified_tx(txid)
+        else:
+            row = self.verified_tx.get(txid)
+        if row is None:
             return None
-        height, timestamp, txpos, header_hash = self.verified_tx[txid]
+        height, timestamp, txpos, header_hash = row
         return TxMinedInfo(height=height,
                            conf=None,
                            timestamp=timestamp,
                            txpos=txpos,
                            header_hash=header_hash)
 
+    @locked
+    def get_verified_txs_above_height(self, height: int) -> Dict[str, TxMinedInfo]:
+        if self._sql:
+            rows = self._sql.get_verified_txs_above_height(height)
+        else:
+            rows = [(txid,) + tuple(row) for txid, row in self.verified_tx.items() if row[0] > height]
+        return {txid: TxMinedInfo(height=tx_height, conf=None, timestamp=timestamp, txpos=txpos, header_hash=header_hash)
+                for txid, tx_height, timestamp, txpos, header_hash in rows}
+
     @modifier
     def add_verified_tx(self, txid: str, info: TxMinedInfo):
-        assert isinstance(txid, str)
-        assert isinstance(info, TxMinedInfo)
-        self.verified_tx[txid] = (info.height, info.timestamp, info.txpos, info.header_hash)
+        self.add_verified_txs({txid: info})
+
+    @modifier
+    def add_verified_txs(self, infos: Mapping[str, TxMinedInfo]):
+        for txid, info in infos.items():
+            assert isinstance(txid, str)
+            assert isinstance(info, TxMinedInfo)
+        if self._sql:
+            self._sql.add_verified_txs(
+                (txid, info.height, info.timestamp, info.txpos, info.header_hash) for txid, info in infos.items())
+            return
+        for txid, info in infos.items():
+            self.verified_tx[txid] = (info.height, info.timestamp, info.txpos, info.header_hash)
 
     @modifier
     def remove_verified_tx(self, txid: str):
         assert isinstance(txid, str)
+        if self._sql:
+            self._sql.remove_verified_tx(txid)
+            return
         self.verified_tx.pop(txid, None)
 
+    @locked
     def is_in_verified_tx(self, txid: str) -> bool:
         assert isinstance(txid, str)
+        if self._sql:
+            return self._sql.is_in_verified_tx(txid)
         return txid in self.verified_tx
 
     @modifier
@@ -1447,6 +1597,8 @@ class WalletDB(JsonDB):
     @locked
     def get_num_ismine_inputs_of_tx(self, txid: str) -> int:
         assert isinstance(txid, str)
+        if self._sql:
+            return self._sql.get_num_txi(txid)
         txins = self.txi.get(txid, {})
         return sum([len(tupls) for addr, tupls in txins.items()])
 
@@ -1533,7 +1685,10 @@ class WalletDB(JsonDB):
 
     @profiler
     def _load_transactions(self):
-        self.data = StoredDict(self.data, self, [])
+        if self.modified():
+            # changes made before this point (e.g. by upgrades) are not recorded as patches
+            self._needs_consolidation = True
+        self.data = StoredDict(self.data, self, [], lazy=self.LAZY_LOAD)
         # references in self.data
         # TODO make all these private
         # txid -> address -> prev_outpoint -> value
@@ -1562,6 +1717,8 @@ class WalletDB(JsonDB):
 
     @modifier
     def clear_history(self):
+        if self._sql:
+            self._sql.clear()
         self.txi.clear()
         self.txo.clear()
         self.spent_outpoints.clear()
@@ -1571,11 +1728,89 @@ class WalletDB(JsonDB):
         self.tx_fees.clear()
         self._prevouts_by_scripthash.clear()
 
+    def uses_sqlite_tables(self) -> bool:
+        return bool(self.get('sqlite_tx_tables'))
+
+    @locked
+    def attach_sqlite_tables(self, path: str) -> None:
+        """Moves the tx related tables (txi, txo, transactions, ...) from the
+        json data into an sqlite db at 'path', and uses that from now on.
+        """
+        if self._sql:
+            return
+        sql = WalletSqliteTables(path)
+        # first use, or previous migration was interrupted before the json was saved.
+        # note: inserts are idempotent
+        for tx_hash, d in self.txi.items():
+            for addr, prevouts in d.items():
+                for ser, v in prevouts.items():
+                    sql.add_txi_addr(tx_hash, addr, ser, v)
+        for tx_hash, d in self.txo.items():
+            for addr, outputs in d.items():
+                for n, (v, is_cb) in outputs.items():
+                    sql.add_txo_addr(tx_hash, addr, int(n), v, is_cb)
+        for tx_hash, tx in self.transactions.items():
+            sql.add_transaction(tx_hash, tx.serialize())
+        for prevout_hash, d in self.spent_outpoints.items():
+            for prevout_n, spending_txid in d.items():
+                sql.set_spent_outpoint(prevout_hash, int(prevout_n), spending_txid)
+        for addr, hist in self.history.items():
+            sql.set_addr_history(addr, hist)
+        for txid, (height, timestamp, txpos, header_hash) in self.verified_tx.items():
+            sql.add_verified_tx(txid, height, timestamp, txpos, header_hash)
+        for scripthash, prevouts in self._prevouts_by_scripthash.items():
+            for prevout, value in prevouts:
+                sql.add_prevout_by_scripthash(scripthash, prevout, value)
+        sql.remove_unreferenced()
+        sql.commit()
+        self._sql = sql
+        for d in [self.txi, self.txo, self.transactions, self.spent_outpoints,
+                  self.history, self.verified_tx, self._prevouts_by_scripthash]:
+            if d:
+                d.clear()
+        self.put('sqlite_tx_tables', True)
+        self.logger.info(f"using sqlite tables at {path}")
+
+    @locked
+    def detach_sqlite_tables(self) -> None:
+        """Moves the tx related tables back into the json data, and deletes the sqlite db."""
+        sql = self._sql
+        if not sql:
+            return
+        self._sql = None
+        self._sql_tx_cache.clear()
+        for tx_hash in sql.list_transactions():
+            self.transactions[tx_hash] = tx_from_any(sql.get_transaction(tx_hash), deserialize=False)
+        for tx_hash in sql.list_txi():
+            for addr in sql.get_txi_addresses(tx_hash):
+                for ser, v in sql.get_txi_addr(tx_hash, addr):
+                    self.add_txi_addr(tx_hash, addr, ser, v)
+        for tx_hash in sql.list_txo():
+            for addr in sql.get_txo_addresses(tx_hash):
+                for n, (v, is_cb) in sql.get_txo_addr(tx_hash, addr).items():
+                    self.add_txo_addr(tx_hash, addr, n, v, is_cb)
+        for prevout_hash, prevout_n in sql.list_spent_outpoints():
+            self.set_spent_outpoint(prevout_hash, prevout_n, sql.get_spent_outpoint(prevout_hash, int(prevout_n)))
+        for addr in sql.get_history():
+            self.set_addr_history(addr, sql.get_addr_history(addr))
+        for txid in sql.list_verified_tx():
+            self.verified_tx[txid] = sql.get_verified_tx(txid)
+        for scripthash, prevout, value in sql.list_prevouts_by_scripthash():
+            self.add_prevout_by_scripthash(scripthash, prevout=TxOutpoint.from_str(prevout), value=value)
+        self.put('sqlite_tx_tables', None)
+        sql.close()
+        os.unlink(sql.path)
+        self.logger.info(f"moved sqlite tables back into json db")
+
+    def _write(self, storage: 'WalletStorage'):
+        if self._sql:
+            self._sql.commit()
+        JsonDB._write(self, storage)
+
     def _should_convert_to_stored_dict(self, key) -> bool:
         if key == 'keystore':
             return False
-        multisig_keystore_names = [('x%d/' % i) for i in range(1, 16)]
-        if key in multisig_keystore_names:
+        if key in _MULTISIG_KEYSTORE_NAMES:
             return False
         return True
 
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+#
+# Electrum - lightweight Bitcoin client
+# Copyright (C) 2026 The Electrum Developers
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# SQLite storage for the large per-transaction tables of WalletDB
+# (transactions, txi, txo, spent_outpoints, addr_history, verified_tx3,
+# prevouts_by_scripthash). Rows are only read when accessed, so memory use
+# and wallet open time do not grow with the size of the history.
+#
+# Unlike sql_db.SqlDB, queries are synchronous: WalletDB accessors are
+# called from the GUI and from asyncio code alike, and must return a value.
+# All methods are called with the WalletDB lock held.
+
+import json
+import sqlite3
+from typing import Dict, Optional, List, Tuple, Set, Iterable, Sequence
+
+from .logging import Logger
+from .util import test_read_write_permissions
+
+
+class WalletSqliteTables(Logger):
+
+    def __init__(self, path: str):
+        Logger.__init__(self)
+        self.path = path
+        test_read_write_permissions(path)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.create_database()
+
+    def create_database(self):
+        c = self.conn.cursor()
+        c.execute("CREATE TABLE IF NOT EXISTS transactions (txid TEXT PRIMARY KEY, raw TEXT NOT NULL)")
+        c.execute("CREATE TABLE IF NOT EXISTS txi (txid TEXT NOT NULL, address TEXT NOT NULL, prevout TEXT NOT NULL, value INTEGER NOT NULL, PRIMARY KEY(txid, address, prevout))")
+        c.execute("CREATE INDEX IF NOT EXISTS txi_address ON txi(address)")
+        c.execute("CREATE TABLE IF NOT EXISTS txo (txid TEXT NOT NULL, address TEXT NOT NULL, n INTEGER NOT NULL, value INTEGER NOT NULL, is_coinbase INTEGER NOT NULL, PRIMARY KEY(txid, address, n))")
+        c.execute("CREATE INDEX IF NOT EXISTS txo_address ON txo(address)")
+        c.execute("CREATE TABLE IF NOT EXISTS spent_outpoints (prevout_hash TEXT NOT NULL, prevout_n INTEGER NOT NULL, spending_txid TEXT NOT NULL, PRIMARY KEY(prevout_hash, prevout_n))")
+        c.execute("CREATE INDEX IF NOT EXISTS spent_outpoints_spending_txid ON spent_outpoints(spending_txid)")
+        c.execute("CREATE TABLE IF NOT EXISTS addr_history (address TEXT PRIMARY KEY, history TEXT NOT NULL)")
+        c.execute("CREATE TABLE IF NOT EXISTS verified_tx (txid TEXT PRIMARY KEY, height INTEGER, timestamp INTEGER, txpos INTEGER, header_hash TEXT)")
+        c.execute("CREATE INDEX IF NOT EXISTS verified_tx_height ON verified_tx(height)")
+        c.execute("CREATE TABLE IF NOT EXISTS prevouts_by_scripthash (scripthash TEXT NOT NULL, prevout TEXT NOT NULL, value INTEGER NOT NULL, PRIMARY KEY(scripthash, prevout, value))")
+        self.conn.commit()
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def _query(self, sql: str, params=()) -> List[tuple]:
+        return self.conn.execute(sql, params).fetchall()
+
+    def _exists(self, sql: str, params=()) -> bool:
+        return self.conn.execute(sql, params).fetchone() is not None
+
+    # txi / txo
+
+    def get_txi_addresses(self, tx_hash: str) -> List[str]:
+        rows = self._query("SELECT address FROM txi WHERE txid=? GROUP BY address ORDER BY MIN(rowid)", (tx_hash,))
+        return [r[0] for r in rows]
+
+    def get_txo_addresses(self, tx_hash: str) -> List[str]:
+        rows = self._query("SELECT address FROM txo WHERE txid=? GROUP BY address ORDER BY MIN(rowid)", (tx_hash,))
+        return [r[0] for r in rows]
+
+    def get_txi_addr(self, tx_hash: str, address: str) -> List[Tuple[str, int]]:
+        rows = self._query("SELECT prevout, value FROM txi WHERE txid=? AND address=? ORDER BY rowid", (tx_hash, address))
+        return [(prevout, value) for prevout, value in rows]
+
+    def get_txo_addr(self, tx_hash: str, address: str) -> Dict[int, Tuple[int, bool]]:
+        rows = self._query("SELECT n, value, is_coinbase FROM txo WHERE txid=? AND address=? ORDER BY rowid", (tx_hash, address))
+        return {n: (value, bool(is_coinbase)) for n, value, is_coinbase in rows}
+
+    def add_txi_addr(self, tx_hash: str, addr: str, ser: str, v: int) -> None:
+        self.conn.execute(
+            "INSERT INTO txi (txid, address, prevout, value) VALUES (?,?,?,?) "
+            "ON CONFLICT(txid, address, prevout) DO UPDATE SET value=excluded.value",
+            (tx_hash, addr, ser, v))
+
+    def add_txo_addr(self, tx_hash: str, addr: str, n: int, v: int, is_coinbase: bool) -> None:
+        self.conn.execute(
+            "INSERT INTO txo (txid, address, n, value, is_coinbase) VALUES (?,?,?,?,?) "
+            "ON CONFLICT(txid, address, n) DO UPDATE SET value=excluded.value, is_coinbase=excluded.is_coinbase",
+            (tx_hash, addr, n, v, int(is_coinbase)))
+
+    def list_txi(self) -> List[str]:
+        return [r[0] for r in self._query("SELECT txid FROM txi GROUP BY txid ORDER BY MIN(rowid)")]
+
+    def list_txo(self) -> List[str]:
+        return [r[0] for r in self._query("SELECT txid FROM txo GROUP BY txid ORDER BY MIN(rowid)")]
+
+    def remove_txi(self, tx_hash: str) -> None:
+        self.conn.execute("DELETE FROM txi WHERE txid=?", (tx_hash,))
+
+    def remove_txo(self, tx_hash: str) -> None:
+        self.conn.execute("DELETE FROM txo WHERE txid=?", (tx_hash,))
+
+    def get_num_txi(self, tx_hash: str) -> int:
+        return self._query("SELECT COUNT(*) FROM txi WHERE txid=?", (tx_hash,))[0][0]
+
+    # spent outpoints
+
+    def list_spent_outpoints(self) -> List[Tuple[str, str]]:
+        rows = self._query("SELECT prevout_hash, prevout_n FROM spent_outpoints ORDER BY rowid")
+        return [(h, str(n)) for h, n in rows]
+
+    def get_spent_outpoints(self, prevout_hash: str) -> List[str]:
+        rows = self._query("SELECT prevout_n FROM spent_outpoints WHERE prevout_hash=? ORDER BY rowid", (prevout_hash,))
+        return [str(r[0]) for r in rows]
+
+    def get_spent_outpoint(self, prevout_hash: str, prevout_n: int) -> Optional[str]:
+        rows = self._query("SELECT spending_txid FROM spent_outpoints WHERE prevout_hash=? AND prevout_n=?", (prevout_hash, prevout_n))
+        return rows[0][0] if rows else None
+
+    def remove_spent_outpoint(self, prevout_hash: str, prevout_n: int) -> None:
+        self.conn.execute("DELETE FROM spent_outpoints WHERE prevout_hash=? AND prevout_n=?", (prevout_hash, prevout_n))
+
+    def set_spent_outpoint(self, prevout_hash: str, prevout_n: int, tx_hash: str) -> None:
+        self.conn.execute(
+            "INSERT INTO spent_outpoints (prevout_hash, prevout_n, spending_txid) VALUES (?,?,?) "
+            "ON CONFLICT(prevout_hash, prevout_n) DO UPDATE SET spending_txid=excluded.spending_txid",
+            (prevout_hash, prevout_n, tx_hash))
+
+    # prevouts by scripthash
+
+    def add_prevout_by_scripthash(self, scripthash: str, prevout: str, value: int) -> None:
+        self.conn.execute(
+            "INSERT OR IGNORE INTO prevouts_by_scripthash (scripthash, prevout, value) VALUES (?,?,?)",
+            (scripthash, prevout, value))
+
+    def remove_prevout_by_scripthash(self, scripthash: str, prevout: str, value: int) -> None:
+        self.conn.execute(
+            "DELETE FROM prevouts_by_scripthash WHERE scripthash=? AND prevout=? AND value=?",
+            (scripthash, prevout, value))
+
+    def get_prevouts_by_scripthash(self, scripthash: str) -> Set[Tuple[str, int]]:
+        rows = self._query("SELECT prevout, value FROM prevouts_by_scripthash WHERE scripthash=?", (scripthash,))
+        return {(prevout, value) for prevout, value in rows}
+
+    def list_prevouts_by_scripthash(self) -> List[Tuple[str, str, int]]:
+        return self._query("SELECT scripthash, prevout, value FROM prevouts_by_scripthash ORDER BY rowid")
+
+    # transactions
+
+    def add_transaction(self, tx_hash: str, raw: str) -> None:
+        self.conn.execute(
+            "INSERT INTO transactions (txid, raw) VALUES (?,?) "
+            "ON CONFLICT(txid) DO UPDATE SET raw=excluded.raw",
+            (tx_hash, raw))
+
+    def get_transaction(self, tx_hash: str) -> Optional[str]:
+        rows = self._query("SELECT raw FROM transactions WHERE txid=?", (tx_hash,))
+        return rows[0][0] if rows else None
+
+    def remove_transaction(self, tx_hash: str) -> None:
+        self.conn.execute("DELETE FROM transactions WHERE txid=?", (tx_hash,))
+
+    def list_transactions(self) -> List[str]:
+        return [r[0] for r in self._query("SELECT txid FROM transactions ORDER BY rowid")]
+
+    def has_transaction(self, tx_hash: str) -> bool:
+        return self._exists("SELECT 1 FROM transactions WHERE txid=?", (tx_hash,))
+
+    # address history
+
+    def get_history(self) -> List[str]:
+        return [r[0] for r in self._query("SELECT address FROM addr_history ORDER BY rowid")]
+
+    def is_addr_in_history(self, addr: str) -> bool:
+        return self._exists("SELECT 1 FROM addr_history WHERE address=?", (addr,))
+
+    def get_addr_history(self, addr: str) -> list:
+        rows = self._query("SELECT history FROM addr_history WHERE address=?", (addr,))
+        return json.loads(rows[0][0]) if rows else []
+
+    def set_addr_history(self, addr: str, hist) -> None:
+        self.conn.execute(
+            "INSERT INTO addr_history (address, history) VALUES (?,?) "
+            "ON CONFLICT(address) DO UPDATE SET history=excluded.history",
+            (addr, json.dumps(hist)))
+
+    def remove_addr_history(self, addr: str) -> None:
+        self.conn.execute("DELETE FROM addr_history WHERE address=?", (addr,))
+
+    # verified tx
+
+    def list_verified_tx(self) -> List[str]:
+        return [r[0] for r in self._query("SELECT txid FROM verified_tx ORDER BY rowid")]
+
+    def get_verified_tx(self, txid: str) -> Optional[Tuple[int, int, int, str]]:
+        rows = self._query("SELECT height, timestamp, txpos, header_hash FROM verified_tx WHERE txid=?", (txid,))
+        return rows[0] if rows else None
+
+    def get_verified_txs_above_height(self, height: int) -> List[Tuple[str, int, int, int, str]]:
+        return self._query(
+            "SELECT txid, height, timestamp, txpos, header_hash FROM verified_tx WHERE height>? ORDER BY rowid", (height,))
+
+    def add_verified_tx(self, txid: str, height: int, timestamp: int, txpos: int, header_hash: str) -> None:
+        self.add_verified_txs([(txid, height, timestamp, txpos, header_hash)])
+
+    def add_verified_txs(self, rows: Iterable[Tuple[str, int, int, int, str]]) -> None:
+        self.conn.executemany(
+            "INSERT INTO verified_tx (txid, height, timestamp, txpos, header_hash) VALUES (?,?,?,?,?) "
+            "ON CONFLICT(txid) DO UPDATE SET height=excluded.height, timestamp=excluded.timestamp, "
+            "txpos=excluded.txpos, header_hash=excluded.header_hash",
+            rows)
+
+    def remove_verified_tx(self, txid: str) -> None:
+        self.conn.execute("DELETE FROM verified_tx WHERE txid=?", (txid,))
+
+    def is_in_verified_tx(self, txid: str) -> bool:
+        return self._exists("SELECT 1 FROM verified_tx WHERE txid=?", (txid,))
+
+    # maintenance
+
+    def remove_unreferenced(self) -> None:
+        """Same cleanup as WalletDB._load_transactions does for the json tables."""
+        c = self.conn.execute(
+            "DELETE FROM transactions WHERE txid NOT IN (SELECT txid FROM txi) AND txid NOT IN (SELECT txid FROM txo)")
+        if c.rowcount:
+            self.logger.info(f"removed {c.rowcount} unreferenced txs")
+        c = self.conn.execute(
+            "DELETE FROM spent_outpoints WHERE spending_txid NOT IN (SELECT txid FROM transactions)")
+        if c.rowcount:
+            self.logger.info(f"removed {c.rowcount} unreferenced spent outpoints")
+
+    def clear(self) -> None:
+        for table in ['transactions', 'txi', 'txo', 'spent_outpoints', 'addr_history', 'verified_tx', 'prevouts_by_scripthash']:
+            self.conn.execute(f"DELETE FROM {table}")
+
+    def is_empty(self) -> bool:
+        return not self._exists("SELECT 1 FROM addr_history") and not self._exists("SELECT 1 FROM transactions")